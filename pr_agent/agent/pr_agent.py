@@ -2,7 +2,7 @@ import shlex
 from functools import partial
 
 from pr_agent.algo.ai_handlers.base_ai_handler import BaseAiHandler
-from pr_agent.algo.ai_handlers.litellm_ai_handler import LiteLLMAIHandler
+from pr_agent.algo.ai_handlers.handler_pool import get_pooled_ai_handler
 from pr_agent.algo.cli_args import CliArgs
 from pr_agent.algo.utils import update_settings_from_args
 from pr_agent.config_loader import get_settings
@@ -21,6 +21,8 @@ from pr_agent.tools.pr_reviewer import PRReviewer
 from pr_agent.tools.pr_similar_issue import PRSimilarIssue
 from pr_agent.tools.pr_update_changelog import PRUpdateChangelog
 
+_MISSING = object()
+
 command2class = {
     "auto_review": PRReviewer,
     "answer": PRReviewer,
@@ -48,8 +50,8 @@ commands = list(command2class.keys())
 
 
 class PRAgent:
-    def __init__(self, ai_handler: partial[BaseAiHandler,] = LiteLLMAIHandler):
-        self.ai_handler = ai_handler  # will be initialized in run_action
+    def __init__(self, ai_handler: partial[BaseAiHandler,] = get_pooled_ai_handler):
+        self.ai_handler = ai_handler  # will be initialized in run_action (warm handlers are reused, see AIHandlerPool)
 
     async def _handle_request(self, pr_url, request, notify=None) -> bool:
         # First, apply repo specific settings if exists
@@ -80,22 +82,25 @@ class PRAgent:
         if response_language.lower() != 'en-us':
             get_logger().info(f'User has set the response language to: {response_language}')
             for key in get_settings():
-                setting = get_settings().get(key)
-                if str(type(setting)) == "<class 'dynaconf.utils.boxing.DynaBox'>":
-                    if hasattr(setting, 'extra_instructions'):
-                        current_extra_instructions = setting.extra_instructions
-                        
-                        # Define the language-specific instruction and the separator
-                        lang_instruction_text = f"Your response MUST be written in the language corresponding to locale code: '{response_language}'. This is crucial."
-                        separator_text = "\n======\n\nIn addition, "
-
-                        # Check if the specific language instruction is already present to avoid duplication
-                        if lang_instruction_text not in str(current_extra_instructions):
-                            if current_extra_instructions: # If there's existing text
-                                setting.extra_instructions = str(current_extra_instructions) + separator_text + lang_instruction_text
-                            else: # If extra_instructions was None or empty
-                                setting.extra_instructions = lang_instruction_text
-                        # If lang_instruction_text is already present, do nothing.
+                # only the sections with 'extra_instructions' are read and rewritten, the others are not copied
+                try:
+                    current_extra_instructions = get_settings().get(f"{key}.extra_instructions", _MISSING)
+                except AttributeError:  # not a section
+                    continue
+                if current_extra_instructions is not _MISSING:
+                    # Define the language-specific instruction and the separator
+                    lang_instruction_text = ("Your response MUST be written in the language corresponding to locale "
+                                             f"code: '{response_language}'. This is crucial.")
+                    separator_text = "\n======\n\nIn addition, "
+
+                    # Check if the specific language instruction is already present to avoid duplication
+                    if lang_instruction_text not in str(current_extra_instructions):
+                        if current_extra_instructions: # If there's existing text
+                            get_settings().set(f"{key}.extra_instructions",
+                                               str(current_extra_instructions) + separator_text + lang_instruction_text)
+                        else: # If extra_instructions was None or empty
+                            get_settings().set(f"{key}.extra_instructions", lang_instruction_text)
+                    # If lang_instruction_text is already present, do nothing.
 
         action = action.lstrip("/").lower()
         if action not in command2class:
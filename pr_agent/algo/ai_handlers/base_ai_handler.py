@@ -26,3 +26,30 @@ class BaseAiHandler(ABC):
             temperature (float): the temperature to use for the chat completion
         """
         pass
+
+
+class StreamConsumer(ABC):
+    """
+    Receives the output of a streamed chat completion while it is generated (see LiteLLMAIHandler.chat_completion).
+    """
+
+    @abstractmethod
+    def reset(self):
+        """
+        Called when a new completion attempt starts, e.g. on a retry: the text fed so far is discarded.
+        """
+        pass
+
+    @abstractmethod
+    def feed(self, text: str) -> bool:
+        """
+        Called with each new piece of generated text. Returning True stops the generation.
+        """
+        pass
+
+    @abstractmethod
+    def finish(self):
+        """
+        Called when the generation ended on its own (not stopped by the consumer).
+        """
+        pass
@@ -0,0 +1,92 @@
+"""
+Process-level pool of warm AI handlers. Each tool instantiates its AI handler, and the setup of LiteLLMAIHandler
+(settings to litellm globals, Azure AD token, HTTP clients) is the same for all the requests of a process, unless
+their settings differ. The pool keeps one configured handler per class, re-runs its setup only when the settings it
+depends on change, and hands each tool a shallow copy of it.
+"""
+from __future__ import annotations
+
+import asyncio
+import copy
+from threading import Lock
+from typing import Type
+
+from pr_agent.algo.ai_handlers.base_ai_handler import BaseAiHandler
+from pr_agent.algo.ai_handlers.litellm_ai_handler import LiteLLMAIHandler
+from pr_agent.config_loader import get_settings
+from pr_agent.log import get_logger
+
+
+class AIHandlerPool:
+    """
+    Handler classes are pooled if they implement a 'get_settings_fingerprint()' static method, returning a hash of
+    the settings their __init__ applies. Other classes are instantiated on each request.
+    """
+
+    def __init__(self):
+        self._handlers = {}  # handler class -> (settings fingerprint, handler)
+        self._lock = Lock()
+        self._http_client = None
+        self._http_client_loop = None
+
+    def get(self, handler_cls: Type[BaseAiHandler] = LiteLLMAIHandler) -> BaseAiHandler:
+        get_fingerprint = getattr(handler_cls, "get_settings_fingerprint", None)
+        if not get_settings().get("litellm.enable_handler_pool", True) or get_fingerprint is None:
+            return handler_cls()
+        fingerprint = get_fingerprint()
+        with self._lock:
+            pooled = self._handlers.get(handler_cls)
+            if pooled is None or pooled[0] != fingerprint:
+                if pooled is not None:
+                    get_logger().debug(f"Settings of {handler_cls.__name__} changed, re-applying them")
+                pooled = (fingerprint, handler_cls())
+                self._handlers[handler_cls] = pooled
+        if handler_cls is LiteLLMAIHandler:
+            self._ensure_http_client()
+        # tools set per-request attributes on their handler (e.g. 'main_pr_language')
+        return copy.copy(pooled[1])
+
+    def _ensure_http_client(self):
+        """
+        With 'litellm.http2' set, share an HTTP/2 client session between the litellm requests of the current event
+        loop, so that connections (and their TLS handshakes) are reused across requests. Requires the 'h2' package.
+        """
+        import litellm
+        if not get_settings().get("litellm.http2", False):
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        with self._lock:
+            if self._http_client_loop is loop and litellm.aclient_session is self._http_client:
+                return
+            if litellm.aclient_session is not None and litellm.aclient_session is not self._http_client:
+                return  # a client session set up by the user is kept
+            import httpx
+            try:
+                self._http_client = httpx.AsyncClient(http2=True, timeout=get_settings().config.get("ai_timeout", 120))
+            except ImportError as e:
+                get_logger().warning(f"HTTP/2 is not available, using litellm's default HTTP client: {e}")
+                self._http_client = None
+                return
+            self._http_client_loop = loop
+            litellm.aclient_session = self._http_client
+
+    def clear(self):
+        with self._lock:
+            self._handlers.clear()
+
+
+_handler_pool = AIHandlerPool()
+
+
+def get_ai_handler_pool() -> AIHandlerPool:
+    return _handler_pool
+
+
+def get_pooled_ai_handler(handler_cls: Type[BaseAiHandler] = LiteLLMAIHandler) -> BaseAiHandler:
+    """
+    Drop-in replacement for an AI handler class, e.g. PRAgent(ai_handler=get_pooled_ai_handler).
+    """
+    return _handler_pool.get(handler_cls)
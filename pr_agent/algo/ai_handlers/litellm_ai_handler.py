@@ -1,3 +1,4 @@
+import hashlib
 import os
 import litellm
 import openai
@@ -6,16 +7,41 @@ from litellm import acompletion
 from tenacity import retry, retry_if_exception_type, retry_if_not_exception_type, stop_after_attempt
 
 from pr_agent.algo import CLAUDE_EXTENDED_THINKING_MODELS, NO_SUPPORT_TEMPERATURE_MODELS, SUPPORT_REASONING_EFFORT_MODELS, USER_MESSAGE_ONLY_MODELS, STREAMING_REQUIRED_MODELS
-from pr_agent.algo.ai_handlers.base_ai_handler import BaseAiHandler
+from pr_agent.algo.ai_handlers.base_ai_handler import BaseAiHandler, StreamConsumer
+from pr_agent.algo.ai_handlers.response_cache import (get_response_cache_key,
+                                                      load_cached_response,
+                                                      store_cached_response)
+from pr_agent.algo.ai_handlers.prompt_caching import (add_cache_control_breakpoint, is_prompt_caching_enabled,
+                                                      log_prompt_cache_usage, supports_cache_control)
+from pr_agent.algo.ai_handlers.rate_limiter import get_rate_limiter
+from pr_agent.algo.inflight_runs import check_superseded, track_completion_tokens
 from pr_agent.algo.ai_handlers.litellm_helpers import _handle_streaming_response, MockResponse, _get_azure_ad_token, \
     _process_litellm_extra_body
-from pr_agent.algo.utils import ReasoningEffort, get_version
+from pr_agent.algo.model_health import (CIRCUIT_CLOSED, get_hedge_models, get_model_circuit_breaker, run_hedged,
+                                        track_model_call)
+from pr_agent.algo.token_handler import TokenEncoder
+from pr_agent.algo.utils import ReasoningEffort, get_max_tokens, get_version
 from pr_agent.config_loader import get_settings
 from pr_agent.log import get_logger
 import json
 
 MODEL_RETRIES = 2
 
+# settings sections read by LiteLLMAIHandler.__init__
+LITELLM_HANDLER_SETTINGS_SECTIONS = ("openai", "aws", "litellm", "anthropic", "cohere", "groq", "replicate", "xai",
+                                     "huggingface", "ollama", "vertexai", "google_ai_studio", "deepseek", "deepinfra",
+                                     "mistral", "codestral", "azure_ad", "openrouter")
+
+
+def _is_circuit_probe(retry_state) -> bool:
+    """
+    A failed probe of a half-open circuit (see ModelCircuitBreaker) is not retried: the model is likely still down,
+    and 'retry_with_fallback_models' moves on to the next one.
+    """
+    model = retry_state.kwargs.get("model", retry_state.args[1] if len(retry_state.args) > 1 else None)
+    deployment_id = get_settings().get("openai.deployment_id", None)
+    return get_model_circuit_breaker().get_state(model, deployment_id) != CIRCUIT_CLOSED
+
 
 class LiteLLMAIHandler(BaseAiHandler):
     """
@@ -30,6 +56,7 @@ class LiteLLMAIHandler(BaseAiHandler):
         Raises a ValueError if the OpenAI key is missing.
         """
         self.azure = False
+        self.azure_ad = False
         self.api_base = None
         self.repetition_penalty = None
         
@@ -111,6 +138,7 @@ class LiteLLMAIHandler(BaseAiHandler):
         # Check for Azure AD configuration
         if get_settings().get("AZURE_AD.CLIENT_ID", None):
             self.azure = True
+            self.azure_ad = True
             # Generate access token using Azure AD credentials from settings
             access_token = _get_azure_ad_token()
             litellm.api_key = access_token
@@ -155,6 +183,19 @@ class LiteLLMAIHandler(BaseAiHandler):
             "zhipu/glm-4": "openai/glm-4",
         }
 
+    @staticmethod
+    def get_settings_fingerprint() -> str:
+        """
+        A hash of the settings applied by __init__, used by the handler pool (see AIHandlerPool) to tell whether a
+        warm handler still matches the settings of the current request.
+        """
+        applied_settings = {section: get_settings().get(section, None) for section in LITELLM_HANDLER_SETTINGS_SECTIONS}
+        applied_settings["openai"] = {key.lower(): value for key, value in (applied_settings["openai"] or {}).items()
+                                      if key.lower() != "deployment_id"}  # set per request by the fallback logic
+        applied_settings["model"] = get_settings().config.model
+        settings_str = json.dumps(applied_settings, sort_keys=True, default=str)
+        return hashlib.sha256(settings_str.encode("utf-8")).hexdigest()
+
     def prepare_logs(self, response, system, user, resp, finish_reason):
         response_log = response.dict().copy()
         response_log['system'] = system
@@ -265,11 +306,55 @@ class LiteLLMAIHandler(BaseAiHandler):
         """
         return get_settings().get("OPENAI.DEPLOYMENT_ID", None)
 
+    async def chat_completion(self, model: str, system: str, user: str, temperature: float = 0.2, img_path: str = None,
+                              stream_consumer: StreamConsumer = None, response_schema: dict = None):
+        """
+        'stream_consumer', if given, streams the response and is fed with it while it is generated.
+        It is not fed when the response comes from the response cache.
+        'response_schema', if given (see structured_output.get_response_schema), constrains the response to JSON of
+        that schema, when the model supports it. Otherwise, the response follows the format requested by the prompt.
+        With 'config.enable_hedged_requests', a slow completion is hedged with the fallback models (see run_hedged).
+        """
+        hedge_models = self._get_hedge_models(model) if stream_consumer is None else []
+        if not hedge_models:
+            return await self._chat_completion(model=model, system=system, user=user, temperature=temperature,
+                                               img_path=img_path, stream_consumer=stream_consumer,
+                                               response_schema=response_schema)
+        return await run_hedged(lambda hedge_model: self._chat_completion(
+            model=hedge_model, system=system, user=user, temperature=temperature, img_path=img_path,
+            response_schema=response_schema), [model, *hedge_models])
+
+    @staticmethod
+    def _get_hedge_models(model: str) -> list:
+        """
+        The fallback models the completion may be hedged with: those whose context window is at least the one of
+        'model', since the prompt was prepared for it.
+        """
+        hedge_models = get_hedge_models()
+        if not hedge_models:
+            return []
+        try:
+            max_tokens = get_max_tokens(model)
+        except Exception:
+            return []
+        eligible_models = []
+        for hedge_model in hedge_models:
+            try:
+                if get_max_tokens(hedge_model) >= max_tokens:
+                    eligible_models.append(hedge_model)
+            except Exception:
+                pass
+        return eligible_models
+
     @retry(
         retry=retry_if_exception_type(openai.APIError) & retry_if_not_exception_type(openai.RateLimitError),
-        stop=stop_after_attempt(MODEL_RETRIES),
+        stop=stop_after_attempt(MODEL_RETRIES) | _is_circuit_probe,
     )
-    async def chat_completion(self, model: str, system: str, user: str, temperature: float = 0.2, img_path: str = None):
+    async def _chat_completion(self, model: str, system: str, user: str, temperature: float = 0.2,
+                               img_path: str = None, stream_consumer: StreamConsumer = None,
+                               response_schema: dict = None):
+        await check_superseded()  # a newer commit was pushed since the run of this completion started
+        requested_model = model  # the model health is tracked under the name used by 'retry_with_fallback_models'
         # 处理 zhipu 前缀模型映射
         if model in self.zhipu_model_mapping:
             original_model = model
@@ -281,6 +366,11 @@ class LiteLLMAIHandler(BaseAiHandler):
             deployment_id = self.deployment_id
             if self.azure:
                 model = 'azure/' + model
+            if self.azure_ad:
+                # pooled handlers outlive the token they were created with, the cached token is refreshed before expiry
+                access_token = _get_azure_ad_token()
+                litellm.api_key = access_token
+                openai.api_key = access_token
             if 'claude' in model and not system:
                 system = "No system prompt provided"
                 get_logger().warning(
@@ -338,6 +428,12 @@ class LiteLLMAIHandler(BaseAiHandler):
                     "api_base": self.api_base,
                 }
 
+            if response_schema and self._supports_response_schema(model):
+                kwargs["response_format"] = {"type": "json_schema", "json_schema": response_schema}
+
+            if is_prompt_caching_enabled() and supports_cache_control(model):
+                kwargs["messages"] = add_cache_control_breakpoint(kwargs["messages"])
+
             # Add temperature only if model supports it
             if model not in self.no_support_temperature_models and not get_settings().config.custom_reasoning_model:
                 # get_logger().info(f"Adding temperature with value {temperature} to model {model}.")
@@ -397,8 +493,29 @@ class LiteLLMAIHandler(BaseAiHandler):
                 get_logger().info(f"\nSystem prompt:\n{system}")
                 get_logger().info(f"\nUser prompt:\n{user}")
 
+            response_cache_key = get_response_cache_key(kwargs)
+            cached_response = load_cached_response(response_cache_key)
+            if cached_response:
+                return cached_response
+
+            # wait for capacity in the process-wide RPM/TPM buckets of the model, if limits are configured
+            rate_limiter = get_rate_limiter()
+            estimated_tokens = 0
+            if rate_limiter.needs_token_estimate(model):
+                estimated_tokens = TokenEncoder.count_tokens(system) + TokenEncoder.count_tokens(user)
+            await rate_limiter.acquire(model, estimated_tokens)
+
             # Get completion with automatic streaming detection
-            resp, finish_reason, response_obj = await self._get_completion(**kwargs)
+            if stream_consumer is not None:
+                stream_consumer.reset()
+            track_completion_tokens(pending_tokens=(len(system) + len(user)) // 4)
+            with track_model_call(requested_model, deployment_id):
+                resp, finish_reason, response_obj = await self._get_completion(stream_consumer=stream_consumer,
+                                                                               **kwargs)
+            track_completion_tokens(used_tokens=_get_total_tokens(response_obj))
+            rate_limiter.record_usage(model, estimated_tokens, _get_total_tokens(response_obj))
+            if is_prompt_caching_enabled():
+                log_prompt_cache_usage(model, response_obj)
 
         except openai.RateLimitError as e:
             get_logger().error(f"Rate limit error during LLM inference: {e}")
@@ -420,18 +537,29 @@ class LiteLLMAIHandler(BaseAiHandler):
         if get_settings().config.verbosity_level >= 2:
             get_logger().info(f"\nAI response:\n{resp}")
 
+        if finish_reason == "stop":  # truncated responses are not cached
+            store_cached_response(response_cache_key, resp, finish_reason, _get_total_tokens(response_obj))
+
+        await check_superseded()  # before the caller publishes a result for an older commit
         return resp, finish_reason
 
-    async def _get_completion(self, **kwargs):
+    @staticmethod
+    def _supports_response_schema(model: str) -> bool:
+        try:
+            return litellm.supports_response_schema(model=model)
+        except Exception:
+            return False
+
+    async def _get_completion(self, stream_consumer: StreamConsumer = None, **kwargs):
         """
-        Wrapper that automatically handles streaming for required models.
+        Wrapper that automatically handles streaming for required models, and for requests with a stream consumer.
         """
         model = kwargs["model"]
-        if model in self.streaming_required_models:
+        if model in self.streaming_required_models or stream_consumer is not None:
             kwargs["stream"] = True
             get_logger().info(f"Using streaming mode for model {model}")
             response = await acompletion(**kwargs)
-            resp, finish_reason = await _handle_streaming_response(response)
+            resp, finish_reason = await _handle_streaming_response(response, stream_consumer)
             # Create MockResponse for streaming since we don't have the full response object
             mock_response = MockResponse(resp, finish_reason)
             return resp, finish_reason, mock_response
@@ -442,3 +570,10 @@ class LiteLLMAIHandler(BaseAiHandler):
             return (response["choices"][0]['message']['content'],
                     response["choices"][0]["finish_reason"],
                     response)
+
+
+def _get_total_tokens(response_obj) -> int:
+    try:
+        return int(response_obj["usage"]["total_tokens"])
+    except Exception:
+        return 0
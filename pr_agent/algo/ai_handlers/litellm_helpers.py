@@ -1,23 +1,33 @@
+import hashlib
+import inspect
 import json
+import time
+from threading import Lock
 
 import openai
 
+from pr_agent.algo.ai_handlers.base_ai_handler import StreamConsumer
 from pr_agent.config_loader import get_settings
 from pr_agent.log import get_logger
 
+# finish reason of a streamed response stopped by its consumer (such truncated responses are not cached)
+STREAM_CONSUMER_STOP_FINISH_REASON = "consumer_stop"
 
-async def _handle_streaming_response(response):
+
+async def _handle_streaming_response(response, stream_consumer: StreamConsumer = None):
     """
     Handle streaming response from acompletion and collect the full response.
 
     Args:
         response: The streaming response object from acompletion
+        stream_consumer: Optional consumer fed with each piece of content; it can stop the generation early
 
     Returns:
         tuple: (full_response_content, finish_reason)
     """
-    full_response = ""
+    response_parts = []
     finish_reason = None
+    stopped_early = False
 
     try:
         async for chunk in response:
@@ -26,13 +36,24 @@ async def _handle_streaming_response(response):
                 delta = choice.delta
                 content = getattr(delta, 'content', None)
                 if content:
-                    full_response += content
+                    response_parts.append(content)
+                    if stream_consumer is not None and stream_consumer.feed(content):
+                        stopped_early = True
+                        finish_reason = STREAM_CONSUMER_STOP_FINISH_REASON
+                        break
                 if choice.finish_reason:
                     finish_reason = choice.finish_reason
     except Exception as e:
         get_logger().error(f"Error handling streaming response: {e}")
         raise
 
+    if stopped_early:
+        get_logger().info("Stopped the generation early, the response consumer has what it needs")
+        await _close_stream(response)
+    elif stream_consumer is not None:
+        stream_consumer.finish()
+
+    full_response = "".join(response_parts)
     if not full_response and finish_reason is None:
         get_logger().warning("Streaming response resulted in empty content with no finish reason")
         raise openai.APIError("Empty streaming response received without proper completion")
@@ -42,6 +63,23 @@ async def _handle_streaming_response(response):
     return full_response, finish_reason
 
 
+async def _close_stream(response):
+    """
+    Closes the underlying HTTP stream of a streaming response that is not read to the end, so the provider stops
+    generating (and billing) the rest of it.
+    """
+    stream = getattr(response, "completion_stream", None) or response
+    close = getattr(stream, "aclose", None) or getattr(stream, "close", None)
+    if close is None:
+        return
+    try:
+        result = close()
+        if inspect.isawaitable(result):
+            await result
+    except Exception as e:
+        get_logger().debug(f"Failed to close the streaming response: {e}")
+
+
 class MockResponse:
     """Mock response object for streaming models to enable consistent logging."""
 
@@ -59,25 +97,42 @@ class MockResponse:
         return self._data
 
 
+# cached Azure AD tokens are refreshed when they expire in less than this
+AZURE_AD_TOKEN_REFRESH_MARGIN_SECONDS = 300
+
+_azure_ad_token_cache = {}  # (tenant id, client id, client secret hash) -> azure.core.credentials.AccessToken
+_azure_ad_token_lock = Lock()
+
+
 def _get_azure_ad_token():
     """
     Generates an access token using Azure AD credentials from settings.
+    Tokens are cached per credentials, and refreshed AZURE_AD_TOKEN_REFRESH_MARGIN_SECONDS before they expire.
     Returns:
         str: The access token
     """
     from azure.identity import ClientSecretCredential
-    try:
-        credential = ClientSecretCredential(
-            tenant_id=get_settings().azure_ad.tenant_id,
-            client_id=get_settings().azure_ad.client_id,
-            client_secret=get_settings().azure_ad.client_secret
-        )
-        # Get token for Azure OpenAI service
-        token = credential.get_token("https://cognitiveservices.azure.com/.default")
+    tenant_id = get_settings().azure_ad.tenant_id
+    client_id = get_settings().azure_ad.client_id
+    client_secret = get_settings().azure_ad.client_secret
+    cache_key = (tenant_id, client_id, hashlib.sha256(str(client_secret).encode("utf-8")).hexdigest())
+    with _azure_ad_token_lock:
+        token = _azure_ad_token_cache.get(cache_key)
+        if token is not None and token.expires_on - time.time() > AZURE_AD_TOKEN_REFRESH_MARGIN_SECONDS:
+            return token.token
+        try:
+            credential = ClientSecretCredential(
+                tenant_id=tenant_id,
+                client_id=client_id,
+                client_secret=client_secret
+            )
+            # Get token for Azure OpenAI service
+            token = credential.get_token("https://cognitiveservices.azure.com/.default")
+        except Exception as e:
+            get_logger().error(f"Failed to get Azure AD token: {e}")
+            raise
+        _azure_ad_token_cache[cache_key] = token
         return token.token
-    except Exception as e:
-        get_logger().error(f"Failed to get Azure AD token: {e}")
-        raise
 
 
 def _process_litellm_extra_body(kwargs: dict) -> dict:
@@ -0,0 +1,88 @@
+"""
+Provider-side prompt caching, enabled with 'config.enable_prompt_caching'.
+The system prompts of the tools hold the large static part of each request, and are kept identical across PRs in
+this mode, so providers can reuse it: Anthropic models (direct, Bedrock or Vertex AI) need an explicit 'cache_control'
+breakpoint at the end of the system prompt, while OpenAI caches the longest repeated prefix automatically, as long as
+the static part comes first (the system prompt precedes the per-PR user prompt).
+Per-PR values are rendered in the user prompts. Some system prompts still have sections that are turned on or off per
+PR, but hold no per-PR text: the review prompt has sections for related tickets, answered questions and AI-generated
+file summaries, so each configuration has up to eight review system prompts, each cached on its own.
+"""
+from __future__ import annotations
+
+from threading import Lock
+
+from pr_agent.config_loader import get_settings
+from pr_agent.log import get_logger
+
+_prompt_cache_stats = {"requests": 0, "prompt_tokens": 0, "cached_tokens": 0, "cache_creation_tokens": 0}
+_prompt_cache_lock = Lock()
+
+
+def is_prompt_caching_enabled() -> bool:
+    return get_settings().config.get("enable_prompt_caching", False)
+
+
+def supports_cache_control(model: str) -> bool:
+    """
+    Whether 'model' needs explicit 'cache_control' breakpoints (Anthropic models, on any platform).
+    """
+    model = model.lower()
+    return model.startswith("anthropic/") or model.startswith("claude") or \
+        (model.split("/")[0] in ("bedrock", "vertex_ai") and "claude" in model)
+
+
+def add_cache_control_breakpoint(messages: list) -> list:
+    """
+    Marks the end of the system prompt as a cache breakpoint, so that it is cached and reused by the following
+    requests sharing it.
+    """
+    if not messages or messages[0]["role"] != "system" or not isinstance(messages[0]["content"], str) or \
+            not messages[0]["content"]:
+        return messages
+    system_message = {"role": "system",
+                      "content": [{"type": "text", "text": messages[0]["content"],
+                                   "cache_control": {"type": "ephemeral"}}]}
+    return [system_message] + messages[1:]
+
+
+def _get_usage_value(obj, key: str) -> int:
+    if obj is None:
+        return 0
+    value = obj.get(key) if isinstance(obj, dict) else getattr(obj, key, None)
+    return value if isinstance(value, int) else 0
+
+
+def log_prompt_cache_usage(model: str, response_obj):
+    """
+    Logs the cached and cache-creation prompt tokens of a response, with the running totals of this process.
+    """
+    try:
+        usage = response_obj["usage"]
+    except Exception:
+        return
+    prompt_tokens_details = usage.get("prompt_tokens_details") if isinstance(usage, dict) else \
+        getattr(usage, "prompt_tokens_details", None)
+    cached_tokens = _get_usage_value(prompt_tokens_details, "cached_tokens") or \
+        _get_usage_value(usage, "cache_read_input_tokens")
+    cache_creation_tokens = _get_usage_value(usage, "cache_creation_input_tokens")
+    with _prompt_cache_lock:
+        _prompt_cache_stats["requests"] += 1
+        _prompt_cache_stats["prompt_tokens"] += _get_usage_value(usage, "prompt_tokens")
+        _prompt_cache_stats["cached_tokens"] += cached_tokens
+        _prompt_cache_stats["cache_creation_tokens"] += cache_creation_tokens
+        stats = dict(_prompt_cache_stats)
+    get_logger().info(f"Prompt cache usage of {model}: {cached_tokens} cached tokens, "
+                      f"{cache_creation_tokens} tokens written to the cache",
+                      artifact={"cached_tokens": cached_tokens, "cache_creation_tokens": cache_creation_tokens,
+                                "totals": stats})
+
+
+def get_prompt_cache_stats() -> dict:
+    """
+    Prompt and cached tokens of the requests of this process, and the share of prompt tokens read from the cache.
+    """
+    with _prompt_cache_lock:
+        stats = dict(_prompt_cache_stats)
+    stats["cached_ratio"] = stats["cached_tokens"] / stats["prompt_tokens"] if stats["prompt_tokens"] else 0.0
+    return stats
@@ -0,0 +1,132 @@
+"""
+Process-wide rate limiting of LLM requests, with a requests-per-minute and a tokens-per-minute token bucket per
+model. All the concurrent calls of the tools (and of concurrent webhooks in the same process) share the buckets, so
+bursts are queued locally instead of failing with provider rate limit errors.
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+from threading import Lock
+from typing import Optional
+
+from pr_agent.config_loader import get_settings
+from pr_agent.log import get_logger
+
+
+class TokenBucket:
+    """
+    A token bucket holding up to 'capacity' tokens, refilled continuously at 'capacity' tokens per minute.
+    Acquiring more than the available tokens reserves them anyway (the level goes negative), and returns how long
+    the caller must wait until they are refilled. Waiting callers are therefore served in arrival order.
+    """
+
+    def __init__(self, capacity: float):
+        self.capacity = capacity
+        self.refill_per_second = capacity / 60
+        self._level = capacity
+        self._last_refill = time.monotonic()
+        self._lock = Lock()
+
+    def _refill(self, now: float):
+        self._level = min(self.capacity, self._level + (now - self._last_refill) * self.refill_per_second)
+        self._last_refill = now
+
+    def reserve(self, amount: float) -> float:
+        """
+        Takes 'amount' tokens, and returns the number of seconds to wait before using them.
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            self._level -= amount
+            return max(0.0, -self._level / self.refill_per_second)
+
+    def adjust(self, amount: float):
+        """
+        Returns 'amount' tokens to the bucket (or takes them, if negative), e.g. to correct an estimate.
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            self._level = min(self.capacity, self._level + amount)
+
+
+class ModelRateLimiter:
+    """
+    Request and token buckets per model, configured in the [litellm] section:
+    'rate_limit_rpm'/'rate_limit_tpm' apply to every model, and 'model_rate_limits' overrides them per model,
+    e.g. model_rate_limits = {"gpt-4o" = {rpm = 500, tpm = 800000}}. A limit of 0 means unlimited.
+    The tokens of a request are estimated from its prompt, then corrected with its total (prompt + completion) usage.
+    The limits are read on each request, so changed settings (e.g. per repo) apply to the next requests.
+    """
+
+    def __init__(self):
+        self._buckets = {}  # (model, rpm, tpm) -> (requests bucket or None, tokens bucket or None)
+        self._stats = {}  # model -> {"requests", "queued_requests", "total_queue_seconds", "max_queue_seconds"}
+        self._lock = Lock()
+
+    @staticmethod
+    def _get_limits(model: str) -> tuple[float, float]:
+        rpm = get_settings().get("litellm.rate_limit_rpm", 0)
+        tpm = get_settings().get("litellm.rate_limit_tpm", 0)
+        model_limits = (get_settings().get("litellm.model_rate_limits", None) or {}).get(model, None) or {}
+        return model_limits.get("rpm", rpm), model_limits.get("tpm", tpm)
+
+    def _get_buckets(self, model: str) -> tuple[Optional[TokenBucket], Optional[TokenBucket]]:
+        rpm, tpm = self._get_limits(model)
+        key = (model, rpm, tpm)
+        with self._lock:
+            if key not in self._buckets:
+                self._buckets[key] = (TokenBucket(rpm) if rpm > 0 else None, TokenBucket(tpm) if tpm > 0 else None)
+            return self._buckets[key]
+
+    def needs_token_estimate(self, model: str) -> bool:
+        return self._get_buckets(model)[1] is not None
+
+    async def acquire(self, model: str, estimated_tokens: int = 0) -> float:
+        """
+        Waits until 'model' has capacity for one more request of 'estimated_tokens' tokens.
+        Returns the time spent waiting, in seconds.
+        """
+        requests_bucket, tokens_bucket = self._get_buckets(model)
+        wait_seconds = 0.0
+        if requests_bucket:
+            wait_seconds = requests_bucket.reserve(1)
+        if tokens_bucket and estimated_tokens > 0:
+            wait_seconds = max(wait_seconds, tokens_bucket.reserve(estimated_tokens))
+        self._record_queue_time(model, wait_seconds)
+        if wait_seconds > 0:
+            get_logger().info(f"Rate limit of {model} reached, waiting {wait_seconds:.1f} seconds")
+            await asyncio.sleep(wait_seconds)
+        return wait_seconds
+
+    def record_usage(self, model: str, estimated_tokens: int, actual_tokens: int):
+        """
+        Corrects the tokens bucket of 'model' once the total token usage of a request is known.
+        """
+        tokens_bucket = self._get_buckets(model)[1]
+        if tokens_bucket and actual_tokens > 0:
+            tokens_bucket.adjust(estimated_tokens - actual_tokens)
+
+    def _record_queue_time(self, model: str, wait_seconds: float):
+        with self._lock:
+            stats = self._stats.setdefault(model, {"requests": 0, "queued_requests": 0,
+                                                   "total_queue_seconds": 0.0, "max_queue_seconds": 0.0})
+            stats["requests"] += 1
+            if wait_seconds > 0:
+                stats["queued_requests"] += 1
+                stats["total_queue_seconds"] += wait_seconds
+                stats["max_queue_seconds"] = max(stats["max_queue_seconds"], wait_seconds)
+
+    def get_stats(self) -> dict:
+        """
+        Queue-time metrics per model: number of requests, how many were queued, and the total/max queue time.
+        """
+        with self._lock:
+            return {model: dict(stats) for model, stats in self._stats.items()}
+
+
+_rate_limiter = ModelRateLimiter()
+
+
+def get_rate_limiter() -> ModelRateLimiter:
+    return _rate_limiter
@@ -0,0 +1,195 @@
+"""
+Opt-in cache of LLM responses, keyed by the exact completion request (model, messages, temperature, seed,
+reasoning settings, ...). Re-running a tool on an unchanged PR, or retrying the same prompt, is then answered
+without an LLM round trip.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from threading import Lock
+from typing import Optional, Tuple
+
+from pr_agent.config_loader import get_settings
+from pr_agent.log import get_logger
+
+# completion arguments that do not change the response, and are left out of the cache key
+RESPONSE_CACHE_IGNORED_KWARGS = ("timeout", "metadata", "stream")
+
+
+class ResponseCache(ABC):
+    """
+    A store of (response, finish reason, total tokens) entries, keyed by request hash.
+    """
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[Tuple[str, str, int]]:
+        pass
+
+    @abstractmethod
+    def set(self, key: str, response: str, finish_reason: str, tokens: int):
+        pass
+
+
+class SqliteResponseCache(ResponseCache):
+    """
+    SQLite-backed cache, shareable between processes. Entries older than 'ttl_seconds' are ignored, and when the
+    stored responses grow beyond 'max_size_bytes', the least recently used ones are evicted.
+    """
+
+    def __init__(self, db_path: str, ttl_seconds: int, max_size_bytes: int):
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.max_size_bytes = max_size_bytes
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, response TEXT, "
+                         "finish_reason TEXT, tokens INTEGER, size INTEGER, created_at REAL, last_used REAL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        try:
+            with conn:  # commits on success, rolls back on error
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, key: str) -> Optional[Tuple[str, str, int]]:
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute("SELECT response, finish_reason, tokens FROM responses "
+                               "WHERE key = ? AND created_at >= ?", (key, now - self.ttl_seconds)).fetchone()
+            if row is not None:
+                conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+        return row
+
+    def set(self, key: str, response: str, finish_reason: str, tokens: int):
+        size = len(response.encode("utf-8"))
+        if size > self.max_size_bytes:
+            return
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                         (key, response, finish_reason, tokens, size, now, now))
+            conn.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,))
+            total_size = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total_size > self.max_size_bytes:
+                evicted_keys = []
+                for evicted_key, evicted_size in conn.execute("SELECT key, size FROM responses ORDER BY last_used"):
+                    evicted_keys.append((evicted_key,))
+                    total_size -= evicted_size
+                    if total_size <= self.max_size_bytes:
+                        break
+                conn.executemany("DELETE FROM responses WHERE key = ?", evicted_keys)
+
+
+def _create_sqlite_cache() -> ResponseCache:
+    db_path = get_settings().get("response_cache.sqlite_path", "") or os.path.join(tempfile.gettempdir(),
+                                                                                   "pr_agent_response_cache.db")
+    return SqliteResponseCache(db_path,
+                               ttl_seconds=get_settings().get("response_cache.ttl_seconds", 86400),
+                               max_size_bytes=int(get_settings().get("response_cache.max_size_mb", 256) * 1024 * 1024))
+
+
+_RESPONSE_CACHE_BACKENDS = {
+    'sqlite': _create_sqlite_cache,
+}
+
+_response_cache_instances = {}
+_response_cache_lock = Lock()
+_response_cache_stats = {"hits": 0, "misses": 0, "tokens_saved": 0}
+
+
+def register_response_cache_backend(name: str, factory):
+    """
+    Register a custom backend, selectable with 'response_cache.backend=<name>'.
+    'factory' is a no-argument callable returning a ResponseCache.
+    """
+    _RESPONSE_CACHE_BACKENDS[name] = factory
+
+
+def get_response_cache() -> Optional[ResponseCache]:
+    """
+    Returns the process-wide LLM response cache, or None if caching is disabled.
+    """
+    if not get_settings().get("response_cache.enable", False):
+        return None
+    backend = get_settings().get("response_cache.backend", "sqlite")
+    if backend not in _RESPONSE_CACHE_BACKENDS:
+        get_logger().warning(f"Unknown response cache backend: {backend}, response cache is disabled")
+        return None
+    if backend not in _response_cache_instances:
+        with _response_cache_lock:
+            if backend not in _response_cache_instances:
+                _response_cache_instances[backend] = _RESPONSE_CACHE_BACKENDS[backend]()
+    return _response_cache_instances[backend]
+
+
+def get_response_cache_key(completion_kwargs: dict) -> Optional[str]:
+    """
+    Build the cache key of a completion request from its final arguments, or return None if the response should
+    not be cached (caching is disabled, or the request has a non-zero temperature and
+    'response_cache.skip_nonzero_temperature' is set).
+    """
+    if get_response_cache() is None:
+        return None
+    if get_settings().get("response_cache.skip_nonzero_temperature", False) and \
+            completion_kwargs.get("temperature", 0) > 0:
+        return None
+    key_data = {key: value for key, value in completion_kwargs.items() if key not in RESPONSE_CACHE_IGNORED_KWARGS}
+    key_str = json.dumps(key_data, sort_keys=True, default=str)
+    return hashlib.sha256(key_str.encode("utf-8")).hexdigest()
+
+
+def get_response_cache_stats() -> dict:
+    """
+    Hits, misses, hit rate and tokens saved by the response cache in this process.
+    """
+    stats = dict(_response_cache_stats)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+    return stats
+
+
+def load_cached_response(key: Optional[str]) -> Optional[Tuple[str, str]]:
+    """
+    Returns the cached (response, finish reason) for 'key', or None.
+    """
+    if not key:
+        return None
+    cache = get_response_cache()
+    if cache is None:
+        return None
+    try:
+        entry = cache.get(key)
+    except Exception as e:
+        get_logger().warning(f"Failed to load LLM response from cache: {e}")
+        return None
+    with _response_cache_lock:
+        if entry is None:
+            _response_cache_stats["misses"] += 1
+            return None
+        _response_cache_stats["hits"] += 1
+        _response_cache_stats["tokens_saved"] += entry[2] or 0
+    get_logger().info("LLM response cache hit", artifact=get_response_cache_stats())
+    return entry[0], entry[1]
+
+
+def store_cached_response(key: Optional[str], response: str, finish_reason: str, tokens: int = 0):
+    if not key or not response:
+        return
+    cache = get_response_cache()
+    if cache is None:
+        return
+    try:
+        cache.set(key, response, finish_reason, tokens)
+    except Exception as e:
+        get_logger().warning(f"Failed to store LLM response in cache: {e}")
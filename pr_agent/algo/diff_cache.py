@@ -0,0 +1,275 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from threading import Lock
+from typing import Optional
+
+from pr_agent.config_loader import get_settings
+from pr_agent.log import get_logger
+
+# settings that change the rendered patches or their token counts. Any change to them must produce a different key.
+DIFF_CACHE_RELEVANT_SETTINGS = [
+    "config.model",
+    "config.patch_extension_skip_types",
+    "config.allow_dynamic_context",
+    "config.max_extra_lines_before_dynamic_context",
+    "config.patch_extra_lines_before",
+    "config.patch_extra_lines_after",
+    "config.use_extra_bad_extensions",
+    "config.diff_engine",
+    "config.git_diff_algorithm",
+    "config.large_diff_max_lines",
+    "config.ignore_language_framework",
+    "ignore.glob",
+    "ignore.regex",
+    "bad_extensions",
+    "gitlab.expand_submodule_diffs",
+]
+
+
+class DiffArtifactCache(ABC):
+    """
+    A key-value store for rendered diff artifacts (patches, per-file token counts, file dicts).
+    Values are JSON-serializable dicts.
+    """
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[dict]:
+        pass
+
+    @abstractmethod
+    def set(self, key: str, value: dict):
+        pass
+
+
+class InMemoryDiffArtifactCache(DiffArtifactCache):
+    """
+    In-process LRU cache, bounded by the total size (in bytes) of the serialized artifacts. The artifacts are stored
+    serialized, so that a caller modifying the value it got does not modify the cached one.
+    """
+
+    def __init__(self, max_size_bytes: int):
+        self.max_size_bytes = max_size_bytes
+        self._entries = OrderedDict()  # key -> (serialized value, size)
+        self._size_bytes = 0
+        self._lock = Lock()
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+        return json.loads(entry[0])
+
+    def set(self, key: str, value: dict):
+        data = json.dumps(value)
+        size = len(data)
+        if size > self.max_size_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._size_bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (data, size)
+            self._size_bytes += size
+            while self._size_bytes > self.max_size_bytes and self._entries:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._size_bytes -= evicted_size
+
+
+class DiskDiffArtifactCache(DiffArtifactCache):
+    """
+    On-disk cache, one JSON file per key. When the directory grows beyond 'max_size_bytes',
+    the least recently used files are evicted.
+    """
+
+    def __init__(self, cache_dir: str, max_size_bytes: int):
+        self.cache_dir = cache_dir
+        self.max_size_bytes = max_size_bytes
+        self._lock = Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key: str) -> Optional[dict]:
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                value = json.load(f)
+            os.utime(path)  # mark as recently used
+            return value
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            get_logger().warning(f"Failed to read diff cache entry {key}: {e}")
+            return None
+
+    def set(self, key: str, value: dict):
+        data = json.dumps(value)
+        if len(data) > self.max_size_bytes:
+            return
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(data)
+            os.replace(tmp_path, self._path(key))  # atomic, so concurrent readers never see a partial file
+        except Exception as e:
+            get_logger().warning(f"Failed to write diff cache entry {key}: {e}")
+            return
+        self._evict()
+
+    def _evict(self):
+        with self._lock:
+            entries = []
+            total_size = 0
+            for entry in os.scandir(self.cache_dir):
+                if not entry.name.endswith(".json"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total_size += stat.st_size
+            if total_size <= self.max_size_bytes:
+                return
+            for _, size, path in sorted(entries):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total_size -= size
+                if total_size <= self.max_size_bytes:
+                    break
+
+
+class TieredDiffArtifactCache(DiffArtifactCache):
+    """
+    Looks up the in-memory cache first, then the disk cache (promoting disk hits to memory).
+    """
+
+    def __init__(self, memory_cache: InMemoryDiffArtifactCache, disk_cache: DiskDiffArtifactCache):
+        self.memory_cache = memory_cache
+        self.disk_cache = disk_cache
+
+    def get(self, key: str) -> Optional[dict]:
+        value = self.memory_cache.get(key)
+        if value is None:
+            value = self.disk_cache.get(key)
+            if value is not None:
+                self.memory_cache.set(key, value)
+        return value
+
+    def set(self, key: str, value: dict):
+        self.memory_cache.set(key, value)
+        self.disk_cache.set(key, value)
+
+
+def _create_memory_cache() -> DiffArtifactCache:
+    return InMemoryDiffArtifactCache(int(get_settings().get("diff_cache.max_memory_mb", 64) * 1024 * 1024))
+
+
+def _create_disk_cache() -> DiffArtifactCache:
+    cache_dir = get_settings().get("diff_cache.disk_dir", "") or os.path.join(tempfile.gettempdir(),
+                                                                             "pr_agent_diff_cache")
+    return DiskDiffArtifactCache(cache_dir, int(get_settings().get("diff_cache.max_disk_mb", 512) * 1024 * 1024))
+
+
+def _create_tiered_cache() -> DiffArtifactCache:
+    return TieredDiffArtifactCache(_create_memory_cache(), _create_disk_cache())
+
+
+_DIFF_CACHE_BACKENDS = {
+    'memory': _create_memory_cache,
+    'disk': _create_disk_cache,
+    'memory_and_disk': _create_tiered_cache,
+}
+
+_diff_cache_instances = {}
+_diff_cache_lock = Lock()
+
+
+def register_diff_cache_backend(name: str, factory):
+    """
+    Register a custom backend, selectable with 'diff_cache.backend=<name>'.
+    'factory' is a no-argument callable returning a DiffArtifactCache.
+    """
+    _DIFF_CACHE_BACKENDS[name] = factory
+
+
+def get_diff_cache() -> Optional[DiffArtifactCache]:
+    """
+    Returns the process-wide diff artifact cache, or None if caching is disabled.
+    """
+    if not get_settings().get("diff_cache.enable", False):
+        return None
+    backend = get_settings().get("diff_cache.backend", "memory")
+    if backend not in _DIFF_CACHE_BACKENDS:
+        get_logger().warning(f"Unknown diff cache backend: {backend}, diff cache is disabled")
+        return None
+    if backend not in _diff_cache_instances:
+        with _diff_cache_lock:
+            if backend not in _diff_cache_instances:
+                _diff_cache_instances[backend] = _DIFF_CACHE_BACKENDS[backend]()
+    return _diff_cache_instances[backend]
+
+
+def get_diff_cache_key(git_provider, stage: str, **params) -> Optional[str]:
+    """
+    Build a content-addressed key for a diff artifact: (repo, base sha, head sha, relevant config hash, stage params).
+    Returns None if the artifact should not be cached (the provider cannot identify the exact diff revision,
+    or the rendered patches depend on per-run data such as AI-generated file summaries).
+    """
+    try:
+        diff_revision = git_provider.get_diff_revision()
+    except Exception:
+        return None
+    if not diff_revision:
+        return None
+    if get_settings().get("config.enable_ai_metadata", False):
+        return None
+
+    key_data = {
+        "revision": list(diff_revision),
+        "stage": stage,
+        "params": params,
+        "settings": {key: get_settings().get(key, None) for key in DIFF_CACHE_RELEVANT_SETTINGS},
+    }
+    key_str = json.dumps(key_data, sort_keys=True, default=str)
+    return hashlib.sha256(key_str.encode("utf-8")).hexdigest()
+
+
+def load_diff_artifact(key: Optional[str]) -> Optional[dict]:
+    if not key:
+        return None
+    cache = get_diff_cache()
+    if cache is None:
+        return None
+    try:
+        start_time = time.monotonic()
+        value = cache.get(key)
+        if value is not None:
+            get_logger().debug(f"Diff artifact cache hit ({(time.monotonic() - start_time) * 1000:.1f} ms)")
+        return value
+    except Exception as e:
+        get_logger().warning(f"Failed to load diff artifact from cache: {e}")
+        return None
+
+
+def store_diff_artifact(key: Optional[str], value: dict):
+    if not key:
+        return
+    cache = get_diff_cache()
+    if cache is None:
+        return
+    try:
+        cache.set(key, value)
+    except Exception as e:
+        get_logger().warning(f"Failed to store diff artifact in cache: {e}")
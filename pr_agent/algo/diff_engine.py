@@ -0,0 +1,113 @@
+"""
+Engines that generate a unified diff from two versions of a file, used when a git provider omits the patch
+(see 'load_large_diff'). Those are typically the largest files, so the engine is selectable with 'config.diff_engine',
+and files over 'config.large_diff_max_lines' lines (if set), or whose diff takes longer than
+'config.large_diff_timeout_seconds', get a header-only patch.
+"""
+from __future__ import annotations
+
+import difflib
+import os
+import subprocess
+import tempfile
+from typing import Callable, Optional
+
+from pr_agent.config_loader import get_settings
+from pr_agent.log import get_logger
+
+# the file header of the patches generated by 'difflib.unified_diff' (no file names), kept for all engines
+DIFF_FILE_HEADER = "--- \n+++ \n"
+
+
+class DiffTimeoutError(Exception):
+    pass
+
+
+def _difflib_diff(original_file_content_str: str, new_file_content_str: str, timeout: Optional[float]) -> str:
+    # difflib cannot be interrupted, so large inputs are bounded only by 'config.large_diff_max_lines'
+    diff = difflib.unified_diff(original_file_content_str.splitlines(keepends=True),
+                                new_file_content_str.splitlines(keepends=True))
+    return ''.join(diff)
+
+
+def _git_diff(original_file_content_str: str, new_file_content_str: str, timeout: Optional[float]) -> str:
+    """
+    Runs 'git diff --no-index' on temporary files, with the algorithm set by 'config.git_diff_algorithm'
+    ("myers", "minimal", "patience" or "histogram").
+    """
+    algorithm = get_settings().get("config.git_diff_algorithm", "histogram")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        original_path = os.path.join(tmp_dir, "original")
+        new_path = os.path.join(tmp_dir, "new")
+        with open(original_path, "w", encoding="utf-8", newline="") as f:
+            f.write(original_file_content_str)
+        with open(new_path, "w", encoding="utf-8", newline="") as f:
+            f.write(new_file_content_str)
+        try:
+            res = subprocess.run(["git", "diff", "--no-index", "--no-color", "--no-ext-diff", "--text",
+                                  f"--diff-algorithm={algorithm}", original_path, new_path],
+                                 stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=timeout)
+        except subprocess.TimeoutExpired as e:
+            raise DiffTimeoutError(f"git diff took more than {timeout} seconds") from e
+    if res.returncode not in (0, 1):  # 1 means the files differ
+        raise RuntimeError(f"git diff failed: {res.stderr.decode(errors='ignore')}")
+
+    # replace git's file header ('diff --git', 'index', '---', '+++' lines) with the one of difflib
+    patch = res.stdout.decode("utf-8", errors="replace")
+    first_hunk = patch.find("\n@@ ")
+    if first_hunk == -1:
+        return ""
+    return DIFF_FILE_HEADER + patch[first_hunk + 1:]
+
+
+_DIFF_ENGINES = {
+    'difflib': _difflib_diff,
+    'git': _git_diff,
+}
+
+
+def register_diff_engine(name: str, engine: Callable[[str, str, Optional[float]], str]):
+    """
+    Register a custom engine, selectable with 'config.diff_engine=<name>'.
+    'engine' gets the original content, the new content and a time budget in seconds (None for no limit),
+    returns a unified diff, and raises DiffTimeoutError if the time budget is exceeded.
+    """
+    _DIFF_ENGINES[name] = engine
+
+
+def header_only_diff(original_file_content_str: str, new_file_content_str: str) -> str:
+    """
+    A patch with a single hunk header spanning both files and no lines: the file is reported as changed,
+    without the cost (in time and tokens) of its diff.
+    """
+    original_num_lines = original_file_content_str.count("\n")
+    new_num_lines = new_file_content_str.count("\n")
+    return f"{DIFF_FILE_HEADER}@@ -1,{original_num_lines} +1,{new_num_lines} @@\n"
+
+
+def generate_unified_diff(filename: str, original_file_content_str: str, new_file_content_str: str) -> str:
+    """
+    Generate a unified diff between the two contents with the engine set by 'config.diff_engine', degrading to a
+    header-only patch for files that are too large or whose diff exceeds the time budget.
+    """
+    max_lines = get_settings().get("config.large_diff_max_lines", 0)
+    if max_lines > 0 and max(original_file_content_str.count("\n"), new_file_content_str.count("\n")) > max_lines:
+        get_logger().info(f"File {filename} has more than {max_lines} lines, generating a header-only patch")
+        return header_only_diff(original_file_content_str, new_file_content_str)
+
+    engine_name = get_settings().get("config.diff_engine", "difflib")
+    engine = _DIFF_ENGINES.get(engine_name)
+    if engine is None:
+        get_logger().warning(f"Unknown diff engine: {engine_name}, using difflib")
+        engine = _difflib_diff
+    timeout = get_settings().get("config.large_diff_timeout_seconds", 0) or None
+    try:
+        return engine(original_file_content_str, new_file_content_str, timeout)
+    except DiffTimeoutError as e:
+        get_logger().info(f"Diff of file {filename} timed out, generating a header-only patch: {e}")
+        return header_only_diff(original_file_content_str, new_file_content_str)
+    except Exception as e:
+        if engine is _difflib_diff:
+            raise
+        get_logger().warning(f"Diff engine '{engine_name}' failed for file {filename}, using difflib: {e}")
+        return _difflib_diff(original_file_content_str, new_file_content_str, timeout)
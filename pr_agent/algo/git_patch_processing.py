@@ -1,8 +1,8 @@
 from __future__ import annotations
 
-import re
 import traceback
 
+from pr_agent.algo.parsed_patch import RE_HUNK_HEADER, ParsedPatch, extract_hunk_headers, parse_patch  # noqa: F401
 from pr_agent.algo.types import EDIT_TYPE, FilePatchInfo
 from pr_agent.config_loader import get_settings
 from pr_agent.log import get_logger
@@ -60,25 +60,25 @@ def process_patch_lines(patch_str, original_file_str, patch_extra_lines_before,
     file_original_lines = original_file_str.splitlines()
     file_new_lines = new_file_str.splitlines() if new_file_str else []
     len_original_lines = len(file_original_lines)
-    patch_lines = patch_str.splitlines()
+    parsed_patch = parse_patch(patch_str)
+    patch_lines = parsed_patch.lines
     extended_patch_lines = []
 
     is_valid_hunk = True
     start1, size1, start2, size2 = -1, -1, -1, -1
-    RE_HUNK_HEADER = re.compile(
-        r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@[ ]?(.*)")
     try:
         for i,line in enumerate(patch_lines):
             if line.startswith('@@'):
-                match = RE_HUNK_HEADER.match(line)
+                hunk = parsed_patch.hunk_at(i)
                 # identify hunk header
-                if match:
+                if hunk:
                     # finish processing previous hunk
                     if is_valid_hunk and (start1 != -1 and patch_extra_lines_after > 0):
                         delta_lines_original = [f' {line}' for line in file_original_lines[start1 + size1 - 1:start1 + size1 - 1 + patch_extra_lines_after]]
                         extended_patch_lines.extend(delta_lines_original)
 
-                    section_header, size1, size2, start1, start2 = extract_hunk_headers(match)
+                    section_header, size1, size2, start1, start2 = \
+                        hunk.section_header, hunk.size1, hunk.size2, hunk.start1, hunk.start2
 
                     is_valid_hunk = check_if_hunk_lines_matches_to_file(i, file_original_lines, patch_lines, start1)
 
@@ -211,40 +211,24 @@ def check_if_hunk_lines_matches_to_file(i, original_lines, patch_lines, start1):
     return is_valid_hunk
 
 
-def extract_hunk_headers(match):
-    res = list(match.groups())
-    for i in range(len(res)):
-        if res[i] is None:
-            res[i] = 0
-    try:
-        start1, size1, start2, size2 = map(int, res[:4])
-    except:  # '@@ -0,0 +1 @@' case
-        start1, size1, size2 = map(int, res[:3])
-        start2 = 0
-    section_header = res[4]
-    return section_header, size1, size2, start1, start2
-
-
 def omit_deletion_hunks(patch_lines) -> str:
     """
     Omit deletion hunks from the patch and return the modified patch.
     Args:
-    - patch_lines: a list of strings representing the lines of the patch
+    - patch_lines: a list of strings representing the lines of the patch, or a ParsedPatch
     Returns:
     - A string representing the modified patch with deletion hunks omitted
     """
+    parsed_patch = patch_lines if isinstance(patch_lines, ParsedPatch) else ParsedPatch.from_lines(patch_lines)
 
     temp_hunk = []
     added_patched = []
     add_hunk = False
     inside_hunk = False
-    RE_HUNK_HEADER = re.compile(
-        r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))?\ @@[ ]?(.*)")
 
-    for line in patch_lines:
+    for i, line in enumerate(parsed_patch.lines):
         if line.startswith('@@'):
-            match = RE_HUNK_HEADER.match(line)
-            if match:
+            if parsed_patch.hunk_at(i):
                 # finish previous hunk
                 if inside_hunk and add_hunk:
                     added_patched.extend(temp_hunk)
@@ -288,8 +272,7 @@ def handle_patch_deletions(patch: str, original_file_content_str: str,
             get_logger().info(f"Processing file: {file_name}, minimizing deletion file")
         patch = None # file was deleted
     else:
-        patch_lines = patch.splitlines()
-        patch_new = omit_deletion_hunks(patch_lines)
+        patch_new = omit_deletion_hunks(parse_patch(patch))
         if patch != patch_new:
             if get_settings().config.verbosity_level > 0:
                 get_logger().info(f"Processing file: {file_name}, hunks were deleted")
@@ -297,6 +280,12 @@ def handle_patch_deletions(patch: str, original_file_content_str: str,
     return patch
 
 
+def _get_parsed_patch(patch: str, file=None) -> ParsedPatch:
+    if isinstance(file, FilePatchInfo) and file.patch is patch:
+        return file.parsed_patch
+    return parse_patch(patch)
+
+
 def decouple_and_convert_to_hunks_with_lines_numbers(patch: str, file) -> str:
     """
     Convert a given patch string into a string with line numbers for each hunk, indicating the new and old content of
@@ -331,22 +320,21 @@ __old hunk__
     """
 
     # Add a header for the file
+    # the output is accumulated as a list of parts (joined once at the end), so rendering is linear in the patch size
+    output_parts = []
     if file:
         # if the file was deleted, return a message indicating that the file was deleted
         if hasattr(file, 'edit_type') and file.edit_type == EDIT_TYPE.DELETED:
             return f"\n\n## File '{file.filename.strip()}' was deleted\n"
 
-        patch_with_lines_str = f"\n\n## File: '{file.filename.strip()}'\n"
-    else:
-        patch_with_lines_str = ""
+        output_parts.append(f"\n\n## File: '{file.filename.strip()}'\n")
 
-    patch_lines = patch.splitlines()
-    RE_HUNK_HEADER = re.compile(
-        r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@[ ]?(.*)")
+    parsed_patch = _get_parsed_patch(patch, file)
+    patch_lines = parsed_patch.lines
     new_content_lines = []
     old_content_lines = []
-    match = None
-    start1, size1, start2, size2 = -1, -1, -1, -1
+    hunk = None
+    start2 = -1
     prev_header_line = []
     header_line = []
     for line_i, line in enumerate(patch_lines):
@@ -355,29 +343,15 @@ __old hunk__
 
         if line.startswith('@@'):
             header_line = line
-            match = RE_HUNK_HEADER.match(line)
-            if match and (new_content_lines or old_content_lines):  # found a new hunk, split the previous lines
-                if prev_header_line:
-                    patch_with_lines_str += f'\n{prev_header_line}\n'
-                is_plus_lines = is_minus_lines = False
-                if new_content_lines:
-                    is_plus_lines = any([line.startswith('+') for line in new_content_lines])
-                if old_content_lines:
-                    is_minus_lines = any([line.startswith('-') for line in old_content_lines])
-                if is_plus_lines or is_minus_lines: # notice 'True' here - we always present __new hunk__ for section, otherwise LLM gets confused
-                    patch_with_lines_str = patch_with_lines_str.rstrip() + '\n__new hunk__\n'
-                    for i, line_new in enumerate(new_content_lines):
-                        patch_with_lines_str += f"{start2 + i} {line_new}\n"
-                if is_minus_lines:
-                    patch_with_lines_str = patch_with_lines_str.rstrip() + '\n__old hunk__\n'
-                    for line_old in old_content_lines:
-                        patch_with_lines_str += f"{line_old}\n"
+            hunk = parsed_patch.hunk_at(line_i)
+            if not hunk:
+                raise ValueError(f"Invalid hunk header: {line}")
+            if new_content_lines or old_content_lines:  # found a new hunk, split the previous lines
+                _render_decoupled_hunk(output_parts, prev_header_line, new_content_lines, old_content_lines, start2)
                 new_content_lines = []
                 old_content_lines = []
-            if match:
-                prev_header_line = header_line
-
-            section_header, size1, size2, start1, start2 = extract_hunk_headers(match)
+            prev_header_line = header_line
+            start2 = hunk.start2
 
         elif line.startswith('+'):
             new_content_lines.append(line)
@@ -393,37 +367,59 @@ __old hunk__
             old_content_lines.append(line)
 
     # finishing last hunk
-    if match and new_content_lines:
-        patch_with_lines_str += f'\n{header_line}\n'
-        is_plus_lines = is_minus_lines = False
-        if new_content_lines:
-            is_plus_lines = any([line.startswith('+') for line in new_content_lines])
-        if old_content_lines:
-            is_minus_lines = any([line.startswith('-') for line in old_content_lines])
-        if is_plus_lines or is_minus_lines:  # notice 'True' here - we always present __new hunk__ for section, otherwise LLM gets confused
-            patch_with_lines_str = patch_with_lines_str.rstrip() + '\n__new hunk__\n'
-            for i, line_new in enumerate(new_content_lines):
-                patch_with_lines_str += f"{start2 + i} {line_new}\n"
-        if is_minus_lines:
-            patch_with_lines_str = patch_with_lines_str.rstrip() + '\n__old hunk__\n'
-            for line_old in old_content_lines:
-                patch_with_lines_str += f"{line_old}\n"
-
-    return patch_with_lines_str.rstrip()
+    if hunk and new_content_lines:
+        _render_decoupled_hunk(output_parts, header_line, new_content_lines, old_content_lines, start2)
+
+    _rstrip_parts(output_parts)
+    return ''.join(output_parts)
+
+
+def _rstrip_parts(parts: list) -> None:
+    """
+    In-place equivalent of ''.join(parts).rstrip(), that only touches the trailing parts.
+    """
+    while parts:
+        stripped = parts[-1].rstrip()
+        if stripped:
+            parts[-1] = stripped
+            return
+        parts.pop()
+
+
+def _render_decoupled_hunk(output_parts: list, header_line, new_content_lines: list, old_content_lines: list,
+                           start2: int) -> None:
+    """
+    Append a hunk in the '__new hunk__'/'__old hunk__' format of 'decouple_and_convert_to_hunks_with_lines_numbers'.
+    """
+    if header_line:
+        output_parts.append(f'\n{header_line}\n')
+    is_plus_lines = is_minus_lines = False
+    if new_content_lines:
+        is_plus_lines = any(line.startswith('+') for line in new_content_lines)
+    if old_content_lines:
+        is_minus_lines = any(line.startswith('-') for line in old_content_lines)
+    # notice 'True' here - we always present __new hunk__ for section, otherwise LLM gets confused
+    if is_plus_lines or is_minus_lines:
+        _rstrip_parts(output_parts)
+        output_parts.append('\n__new hunk__\n')
+        for i, line_new in enumerate(new_content_lines):
+            output_parts.append(f"{start2 + i} {line_new}\n")
+    if is_minus_lines:
+        _rstrip_parts(output_parts)
+        output_parts.append('\n__old hunk__\n')
+        for line_old in old_content_lines:
+            output_parts.append(f"{line_old}\n")
 
 
 def extract_hunk_lines_from_patch(patch: str, file_name, line_start, line_end, side, remove_trailing_chars: bool = True) -> tuple[str, str]:
     try:
         patch_with_lines_str = f"\n\n## File: '{file_name.strip()}'\n\n"
         selected_lines = ""
-        patch_lines = patch.splitlines()
-        RE_HUNK_HEADER = re.compile(
-            r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@[ ]?(.*)")
-        match = None
+        parsed_patch = parse_patch(patch)
         start1, size1, start2, size2 = -1, -1, -1, -1
         skip_hunk = False
         selected_lines_num = 0
-        for line in patch_lines:
+        for line_i, line in enumerate(parsed_patch.lines):
             if 'no newline at end of file' in line.lower():
                 continue
 
@@ -432,9 +428,10 @@ def extract_hunk_lines_from_patch(patch: str, file_name, line_start, line_end, s
                 selected_lines_num = 0
                 header_line = line
 
-                match = RE_HUNK_HEADER.match(line)
-
-                section_header, size1, size2, start1, start2 = extract_hunk_headers(match)
+                hunk = parsed_patch.hunk_at(line_i)
+                if not hunk:
+                    raise ValueError(f"Invalid hunk header: {line}")
+                start1, size1, start2, size2 = hunk.start1, hunk.size1, hunk.start2, hunk.size2
 
                 # check if line range is in this hunk
                 if side.lower() == 'left':
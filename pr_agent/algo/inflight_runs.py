@@ -0,0 +1,317 @@
+"""
+Supersede-and-cancel of in-flight runs, enabled with 'inflight_runs.enable'.
+
+The servers run the processing of a pushed commit (e.g. the 'push_commands') with 'run_latest', which records the
+commit as the latest head of the PR. A newer head supersedes the runs of older ones: they stop before they publish
+stale results, at their next checkpoint: before a git mirror fetch ('raise_if_superseded'), and before and after each
+chat completion ('check_superseded'). Runs are never interrupted elsewhere, e.g. while publishing a comment.
+The runs of this process are marked as superseded right away. Those of other processes, which share the latest heads
+through the 'inflight_runs.backend' store, are found superseded by the store read of their next chat completion check.
+Heads are ordered by the push (or head commit) time reported in the webhook, not by arrival: a late event of an older
+push, or a retry of its job (see job_queue.py), does not supersede the runs of a newer head, and is itself skipped.
+Each cancellation is logged with an estimate of the tokens spent on the superseded run.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import sqlite3
+import tempfile
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import datetime
+from threading import Lock
+from typing import Coroutine, Optional, Union
+
+from starlette_context import context
+
+from pr_agent.config_loader import get_settings
+from pr_agent.log import get_logger
+
+
+class RunSuperseded(asyncio.CancelledError):
+    """
+    Raised at a checkpoint of a run whose commit is no longer the head of its PR. A CancelledError, so that the broad
+    'except Exception' handlers of the tools do not turn it into a published error.
+    """
+
+
+@dataclass
+class InflightRun:
+    key: str  # the PR url
+    head_sha: str
+    pushed_at: float  # the push time of 'head_sha', as a POSIX timestamp
+    started_at: float = field(default_factory=time.monotonic)
+    superseded_by: Optional[str] = None
+    tokens: int = 0  # total tokens of the completed chat completions
+    pending_tokens: int = 0  # estimated prompt tokens of the chat completion in progress, if any
+
+
+class HeadStore(ABC):
+    """
+    The latest known head commit of each PR, shared by the processes of a server.
+    """
+
+    @abstractmethod
+    def get_head(self, key: str) -> Optional[str]:
+        pass
+
+    @abstractmethod
+    def set_head(self, key: str, head_sha: str, pushed_at: float) -> bool:
+        """
+        Records 'head_sha' as the head of PR 'key', unless the current head was pushed after 'pushed_at'.
+        Returns False in that case.
+        """
+        pass
+
+
+class InProcessHeadStore(HeadStore):
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self._heads = {}  # key -> (head sha, push time, update time)
+        self._lock = Lock()
+
+    def get_head(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._heads.get(key)
+            if entry is None or time.monotonic() - entry[2] > self.ttl_seconds:
+                return None
+            return entry[0]
+
+    def set_head(self, key: str, head_sha: str, pushed_at: float) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            self._heads = {k: v for k, v in self._heads.items() if now - v[2] <= self.ttl_seconds}
+            if key in self._heads and self._heads[key][1] > pushed_at:
+                return False
+            self._heads[key] = (head_sha, pushed_at, now)
+            return True
+
+
+class SqliteHeadStore(HeadStore):
+    """
+    Shared by the processes using the same SQLite file.
+    """
+
+    def __init__(self, db_path: str, ttl_seconds: float):
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS pr_heads (key TEXT PRIMARY KEY, head_sha TEXT, pushed_at REAL, "
+                         "updated_at REAL)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        try:
+            with conn:  # commits on success, rolls back on error
+                yield conn
+        finally:
+            conn.close()
+
+    def get_head(self, key: str) -> Optional[str]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT head_sha FROM pr_heads WHERE key = ? AND updated_at >= ?",
+                               (key, time.time() - self.ttl_seconds)).fetchone()
+        return row[0] if row else None
+
+    def set_head(self, key: str, head_sha: str, pushed_at: float) -> bool:
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("DELETE FROM pr_heads WHERE updated_at < ?", (now - self.ttl_seconds,))
+            # a single statement, so that concurrent pushes of several processes are ordered atomically
+            cursor = conn.execute("INSERT INTO pr_heads VALUES (?, ?, ?, ?) ON CONFLICT (key) DO UPDATE SET "
+                                  "head_sha = excluded.head_sha, pushed_at = excluded.pushed_at, "
+                                  "updated_at = excluded.updated_at WHERE excluded.pushed_at >= pr_heads.pushed_at",
+                                  (key, head_sha, pushed_at, now))
+            return cursor.rowcount > 0
+
+
+def _create_in_process_store() -> HeadStore:
+    return InProcessHeadStore(ttl_seconds=get_settings().get("inflight_runs.head_ttl_seconds", 3600))
+
+
+def _create_sqlite_store() -> HeadStore:
+    db_path = get_settings().get("inflight_runs.sqlite_path", "") or os.path.join(tempfile.gettempdir(),
+                                                                                  "pr_agent_inflight_runs.db")
+    return SqliteHeadStore(db_path, ttl_seconds=get_settings().get("inflight_runs.head_ttl_seconds", 3600))
+
+
+_HEAD_STORE_BACKENDS = {
+    'memory': _create_in_process_store,
+    'sqlite': _create_sqlite_store,
+}
+
+_head_store_instances = {}
+_lock = Lock()
+_current_run: ContextVar[Optional[InflightRun]] = ContextVar("inflight_run", default=None)
+_runs = {}  # key -> in-flight runs of this process
+_stats = {"superseded_runs": 0, "wasted_tokens": 0}
+
+
+def register_head_store_backend(name: str, factory):
+    """
+    Register a custom backend, selectable with 'inflight_runs.backend=<name>'.
+    'factory' is a no-argument callable returning a HeadStore.
+    """
+    _HEAD_STORE_BACKENDS[name] = factory
+
+
+def get_head_store() -> HeadStore:
+    backend = get_settings().get("inflight_runs.backend", "sqlite")
+    if backend not in _HEAD_STORE_BACKENDS:
+        get_logger().warning(f"Unknown in-flight runs backend: {backend}, using 'memory'")
+        backend = 'memory'
+    if backend not in _head_store_instances:
+        with _lock:
+            if backend not in _head_store_instances:
+                _head_store_instances[backend] = _HEAD_STORE_BACKENDS[backend]()
+    return _head_store_instances[backend]
+
+
+def get_inflight_run_stats() -> dict:
+    """
+    Number of superseded runs of this process, and the estimated tokens they spent.
+    """
+    return dict(_stats)
+
+
+def is_enabled() -> bool:
+    return get_settings().get("inflight_runs.enable", True)
+
+
+def parse_pushed_at(pushed_at: Union[str, float, None]) -> float:
+    """
+    The push time reported by a webhook (e.g. the 'updated_at' of the PR), as a POSIX timestamp. ISO 8601 and
+    GitLab's '2024-01-01 12:00:00 UTC' formats are supported. Defaults to the current time, i.e. the arrival order.
+    """
+    if isinstance(pushed_at, (int, float)):
+        return float(pushed_at)
+    if pushed_at:
+        try:
+            return datetime.fromisoformat(pushed_at.replace(" UTC", "+00:00").replace("Z", "+00:00")).timestamp()
+        except ValueError:
+            get_logger().debug(f"Failed to parse the push time {pushed_at}")
+    return time.time()
+
+
+def _is_job_retry() -> bool:
+    try:
+        return context.get("job_attempt", 1) > 1
+    except Exception:  # outside of a request context
+        return False
+
+
+async def supersede_older_runs(key: str, head_sha: str, pushed_at: Union[str, float, None] = None) -> bool:
+    """
+    Records 'head_sha', pushed at 'pushed_at' (see parse_pushed_at), as the latest head of PR 'key', and marks the
+    runs of older commits of the PR in this process as superseded. All of them stop at their next checkpoint.
+    Returns False, without superseding anything, if a newer head of the PR is already recorded.
+    A retried job (e.g. of an older push) supersedes nothing: it only checks that its commit is still the latest.
+    """
+    if not is_enabled() or not head_sha:
+        return True
+    if _is_job_retry():
+        return await asyncio.to_thread(_get_head_or_none, key) in (None, head_sha)
+    pushed_at = parse_pushed_at(pushed_at)
+    try:
+        if not await asyncio.to_thread(get_head_store().set_head, key, head_sha, pushed_at):
+            return False
+    except Exception as e:
+        get_logger().warning(f"Failed to record the head of {key}: {e}")
+    for run in list(_runs.get(key, [])):
+        if run.head_sha != head_sha and run.pushed_at <= pushed_at and run.superseded_by is None:
+            run.superseded_by = head_sha
+    return True
+
+
+async def run_latest(key: str, head_sha: str, coro: Coroutine, pushed_at: Union[str, float, None] = None) -> bool:
+    """
+    Runs 'coro', the processing of commit 'head_sha' of PR 'key' pushed at 'pushed_at', after superseding the runs
+    of older commits. Returns False if the run was skipped because a newer commit is already known, or was itself
+    superseded by a newer commit before it completed.
+    """
+    if not is_enabled() or not head_sha:
+        await coro
+        return True
+    pushed_at = parse_pushed_at(pushed_at)
+    if not await supersede_older_runs(key, head_sha, pushed_at):
+        coro.close()
+        get_logger().info(f"Skipped the run of {key} at {head_sha}: a newer commit was pushed")
+        return False
+
+    run = InflightRun(key=key, head_sha=head_sha, pushed_at=pushed_at)
+    token = _current_run.set(run)  # tasks created by the run inherit the context, and with it the current run
+    _runs.setdefault(key, []).append(run)
+    try:
+        await coro
+        return True
+    except RunSuperseded:
+        _log_superseded_run(run)
+        return False
+    finally:
+        _current_run.reset(token)
+        _runs[key].remove(run)
+        if not _runs[key]:
+            del _runs[key]
+
+
+def _log_superseded_run(run: InflightRun):
+    wasted_tokens = run.tokens + run.pending_tokens
+    with _lock:
+        _stats["superseded_runs"] += 1
+        _stats["wasted_tokens"] += wasted_tokens
+    get_logger().info(f"Cancelled the run of {run.key} at {run.head_sha}: superseded by {run.superseded_by}",
+                      artifact={"wasted_tokens_estimate": wasted_tokens,
+                                "run_seconds": round(time.monotonic() - run.started_at, 3),
+                                **get_inflight_run_stats()})
+
+
+def _get_head_or_none(key: str) -> Optional[str]:
+    try:
+        return get_head_store().get_head(key)
+    except Exception as e:
+        get_logger().debug(f"Failed to read the head of {key}: {e}")
+        return None
+
+
+def raise_if_superseded():
+    """
+    Raises RunSuperseded if the current run (if any) is known to be superseded: by a push received by this process, or
+    as last read from the shared store by 'check_superseded'. Does not read the store, so it may be called from
+    synchronous code running on the event loop.
+    """
+    run = _current_run.get()
+    if run is not None and run.superseded_by is not None:
+        raise RunSuperseded(f"{run.key} moved from {run.head_sha} to {run.superseded_by}")
+
+
+async def check_superseded():
+    """
+    Raises RunSuperseded if the current run (if any) is for a commit that is no longer the head of its PR, reading the
+    latest head recorded by the other processes off the event loop.
+    """
+    run = _current_run.get()
+    if run is None:
+        return
+    if run.superseded_by is None:
+        latest_head = await asyncio.to_thread(_get_head_or_none, run.key)
+        if latest_head and latest_head != run.head_sha:
+            run.superseded_by = latest_head
+    raise_if_superseded()
+
+
+def track_completion_tokens(pending_tokens: int = 0, used_tokens: int = 0):
+    """
+    Accounts a chat completion to the current run: its estimated prompt tokens while it is in progress, then the
+    tokens it used.
+    """
+    run = _current_run.get()
+    if run is None:
+        return
+    run.pending_tokens = pending_tokens
+    run.tokens += used_tokens
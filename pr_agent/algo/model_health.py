@@ -0,0 +1,253 @@
+"""
+Process-wide bookkeeping of how the LLM models behave, used to decide when to hedge a slow chat completion with the
+next fallback model, and which (model, deployment) pairs 'retry_with_fallback_models' skips while they are down.
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock
+from typing import Awaitable, Callable, List, Optional, Sequence, Tuple
+
+from pr_agent.config_loader import get_settings
+from pr_agent.log import get_logger
+
+# number of recent successful request latencies kept per model
+LATENCY_WINDOW_SIZE = 200
+
+
+class ModelLatencyTracker:
+    """
+    Keeps a sliding window of successful request latencies per model, and answers percentile queries on it.
+    """
+
+    def __init__(self, window_size: int = LATENCY_WINDOW_SIZE):
+        self.window_size = window_size
+        self._latencies = {}  # model -> deque of latencies in seconds
+        self._lock = Lock()
+
+    def record(self, model: str, latency_seconds: float):
+        with self._lock:
+            if model not in self._latencies:
+                self._latencies[model] = deque(maxlen=self.window_size)
+            self._latencies[model].append(latency_seconds)
+
+    def num_samples(self, model: str) -> int:
+        with self._lock:
+            return len(self._latencies.get(model, ()))
+
+    def percentile(self, model: str, percentile: float) -> Optional[float]:
+        """
+        The 'percentile' (0-100) latency of 'model' in seconds (nearest-rank), or None if there are no samples.
+        """
+        with self._lock:
+            latencies = sorted(self._latencies.get(model, ()))
+        if not latencies:
+            return None
+        rank = max(1, min(len(latencies), round(percentile / 100 * len(latencies))))
+        return latencies[rank - 1]
+
+    def hedge_delay(self, model: str) -> float:
+        """
+        How long to wait for 'model' before launching a hedged request: its 'config.hedge_latency_percentile'
+        latency once there are 'config.hedge_min_samples' samples, 'config.hedge_default_delay_seconds' before that.
+        """
+        default_delay = get_settings().config.get("hedge_default_delay_seconds", 30)
+        if self.num_samples(model) < get_settings().config.get("hedge_min_samples", 20):
+            return default_delay
+        return self.percentile(model, get_settings().config.get("hedge_latency_percentile", 95))
+
+
+_latency_tracker = ModelLatencyTracker()
+
+
+def get_model_latency_tracker() -> ModelLatencyTracker:
+    return _latency_tracker
+
+
+# the fallback models a chat completion of the current task may be hedged with (see 'hedge_with')
+_hedge_models: ContextVar[Tuple[str, ...]] = ContextVar("hedge_models", default=())
+
+
+@contextmanager
+def hedge_with(models: Sequence[str]):
+    """
+    Lets the chat completions made within the block be hedged with 'models', in that order.
+    """
+    token = _hedge_models.set(tuple(models))
+    try:
+        yield
+    finally:
+        _hedge_models.reset(token)
+
+
+def get_hedge_models() -> Tuple[str, ...]:
+    return _hedge_models.get()
+
+
+async def run_hedged(call: Callable[[str], Awaitable], models: List[str]):
+    """
+    Awaits 'call(models[0])', and when it has not answered within its hedge delay (see
+    ModelLatencyTracker.hedge_delay), launches 'call' with the next model in parallel. The first successful result
+    is returned and the other calls are cancelled. Failures do not launch further models: once every launched call
+    failed, the last error is raised, and the caller's sequential fallback takes over.
+    """
+    token = _hedge_models.set(())  # the hedged calls are not hedged again
+    latency_tracker = get_model_latency_tracker()
+    pending = {}  # task -> model
+    next_model_i = 0
+    last_error = None
+
+    def launch_next_model():
+        nonlocal next_model_i
+        model = models[next_model_i]
+        next_model_i += 1
+        pending[asyncio.ensure_future(call(model))] = model
+        return model
+
+    try:
+        last_launched_model = launch_next_model()
+        while pending:
+            hedge_delay = latency_tracker.hedge_delay(last_launched_model) if next_model_i < len(models) else None
+            done, _ = await asyncio.wait(pending.keys(), timeout=hedge_delay, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                get_logger().info(f"No response from {last_launched_model} after {hedge_delay:.1f} seconds, "
+                                  f"hedging with {models[next_model_i]}")
+                last_launched_model = launch_next_model()
+                continue
+            for task in done:
+                model = pending.pop(task)
+                if task.exception() is None:
+                    if model != models[0]:
+                        get_logger().info(f"Using the hedged response of {model}")
+                    return task.result()
+                last_error = task.exception()
+                if pending:
+                    get_logger().warning(f"Hedged request to {model} failed", artifact={"error": last_error})
+        raise last_error
+    finally:
+        _hedge_models.reset(token)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending.keys(), return_exceptions=True)
+
+
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_OPEN = "open"
+CIRCUIT_HALF_OPEN = "half_open"
+
+
+class _Circuit:
+    def __init__(self):
+        self.state = CIRCUIT_CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.probe_started_at = None
+
+
+class ModelCircuitBreaker:
+    """
+    A circuit breaker per (model, deployment_id), enabled with 'config.enable_circuit_breaker'.
+    After 'config.circuit_breaker_failure_threshold' consecutive failures (successful calls slower than
+    'config.circuit_breaker_slow_call_seconds' count as failures), the circuit opens and the pair is skipped.
+    Once 'config.circuit_breaker_open_seconds' have passed, a single probe request is let through (half-open):
+    its success closes the circuit, its failure opens it again.
+    """
+
+    def __init__(self):
+        self._circuits = {}  # (model, deployment_id) -> _Circuit
+        self._lock = Lock()
+
+    @staticmethod
+    def is_enabled() -> bool:
+        return get_settings().config.get("enable_circuit_breaker", False)
+
+    def _get_circuit(self, model: str, deployment_id: Optional[str]) -> _Circuit:
+        key = (model, deployment_id)
+        if key not in self._circuits:
+            self._circuits[key] = _Circuit()
+        return self._circuits[key]
+
+    def get_state(self, model: str, deployment_id: Optional[str] = None) -> str:
+        with self._lock:
+            return self._get_circuit(model, deployment_id).state
+
+    def select_targets(self, targets: List[Tuple[str, Optional[str]]]) -> List[Tuple[str, Optional[str]]]:
+        """
+        Filters and reorders the (model, deployment_id) pairs to try for a request: pairs due for a probe come first
+        (each probe is handed to a single request), then the closed circuits by increasing number of recent failures.
+        Open circuits are skipped. The configured order is kept otherwise.
+        """
+        if not self.is_enabled():
+            return list(targets)
+        open_seconds = get_settings().config.get("circuit_breaker_open_seconds", 60)
+        now = time.monotonic()
+        probes, closed = [], []
+        with self._lock:
+            for target in targets:
+                circuit = self._get_circuit(*target)
+                if circuit.state == CIRCUIT_CLOSED:
+                    closed.append((circuit.consecutive_failures, target))
+                    continue
+                # a probe that never reported back (e.g. a cancelled hedged request) is given up after 'open_seconds'
+                probe_pending = circuit.probe_started_at is not None and now - circuit.probe_started_at < open_seconds
+                if now - circuit.opened_at >= open_seconds and not probe_pending:
+                    circuit.state = CIRCUIT_HALF_OPEN
+                    circuit.probe_started_at = now
+                    probes.append(target)
+        closed.sort(key=lambda failures_and_target: failures_and_target[0])
+        return probes + [target for _, target in closed]
+
+    def record_success(self, model: str, deployment_id: Optional[str], latency_seconds: float):
+        if not self.is_enabled():
+            return
+        slow_call_seconds = get_settings().config.get("circuit_breaker_slow_call_seconds", 0)
+        if slow_call_seconds and latency_seconds > slow_call_seconds:
+            self.record_failure(model, deployment_id)
+            return
+        with self._lock:
+            circuit = self._get_circuit(model, deployment_id)
+            circuit.state = CIRCUIT_CLOSED
+            circuit.consecutive_failures = 0
+            circuit.probe_started_at = None
+
+    def record_failure(self, model: str, deployment_id: Optional[str]):
+        if not self.is_enabled():
+            return
+        threshold = get_settings().config.get("circuit_breaker_failure_threshold", 3)
+        with self._lock:
+            circuit = self._get_circuit(model, deployment_id)
+            circuit.consecutive_failures += 1
+            if circuit.state == CIRCUIT_HALF_OPEN or circuit.consecutive_failures >= threshold:
+                circuit.state = CIRCUIT_OPEN
+                circuit.opened_at = time.monotonic()
+                circuit.probe_started_at = None
+
+
+_circuit_breaker = ModelCircuitBreaker()
+
+
+def get_model_circuit_breaker() -> ModelCircuitBreaker:
+    return _circuit_breaker
+
+
+@contextmanager
+def track_model_call(model: str, deployment_id: Optional[str]):
+    """
+    Records the outcome and latency of the LLM call made within the block, for the hedge delays and the circuit
+    breaker. Only the call itself is tracked, so that errors and delays of the callers (e.g. building the diff or
+    parsing the response) are not attributed to the model.
+    """
+    start_time = time.monotonic()
+    try:
+        yield
+    except Exception:
+        get_model_circuit_breaker().record_failure(model, deployment_id)
+        raise
+    latency = time.monotonic() - start_time
+    get_model_latency_tracker().record(model, latency)
+    get_model_circuit_breaker().record_success(model, deployment_id, latency)
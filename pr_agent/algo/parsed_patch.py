@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import re
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+RE_HUNK_HEADER = re.compile(
+    r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@[ ]?(.*)")
+
+
+def extract_hunk_headers(match):
+    res = list(match.groups())
+    for i in range(len(res)):
+        if res[i] is None:
+            res[i] = 0
+    try:
+        start1, size1, start2, size2 = map(int, res[:4])
+    except ValueError:  # '@@ -0,0 +1 @@' case
+        start1, size1, size2 = map(int, res[:3])
+        start2 = 0
+    section_header = res[4]
+    return section_header, size1, size2, start1, start2
+
+
+class PatchHunk:
+    """
+    A single hunk of a unified diff. 'header_index' is the index of the '@@' line in ParsedPatch.lines,
+    and the hunk body spans lines [header_index + 1, end_index).
+    """
+    __slots__ = ('header_index', 'end_index', 'header', 'section_header', 'start1', 'size1', 'start2', 'size2')
+
+    def __init__(self, header_index: int, header: str, section_header: str,
+                 start1: int, size1: int, start2: int, size2: int):
+        self.header_index = header_index
+        self.end_index = header_index + 1
+        self.header = header
+        self.section_header = section_header
+        self.start1 = start1
+        self.size1 = size1
+        self.start2 = start2
+        self.size2 = size2
+
+    def __repr__(self):
+        return f"PatchHunk({self.header!r}, lines=[{self.header_index}, {self.end_index}))"
+
+
+class ParsedPatch:
+    """
+    A patch split into lines, with every hunk header parsed exactly once.
+    Instances are shared (see 'parse_patch' and 'FilePatchInfo.parsed_patch') and must be treated as read-only.
+    """
+    __slots__ = ('patch', 'lines', 'hunks', '_hunk_by_header_index')
+
+    def __init__(self, patch: Optional[str], lines: List[str]):
+        self.patch = patch
+        self.lines = lines
+        self.hunks: List[PatchHunk] = []
+        self._hunk_by_header_index: Dict[int, PatchHunk] = {}
+        for i, line in enumerate(lines):
+            if line.startswith('@@'):
+                match = RE_HUNK_HEADER.match(line)
+                if match:
+                    section_header, size1, size2, start1, start2 = extract_hunk_headers(match)
+                    if self.hunks:
+                        self.hunks[-1].end_index = i
+                    hunk = PatchHunk(i, line, section_header, start1, size1, start2, size2)
+                    self.hunks.append(hunk)
+                    self._hunk_by_header_index[i] = hunk
+        if self.hunks:
+            self.hunks[-1].end_index = len(lines)
+
+    @classmethod
+    def from_lines(cls, lines: List[str]) -> ParsedPatch:
+        return cls(None, list(lines))
+
+    def hunk_at(self, line_index: int) -> Optional[PatchHunk]:
+        """
+        Returns the hunk whose header is at 'line_index', or None if that line is not a valid hunk header.
+        """
+        return self._hunk_by_header_index.get(line_index)
+
+    def __len__(self):
+        return len(self.lines)
+
+
+@lru_cache(maxsize=256)
+def _parse_patch_cached(patch: str) -> ParsedPatch:
+    return ParsedPatch(patch, patch.splitlines())
+
+
+def parse_patch(patch: str) -> ParsedPatch:
+    """
+    Parse a patch string into a ParsedPatch. Identical patch strings share the same parsed instance,
+    so the renderers and lookups that receive the same patch do not re-split and re-match it.
+    """
+    if not patch:
+        return ParsedPatch(patch, [])
+    return _parse_patch_cached(patch)
@@ -5,14 +5,17 @@ from typing import Callable, List, Tuple
 
 from github import RateLimitExceededException
 
+from pr_agent.algo.diff_cache import (get_diff_cache_key, load_diff_artifact,
+                                      store_diff_artifact)
 from pr_agent.algo.file_filter import filter_ignored
 from pr_agent.algo.git_patch_processing import (
     extend_patch, handle_patch_deletions,
     decouple_and_convert_to_hunks_with_lines_numbers)
 from pr_agent.algo.language_handler import sort_files_by_main_languages
+from pr_agent.algo.model_health import get_model_circuit_breaker, hedge_with
 from pr_agent.algo.token_handler import TokenHandler
 from pr_agent.algo.types import EDIT_TYPE, FilePatchInfo
-from pr_agent.algo.utils import ModelType, clip_tokens, get_max_tokens, get_model
+from pr_agent.algo.utils import ModelType, clip_tokens_exact, get_max_tokens, get_model
 from pr_agent.config_loader import get_settings
 from pr_agent.git_providers.git_provider import GitProvider
 from pr_agent.log import get_logger
@@ -35,6 +38,26 @@ def cap_and_log_extra_lines(value, direction) -> int:
     return value
 
 
+def get_pr_languages(git_provider: GitProvider) -> list:
+    """
+    Retrieves the diff files from the git provider, and groups them by the PR main languages.
+    """
+    try:
+        diff_files = git_provider.get_diff_files()
+    except RateLimitExceededException as e:
+        get_logger().error(f"Rate limit exceeded for git provider API. original message {e}")
+        raise
+
+    # get pr languages
+    pr_languages = sort_files_by_main_languages(git_provider.get_languages(), diff_files)
+    if pr_languages:
+        try:
+            get_logger().info(f"PR main language: {pr_languages[0]['language']}")
+        except Exception as e:
+            pass
+    return pr_languages
+
+
 def get_pr_diff(git_provider: GitProvider, token_handler: TokenHandler,
                 model: str,
                 add_line_numbers_to_hunks: bool = False,
@@ -50,24 +73,34 @@ def get_pr_diff(git_provider: GitProvider, token_handler: TokenHandler,
         PATCH_EXTRA_LINES_BEFORE = cap_and_log_extra_lines(PATCH_EXTRA_LINES_BEFORE, "before")
         PATCH_EXTRA_LINES_AFTER = cap_and_log_extra_lines(PATCH_EXTRA_LINES_AFTER, "after")
 
-    try:
-        diff_files = git_provider.get_diff_files()
-    except RateLimitExceededException as e:
-        get_logger().error(f"Rate limit exceeded for git provider API. original message {e}")
-        raise
-
-    # get pr languages
-    pr_languages = sort_files_by_main_languages(git_provider.get_languages(), diff_files)
-    if pr_languages:
-        try:
-            get_logger().info(f"PR main language: {pr_languages[0]['language']}")
-        except Exception as e:
-            pass
+    # the extended diff is returned only if it fits, so file contents are fetched only while it still can
+    max_extended_tokens = get_max_tokens(model) - OUTPUT_BUFFER_TOKENS_SOFT_THRESHOLD
+
+    # rendered diff artifacts are shared between tools (and re-runs) on the same PR revision
+    cache_key = get_diff_cache_key(git_provider, "pr_diff",
+                                   add_line_numbers_to_hunks=add_line_numbers_to_hunks,
+                                   patch_extra_lines_before=PATCH_EXTRA_LINES_BEFORE,
+                                   patch_extra_lines_after=PATCH_EXTRA_LINES_AFTER,
+                                   # the budget of the patches, which decides where the file contents stop
+                                   extended_patches_budget=max_extended_tokens - token_handler.prompt_tokens)
+    artifact = load_diff_artifact(cache_key) or {}
+    pr_languages = None  # loaded only on a cache miss
+
+    if 'extended' in artifact:
+        patches_extended = artifact['extended']['patches']
+        patches_extended_tokens = artifact['extended']['tokens']
+        total_tokens = token_handler.prompt_tokens + sum(patches_extended_tokens)
+    else:
+        pr_languages = get_pr_languages(git_provider)
 
-    # generate a standard diff string, with patch extension
-    patches_extended, total_tokens, patches_extended_tokens = pr_generate_extended_diff(
-        pr_languages, token_handler, add_line_numbers_to_hunks,
-        patch_extra_lines_before=PATCH_EXTRA_LINES_BEFORE, patch_extra_lines_after=PATCH_EXTRA_LINES_AFTER)
+        # generate a standard diff string, with patch extension
+        patches_extended, total_tokens, patches_extended_tokens = pr_generate_extended_diff(
+            pr_languages, token_handler, add_line_numbers_to_hunks,
+            patch_extra_lines_before=PATCH_EXTRA_LINES_BEFORE, patch_extra_lines_after=PATCH_EXTRA_LINES_AFTER,
+            max_tokens=max_extended_tokens, prefetch_contents=git_provider.prefetch_diff_files_content)
+        artifact['extended'] = {'patches': patches_extended, 'tokens': patches_extended_tokens,
+                                'file_tokens': _get_files_tokens(pr_languages)}
+        store_diff_artifact(cache_key, artifact)
 
     # if we are under the limit, return the full diff
     if total_tokens + OUTPUT_BUFFER_TOKENS_SOFT_THRESHOLD < get_max_tokens(model):
@@ -78,8 +111,18 @@ def get_pr_diff(git_provider: GitProvider, token_handler: TokenHandler,
     # if we are over the limit, start pruning (If we got here, we will not extend the patches with extra lines)
     get_logger().info(f"Tokens: {total_tokens}, total tokens over limit: {get_max_tokens(model)}, "
                       f"pruning diff.")
+    if 'compressed' in artifact:
+        compressed_files = _deserialize_compressed_files(artifact['compressed'])
+    else:
+        if pr_languages is None:
+            pr_languages = get_pr_languages(git_provider)
+            _set_files_tokens(pr_languages, artifact['extended']['file_tokens'])
+        compressed_files = generate_compressed_files(pr_languages, token_handler, add_line_numbers_to_hunks)
+        artifact['compressed'] = _serialize_compressed_files(compressed_files)
+        store_diff_artifact(cache_key, artifact)
     patches_compressed_list, total_tokens_list, deleted_files_list, remaining_files_list, file_dict, files_in_patches_list = \
-        pr_generate_compressed_diff(pr_languages, token_handler, model, add_line_numbers_to_hunks, large_pr_handling)
+        pr_generate_compressed_diff(pr_languages, token_handler, model, add_line_numbers_to_hunks, large_pr_handling,
+                                    compressed_files=compressed_files)
 
     if large_pr_handling and len(patches_compressed_list) > 1:
         get_logger().info(f"Large PR handling mode, and found {len(patches_compressed_list)} patches with original diff.")
@@ -122,15 +165,15 @@ def get_pr_diff(git_provider: GitProvider, token_handler: TokenHandler,
                     deleted_list_str = deleted_list_str + f"\n{filename}"
 
     # prune the added, modified, and deleted files lists, and add them to the final diff
-    added_list_str = clip_tokens(added_list_str, max_tokens - curr_token)
+    added_list_str, added_list_tokens = clip_tokens_exact(added_list_str, max_tokens - curr_token)
     if added_list_str:
         final_diff = final_diff + "\n\n" + added_list_str
-        curr_token += token_handler.count_tokens(added_list_str) + 2
-    modified_list_str = clip_tokens(modified_list_str, max_tokens - curr_token)
+        curr_token += added_list_tokens + 2
+    modified_list_str, modified_list_tokens = clip_tokens_exact(modified_list_str, max_tokens - curr_token)
     if modified_list_str:
         final_diff = final_diff + "\n\n" + modified_list_str
-        curr_token += token_handler.count_tokens(modified_list_str) + 2
-    deleted_list_str = clip_tokens(deleted_list_str, max_tokens - curr_token)
+        curr_token += modified_list_tokens + 2
+    deleted_list_str, _ = clip_tokens_exact(deleted_list_str, max_tokens - curr_token)
     if deleted_list_str:
         final_diff = final_diff + "\n\n" + deleted_list_str
 
@@ -144,22 +187,20 @@ def get_pr_diff(git_provider: GitProvider, token_handler: TokenHandler,
 
 def get_pr_diff_multiple_patchs(git_provider: GitProvider, token_handler: TokenHandler, model: str,
                 add_line_numbers_to_hunks: bool = False, disable_extra_lines: bool = False):
-    try:
-        diff_files = git_provider.get_diff_files()
-    except RateLimitExceededException as e:
-        get_logger().error(f"Rate limit exceeded for git provider API. original message {e}")
-        raise
-
-    # get pr languages
-    pr_languages = sort_files_by_main_languages(git_provider.get_languages(), diff_files)
-    if pr_languages:
-        try:
-            get_logger().info(f"PR main language: {pr_languages[0]['language']}")
-        except Exception as e:
-            pass
+    cache_key = get_diff_cache_key(git_provider, "pr_diff_multiple_patches",
+                                   add_line_numbers_to_hunks=add_line_numbers_to_hunks)
+    artifact = load_diff_artifact(cache_key) or {}
+    if 'compressed' in artifact:
+        pr_languages = None
+        compressed_files = _deserialize_compressed_files(artifact['compressed'])
+    else:
+        pr_languages = get_pr_languages(git_provider)
+        compressed_files = generate_compressed_files(pr_languages, token_handler, add_line_numbers_to_hunks)
+        store_diff_artifact(cache_key, {'compressed': _serialize_compressed_files(compressed_files)})
 
     patches_compressed_list, total_tokens_list, deleted_files_list, remaining_files_list, file_dict, files_in_patches_list = \
-        pr_generate_compressed_diff(pr_languages, token_handler, model, add_line_numbers_to_hunks, large_pr_handling=True)
+        pr_generate_compressed_diff(pr_languages, token_handler, model, add_line_numbers_to_hunks,
+                                    large_pr_handling=True, compressed_files=compressed_files)
 
     return patches_compressed_list, total_tokens_list, deleted_files_list, remaining_files_list, file_dict, files_in_patches_list
 
@@ -168,48 +209,101 @@ def pr_generate_extended_diff(pr_languages: list,
                               token_handler: TokenHandler,
                               add_line_numbers_to_hunks: bool,
                               patch_extra_lines_before: int = 0,
-                              patch_extra_lines_after: int = 0) -> Tuple[list, int, list]:
+                              patch_extra_lines_after: int = 0,
+                              max_tokens: int = None,
+                              prefetch_contents: Callable[[list], None] = None) -> Tuple[list, int, list]:
+    """
+    Generate the extended diff (each patch extended with extra lines of context from the file contents).
+
+    If 'max_tokens' is given, file contents are fetched only while the extended diff can still fit in it: once the
+    tokens so far plus the (unextended) patches of the remaining files reach 'max_tokens', the remaining patches are
+    rendered without extra lines, so their contents are never downloaded.
+
+    If 'prefetch_contents' is given and the patches are going to be extended, it is called once with the files whose
+    contents are not loaded yet, so the git provider can fetch them in bulk instead of one by one.
+    """
     total_tokens = token_handler.prompt_tokens  # initial tokens
+    files = [file for lang in pr_languages for file in lang['files'] if file.patch]
+
+    remaining_min_tokens = 0
+    files_min_tokens = []
+    if max_tokens is not None:
+        files_min_tokens = token_handler.count_tokens_batch([file.patch for file in files])
+        remaining_min_tokens = sum(files_min_tokens)
+    can_fit = True
+    extend_patches = patch_extra_lines_before > 0 or patch_extra_lines_after > 0
+    fits_budget = max_tokens is None or total_tokens + remaining_min_tokens < max_tokens
+    if prefetch_contents and extend_patches and fits_budget:
+        files_to_load = [file for file in files if not file.is_content_loaded()]
+        if files_to_load:
+            try:
+                prefetch_contents(files_to_load)
+            except Exception as e:
+                # the contents are still loaded one by one on first access
+                get_logger().warning(f"Failed to prefetch file contents: {e}")
+
     patches_extended = []
+    extended_files = []
     patches_extended_tokens = []
-    for lang in pr_languages:
-        for file in lang['files']:
-            original_file_content_str = file.base_file
-            new_file_content_str = file.head_file
-            patch = file.patch
-            if not patch:
-                continue
+    skipped_content_files = 0
+    for i, file in enumerate(files):
+        if max_tokens is not None:
+            can_fit = can_fit and total_tokens + remaining_min_tokens < max_tokens
+            remaining_min_tokens -= files_min_tokens[i]
 
+        patch = file.patch
+        if can_fit and extend_patches:
             # extend each patch with extra lines of context
-            extended_patch = extend_patch(original_file_content_str, patch,
+            extended_patch = extend_patch(file.base_file, patch,
                                           patch_extra_lines_before, patch_extra_lines_after, file.filename,
-                                          new_file_str=new_file_content_str)
-            if not extended_patch:
-                get_logger().warning(f"Failed to extend patch for file: {file.filename}")
-                continue
+                                          new_file_str=file.head_file)
+        else:
+            extended_patch = patch
+            if extend_patches:
+                skipped_content_files += not file.is_content_loaded()
+        if not extended_patch:
+            get_logger().warning(f"Failed to extend patch for file: {file.filename}")
+            continue
 
-            if add_line_numbers_to_hunks:
-                full_extended_patch = decouple_and_convert_to_hunks_with_lines_numbers(extended_patch, file)
-            else:
-                extended_patch = extended_patch.replace('\n@@ ', '\n\n@@ ') # add extra line before each hunk
-                full_extended_patch = f"\n\n## File: '{file.filename.strip()}'\n\n{extended_patch.strip()}\n"
+        if add_line_numbers_to_hunks:
+            full_extended_patch = decouple_and_convert_to_hunks_with_lines_numbers(extended_patch, file)
+        else:
+            extended_patch = extended_patch.replace('\n@@ ', '\n\n@@ ') # add extra line before each hunk
+            full_extended_patch = f"\n\n## File: '{file.filename.strip()}'\n\n{extended_patch.strip()}\n"
 
-            # add AI-summary metadata to the patch
-            if file.ai_file_summary and get_settings().get("config.enable_ai_metadata", False):
-                full_extended_patch = add_ai_summary_top_patch(file, full_extended_patch)
+        # add AI-summary metadata to the patch
+        if file.ai_file_summary and get_settings().get("config.enable_ai_metadata", False):
+            full_extended_patch = add_ai_summary_top_patch(file, full_extended_patch)
 
+        patches_extended.append(full_extended_patch)
+        extended_files.append(file)
+        if max_tokens is not None:
+            # the running total decides whether the next files are extended, so count now
             patch_tokens = token_handler.count_tokens(full_extended_patch)
-            file.tokens = patch_tokens
-            total_tokens += patch_tokens
             patches_extended_tokens.append(patch_tokens)
-            patches_extended.append(full_extended_patch)
+            total_tokens += patch_tokens
+
+    if max_tokens is None:
+        patches_extended_tokens = token_handler.count_tokens_batch(patches_extended)
+        total_tokens += sum(patches_extended_tokens)
+    for file, patch_tokens in zip(extended_files, patches_extended_tokens, strict=True):
+        file.tokens = patch_tokens
 
+    if skipped_content_files:
+        get_logger().info(f"Extended diff cannot fit in {max_tokens} tokens, "
+                          f"skipped fetching the content of {skipped_content_files} files")
     return patches_extended, total_tokens, patches_extended_tokens
 
 
-def pr_generate_compressed_diff(top_langs: list, token_handler: TokenHandler, model: str,
-                                convert_hunks_to_line_numbers: bool,
-                                large_pr_handling: bool) -> Tuple[list, list, list, list, dict, list]:
+def generate_compressed_files(top_langs: list, token_handler: TokenHandler,
+                              convert_hunks_to_line_numbers: bool) -> Tuple[dict, list, list]:
+    """
+    Generate the compressed (deletion hunks omitted) patch of each file, and count its tokens.
+
+    Returns:
+        A tuple of (file_dict, deleted_files_list, sorted_filenames), where 'sorted_filenames' is the order in which
+        files are added to the compressed diff.
+    """
     deleted_files_list = []
 
     # sort each one of the languages in top_langs by the number of tokens in the diff
@@ -220,15 +314,12 @@ def pr_generate_compressed_diff(top_langs: list, token_handler: TokenHandler, mo
     # generate patches for each file, and count tokens
     file_dict = {}
     for file in sorted_files:
-        original_file_content_str = file.base_file
-        new_file_content_str = file.head_file
         patch = file.patch
         if not patch:
             continue
 
         # removing delete-only hunks
-        patch = handle_patch_deletions(patch, original_file_content_str,
-                                       new_file_content_str, file.filename, file.edit_type)
+        patch = handle_patch_deletions(patch, None, _get_head_file_for_deletions(file), file.filename, file.edit_type)
         if patch is None:
             if file.filename not in deleted_files_list:
                 deleted_files_list.append(file.filename)
@@ -241,14 +332,29 @@ def pr_generate_compressed_diff(top_langs: list, token_handler: TokenHandler, mo
         # if file.ai_file_summary and get_settings().config.get('config.is_auto_command', False):
         #     patch = add_ai_summary_top_patch(file, patch)
 
-        new_patch_tokens = token_handler.count_tokens(patch)
-        file_dict[file.filename] = {'patch': patch, 'tokens': new_patch_tokens, 'edit_type': file.edit_type}
+        file_dict[file.filename] = {'patch': patch, 'tokens': -1, 'edit_type': file.edit_type}
+
+    files_tokens = token_handler.count_tokens_batch([data['patch'] for data in file_dict.values()])
+    for data, new_patch_tokens in zip(file_dict.values(), files_tokens, strict=True):
+        data['tokens'] = new_patch_tokens
+
+    return file_dict, deleted_files_list, [file.filename for file in sorted_files]
+
+
+def pr_generate_compressed_diff(top_langs: list, token_handler: TokenHandler, model: str,
+                                convert_hunks_to_line_numbers: bool,
+                                large_pr_handling: bool,
+                                compressed_files: Tuple[dict, list, list] = None
+                                ) -> Tuple[list, list, list, list, dict, list]:
+    if compressed_files is None:
+        compressed_files = generate_compressed_files(top_langs, token_handler, convert_hunks_to_line_numbers)
+    file_dict, deleted_files_list, sorted_filenames = compressed_files
 
     max_tokens_model = get_max_tokens(model)
 
     # first iteration
     files_in_patches_list = []
-    remaining_files_list =  [file.filename for file in sorted_files]
+    remaining_files_list = list(sorted_filenames)
     patches_list =[]
     total_tokens_list = []
     total_tokens, patches, remaining_files_list, files_in_patch_list = generate_full_patch(convert_hunks_to_line_numbers, file_dict,
@@ -320,15 +426,24 @@ def generate_full_patch(convert_hunks_to_line_numbers, file_dict, max_tokens_mod
 async def retry_with_fallback_models(f: Callable, model_type: ModelType = ModelType.REGULAR):
     all_models = _get_all_models(model_type)
     all_deployments = _get_all_deployments(all_models)
+    all_models, all_deployments = _order_by_health(all_models, all_deployments)
+    hedging = get_settings().config.get("enable_hedged_requests", False) and len(all_models) > 1
+    # the deployment id is a global setting, so only models on the same deployment can run concurrently
+    if hedging and len(set(all_deployments)) > 1:
+        get_logger().debug("Hedged requests are not supported with fallback deployments, trying models in sequence")
+        hedging = False
+
     # try each (model, deployment_id) pair until one is successful, otherwise raise exception
-    for i, (model, deployment_id) in enumerate(zip(all_models, all_deployments)):
+    for i, (model, deployment_id) in enumerate(zip(all_models, all_deployments, strict=True)):
         try:
             get_logger().debug(
                 f"Generating prediction with {model}"
                 f"{(' from deployment ' + deployment_id) if deployment_id else ''}"
             )
             get_settings().set("openai.deployment_id", deployment_id)
-            return await f(model)
+            # the prediction is prepared for 'model', and only its chat completions are hedged with the next models
+            with hedge_with(all_models[i + 1:] if hedging else ()):
+                return await f(model)
         except Exception as e:
             get_logger().warning(
                 f"Failed to generate prediction with {model}",
@@ -364,11 +479,25 @@ def _get_all_deployments(all_models: List[str]) -> List[str]:
         if len(all_deployments) < len(all_models):
             raise ValueError(f"The number of deployments ({len(all_deployments)}) "
                              f"is less than the number of models ({len(all_models)})")
+        all_deployments = all_deployments[:len(all_models)]  # paired with the models by position
     else:
         all_deployments = [deployment_id] * len(all_models)
     return all_deployments
 
 
+def _order_by_health(all_models: List[str], all_deployments: List[str]) -> Tuple[List[str], List[str]]:
+    """
+    Reorders the (model, deployment_id) pairs so that healthy ones come first, and drops those whose circuit is open
+    (see ModelCircuitBreaker). Models and deployments are paired by position, so they are reordered together.
+    """
+    targets = get_model_circuit_breaker().select_targets(list(zip(all_models, all_deployments, strict=True)))
+    if not targets:
+        raise Exception(f"Failed to generate prediction: the circuits of all models of {all_models} are open")
+    if targets != list(zip(all_models, all_deployments, strict=True)):
+        get_logger().info(f"Models ordered by health: {[model for model, _ in targets]}")
+    return [model for model, _ in targets], [deployment_id for _, deployment_id in targets]
+
+
 def get_pr_multi_diffs(git_provider: GitProvider,
                        token_handler: TokenHandler,
                        model: str,
@@ -390,87 +519,81 @@ def get_pr_multi_diffs(git_provider: GitProvider,
     Raises:
         RateLimitExceededException: If the rate limit for the Git provider API is exceeded.
     """
-    try:
-        diff_files = git_provider.get_diff_files()
-    except RateLimitExceededException as e:
-        get_logger().error(f"Rate limit exceeded for git provider API. original message {e}")
-        raise
-
-    # Sort files by main language
-    pr_languages = sort_files_by_main_languages(git_provider.get_languages(), diff_files)
-
     # Get the maximum number of extra lines before and after the patch
     PATCH_EXTRA_LINES_BEFORE = get_settings().config.patch_extra_lines_before
     PATCH_EXTRA_LINES_AFTER = get_settings().config.patch_extra_lines_after
     PATCH_EXTRA_LINES_BEFORE = cap_and_log_extra_lines(PATCH_EXTRA_LINES_BEFORE, "before")
     PATCH_EXTRA_LINES_AFTER = cap_and_log_extra_lines(PATCH_EXTRA_LINES_AFTER, "after")
 
-    # try first a single run with standard diff string, with patch extension, and no deletions
-    patches_extended, total_tokens, patches_extended_tokens = pr_generate_extended_diff(
-        pr_languages, token_handler,
-        add_line_numbers_to_hunks=add_line_numbers,
-        patch_extra_lines_before=PATCH_EXTRA_LINES_BEFORE,
-        patch_extra_lines_after=PATCH_EXTRA_LINES_AFTER)
+    max_extended_tokens = get_max_tokens(model) - OUTPUT_BUFFER_TOKENS_SOFT_THRESHOLD
+    cache_key = get_diff_cache_key(git_provider, "pr_multi_diffs",
+                                   add_line_numbers=add_line_numbers,
+                                   patch_extra_lines_before=PATCH_EXTRA_LINES_BEFORE,
+                                   patch_extra_lines_after=PATCH_EXTRA_LINES_AFTER,
+                                   # the budget of the patches, which decides where the file contents stop
+                                   extended_patches_budget=max_extended_tokens - token_handler.prompt_tokens)
+    artifact = load_diff_artifact(cache_key) or {}
+    pr_languages = None  # loaded only on a cache miss
+
+    if 'extended' in artifact:
+        patches_extended = artifact['extended']['patches']
+        total_tokens = token_handler.prompt_tokens + sum(artifact['extended']['tokens'])
+    else:
+        # Sort files by main language
+        pr_languages = get_pr_languages(git_provider)
+
+        # try first a single run with standard diff string, with patch extension, and no deletions
+        patches_extended, total_tokens, patches_extended_tokens = pr_generate_extended_diff(
+            pr_languages, token_handler,
+            add_line_numbers_to_hunks=add_line_numbers,
+            patch_extra_lines_before=PATCH_EXTRA_LINES_BEFORE,
+            patch_extra_lines_after=PATCH_EXTRA_LINES_AFTER,
+            max_tokens=max_extended_tokens, prefetch_contents=git_provider.prefetch_diff_files_content)
+        artifact['extended'] = {'patches': patches_extended, 'tokens': patches_extended_tokens,
+                                'file_tokens': _get_files_tokens(pr_languages)}
+        store_diff_artifact(cache_key, artifact)
 
     # if we are under the limit, return the full diff
     if total_tokens + OUTPUT_BUFFER_TOKENS_SOFT_THRESHOLD < get_max_tokens(model):
         return ["\n".join(patches_extended)] if patches_extended else []
 
-    # Sort files within each language group by tokens in descending order
-    sorted_files = []
-    for lang in pr_languages:
-        sorted_files.extend(sorted(lang['files'], key=lambda x: x.tokens, reverse=True))
+    if 'multi' in artifact:
+        file_patches = artifact['multi']
+    else:
+        if pr_languages is None:
+            pr_languages = get_pr_languages(git_provider)
+            _set_files_tokens(pr_languages, artifact['extended']['file_tokens'])
+        file_patches = _generate_multi_diff_file_patches(pr_languages, token_handler, add_line_numbers)
+        artifact['multi'] = file_patches
+        store_diff_artifact(cache_key, artifact)
 
     patches = []
     final_diff_list = []
     total_tokens = token_handler.prompt_tokens
     call_number = 1
-    for file in sorted_files:
+    for filename, patch, new_patch_tokens in file_patches:
         if call_number > max_calls:
             if get_settings().config.verbosity_level >= 2:
                 get_logger().info(f"Reached max calls ({max_calls})")
             break
 
-        original_file_content_str = file.base_file
-        new_file_content_str = file.head_file
-        patch = file.patch
-        if not patch:
-            continue
-
-        # Remove delete-only hunks
-        patch = handle_patch_deletions(patch, original_file_content_str, new_file_content_str, file.filename, file.edit_type)
-        if patch is None:
-            continue
-
-        # Add line numbers and metadata to the patch
-        if add_line_numbers:
-            patch = decouple_and_convert_to_hunks_with_lines_numbers(patch, file)
-        else:
-            patch = f"\n\n## File: '{file.filename.strip()}'\n\n{patch.strip()}\n"
-
-        # add AI-summary metadata to the patch
-        if file.ai_file_summary and get_settings().get("config.enable_ai_metadata", False):
-            patch = add_ai_summary_top_patch(file, patch)
-        new_patch_tokens = token_handler.count_tokens(patch)
-
         if patch and (token_handler.prompt_tokens + new_patch_tokens) > get_max_tokens(
                 model) - OUTPUT_BUFFER_TOKENS_SOFT_THRESHOLD:
             if get_settings().config.get('large_patch_policy', 'skip') == 'skip':
-                get_logger().warning(f"Patch too large, skipping: {file.filename}")
+                get_logger().warning(f"Patch too large, skipping: {filename}")
                 continue
             elif get_settings().config.get('large_patch_policy') == 'clip':
                 delta_tokens = get_max_tokens(model) - OUTPUT_BUFFER_TOKENS_SOFT_THRESHOLD - token_handler.prompt_tokens
-                patch_clipped = clip_tokens(patch, delta_tokens, delete_last_line=True, num_input_tokens=new_patch_tokens)
-                new_patch_tokens = token_handler.count_tokens(patch_clipped)
+                patch_clipped, new_patch_tokens = clip_tokens_exact(patch, delta_tokens)
                 if patch_clipped and (token_handler.prompt_tokens + new_patch_tokens) > get_max_tokens(
                         model) - OUTPUT_BUFFER_TOKENS_SOFT_THRESHOLD:
-                    get_logger().warning(f"Patch too large, skipping: {file.filename}")
+                    get_logger().warning(f"Patch too large, skipping: {filename}")
                     continue
                 else:
-                    get_logger().info(f"Clipped large patch for file: {file.filename}")
+                    get_logger().info(f"Clipped large patch for file: {filename}")
                     patch = patch_clipped
             else:
-                get_logger().warning(f"Patch too large, skipping: {file.filename}")
+                get_logger().warning(f"Patch too large, skipping: {filename}")
                 continue
 
         if patch and (total_tokens + new_patch_tokens > get_max_tokens(model) - OUTPUT_BUFFER_TOKENS_SOFT_THRESHOLD):
@@ -490,7 +613,7 @@ def get_pr_multi_diffs(git_provider: GitProvider,
             patches.append(patch)
             total_tokens += new_patch_tokens
             if get_settings().config.verbosity_level >= 2:
-                get_logger().info(f"Tokens: {total_tokens}, last filename: {file.filename}")
+                get_logger().info(f"Tokens: {total_tokens}, last filename: {filename}")
 
     # Add the last chunk
     if patches:
@@ -500,6 +623,82 @@ def get_pr_multi_diffs(git_provider: GitProvider,
     return final_diff_list
 
 
+def _generate_multi_diff_file_patches(pr_languages: list, token_handler: TokenHandler,
+                                      add_line_numbers: bool) -> List[list]:
+    """
+    Generate the per-file patches used by 'get_pr_multi_diffs', as a list of [filename, patch, tokens].
+    """
+    # Sort files within each language group by tokens in descending order
+    sorted_files = []
+    for lang in pr_languages:
+        sorted_files.extend(sorted(lang['files'], key=lambda x: x.tokens, reverse=True))
+
+    file_patches = []
+    for file in sorted_files:
+        patch = file.patch
+        if not patch:
+            continue
+
+        # Remove delete-only hunks
+        patch = handle_patch_deletions(patch, None, _get_head_file_for_deletions(file), file.filename, file.edit_type)
+        if patch is None:
+            continue
+
+        # Add line numbers and metadata to the patch
+        if add_line_numbers:
+            patch = decouple_and_convert_to_hunks_with_lines_numbers(patch, file)
+        else:
+            patch = f"\n\n## File: '{file.filename.strip()}'\n\n{patch.strip()}\n"
+
+        # add AI-summary metadata to the patch
+        if file.ai_file_summary and get_settings().get("config.enable_ai_metadata", False):
+            patch = add_ai_summary_top_patch(file, patch)
+        file_patches.append([file.filename, patch, -1])
+
+    files_tokens = token_handler.count_tokens_batch([file_patch[1] for file_patch in file_patches])
+    for file_patch, patch_tokens in zip(file_patches, files_tokens, strict=True):
+        file_patch[2] = patch_tokens
+    return file_patches
+
+
+def _get_head_file_for_deletions(file: FilePatchInfo) -> str:
+    """
+    'handle_patch_deletions' reads the head content only to detect deleted files, so avoid fetching it for other files.
+    """
+    if file.edit_type in (EDIT_TYPE.DELETED, EDIT_TYPE.UNKNOWN):
+        return file.head_file
+    return ""
+
+
+def _get_files_tokens(pr_languages: list) -> dict:
+    return {file.filename: file.tokens for lang in pr_languages for file in lang['files']}
+
+
+def _set_files_tokens(pr_languages: list, files_tokens: dict):
+    # restore the tokens computed by 'pr_generate_extended_diff', which determine the order of the compressed diff
+    for lang in pr_languages:
+        for file in lang['files']:
+            if file.filename in files_tokens:
+                file.tokens = files_tokens[file.filename]
+
+
+def _serialize_compressed_files(compressed_files: Tuple[dict, list, list]) -> dict:
+    file_dict, deleted_files_list, sorted_filenames = compressed_files
+    return {
+        'file_dict': {filename: {'patch': data['patch'], 'tokens': data['tokens'], 'edit_type': data['edit_type'].value}
+                      for filename, data in file_dict.items()},
+        'deleted_files_list': deleted_files_list,
+        'sorted_filenames': sorted_filenames,
+    }
+
+
+def _deserialize_compressed_files(data: dict) -> Tuple[dict, list, list]:
+    file_dict = {filename: {'patch': values['patch'], 'tokens': values['tokens'],
+                            'edit_type': EDIT_TYPE(values['edit_type'])}
+                 for filename, values in data['file_dict'].items()}
+    return file_dict, list(data['deleted_files_list']), list(data['sorted_filenames'])
+
+
 def add_ai_metadata_to_diff_files(git_provider, pr_description_files):
     """
     Adds AI metadata to the diff files based on the PR description files (FilePatchInfo.ai_file_summary).
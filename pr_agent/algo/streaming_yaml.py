@@ -0,0 +1,106 @@
+"""
+Incremental parsing of a YAML list while an LLM is still generating it, e.g. the 'code_suggestions' of /improve.
+"""
+from __future__ import annotations
+
+import re
+from typing import Callable, List, Optional
+
+from pr_agent.algo.ai_handlers.base_ai_handler import StreamConsumer
+from pr_agent.algo.utils import load_yaml
+
+
+class IncrementalYamlListParser(StreamConsumer):
+    """
+    Collects the items of the top-level '<list_key>:' list of a streamed YAML response. An item is complete once the
+    next item starts (a '- ' line at the item indentation), the list ends (a line at the key indentation or a closing
+    code fence), or the stream ends. Each complete item is parsed on its own with 'load_yaml', then passed to
+    'validate_item', which returns the (possibly edited) item to keep, or None to drop it.
+    The generation is stopped once 'max_items' items are kept (0 for no limit).
+    """
+
+    def __init__(self, list_key: str, validate_item: Callable[[dict, List[dict]], Optional[dict]] = None,
+                 max_items: int = 0, keys_fix_yaml: List[str] = None, last_key: str = ""):
+        self.list_key = list_key
+        self.validate_item = validate_item
+        self.max_items = max_items
+        self.keys_fix_yaml = keys_fix_yaml or []
+        self.last_key = last_key
+        self._list_key_pattern = re.compile(rf"^(\s*){re.escape(list_key)}:\s*$")
+        self.reset()
+
+    def reset(self):
+        self.items = []
+        self.stopped = False
+        self._partial_line = ""
+        self._key_indent = None  # indentation of the '<list_key>:' line, None until it is found
+        self._item_indent = None
+        self._item_lines = []
+        self._list_ended = False
+
+    def feed(self, text: str) -> bool:
+        if self.stopped or self._list_ended:
+            return self.stopped
+        lines = (self._partial_line + text).split("\n")
+        self._partial_line = lines.pop()
+        for line in lines:
+            self._process_line(line)
+            if self.stopped or self._list_ended:
+                break
+        return self.stopped
+
+    def finish(self):
+        if self.stopped or self._list_ended:
+            return
+        if self._partial_line:
+            self._process_line(self._partial_line)
+            self._partial_line = ""
+        self._complete_item()
+
+    def _process_line(self, line: str):
+        if self._key_indent is None:
+            match = self._list_key_pattern.match(line)
+            if match:
+                self._key_indent = len(match.group(1))
+            return
+        stripped = line.lstrip()
+        if not stripped:
+            if self._item_lines:
+                self._item_lines.append(line)
+            return
+        indent = len(line) - len(stripped)
+        is_list_item = stripped == "-" or stripped.startswith("- ")
+        if self._item_indent is None:
+            if is_list_item and indent >= self._key_indent:
+                self._item_indent = indent
+                self._item_lines = [line]
+            else:
+                self._list_ended = True
+            return
+        if indent == self._item_indent and is_list_item:
+            self._complete_item()
+            self._item_lines = [line]
+        elif (indent <= self._key_indent and not is_list_item) or stripped.startswith("```"):
+            self._complete_item()
+            self._list_ended = True
+        else:
+            self._item_lines.append(line)
+
+    def _complete_item(self):
+        if not self._item_lines or self.stopped:
+            return
+        item_text = "\n".join([f"{self.list_key}:"] + self._item_lines)
+        self._item_lines = []
+        data = load_yaml(item_text, keys_fix_yaml=self.keys_fix_yaml, first_key=self.list_key,
+                         last_key=self.last_key)
+        items = data.get(self.list_key) if isinstance(data, dict) else None
+        if not items or not isinstance(items, list) or not isinstance(items[0], dict):
+            return
+        item = items[0]
+        if self.validate_item is not None:
+            item = self.validate_item(item, self.items)
+        if item is None:
+            return
+        self.items.append(item)
+        if self.max_items and len(self.items) >= self.max_items:
+            self.stopped = True
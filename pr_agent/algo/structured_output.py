@@ -0,0 +1,153 @@
+"""
+Structured output mode, enabled with 'config.enable_structured_output'.
+The output type of a tool is defined by Pydantic classes in its system prompt (e.g. '$PRReview' in
+pr_reviewer_prompts.toml). These definitions are converted to a JSON schema, which LiteLLMAIHandler sends as the
+'response_format' of the models that support it (JSON schema, or tool calling for Anthropic models). Their response is
+then JSON that is parsed directly, without the YAML repair passes. Other models are prompted and parsed as before.
+The definitions are parsed, never executed: a prompt may be overridden by repo settings.
+"""
+from __future__ import annotations
+
+import ast
+import json
+import re
+from typing import Optional
+
+from pr_agent.algo.utils import load_yaml
+from pr_agent.config_loader import get_settings
+from pr_agent.log import get_logger
+
+_DEFINITIONS_PATTERN = re.compile(
+    r"equivalent to type \$(\w+), according to the following Pydantic definitions:\s*\n=+\n(.*?)\n=+", re.DOTALL)
+_CLASS_PATTERN = re.compile(r"^class\s+(\w+)\((.*)\)\s*:\s*$")
+_FIELD_PATTERN = re.compile(r"^\s+([\w\[\]-]+)\s*:\s*([^=]+?)\s*(?:=\s*(.+))?$")
+
+_BASIC_TYPES = {"str": {"type": "string"}, "int": {"type": "integer"}, "float": {"type": "number"},
+                "bool": {"type": "boolean"}, "dict": {"type": "object"}, "Dict": {"type": "object"}}
+
+
+def is_structured_output_enabled() -> bool:
+    return get_settings().config.get("enable_structured_output", False)
+
+
+def _parse_definitions(definitions: str) -> dict:
+    """
+    Returns {class name: (is_enum, [(field name, annotation, Field(...) expression)])} of the Pydantic definitions.
+    """
+    classes = {}
+    fields = None
+    is_enum = False
+    for line in definitions.splitlines():
+        if not line.strip() or line.strip().startswith("#"):
+            continue
+        class_match = _CLASS_PATTERN.match(line)
+        if class_match:
+            is_enum = "Enum" in class_match.group(2)
+            fields = []
+            classes[class_match.group(1)] = (is_enum, fields)
+        elif fields is not None and not is_enum:
+            field_match = _FIELD_PATTERN.match(line)
+            if field_match:
+                fields.append(field_match.groups())
+    return classes
+
+
+def _get_field_options(field_expression: Optional[str]) -> dict:
+    """
+    The description (keyword, or first positional argument) and the item limits of a 'Field(...)' expression.
+    """
+    options = {}
+    if not field_expression:
+        return options
+    try:
+        call = ast.parse(field_expression.strip(), mode="eval").body
+        if not isinstance(call, ast.Call):
+            return options
+        if call.args and isinstance(call.args[0], ast.Constant) and isinstance(call.args[0].value, str):
+            options["description"] = call.args[0].value
+        for keyword in call.keywords:
+            if keyword.arg in ("description", "min_items", "max_items"):
+                options[keyword.arg] = ast.literal_eval(keyword.value)
+    except (SyntaxError, ValueError):
+        pass
+    return options
+
+
+def _annotation_to_schema(node: ast.expr, classes: dict, seen: tuple) -> dict:
+    if isinstance(node, ast.Name):
+        if node.id in _BASIC_TYPES:
+            return dict(_BASIC_TYPES[node.id])
+        if node.id in classes and node.id not in seen:
+            return _class_to_schema(node.id, classes, seen)
+        return {}
+    if isinstance(node, ast.Subscript) and isinstance(node.value, ast.Name):
+        args = node.slice.elts if isinstance(node.slice, ast.Tuple) else [node.slice]
+        if node.value.id in ("List", "list") and len(args) == 1:
+            return {"type": "array", "items": _annotation_to_schema(args[0], classes, seen)}
+        if node.value.id == "Union":
+            return {"anyOf": [_annotation_to_schema(arg, classes, seen) for arg in args]}
+        if node.value.id == "Optional" and len(args) == 1:
+            return {"anyOf": [_annotation_to_schema(args[0], classes, seen), {"type": "null"}]}
+    return {}
+
+
+def _class_to_schema(name: str, classes: dict, seen: tuple = ()) -> dict:
+    is_enum, fields = classes[name]
+    if is_enum:
+        # the allowed values are described in the prompt, which also tells whether member names or values are expected
+        return {"type": "string"}
+    properties = {}
+    for field_name, annotation, field_expression in fields:
+        try:
+            schema = _annotation_to_schema(ast.parse(annotation, mode="eval").body, classes, seen + (name,))
+        except SyntaxError:
+            schema = {}
+        options = _get_field_options(field_expression)
+        if "description" in options:
+            schema["description"] = options["description"]
+        if schema.get("type") == "array":
+            if "min_items" in options:
+                schema["minItems"] = options["min_items"]
+            if "max_items" in options:
+                schema["maxItems"] = options["max_items"]
+        properties[field_name] = schema
+    return {"type": "object", "properties": properties, "required": list(properties), "additionalProperties": False}
+
+
+def get_response_schema(system_prompt: str) -> Optional[dict]:
+    """
+    The '{"name": ..., "schema": ...}' JSON schema of the output type defined in a rendered system prompt, or None if
+    the structured output mode is disabled, or the prompt has no Pydantic output definitions.
+    """
+    if not is_structured_output_enabled():
+        return None
+    match = _DEFINITIONS_PATTERN.search(system_prompt)
+    if not match:
+        return None
+    root_name, definitions = match.groups()
+    try:
+        classes = _parse_definitions(definitions)
+        if root_name not in classes:
+            return None
+        return {"name": root_name, "schema": _class_to_schema(root_name, classes)}
+    except Exception as e:
+        get_logger().warning(f"Failed to build the response schema of {root_name}: {e}")
+        return None
+
+
+def load_prediction(response_text: str, keys_fix_yaml: list = None, first_key: str = "", last_key: str = ""):
+    """
+    Loads an AI response: a JSON object (the structured output mode) is parsed directly, anything else with
+    'load_yaml'.
+    """
+    response_text = response_text.strip()
+    if response_text.startswith("```json"):
+        response_text = response_text.removeprefix("```json").removesuffix("```").strip()
+    if response_text.startswith("{"):
+        try:
+            data = json.loads(response_text)
+            if isinstance(data, dict):
+                return data
+        except json.JSONDecodeError:
+            pass
+    return load_yaml(response_text, keys_fix_yaml=keys_fix_yaml or [], first_key=first_key, last_key=last_key)
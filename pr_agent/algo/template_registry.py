@@ -0,0 +1,60 @@
+"""
+Registry of compiled Jinja prompt templates. The tools render the same '[*_prompt]' system/user templates on every
+request (and TokenHandler renders them once more to count their tokens), so each template text is compiled once and
+reused. Entries are keyed by the template text itself: a per-repo or per-request prompt override is a different text,
+compiled on first use, and the least recently used entries are evicted beyond PROMPT_TEMPLATE_CACHE_SIZE.
+"""
+from __future__ import annotations
+
+import hashlib
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from jinja2 import Environment, StrictUndefined, Template
+
+# max number of compiled templates kept
+PROMPT_TEMPLATE_CACHE_SIZE = 256
+
+_environment = Environment(undefined=StrictUndefined)
+_templates = OrderedDict()  # sha256 of the template text -> compiled template
+_templates_lock = Lock()
+_template_stats = {"hits": 0, "compilations": 0, "compile_seconds": 0.0}
+
+
+def get_prompt_template(template_str: str) -> Template:
+    """
+    Returns the compiled template of 'template_str', compiling it on first use.
+    """
+    key = hashlib.sha256(template_str.encode("utf-8")).hexdigest()
+    with _templates_lock:
+        template = _templates.get(key)
+        if template is not None:
+            _templates.move_to_end(key)
+            _template_stats["hits"] += 1
+            return template
+    start_time = time.perf_counter()
+    template = _environment.from_string(template_str)
+    compile_seconds = time.perf_counter() - start_time
+    with _templates_lock:
+        _templates[key] = template
+        _template_stats["compilations"] += 1
+        _template_stats["compile_seconds"] += compile_seconds
+        while len(_templates) > PROMPT_TEMPLATE_CACHE_SIZE:
+            _templates.popitem(last=False)
+    return template
+
+
+def get_prompt_template_stats() -> dict:
+    """
+    Cache hits, compilations, total compile time and number of cached templates, for this process.
+    """
+    with _templates_lock:
+        stats = dict(_template_stats)
+        stats["cached_templates"] = len(_templates)
+    return stats
+
+
+def clear_prompt_templates():
+    with _templates_lock:
+        _templates.clear()
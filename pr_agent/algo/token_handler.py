@@ -1,10 +1,13 @@
+import hashlib
+from collections import OrderedDict
 from threading import Lock
 from math import ceil
 import re
+from typing import List
 
-from jinja2 import Environment, StrictUndefined
 from tiktoken import encoding_for_model, get_encoding
 
+from pr_agent.algo.template_registry import get_prompt_template
 from pr_agent.config_loader import get_settings
 from pr_agent.log import get_logger
 
@@ -40,6 +43,79 @@ class TokenEncoder:
                         cls._encoder_instance = get_encoding("o200k_base")
         return cls._encoder_instance
 
+    # Memoized token counts, keyed by (encoder name, content hash). Short texts are cheaper to encode than to cache.
+    _token_count_cache = OrderedDict()
+    _token_count_cache_lock = Lock()
+    MIN_CACHED_TEXT_LENGTH = 256
+
+    @classmethod
+    def count_tokens(cls, text: str, encoder=None) -> int:
+        """
+        Counts the number of tokens in 'text', reusing the count of a previous call on the same content.
+        """
+        if encoder is None:
+            encoder = cls.get_token_encoder()
+        key = cls._get_token_count_key(encoder, text)
+        if key is not None:
+            with cls._token_count_cache_lock:
+                count = cls._token_count_cache.get(key)
+                if count is not None:
+                    cls._token_count_cache.move_to_end(key)
+                    return count
+        count = len(encoder.encode(text, disallowed_special=()))
+        cls._store_token_counts([(key, count)])
+        return count
+
+    @classmethod
+    def count_tokens_batch(cls, texts: List[str], encoder=None) -> List[int]:
+        """
+        Counts the number of tokens in each of 'texts'. Texts missing from the cache are encoded together,
+        using tiktoken's multithreaded batch encoding.
+        """
+        if encoder is None:
+            encoder = cls.get_token_encoder()
+        keys = [cls._get_token_count_key(encoder, text) for text in texts]
+        counts = [None] * len(texts)
+        with cls._token_count_cache_lock:
+            for i, key in enumerate(keys):
+                if key is not None and key in cls._token_count_cache:
+                    cls._token_count_cache.move_to_end(key)
+                    counts[i] = cls._token_count_cache[key]
+
+        missing_indices = [i for i, count in enumerate(counts) if count is None]
+        if missing_indices:
+            missing_texts = [texts[i] for i in missing_indices]
+            if hasattr(encoder, 'encode_batch'):
+                encoded = encoder.encode_batch(missing_texts, disallowed_special=())
+            else:
+                encoded = [encoder.encode(text, disallowed_special=()) for text in missing_texts]
+            for i, tokens in zip(missing_indices, encoded, strict=True):
+                counts[i] = len(tokens)
+            cls._store_token_counts([(keys[i], counts[i]) for i in missing_indices])
+        return counts
+
+    @classmethod
+    def _get_token_count_key(cls, encoder, text: str):
+        if not text or len(text) < cls.MIN_CACHED_TEXT_LENGTH:
+            return None
+        digest = hashlib.blake2b(text.encode('utf-8', errors='surrogatepass'), digest_size=16).digest()
+        return getattr(encoder, 'name', None), digest
+
+    @classmethod
+    def _store_token_counts(cls, items: list):
+        items = [(key, count) for key, count in items if key is not None]
+        if not items:
+            return
+        max_size = get_settings().get('config.token_count_cache_size', 4096)
+        if max_size <= 0:
+            return
+        with cls._token_count_cache_lock:
+            for key, count in items:
+                cls._token_count_cache[key] = count
+                cls._token_count_cache.move_to_end(key)
+            while len(cls._token_count_cache) > max_size:
+                cls._token_count_cache.popitem(last=False)
+
 
 class TokenHandler:
     """
@@ -88,11 +164,10 @@ class TokenHandler:
         The sum of the number of tokens in the system and user strings.
         """
         try:
-            environment = Environment(undefined=StrictUndefined)
-            system_prompt = environment.from_string(system).render(vars)
-            user_prompt = environment.from_string(user).render(vars)
-            system_prompt_tokens = len(encoder.encode(system_prompt))
-            user_prompt_tokens = len(encoder.encode(user_prompt))
+            system_prompt = get_prompt_template(system).render(vars)
+            user_prompt = get_prompt_template(user).render(vars)
+            system_prompt_tokens = TokenEncoder.count_tokens(system_prompt, encoder)
+            user_prompt_tokens = TokenEncoder.count_tokens(user_prompt, encoder)
             return system_prompt_tokens + user_prompt_tokens
         except Exception as e:
             get_logger().error(f"Error in _get_system_user_tokens: {e}")
@@ -164,10 +239,28 @@ class TokenHandler:
         Returns:
         The number of tokens in the patch string.
         """
-        encoder_estimate = len(self.encoder.encode(patch, disallowed_special=()))
+        encoder_estimate = TokenEncoder.count_tokens(patch, self.encoder)
 
         # If an estimate is enough (for example, in cases where the maximal allowed tokens is way below the known limits), return it.
         if not force_accurate:
             return encoder_estimate
 
         return self._get_token_count_by_model_type(patch, encoder_estimate)
+
+    def count_tokens_batch(self, patches: List[str], force_accurate: bool = False) -> List[int]:
+        """
+        Counts the number of tokens in each of the given patch strings, encoding them in a single batch.
+
+        Args:
+        - patches: The patch strings.
+        - force_accurate: If True, uses a more precise calculation method.
+
+        Returns:
+        A list with the number of tokens in each patch string.
+        """
+        encoder_estimates = TokenEncoder.count_tokens_batch(patches, self.encoder)
+        if not force_accurate:
+            return encoder_estimates
+
+        return [self._get_token_count_by_model_type(patch, estimate)
+                for patch, estimate in zip(patches, encoder_estimates, strict=True)]
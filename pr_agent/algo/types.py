@@ -1,6 +1,8 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from enum import Enum
-from typing import Optional
+from typing import Callable, Optional
+
+from pr_agent.algo.parsed_patch import ParsedPatch, parse_patch
 
 
 class EDIT_TYPE(Enum):
@@ -13,8 +15,9 @@ class EDIT_TYPE(Enum):
 
 @dataclass
 class FilePatchInfo:
-    base_file: str
-    head_file: str
+    # lazily loaded (see 'base_file_loader' below), so neither repr() nor == reads them: that would fetch every file
+    base_file: str = field(repr=False, compare=False)
+    head_file: str = field(repr=False, compare=False)
     patch: str
     filename: str
     tokens: int = -1
@@ -24,3 +27,58 @@ class FilePatchInfo:
     num_minus_lines: int = -1
     language: Optional[str] = None
     ai_file_summary: str = None
+    # Optional callables that fetch 'base_file'/'head_file' the first time they are accessed.
+    # Git providers use them to avoid downloading the content of files that never make it into the prompt.
+    base_file_loader: Optional[Callable[[], str]] = field(default=None, repr=False, compare=False)
+    head_file_loader: Optional[Callable[[], str]] = field(default=None, repr=False, compare=False)
+    _parsed_patch: Optional[ParsedPatch] = field(default=None, init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        # a loader is only needed for content that was not provided
+        if self.__dict__.get('_base_file') is not None:
+            self.base_file_loader = None
+        if self.__dict__.get('_head_file') is not None:
+            self.head_file_loader = None
+
+    def is_content_loaded(self) -> bool:
+        """
+        True if accessing 'base_file' and 'head_file' will not trigger a fetch.
+        """
+        return self.base_file_loader is None and self.head_file_loader is None
+
+    @property
+    def parsed_patch(self) -> ParsedPatch:
+        """
+        The hunk structure of 'patch', parsed once and re-parsed only if 'patch' is replaced.
+        """
+        if self._parsed_patch is None or self._parsed_patch.patch is not self.patch:
+            self._parsed_patch = parse_patch(self.patch)
+        return self._parsed_patch
+
+
+def _lazy_file_content(name: str) -> property:
+    """
+    A property for a FilePatchInfo content field. When the stored value is None and a loader is set,
+    the loader is called once and its result replaces the value.
+    """
+    value_attr = f"_{name}"
+    loader_attr = f"{name}_loader"
+
+    def getter(self):
+        value = self.__dict__.get(value_attr)
+        if value is None and getattr(self, loader_attr) is not None:
+            value = getattr(self, loader_attr)()
+            self.__dict__[value_attr] = value
+            setattr(self, loader_attr, None)
+        return value
+
+    def setter(self, value):
+        self.__dict__[value_attr] = value
+        if value is not None:
+            setattr(self, loader_attr, None)
+
+    return property(getter, setter)
+
+
+FilePatchInfo.base_file = _lazy_file_content('base_file')
+FilePatchInfo.head_file = _lazy_file_content('head_file')
@@ -24,6 +24,7 @@ from pydantic import BaseModel
 from starlette_context import context
 
 from pr_agent.algo import MAX_TOKENS
+from pr_agent.algo.diff_engine import generate_unified_diff
 from pr_agent.algo.git_patch_processing import extract_hunk_lines_from_patch
 from pr_agent.algo.token_handler import TokenEncoder
 from pr_agent.algo.types import FilePatchInfo
@@ -689,12 +690,9 @@ def load_large_diff(filename, new_file_content_str: str, original_file_content_s
     try:
         original_file_content_str = (original_file_content_str or "").rstrip() + "\n"
         new_file_content_str = (new_file_content_str or "").rstrip() + "\n"
-        diff = difflib.unified_diff(original_file_content_str.splitlines(keepends=True),
-                                    new_file_content_str.splitlines(keepends=True))
         if get_settings().config.verbosity_level >= 2 and show_warning:
             get_logger().info(f"File was modified, but no patch was found. Manually creating patch: {filename}.")
-        patch = ''.join(diff)
-        return patch
+        return generate_unified_diff(filename, original_file_content_str, new_file_content_str)
     except Exception as e:
         get_logger().exception(f"Failed to generate patch for file: {filename}")
         return ""
@@ -746,11 +744,19 @@ def _fix_key_value(key: str, value: str):
     return key, value
 
 
+# the libyaml-based loader is several times faster on long responses, and parses the same documents
+_YAML_SAFE_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+def _safe_load_yaml(text: str):
+    return yaml.load(text, Loader=_YAML_SAFE_LOADER)
+
+
 def load_yaml(response_text: str, keys_fix_yaml: List[str] = [], first_key="", last_key="") -> dict:
     response_text_original = copy.deepcopy(response_text)
     response_text = response_text.strip('\n').removeprefix('yaml').removeprefix('```yaml').rstrip().removesuffix('```')
     try:
-        data = yaml.safe_load(response_text)
+        data = _safe_load_yaml(response_text)
     except Exception as e:
         get_logger().warning(f"Initial failure to parse AI prediction: {e}")
         data = try_fix_yaml(response_text, keys_fix_yaml=keys_fix_yaml, first_key=first_key, last_key=last_key,
@@ -765,6 +771,53 @@ def load_yaml(response_text: str, keys_fix_yaml: List[str] = [], first_key="", l
 
 
 
+def _repair_yaml_single_pass(response_text_lines: List[str], keys_yaml: List[str], first_key: str = ""):
+    """
+    Repairs the known failure modes of AI generated YAML in one scan of the lines, and parses the result once:
+    prose around the YAML (kept to the first code fence, or to the 'first_key' line, up to the closing fence),
+    a stray '{' ... '}' wrapper, a leading '+' (copied from the diff), tab indentation, and 'key: value' lines of
+    'keys_yaml' that should be block scalars. Returns None if the repaired text does not parse into a dict or list.
+    """
+    start, end = 0, len(response_text_lines)
+    for i, line in enumerate(response_text_lines):
+        if line.startswith('```'):
+            start = i + 1
+            break
+        if first_key and line.startswith(f"{first_key}:"):
+            start = i
+            break
+    for i in range(start, len(response_text_lines)):
+        if response_text_lines[i].startswith('```'):  # end of the YAML, the rest is prose
+            end = i
+            break
+    # stray '{' ... '}' wrapper around the YAML
+    non_blank = [i for i in range(start, end) if response_text_lines[i].strip()]
+    if non_blank and response_text_lines[non_blank[-1]].strip() == '}':
+        if response_text_lines[non_blank[0]].strip() == '{':
+            start, end = non_blank[0] + 1, non_blank[-1]
+        elif start > 0 and response_text_lines[start - 1].strip() == '{':
+            end = non_blank[-1]
+
+    repaired_lines = []
+    for line in response_text_lines[start:end]:
+        if line.startswith('+'):
+            line = ' ' + line[1:]
+        if line.startswith('\t'):
+            stripped_line = line.lstrip('\t')
+            line = '    ' * (len(line) - len(stripped_line)) + stripped_line
+        if '|' not in line:
+            for key in keys_yaml:
+                if key in line:
+                    line = line.replace(key, f'{key} |\n        ')
+        repaired_lines.append(line)
+
+    try:
+        data = _safe_load_yaml('\n'.join(repaired_lines))
+    except Exception:
+        return None
+    return data if isinstance(data, (dict, list)) else None
+
+
 def try_fix_yaml(response_text: str,
                  keys_fix_yaml: List[str] = [],
                  first_key="",
@@ -776,6 +829,12 @@ def try_fix_yaml(response_text: str,
                  'improved code:', 'label:', 'why:', 'suggestion_summary:']
     keys_yaml = keys_yaml + keys_fix_yaml
 
+    # fast path - repair the common failure modes in a single scan. The fallbacks below are the last resort
+    data = _repair_yaml_single_pass(response_text_lines, keys_yaml, first_key)
+    if data is not None:
+        get_logger().info("Successfully parsed AI prediction after a single-pass repair")
+        return data
+
     # first fallback - try to convert 'relevant line: ...' to relevant line: |-\n        ...'
     response_text_lines_copy = response_text_lines.copy()
     for i in range(0, len(response_text_lines_copy)):
@@ -784,7 +843,7 @@ def try_fix_yaml(response_text: str,
                 response_text_lines_copy[i] = response_text_lines_copy[i].replace(f'{key}',
                                                                                   f'{key} |\n        ')
     try:
-        data = yaml.safe_load('\n'.join(response_text_lines_copy))
+        data = _safe_load_yaml('\n'.join(response_text_lines_copy))
         get_logger().info(f"Successfully parsed AI prediction after adding |-\n")
         return data
     except:
@@ -794,7 +853,7 @@ def try_fix_yaml(response_text: str,
     response_text_copy = copy.deepcopy(response_text)
     response_text_copy = response_text_copy.replace('|\n', '|2\n')
     try:
-        data = yaml.safe_load(response_text_copy)
+        data = _safe_load_yaml(response_text_copy)
         get_logger().info(f"Successfully parsed AI prediction after replacing | with |2")
         return data
     except:
@@ -805,7 +864,7 @@ def try_fix_yaml(response_text: str,
             if initial_space == 2 and '|2' not in response_text_lines_copy[i] and '}' in response_text_lines_copy[i]:
                 response_text_lines_copy[i] = '    ' + response_text_lines_copy[i].lstrip()
         try:
-            data = yaml.safe_load('\n'.join(response_text_lines_copy))
+            data = _safe_load_yaml('\n'.join(response_text_lines_copy))
             get_logger().info(f"Successfully parsed AI prediction after replacing | with |2 and adding spaces")
             return data
         except:
@@ -819,7 +878,7 @@ def try_fix_yaml(response_text: str,
     if snippet:
         snippet_text = snippet.group()
         try:
-            data = yaml.safe_load(snippet_text.removeprefix('```yaml').rstrip('`'))
+            data = _safe_load_yaml(snippet_text.removeprefix('```yaml').rstrip('`'))
             get_logger().info(f"Successfully parsed AI prediction after extracting yaml snippet")
             return data
         except:
@@ -829,7 +888,7 @@ def try_fix_yaml(response_text: str,
     # third fallback - try to remove leading and trailing curly brackets
     response_text_copy = response_text.strip().rstrip().removeprefix('{').removesuffix('}').rstrip(':\n')
     try:
-        data = yaml.safe_load(response_text_copy)
+        data = _safe_load_yaml(response_text_copy)
         get_logger().info(f"Successfully parsed AI prediction after removing curly brackets")
         return data
     except:
@@ -850,7 +909,7 @@ def try_fix_yaml(response_text: str,
         response_text_copy = response_text[index_start:index_end].strip().strip('```yaml').strip('`').strip()
         if response_text_copy:
             try:
-                data = yaml.safe_load(response_text_copy)
+                data = _safe_load_yaml(response_text_copy)
                 get_logger().info(f"Successfully parsed AI prediction after extracting yaml snippet")
                 return data
             except:
@@ -862,7 +921,7 @@ def try_fix_yaml(response_text: str,
         if response_text_lines_copy[i].startswith('+'):
             response_text_lines_copy[i] = ' ' + response_text_lines_copy[i][1:]
     try:
-        data = yaml.safe_load('\n'.join(response_text_lines_copy))
+        data = _safe_load_yaml('\n'.join(response_text_lines_copy))
         get_logger().info(f"Successfully parsed AI prediction after removing leading '+'")
         return data
     except:
@@ -873,7 +932,7 @@ def try_fix_yaml(response_text: str,
         response_text_copy = copy.deepcopy(response_text)
         response_text_copy = response_text_copy.replace('\t', '    ')
         try:
-            data = yaml.safe_load(response_text_copy)
+            data = _safe_load_yaml(response_text_copy)
             get_logger().info(f"Successfully parsed AI prediction after replacing tabs with spaces")
             return data
         except:
@@ -896,7 +955,7 @@ def try_fix_yaml(response_text: str,
     response_text_copy = '\n'.join(response_text_copy_lines)
     response_text_copy = response_text_copy.replace(' |\n', ' |2\n')
     try:
-        data = yaml.safe_load(response_text_copy)
+        data = _safe_load_yaml(response_text_copy)
         get_logger().info(f"Successfully parsed AI prediction after adding indent for sections of code blocks")
         return data
     except:
@@ -906,7 +965,7 @@ def try_fix_yaml(response_text: str,
     response_text_copy = copy.deepcopy(response_text)
     response_text_copy = response_text_copy.lstrip('|\n')
     try:
-        data = yaml.safe_load(response_text_copy)
+        data = _safe_load_yaml(response_text_copy)
         get_logger().info(f"Successfully parsed AI prediction after removing pipe chars")
         return data
     except:
@@ -916,7 +975,7 @@ def try_fix_yaml(response_text: str,
     encodings_to_try = ['latin-1', 'utf-16']
     for encoding in encodings_to_try:
         try:
-            data = yaml.safe_load(response_text.encode(encoding).decode("utf-8"))
+            data = _safe_load_yaml(response_text.encode(encoding).decode("utf-8"))
             if data:
                 get_logger().info(f"Successfully parsed AI prediction after decoding with {encoding} encoding")
                 return data
@@ -927,7 +986,7 @@ def try_fix_yaml(response_text: str,
     # for i in range(1, len(response_text_lines)):
     #     response_text_lines_tmp = '\n'.join(response_text_lines[:-i])
     #     try:
-    #         data = yaml.safe_load(response_text_lines_tmp)
+    #         data = _safe_load_yaml(response_text_lines_tmp)
     #         get_logger().info(f"Successfully parsed AI prediction after removing {i} lines")
     #         return data
     #     except:
@@ -1009,7 +1068,8 @@ def get_max_tokens(model):
     return max_tokens_model
 
 
-def clip_tokens(text: str, max_tokens: int, add_three_dots=True, num_input_tokens=None, delete_last_line=False) -> str:
+def clip_tokens(text: str, max_tokens: int, add_three_dots=True, num_input_tokens=None, delete_last_line=False,
+                exact=False) -> str:
     """
     Clip the number of tokens in a string to a maximum number of tokens.
 
@@ -1032,6 +1092,9 @@ def clip_tokens(text: str, max_tokens: int, add_three_dots=True, num_input_token
                                          clipped content before adding truncation indicator.
                                          Useful for ensuring clean breaks at line boundaries.
                                          Defaults to False.
+        exact (bool, optional): Whether to cut on token boundaries instead of estimating the cut
+                              from the character-to-token ratio. See 'clip_tokens_exact'.
+                              Defaults to False.
 
     Returns:
         str: The clipped string. Returns original text if:
@@ -1074,13 +1137,15 @@ def clip_tokens(text: str, max_tokens: int, add_three_dots=True, num_input_token
         result stays within the token limit, as character-to-token ratios can vary.
         If token encoding fails, the original text is returned with a warning logged.
     """
+    if exact:
+        return clip_tokens_exact(text, max_tokens, add_three_dots)[0]
+
     if not text:
         return text
 
     try:
         if num_input_tokens is None:
-            encoder = TokenEncoder.get_token_encoder()
-            num_input_tokens = len(encoder.encode(text))
+            num_input_tokens = TokenEncoder.count_tokens(text)
         if num_input_tokens <= max_tokens:
             return text
         if max_tokens < 0:
@@ -1107,6 +1172,61 @@ def clip_tokens(text: str, max_tokens: int, add_three_dots=True, num_input_token
         get_logger().warning(f"Failed to clip tokens: {e}")
         return text
 
+
+def clip_tokens_exact(text: str, max_tokens: int, add_three_dots=True) -> Tuple[str, int]:
+    """
+    Clip a string to at most 'max_tokens' tokens, cutting on token boundaries.
+
+    The text is encoded once, the token array is sliced at the budget (minus the truncation indicator), and the
+    kept tokens are decoded back and snapped to the last complete line. Unlike 'clip_tokens', the result never
+    exceeds the budget and does not waste it on a conservative estimate.
+
+    Args:
+        text (str): The string to clip.
+        max_tokens (int): The maximum number of tokens allowed in the returned string.
+        add_three_dots (bool, optional): Whether to add "\n...(truncated)" at the end of the clipped text.
+                                       Defaults to True.
+
+    Returns:
+        Tuple[str, int]: The clipped string and its number of tokens, so callers do not need to count it again.
+                         If an error occurs, the original text is returned with its token count (-1 if unknown).
+    """
+    if not text:
+        return text, 0
+
+    tokens = None
+    try:
+        encoder = TokenEncoder.get_token_encoder()
+        tokens = encoder.encode(text, disallowed_special=())
+        if len(tokens) <= max_tokens:
+            return text, len(tokens)
+        if max_tokens <= 0:
+            return "", 0
+
+        suffix = "\n...(truncated)" if add_three_dots else ""
+        budget = max_tokens - (TokenEncoder.count_tokens(suffix, encoder) if suffix else 0)
+        if budget <= 0:
+            return "", 0
+
+        # decoding a token prefix may end mid-character, so drop incomplete trailing bytes
+        clipped_text = encoder.decode_bytes(tokens[:budget]).decode('utf-8', errors='ignore')
+        last_newline = clipped_text.rfind('\n')
+        if last_newline > 0:
+            clipped_text = clipped_text[:last_newline]
+
+        # re-joining the cut text with the suffix can merge tokens differently, so count the final string
+        while True:
+            clipped_text_final = clipped_text + suffix
+            num_tokens = TokenEncoder.count_tokens(clipped_text_final, encoder)
+            if num_tokens <= max_tokens or not clipped_text:
+                break
+            clipped_text = clipped_text.rsplit('\n', 1)[0] if '\n' in clipped_text else ""
+        return clipped_text_final, num_tokens
+    except Exception as e:
+        get_logger().warning(f"Failed to clip tokens: {e}")
+        return text, len(tokens) if tokens is not None else -1
+
+
 def replace_code_tags(text):
     """
     Replace odd instances of ` with <code> and even instances of ` with </code>
@@ -1125,25 +1245,22 @@ def find_line_number_of_relevant_line_in_file(diff_files: List[FilePatchInfo],
     position = -1
     if absolute_position is None:
         absolute_position = -1
-    re_hunk_header = re.compile(
-        r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@[ ]?(.*)")
 
     if not diff_files:
         return position, absolute_position
 
     for file in diff_files:
         if file.filename and (file.filename.strip() == relevant_file):
-            patch = file.patch
-            patch_lines = patch.splitlines()
+            parsed_patch = file.parsed_patch
+            patch_lines = parsed_patch.lines
             delta = 0
-            start1, size1, start2, size2 = 0, 0, 0, 0
+            start2 = 0
             if absolute_position != -1: # matching absolute to relative
                 for i, line in enumerate(patch_lines):
                     # new hunk
                     if line.startswith('@@'):
                         delta = 0
-                        match = re_hunk_header.match(line)
-                        start1, size1, start2, size2 = map(int, match.groups()[:4])
+                        start2 = parsed_patch.hunk_at(i).start2
                     elif not line.startswith('-'):
                         delta += 1
 
@@ -1164,8 +1281,7 @@ def find_line_number_of_relevant_line_in_file(diff_files: List[FilePatchInfo],
                 for i, line in enumerate(patch_lines):
                     if line.startswith('@@'):
                         delta = 0
-                        match = re_hunk_header.match(line)
-                        start1, size1, start2, size2 = map(int, match.groups()[:4])
+                        start2 = parsed_patch.hunk_at(i).start2
                     elif not line.startswith('-'):
                         delta += 1
 
@@ -1179,8 +1295,7 @@ def find_line_number_of_relevant_line_in_file(diff_files: List[FilePatchInfo],
                     for i, line in enumerate(patch_lines):
                         if line.startswith('@@'):
                             delta = 0
-                            match = re_hunk_header.match(line)
-                            start1, size1, start2, size2 = map(int, match.groups()[:4])
+                            start2 = parsed_patch.hunk_at(i).start2
                         elif not line.startswith('-'):
                             delta += 1
 
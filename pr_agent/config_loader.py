@@ -1,8 +1,12 @@
+import copy
 from os.path import abspath, dirname, join
 from pathlib import Path
-from typing import Optional
+from typing import List, Optional, Tuple
 
 from dynaconf import Dynaconf
+from dynaconf.utils import object_merge
+from dynaconf.utils.boxing import DynaBox
+from dynaconf.utils.parse_conf import parse_conf_data
 from starlette_context import context
 
 PR_AGENT_TOML_KEY = 'pr-agent'
@@ -37,6 +41,141 @@ global_settings = Dynaconf(
 )
 
 
+_UNSET = object()
+
+
+class LayeredSettings:
+    """
+    Copy-on-write view of a base settings object, for one request: the servers set one in the request context
+    instead of a deep copy of 'global_settings', which holds all the prompts.
+
+    The base is never modified. A top-level key (a section, e.g. 'config', or a value) is copied into the
+    overlay of the request the first time it is written, or read as a section or a list, since the object read may be
+    mutated in place (e.g. 'get_settings().config.model = ...'). Reads of other values go straight to the base.
+    Writes follow the Dynaconf semantics: dotted keys set a nested value, dicts are merged into existing ones, and
+    top-level values are merged unless 'merge=False'.
+    """
+
+    def __init__(self, base: Dynaconf):
+        object.__setattr__(self, "_base", base)
+        object.__setattr__(self, "_overlay", {})  # upper-case top-level key -> value of this request, or _UNSET
+
+    @staticmethod
+    def _split_key(key: str) -> Tuple[str, List[str]]:
+        parts = key.replace("__", ".").split(".")
+        return parts[0].strip().upper(), parts[1:]
+
+    def _own(self, top_key: str):
+        """
+        The overlay value of a top-level key, copied from the base on first use.
+        """
+        if top_key not in self._overlay:
+            value = self._base.get(top_key, _UNSET)
+            self._overlay[top_key] = copy.deepcopy(value) if value is not _UNSET else _UNSET
+        return self._overlay[top_key]
+
+    def get(self, key: str, default=None):
+        top_key, path = self._split_key(key)
+        if top_key in self._overlay:
+            value = self._overlay[top_key]
+        else:
+            value = self._base.get(top_key, _UNSET)
+        if value is _UNSET:
+            return default
+        for part in path:
+            if not isinstance(value, dict):
+                return default
+            value = value.get(part, _UNSET)
+            if value is _UNSET:
+                return default
+        if isinstance(value, (dict, list)) and top_key not in self._overlay:
+            return self.get(key, default) if self._own(top_key) is not _UNSET else default
+        return value
+
+    def set(self, key: str, value, tomlfy: bool = False, merge=None, **kwargs):
+        top_key, path = self._split_key(key)
+        parsed = parse_conf_data(value, tomlfy=tomlfy, box_settings=self._base)
+        existing = self._own(top_key)
+        if not path:
+            if merge is not False and existing is not _UNSET and existing is not None and existing != parsed and \
+                    (merge or self._base.get("MERGE_ENABLED_FOR_DYNACONF", False)):
+                parsed = object_merge(existing, parsed)
+            if isinstance(parsed, dict) and not isinstance(parsed, DynaBox):
+                parsed = DynaBox(parsed, box_settings=self._base)
+            self._overlay[top_key] = parsed
+            return
+        if not isinstance(existing, dict):
+            existing = self._overlay[top_key] = DynaBox({}, box_settings=self._base)
+        parent = existing
+        for part in path[:-1]:
+            part = self._find_key(parent, part)
+            if not isinstance(parent.get(part), dict):
+                parent[part] = DynaBox({}, box_settings=self._base)
+            parent = parent[part]
+        leaf = self._find_key(parent, path[-1])
+        if isinstance(parsed, dict) and isinstance(parent.get(leaf), dict):
+            parsed = object_merge(parent[leaf], parsed)
+        parent[leaf] = parsed
+
+    @staticmethod
+    def _find_key(section: dict, key: str) -> str:
+        """
+        The existing spelling of a key in a section (Dynaconf keys are case-insensitive), or 'key' if it is new.
+        """
+        for candidate in (key, key.lower(), key.upper()):
+            if candidate in section:
+                return candidate
+        return key
+
+    def unset(self, key: str, **kwargs):
+        top_key, _ = self._split_key(key)
+        self._overlay[top_key] = _UNSET
+
+    def as_dict(self, **kwargs) -> dict:
+        data = self._base.as_dict(**kwargs)
+        for top_key, value in self._overlay.items():
+            if value is _UNSET:
+                data.pop(top_key, None)
+            else:
+                data[top_key] = value.to_dict() if isinstance(value, DynaBox) else copy.deepcopy(value)
+        return data
+
+    to_dict = as_dict
+
+    def find_file(self, *args, **kwargs):
+        return self._base.find_file(*args, **kwargs)
+
+    def __getattr__(self, name: str):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        value = self.get(name, _UNSET)
+        if value is _UNSET:
+            raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name.upper()}'")
+        return value
+
+    def __setattr__(self, name: str, value):
+        self.set(name, value)
+
+    def __getitem__(self, key: str):
+        value = self.get(key, _UNSET)
+        if value is _UNSET:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: str, value):
+        self.set(key, value)
+
+    def __contains__(self, key) -> bool:
+        if isinstance(key, str) and key.upper() in self._overlay:
+            return self._overlay[key.upper()] is not _UNSET
+        return key in self._base
+
+    def __iter__(self):
+        keys = [key for key in self._base if self._overlay.get(key) is not _UNSET]
+        keys += [key for key, value in self._overlay.items() if value is not _UNSET and key not in keys]
+        return iter(keys)
+
+
 def get_settings(use_context=False):
     """
     Retrieves the current settings.
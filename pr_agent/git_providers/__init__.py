@@ -13,6 +13,8 @@ from pr_agent.git_providers.github_provider import GithubProvider
 from pr_agent.git_providers.gitlab_provider import GitLabProvider
 from pr_agent.git_providers.local_git_provider import LocalGitProvider
 from pr_agent.git_providers.gitea_provider import GiteaProvider
+from pr_agent.git_providers.provider_cache import (GitProviderCache,
+                                                   get_git_provider_cache)
 
 _GIT_PROVIDERS = {
     'github': GithubProvider,
@@ -40,6 +42,7 @@ def get_git_provider():
 def get_git_provider_with_context(pr_url) -> GitProvider:
     """
     Get a GitProvider instance for the given PR URL. If the GitProvider instance is already in the context, return it.
+    Otherwise, in a context environment, a provider of the PR cached by the worker is reused (see provider_cache.py).
     """
 
     is_context_env = None
@@ -48,20 +51,21 @@ def get_git_provider_with_context(pr_url) -> GitProvider:
     except Exception:
         pass  # we are not in a context environment (CLI)
 
-    # check if context["git_provider"]["pr_url"] exists
-    if is_context_env and context.get("git_provider", {}).get("pr_url", {}):
-        git_provider = context["git_provider"]["pr_url"]
-        # possibly check if the git_provider is still valid, or if some reset is needed
-        # ...
-        return git_provider
-    else:
-        try:
-            provider_id = get_settings().config.git_provider
-            if provider_id not in _GIT_PROVIDERS:
-                raise ValueError(f"Unknown git provider: {provider_id}")
+    if is_context_env and pr_url in context.get("git_provider", {}):
+        return context["git_provider"][pr_url]
+    try:
+        provider_id = get_settings().config.git_provider
+        if provider_id not in _GIT_PROVIDERS:
+            raise ValueError(f"Unknown git provider: {provider_id}")
+        # providers are shared across the requests of a worker only in a context environment (servers)
+        provider_cache = get_git_provider_cache() if is_context_env and GitProviderCache.is_enabled() else None
+        git_provider = provider_cache.get(provider_id, pr_url) if provider_cache else None
+        if git_provider is None:
             git_provider = _GIT_PROVIDERS[provider_id](pr_url)
-            if is_context_env:
-                context["git_provider"] = {pr_url: git_provider}
-            return git_provider
-        except Exception as e:
-            raise ValueError(f"Failed to get git provider for {pr_url}") from e
+            if provider_cache:
+                git_provider = provider_cache.set(provider_id, pr_url, git_provider)
+        if is_context_env:
+            context["git_provider"] = {**context.get("git_provider", {}), pr_url: git_provider}
+        return git_provider
+    except Exception as e:
+        raise ValueError(f"Failed to get git provider for {pr_url}") from e
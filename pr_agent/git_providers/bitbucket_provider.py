@@ -1,4 +1,5 @@
 import difflib
+import functools
 import json
 import re
 from typing import Optional, Tuple
@@ -294,19 +295,24 @@ class BitbucketProvider(GitProvider):
                 invalid_files_names.append(file_path)
                 continue
 
+            base_file_loader = head_file_loader = None
             try:
                 counter_valid += 1
                 if get_settings().get("bitbucket_app.avoid_full_files", False):
                     original_file_content_str = ""
                     new_file_content_str = ""
                 elif counter_valid < MAX_FILES_ALLOWED_FULL // 2:  # factor 2 because bitbucket has limited API calls
+                    # fetched on first access, so files that are dropped for budget reasons are never downloaded
                     if diff.old.get_data("links"):
-                        original_file_content_str = self._get_pr_file_content(
-                            diff.old.get_data("links")['self']['href'])
+                        original_file_content_str = None
+                        base_file_loader = functools.partial(self._get_pr_file_content,
+                                                             diff.old.get_data("links")['self']['href'])
                     else:
                         original_file_content_str = ""
                     if diff.new.get_data("links"):
-                        new_file_content_str = self._get_pr_file_content(diff.new.get_data("links")['self']['href'])
+                        new_file_content_str = None
+                        head_file_loader = functools.partial(self._get_pr_file_content,
+                                                             diff.new.get_data("links")['self']['href'])
                     else:
                         new_file_content_str = ""
                 else:
@@ -319,12 +325,15 @@ class BitbucketProvider(GitProvider):
                 get_logger().exception(f"Error - bitbucket failed to get file content, error: {e}")
                 original_file_content_str = ""
                 new_file_content_str = ""
+                base_file_loader = head_file_loader = None
 
             file_patch_canonic_structure = FilePatchInfo(
                 original_file_content_str,
                 new_file_content_str,
                 diff_split[index],
                 file_path,
+                base_file_loader=base_file_loader,
+                head_file_loader=head_file_loader,
             )
 
             if diff.data['status'] == 'added':
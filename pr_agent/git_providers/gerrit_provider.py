@@ -14,6 +14,8 @@ from git import Repo
 
 from pr_agent.algo.types import EDIT_TYPE, FilePatchInfo
 from pr_agent.config_loader import get_settings
+from pr_agent.git_providers.git_mirror import (GitMirror, GitMirrorCache,
+                                               get_git_mirror_cache)
 from pr_agent.git_providers.git_provider import GitProvider
 from pr_agent.git_providers.local_git_provider import PullRequestMimic
 from pr_agent.log import get_logger
@@ -99,14 +101,23 @@ def list_comments(url: urllib3.util.Url, refspec):
     return json.loads(change_set)["currentPatchSet"]["comments"]
 
 
-def prepare_repo(url: urllib3.util.Url, project, refspec):
+def prepare_repo(url: urllib3.util.Url, project, refspec, mirror_cache: GitMirrorCache = None):
+    """
+    Checks out 'refspec' into a new temporary directory. Returns the directory, and the git mirror backing it
+    (None when 'mirror_cache' is not given or the mirror could not be updated, in which case the repo is cloned).
+    """
     repo_url = (f"{url.scheme}://{url.auth}@{url.host}:{url.port}/{project}")
 
     directory = pathlib.Path(mkdtemp())
+    mirror = mirror_cache.get_mirror(repo_url, [refspec]) if mirror_cache else None
+    if mirror:
+        get_logger().info("Checking out %s from the git mirror", refspec)
+        mirror.add_worktree(directory, GitMirror.local_ref(refspec))
+        return directory, mirror
     clone(repo_url, directory)
     fetch(repo_url, refspec, cwd=directory)
     checkout(cwd=directory)
-    return directory
+    return directory, None
 
 
 def adopt_to_gerrit_message(message):
@@ -188,18 +199,24 @@ class GerritProvider(GitProvider):
             f"{parsed.scheme}://{user}@{parsed.host}:{parsed.port}"
         )
 
-        self.repo_path = prepare_repo(
-            self.parsed_url, self.project, self.refspec
+        self.repo_path, self._git_mirror = prepare_repo(
+            self.parsed_url, self.project, self.refspec, get_git_mirror_cache()
         )
         self.repo = Repo(self.repo_path)
         assert self.repo
+        if self._git_mirror:
+            # blobs not checked out (e.g. of the parent commit) are fetched from the remote when first read
+            self.repo.git.update_environment(**self._git_mirror.credentials_env)
         self.pr_url = base_url
         self.pr = PullRequestMimic(self.get_pr_title(), self.get_diff_files())
 
     def get_pr_title(self):
         """
-        Substitutes the branch-name as the PR-mimic title.
+        Substitutes the branch-name as the PR-mimic title, or the refspec for a checkout of the git mirror, which
+        has no local branch.
         """
+        if not self.repo.branches:
+            return self.refspec
         return self.repo.branches[0].name
 
     def get_issue_comments(self):
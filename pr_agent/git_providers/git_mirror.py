@@ -0,0 +1,339 @@
+"""
+Local bare mirrors of remote repositories, used as a content source for file reads and clones.
+
+Each mirror is a blobless partial clone ('--filter=blob:none'): commits and trees arrive with the fetched PR refs,
+and git fetches a blob from the remote the first time it is read, then keeps it on disk for later reads.
+"""
+from __future__ import annotations
+
+import base64
+import contextlib
+import fcntl
+import hashlib
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+from threading import Lock
+from typing import Optional
+from urllib.parse import unquote, urlsplit, urlunsplit
+
+from pr_agent.algo.inflight_runs import raise_if_superseded
+from pr_agent.config_loader import get_settings
+from pr_agent.log import get_logger
+
+# fetched refs are stored under this prefix, e.g. 'refs/pull/1/head' -> 'refs/pr-agent/pull/1/head'
+MIRROR_REF_PREFIX = "refs/pr-agent/"
+
+
+def _git_env(credentials_env: dict = None) -> dict:
+    return {**os.environ, "GIT_TERMINAL_PROMPT": "0", **(credentials_env or {})}
+
+
+def _run_git(*args, cwd: str = None, timeout: int = None, credentials_env: dict = None) -> str:
+    res = subprocess.run(["git", *args], cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True,
+                         timeout=timeout, env=_git_env(credentials_env))
+    return res.stdout.decode()
+
+
+def _strip_credentials(url: str) -> str:
+    parts = urlsplit(url)
+    if not parts.hostname:
+        return url
+    netloc = parts.hostname if parts.port is None else f"{parts.hostname}:{parts.port}"
+    return urlunsplit((parts.scheme, netloc, parts.path, parts.query, parts.fragment))
+
+
+def _split_credentials(url: str) -> tuple[str, dict]:
+    """
+    Splits an http(s) url embedding credentials into the url without them, and the environment that passes them to
+    a git command as an 'http.extraHeader' (through GIT_CONFIG_COUNT, so they are neither stored in the mirror's
+    config nor visible in the process list). Other urls (e.g. ssh, where the user is not a secret) are kept as is.
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not (parts.username or parts.password):
+        return url, {}
+    user_pass = f"{unquote(parts.username or '')}:{unquote(parts.password or '')}"
+    basic_auth = base64.b64encode(user_pass.encode("utf-8")).decode("ascii")
+    return _strip_credentials(url), {"GIT_CONFIG_COUNT": "1",
+                                     "GIT_CONFIG_KEY_0": "http.extraHeader",
+                                     "GIT_CONFIG_VALUE_0": f"Authorization: Basic {basic_auth}"}
+
+
+def _lock_file(path: str, operation: int, timeout: float) -> Optional[int]:
+    """
+    Opens 'path' and applies flock 'operation' to it, retrying until 'timeout' seconds have passed.
+    Returns the file descriptor holding the lock, or None on timeout.
+    """
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            fcntl.flock(fd, operation | fcntl.LOCK_NB)
+            return fd
+        except BlockingIOError:
+            if time.monotonic() >= deadline:
+                os.close(fd)
+                return None
+            time.sleep(0.1)
+
+
+def _mirror_size(path: str) -> int:
+    """
+    The disk usage of a mirror's objects, as counted by git (without walking the object directories).
+    """
+    stats = dict(line.split(": ", 1) for line in _run_git("count-objects", "-v", cwd=path).splitlines())
+    return sum(int(stats.get(name, 0)) for name in ("size", "size-pack", "size-garbage")) * 1024
+
+
+class GitMirror:
+    """
+    A bare mirror of one remote repository. While the object is alive it holds a shared lock on the mirror,
+    so the mirror is not evicted while in use. 'credentials_env' authenticates the blobs fetched on demand, also by
+    the git commands run on worktrees of the mirror (e.g. through GitPython, see 'credentials_env').
+    """
+
+    def __init__(self, path: str, use_lock_fd: int, credentials_env: dict = None, read_timeout: int = None):
+        self.path = path
+        self._use_lock_fd = use_lock_fd
+        self._credentials_env = credentials_env or {}
+        self.read_timeout = read_timeout
+        self._known_revs = set()
+
+    @property
+    def credentials_env(self) -> dict:
+        """
+        The environment variables to set for any git command run on the mirror or on one of its worktrees, since
+        reading a blob that is not on disk yet fetches it from the remote.
+        """
+        return dict(self._credentials_env)
+
+    def __del__(self):
+        self.close()
+
+    def close(self):
+        if self._use_lock_fd is not None:
+            os.close(self._use_lock_fd)
+            self._use_lock_fd = None
+
+    @staticmethod
+    def local_ref(ref: str) -> str:
+        """
+        The name under which a fetched remote ref is stored in the mirror.
+        """
+        return MIRROR_REF_PREFIX + ref.removeprefix("refs/")
+
+    def has_revision(self, rev: str) -> bool:
+        if rev in self._known_revs:
+            return True
+        try:
+            _run_git("rev-parse", "--verify", "--quiet", f"{rev}^{{commit}}", cwd=self.path)
+        except subprocess.CalledProcessError:
+            return False
+        self._known_revs.add(rev)
+        return True
+
+    def read_file(self, rev: str, file_path: str) -> Optional[str]:
+        """
+        Returns the content of 'file_path' at 'rev', or "" if the file does not exist there or is not text.
+        Returns None if 'rev' is not in the mirror or the read failed, so the caller can fall back to the API.
+        """
+        if not self.has_revision(rev):
+            return None
+        try:
+            res = subprocess.run(["git", "cat-file", "blob", f"{rev}:{file_path}"], cwd=self.path,
+                                 stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True,
+                                 timeout=self.read_timeout, env=_git_env(self._credentials_env))
+        except subprocess.CalledProcessError as e:
+            if b"does not exist in" in e.stderr:
+                return ""
+            get_logger().warning(f"Failed to read {file_path} at {rev} from the git mirror: "
+                                 f"{e.stderr.decode(errors='replace').strip()}")
+            return None
+        except Exception as e:  # e.g. a timed out fetch of the blob
+            get_logger().warning(f"Failed to read {file_path} at {rev} from the git mirror: {e}")
+            return None
+        try:
+            return res.stdout.decode()
+        except UnicodeDecodeError:
+            return ""
+
+    def merge_base(self, rev1: str, rev2: str) -> Optional[str]:
+        try:
+            return _run_git("merge-base", rev1, rev2, cwd=self.path).strip() or None
+        except subprocess.CalledProcessError:
+            return None
+
+    def add_worktree(self, dest_folder: str, rev: str, timeout: int = None):
+        """
+        Checks out 'rev' into 'dest_folder' (which must not exist or be empty), sharing the mirror's objects.
+        """
+        _run_git("worktree", "add", "--detach", str(dest_folder), rev, cwd=self.path, timeout=timeout,
+                 credentials_env=self._credentials_env)
+
+
+class GitMirrorCache:
+    """
+    A directory of bare mirrors, one per remote repository. Fetches into a mirror are serialized with a per-repo
+    lock file (shared across processes), and when the directory grows beyond 'max_size_bytes', the least recently
+    used mirrors that are not in use are evicted. The size of each mirror is recorded after each fetch into it.
+    """
+
+    def __init__(self, cache_dir: str, max_size_bytes: int, fetch_timeout: int = 300, lock_timeout: int = 120,
+                 read_timeout: int = 60):
+        self.cache_dir = cache_dir
+        self.max_size_bytes = max_size_bytes
+        self.fetch_timeout = fetch_timeout
+        self.lock_timeout = lock_timeout
+        self.read_timeout = read_timeout
+        self._evict_lock = Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _mirror_paths(self, key: str) -> tuple[str, str, str]:
+        base = os.path.join(self.cache_dir, key)
+        return f"{base}.git", f"{base}.fetch.lock", f"{base}.use.lock"
+
+    def _size_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.size")
+
+    def _read_size(self, key: str) -> int:
+        try:
+            with open(self._size_path(key)) as f:
+                return int(f.read())
+        except (FileNotFoundError, ValueError):  # a mirror being created, or of an earlier version
+            path, _, _ = self._mirror_paths(key)
+            try:
+                return _mirror_size(path)
+            except Exception:
+                return 0
+
+    def _write_size(self, key: str, size: int):
+        tmp_path = f"{self._size_path(key)}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(str(size))
+        os.replace(tmp_path, self._size_path(key))
+
+    def get_mirror(self, remote_url: str, refs: list[str]) -> Optional[GitMirror]:
+        """
+        Returns the mirror of 'remote_url', with 'refs' fetched into it (see GitMirror.local_ref), or None on failure.
+        'remote_url' may embed credentials; they are passed to each git command instead of being stored in the mirror,
+        and are not part of the mirror identity.
+        Raises RunSuperseded instead of fetching for a run known to be of an outdated commit (see inflight_runs.py).
+        """
+        raise_if_superseded()
+        remote_url, credentials_env = _split_credentials(remote_url)
+        key = hashlib.sha256(_strip_credentials(remote_url).encode("utf-8")).hexdigest()[:32]
+        path, fetch_lock_path, use_lock_path = self._mirror_paths(key)
+
+        use_lock_fd = _lock_file(use_lock_path, fcntl.LOCK_SH, self.lock_timeout)
+        if use_lock_fd is None:
+            get_logger().warning(f"Timed out waiting for the git mirror lock: {use_lock_path}")
+            return None
+        fetch_lock_fd = _lock_file(fetch_lock_path, fcntl.LOCK_EX, self.lock_timeout)
+        if fetch_lock_fd is None:
+            os.close(use_lock_fd)
+            get_logger().warning(f"Timed out waiting for the git mirror lock: {fetch_lock_path}")
+            return None
+        try:
+            start_time = time.perf_counter()
+            self._init_mirror(path, remote_url)
+            refspecs = [f"+{ref}:{GitMirror.local_ref(ref)}" for ref in refs]
+            _run_git("fetch", "--quiet", "--no-tags", "--filter=blob:none", "origin", *refspecs, cwd=path,
+                     timeout=self.fetch_timeout, credentials_env=credentials_env)
+            _run_git("worktree", "prune", cwd=path)  # worktrees of finished clones
+            self._write_size(key, _mirror_size(path))
+            os.utime(use_lock_path)  # mark as recently used
+            get_logger().info(f"Updated git mirror in {time.perf_counter() - start_time:.2f} seconds")
+        except Exception as e:
+            get_logger().warning(f"Failed to update git mirror: {e}")
+            os.close(use_lock_fd)
+            return None
+        finally:
+            os.close(fetch_lock_fd)
+
+        self._evict(exclude=path)
+        return GitMirror(path, use_lock_fd, credentials_env, read_timeout=self.read_timeout)
+
+    @staticmethod
+    def _init_mirror(path: str, remote_url: str):
+        if not os.path.isdir(path):
+            tmp_path = tempfile.mkdtemp(dir=os.path.dirname(path), suffix=".tmp")
+            _run_git("init", "--quiet", "--bare", tmp_path)
+            _run_git("config", "core.repositoryformatversion", "1", cwd=tmp_path)
+            _run_git("config", "extensions.partialClone", "origin", cwd=tmp_path)
+            _run_git("config", "remote.origin.url", remote_url, cwd=tmp_path)
+            _run_git("config", "remote.origin.promisor", "true", cwd=tmp_path)
+            _run_git("config", "remote.origin.partialclonefilter", "blob:none", cwd=tmp_path)
+            os.rename(tmp_path, path)
+        else:
+            # also drops the credentials that mirrors created by earlier versions stored in their url
+            _run_git("config", "remote.origin.url", remote_url, cwd=path)
+
+    def _evict(self, exclude: str):
+        with self._evict_lock:
+            mirrors = []
+            total_size = 0
+            for entry in os.scandir(self.cache_dir):
+                if not entry.name.endswith(".git"):
+                    continue
+                key = entry.name[:-len(".git")]
+                _, _, use_lock_path = self._mirror_paths(key)
+                try:
+                    last_used = os.stat(use_lock_path).st_mtime
+                except FileNotFoundError:
+                    last_used = 0
+                size = self._read_size(key)
+                mirrors.append((last_used, size, key))
+                total_size += size
+            if total_size <= self.max_size_bytes:
+                return
+            for _, size, key in sorted(mirrors):
+                path, fetch_lock_path, use_lock_path = self._mirror_paths(key)
+                if path == exclude:
+                    continue
+                # a mirror that is being fetched into or used elsewhere is not evicted
+                use_lock_fd = _lock_file(use_lock_path, fcntl.LOCK_EX, 0)
+                if use_lock_fd is None:
+                    continue
+                try:
+                    fetch_lock_fd = _lock_file(fetch_lock_path, fcntl.LOCK_EX, 0)
+                    if fetch_lock_fd is None:
+                        continue
+                    try:
+                        shutil.rmtree(path, ignore_errors=True)
+                        with contextlib.suppress(FileNotFoundError):
+                            os.remove(self._size_path(key))
+                    finally:
+                        os.close(fetch_lock_fd)
+                finally:
+                    os.close(use_lock_fd)
+                get_logger().info(f"Evicted git mirror {key} ({size} bytes)")
+                total_size -= size
+                if total_size <= self.max_size_bytes:
+                    break
+
+
+_git_mirror_cache = None
+_git_mirror_cache_lock = Lock()
+
+
+def get_git_mirror_cache() -> Optional[GitMirrorCache]:
+    """
+    Returns the process-wide git mirror cache, or None if mirrors are disabled.
+    """
+    global _git_mirror_cache
+    if not get_settings().get("git_mirror.enable", False):
+        return None
+    if _git_mirror_cache is None:
+        with _git_mirror_cache_lock:
+            if _git_mirror_cache is None:
+                cache_dir = get_settings().get("git_mirror.cache_dir", "") or os.path.join(tempfile.gettempdir(),
+                                                                                         "pr_agent_git_mirrors")
+                _git_mirror_cache = GitMirrorCache(
+                    cache_dir,
+                    int(get_settings().get("git_mirror.max_disk_mb", 10240) * 1024 * 1024),
+                    fetch_timeout=get_settings().get("git_mirror.fetch_timeout_seconds", 300),
+                    lock_timeout=get_settings().get("git_mirror.lock_timeout_seconds", 120),
+                    read_timeout=get_settings().get("git_mirror.read_timeout_seconds", 60))
+    return _git_mirror_cache
@@ -1,3 +1,4 @@
+import copy
 from abc import ABC, abstractmethod
 # enum EDIT_TYPE (ADDED, DELETED, MODIFIED, RENAMED)
 import os
@@ -8,6 +9,7 @@ from typing import Optional, Tuple
 from pr_agent.algo.types import FilePatchInfo
 from pr_agent.algo.utils import Range, process_description
 from pr_agent.config_loader import get_settings
+from pr_agent.git_providers.git_mirror import GitMirror, get_git_mirror_cache
 from pr_agent.log import get_logger
 
 MAX_FILES_ALLOWED_FULL = 50
@@ -38,8 +40,9 @@ class GitProvider(ABC):
     #            print(returned_obj.path) #Use returned_obj.path.
     #    #From this point, returned_obj.path may be deleted at any point and therefore must not be used.
     class ScopedClonedRepo(object):
-        def __init__(self, dest_folder):
+        def __init__(self, dest_folder, mirror: GitMirror = None):
             self.path = dest_folder
+            self.mirror = mirror  # keeps the mirror that backs a worktree clone from being evicted
 
         def __del__(self):
             if self.path and os.path.exists(self.path):
@@ -78,8 +81,17 @@ class GitProvider(ABC):
         try:
             if remove_dest_folder and os.path.exists(dest_folder) and os.path.isdir(dest_folder):
                 shutil.rmtree(dest_folder)
-            self._clone_inner(clone_url, dest_folder, operation_timeout_in_seconds)
-            returned_obj = GitProvider.ScopedClonedRepo(dest_folder)
+            mirror = None
+            mirror_cache = get_git_mirror_cache()
+            # providers that customize the clone command (e.g. to pass credentials as headers) keep using it
+            if mirror_cache and type(self)._clone_inner is GitProvider._clone_inner:
+                mirror = mirror_cache.get_mirror(clone_url, ["HEAD"])
+            if mirror:
+                # a checkout of the local mirror: only blobs missing from the mirror are downloaded
+                mirror.add_worktree(dest_folder, GitMirror.local_ref("HEAD"), operation_timeout_in_seconds)
+            else:
+                self._clone_inner(clone_url, dest_folder, operation_timeout_in_seconds)
+            returned_obj = GitProvider.ScopedClonedRepo(dest_folder, mirror)
         except Exception as e:
             get_logger().exception(f"Clone failed: Could not clone url.",
                 artifact={"error": str(e), "url": clone_url, "dest_folder": dest_folder})
@@ -94,6 +106,41 @@ class GitProvider(ABC):
     def get_diff_files(self) -> list[FilePatchInfo]:
         pass
 
+    def get_diff_revision(self) -> Optional[Tuple[str, str, str]]:
+        """
+        Returns a (repo, base sha, head sha) triplet that uniquely identifies the diff returned by 'get_diff_files',
+        or None if it cannot be determined. Used as the key for caching rendered diff artifacts.
+        """
+        return None
+
+    def prefetch_diff_files_content(self, diff_files: list[FilePatchInfo]) -> None:
+        """
+        Loads the base/head contents of 'diff_files' ahead of their first access, so that providers which support it
+        can fetch them concurrently or in bulk. By default the contents are loaded one by one when first accessed.
+        """
+        return
+
+    def _get_mirror_source(self) -> Optional[Tuple[str, list[str]]]:
+        """
+        Returns the (clone url with credentials, refs of the PR) pair used to mirror the PR repository locally,
+        or None if the provider does not support git mirrors.
+        """
+        return None
+
+    def get_git_mirror(self) -> Optional[GitMirror]:
+        """
+        Returns a local mirror of the PR repository with the PR refs fetched, or None if 'git_mirror.enable' is off
+        or the mirror could not be updated. The mirror is prepared once per provider instance.
+        """
+        if not hasattr(self, '_git_mirror'):
+            self._git_mirror = None
+            mirror_cache = get_git_mirror_cache()
+            mirror_source = self._get_mirror_source() if mirror_cache else None
+            if mirror_source:
+                clone_url, refs = mirror_source
+                self._git_mirror = mirror_cache.get_mirror(clone_url, refs)
+        return self._git_mirror
+
     def get_incremental_commits(self, is_incremental):
         pass
 
@@ -327,6 +374,19 @@ class GitProvider(ABC):
     def calc_pr_statistics(self, pull_request_data: dict):
         return {}
 
+    # Reuse across requests (see provider_cache.py). A provider that implements get_pr_revision() is cached per worker:
+    # it returns '<head sha>:<base sha>' of the PR it holds, or None if it can't be reused.
+    def get_pr_revision(self) -> Optional[str]:
+        return None
+
+    # Refreshes the PR data before a reuse (a conditional request where supported). Returns whether the PR changed.
+    def revalidate_pr(self) -> bool:
+        return True
+
+    # The provider handed to a new request. The copy shares the client and the PR objects, not the per-request state.
+    def copy_for_request(self) -> 'GitProvider':
+        return copy.copy(self)
+
     def get_num_of_files(self):
         try:
             return len(self.get_diff_files())
@@ -1,3 +1,4 @@
+import functools
 import hashlib
 import json
 from typing import Any, Dict, List, Optional, Set, Tuple
@@ -85,7 +86,6 @@ class GiteaProvider(GitProvider):
             self.git_files = filter_ignored(self.git_files, platform="gitea")
 
             self.sha = self.pr.head.sha if self.pr.head.sha else ""
-            self.__add_file_content()
             self.__add_file_diff()
             self.pr_commits = self.repo_api.list_all_commits(
                 owner=self.owner,
@@ -101,13 +101,10 @@ class GiteaProvider(GitProvider):
         else:
             self.pr_commits = None
 
-    def __add_file_content(self):
-        for file in self.git_files:
-            file_path = file.get("filename")
-            # Ignore file from default settings
-            if not is_valid_file(file_path):
-                continue
-
+    def _get_head_file_content(self, file_path: str) -> str:
+        # fetched on first access and cached, so files that are dropped for budget reasons are never downloaded
+        if file_path not in self.file_contents:
+            content = ""
             if file_path and self.sha:
                 try:
                     content = self.repo_api.get_file_content(
@@ -116,10 +113,10 @@ class GiteaProvider(GitProvider):
                         commit_sha=self.sha,
                         filepath=file_path
                     )
-                    self.file_contents[file_path] = content
                 except ApiException as e:
                     self.logger.error(f"Error getting file content for {file_path}: {str(e)}")
-                    self.file_contents[file_path] = ""
+            self.file_contents[file_path] = content
+        return self.file_contents[file_path]
 
     def __add_file_diff(self):
         try:
@@ -456,11 +453,13 @@ class GiteaProvider(GitProvider):
                 if counter_valid == MAX_FILES_ALLOWED_FULL:
                     self.logger.info("Too many files in PR, will avoid loading full content for rest of files")
 
+            base_file_loader = head_file_loader = None
             if avoid_load:
                 head_file = ""
             else:
-                # Get file content from this pr
-                head_file = self.file_contents.get(filename,"")
+                # Get file content from this pr, on first access
+                head_file = None
+                head_file_loader = functools.partial(self._get_head_file_content, filename)
 
             if self.incremental.is_incremental and self.unreviewed_files_set:
                 base_file = self._get_file_content_from_latest_commit(filename)
@@ -469,7 +468,8 @@ class GiteaProvider(GitProvider):
                 if avoid_load:
                     base_file = ""
                 else:
-                    base_file = self._get_file_content_from_base(filename)
+                    base_file = None
+                    base_file_loader = functools.partial(self._get_file_content_from_base, filename)
 
             num_plus_lines = file.get("additions",0)
             num_minus_lines = file.get("deletions",0)
@@ -494,7 +494,9 @@ class GiteaProvider(GitProvider):
                 filename=filename,
                 num_minus_lines=num_minus_lines,
                 num_plus_lines=num_plus_lines,
-                edit_type=edit_type
+                edit_type=edit_type,
+                base_file_loader=base_file_loader,
+                head_file_loader=head_file_loader
             )
             diff_files.append(file_patch_info)
 
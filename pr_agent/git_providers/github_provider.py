@@ -1,11 +1,14 @@
 import copy
 import difflib
+import functools
 import hashlib
 import itertools
 import re
+import threading
 import time
 import traceback
 import json
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from typing import Optional, Tuple
 from urllib.parse import urlparse
@@ -16,7 +19,6 @@ from retry import retry
 from starlette_context import context
 
 from ..algo.file_filter import filter_ignored
-from ..algo.git_patch_processing import extract_hunk_headers
 from ..algo.language_handler import is_valid_file
 from ..algo.types import EDIT_TYPE
 from ..algo.utils import (PRReviewHeader, Range, clip_tokens,
@@ -28,6 +30,11 @@ from ..servers.utils import RateLimitExceeded
 from .git_provider import (MAX_FILES_ALLOWED_FULL, FilePatchInfo, GitProvider,
                            IncrementalPR)
 
+# requests left for the rest of the flow (comments, labels, ...) when deciding whether to fetch contents in bulk
+FETCH_RATE_LIMIT_RESERVE = 100
+# number of blobs requested in a single GraphQL query when 'github.content_fetch_mode' is "graphql"
+GRAPHQL_CONTENT_BATCH_SIZE = 50
+
 
 class GithubProvider(GitProvider):
     def __init__(self, pr_url: Optional[str] = None):
@@ -46,6 +53,7 @@ class GithubProvider(GitProvider):
         self.issue_main = None
         self.github_user_id = None
         self.diff_files = None
+        self._merge_base_sha = None
         self.git_files = None
         self.incremental = IncrementalPR(False)
         if pr_url and 'pull' in pr_url:
@@ -149,6 +157,28 @@ class GithubProvider(GitProvider):
         self.repo, self.pr_num = self._parse_pr_url(pr_url)
         self.pr = self._get_pr()
 
+    def get_pr_revision(self) -> Optional[str]:
+        if self.pr is None:
+            return None
+        return f"{self.pr.head.sha}:{self.pr.base.sha}"
+
+    def revalidate_pr(self) -> bool:
+        # conditional request with the ETag of the PR: a '304 Not Modified' answer does not count against the rate limit
+        return self.pr.update()
+
+    def copy_for_request(self) -> 'GithubProvider':
+        provider = copy.copy(self)
+        # the per-request state is reset, or copied when it is read from the shared PR, so that requests sharing the
+        # cached provider never modify each other's state
+        provider.diff_files = None
+        provider.git_files = None
+        provider.pr_commits = list(self.pr_commits) if self.pr_commits is not None else None
+        provider.incremental = IncrementalPR(False)
+        provider.unreviewed_files_set = dict()
+        provider.comments = None
+        provider.previous_review = None
+        return provider
+
     def _get_incremental_commits(self):
         if not self.pr_commits:
             self.pr_commits = list(self.pr.get_commits())
@@ -256,22 +286,6 @@ class GithubProvider(GitProvider):
             invalid_files_names = []
             is_close_to_rate_limit = False
 
-            # The base.sha will point to the current state of the base branch (including parallel merges), not the original base commit when the PR was created
-            # We can fix this by finding the merge base commit between the PR head and base branches
-            # Note that The pr.head.sha is actually correct as is - it points to the latest commit in your PR branch.
-            # This SHA isn't affected by parallel merges to the base branch since it's specific to your PR's branch.
-            repo = self.repo_obj
-            pr = self.pr
-            try:
-                compare = repo.compare(pr.base.sha, pr.head.sha) # communication with GitHub
-                merge_base_commit = compare.merge_base_commit
-            except Exception as e:
-                get_logger().error(f"Failed to get merge base commit: {e}")
-                merge_base_commit = pr.base
-            if merge_base_commit.sha != pr.base.sha:
-                get_logger().info(
-                    f"Using merge base commit {merge_base_commit.sha} instead of base commit ")
-
             counter_valid = 0
             for file in files:
                 if not is_valid_file(file.filename):
@@ -279,6 +293,9 @@ class GithubProvider(GitProvider):
                     continue
 
                 patch = file.patch
+                # file contents are fetched on first access (see FilePatchInfo.base_file/head_file), so files that
+                # are dropped for budget reasons are never downloaded
+                base_file_loader = head_file_loader = None
                 if is_close_to_rate_limit:
                     new_file_content_str = ""
                     original_file_content_str = ""
@@ -294,9 +311,13 @@ class GithubProvider(GitProvider):
                     if avoid_load:
                         new_file_content_str = ""
                     else:
-                        new_file_content_str = self._get_pr_file_content(file, self.pr.head.sha)  # communication with GitHub
+                        new_file_content_str = None
+                        # communication with GitHub
+                        head_file_loader = functools.partial(self._get_pr_file_content, file, self.pr.head.sha)
 
                     if self.incremental.is_incremental and self.unreviewed_files_set:
+                        if head_file_loader:
+                            new_file_content_str, head_file_loader = head_file_loader(), None
                         original_file_content_str = self._get_pr_file_content(file, self.incremental.last_seen_commit_sha)
                         patch = load_large_diff(file.filename, new_file_content_str, original_file_content_str)
                         self.unreviewed_files_set[file.filename] = patch
@@ -304,9 +325,14 @@ class GithubProvider(GitProvider):
                         if avoid_load:
                             original_file_content_str = ""
                         else:
-                            original_file_content_str = self._get_pr_file_content(file, merge_base_commit.sha)
-                            # original_file_content_str = self._get_pr_file_content(file, self.pr.base.sha)
+                            original_file_content_str = None
+                            base_file_loader = functools.partial(self._get_merge_base_file_content, file)
                         if not patch:
+                            # the patch is generated from the contents, so they are needed now
+                            if head_file_loader:
+                                new_file_content_str, head_file_loader = head_file_loader(), None
+                            if base_file_loader:
+                                original_file_content_str, base_file_loader = base_file_loader(), None
                             patch = load_large_diff(file.filename, new_file_content_str, original_file_content_str)
 
 
@@ -334,7 +360,9 @@ class GithubProvider(GitProvider):
                 file_patch_canonical_structure = FilePatchInfo(original_file_content_str, new_file_content_str, patch,
                                                                file.filename, edit_type=edit_type,
                                                                num_plus_lines=num_plus_lines,
-                                                               num_minus_lines=num_minus_lines,)
+                                                               num_minus_lines=num_minus_lines,
+                                                               base_file_loader=base_file_loader,
+                                                               head_file_loader=head_file_loader)
                 diff_files.append(file_patch_canonical_structure)
             if invalid_files_names:
                 get_logger().info(f"Filtered out files with invalid extensions: {invalid_files_names}")
@@ -352,6 +380,11 @@ class GithubProvider(GitProvider):
                                artifact={"traceback": traceback.format_exc()})
             raise RateLimitExceeded("Rate limit exceeded for GitHub API.") from e
 
+    def get_diff_revision(self) -> Optional[Tuple[str, str, str]]:
+        if not self.pr or self.incremental.is_incremental:
+            return None
+        return f"{self.base_url}/{self.repo}", self.pr.base.sha, self.pr.head.sha
+
     def publish_description(self, pr_title: str, pr_body: str):
         self.pr.edit(title=pr_title, body=pr_body)
 
@@ -399,7 +432,7 @@ class GithubProvider(GitProvider):
     def create_inline_comment(self, body: str, relevant_file: str, relevant_line_in_file: str,
                               absolute_position: int = None):
         body = self.limit_output_characters(body, self.max_comment_chars)
-        position, absolute_position = find_line_number_of_relevant_line_in_file(self.diff_files,
+        position, absolute_position = find_line_number_of_relevant_line_in_file(self.get_diff_files(),
                                                                                 relevant_file.strip('`'),
                                                                                 relevant_line_in_file,
                                                                                 absolute_position)
@@ -892,8 +925,148 @@ class GithubProvider(GitProvider):
         )
 
     def _get_pr_file_content(self, file: FilePatchInfo, sha: str) -> str:
+        git_mirror = self.get_git_mirror()
+        if git_mirror:
+            content = git_mirror.read_file(sha, file.filename)
+            if content is not None:
+                return content
         return self.get_pr_file_content(file.filename, sha)
 
+    def _get_mirror_source(self) -> Optional[Tuple[str, list[str]]]:
+        if not self.pr:
+            return None
+        clone_url = self._prepare_clone_url_with_token(f"{self.base_url_html}/{self.repo}.git")
+        if not clone_url:
+            return None
+        return clone_url, [f"refs/pull/{self.pr_num}/head", f"refs/heads/{self.pr.base.ref}"]
+
+    def _get_merge_base_sha(self) -> str:
+        # The base.sha will point to the current state of the base branch (including parallel merges), not the original base commit when the PR was created
+        # We can fix this by finding the merge base commit between the PR head and base branches
+        # Note that The pr.head.sha is actually correct as is - it points to the latest commit in your PR branch.
+        # This SHA isn't affected by parallel merges to the base branch since it's specific to your PR's branch.
+        if self._merge_base_sha is None:
+            repo = self.repo_obj
+            pr = self.pr
+            git_mirror = self.get_git_mirror()
+            merge_base_sha = git_mirror.merge_base(pr.base.sha, pr.head.sha) if git_mirror else None
+            if not merge_base_sha:
+                try:
+                    compare = repo.compare(pr.base.sha, pr.head.sha) # communication with GitHub
+                    merge_base_sha = compare.merge_base_commit.sha
+                except Exception as e:
+                    get_logger().error(f"Failed to get merge base commit: {e}")
+                    merge_base_sha = pr.base.sha
+            if merge_base_sha != pr.base.sha:
+                get_logger().info(
+                    f"Using merge base commit {merge_base_sha} instead of base commit ")
+            self._merge_base_sha = merge_base_sha
+        return self._merge_base_sha
+
+    def _get_merge_base_file_content(self, file) -> str:
+        return self._get_pr_file_content(file, self._get_merge_base_sha())
+
+    def prefetch_diff_files_content(self, diff_files: list[FilePatchInfo]) -> None:
+        """
+        Fetches the pending base/head contents of 'diff_files' ahead of their first access.
+        With 'github.content_fetch_mode' set to "graphql", the contents are fetched in batched GraphQL queries, and
+        only the blobs that GraphQL cannot return in full are fetched with REST.
+        With a local git mirror (see 'git_mirror.enable'), nothing is prefetched: the contents are read from it.
+        """
+        if self.get_git_mirror():
+            return
+        requests = [(file, 'head_file', self.pr.head.sha) for file in diff_files if file.head_file_loader]
+        if any(file.base_file_loader for file in diff_files):
+            merge_base_sha = self._get_merge_base_sha()
+            requests += [(file, 'base_file', merge_base_sha) for file in diff_files if file.base_file_loader]
+        if get_settings().get("github.content_fetch_mode", "rest") == "graphql":
+            requests = self._fetch_contents_graphql(requests)
+        self._fetch_contents_concurrently(requests)
+
+    def _fetch_contents_graphql(self, requests: list) -> list:
+        """
+        Fetches the contents for 'requests' ((file, 'base_file'/'head_file', sha) triplets) with batched GraphQL
+        'object(expression: "sha:path")' queries. Returns the requests that still need a REST call: truncated
+        (too large) blobs, and the requests of failed queries.
+        """
+        if not requests:
+            return requests
+        owner, name = self.repo.split('/', 1)
+        rest_requests = []
+        start_time = time.perf_counter()
+        for i in range(0, len(requests), GRAPHQL_CONTENT_BATCH_SIZE):
+            batch = requests[i:i + GRAPHQL_CONTENT_BATCH_SIZE]
+            variables = {"owner": owner, "name": name}
+            for j, (file, _, sha) in enumerate(batch):
+                variables[f"expression{j}"] = f"{sha}:{file.filename}"
+            parameters = "".join(f", $expression{j}: String!" for j in range(len(batch)))
+            objects = " ".join(f"blob{j}: object(expression: $expression{j}) {{ ... on Blob {{ text isTruncated }} }}"
+                               for j in range(len(batch)))
+            query = (f"query($owner: String!, $name: String!{parameters}) "
+                     f"{{ repository(owner: $owner, name: $name) {{ {objects} }} }}")
+            try:
+                response_tuple = self.github_client._Github__requester.requestJson(
+                    "POST", "/graphql", input={"query": query, "variables": variables})
+                repository = json.loads(response_tuple[2])["data"]["repository"]
+                if repository is None:
+                    raise ValueError(f"repository {self.repo} not found")
+            except Exception as e:
+                get_logger().warning(f"Failed to fetch file contents with GraphQL, falling back to REST: {e}")
+                rest_requests.extend(batch)
+                continue
+
+            for j, request in enumerate(batch):
+                blob = repository.get(f"blob{j}")
+                if blob and blob.get("isTruncated"):
+                    rest_requests.append(request)
+                    continue
+                file, attr, _ = request
+                # a missing path or a binary blob has no text, same as an unreadable file over REST
+                setattr(file, attr, (blob or {}).get("text") or "")
+        num_queries = (len(requests) + GRAPHQL_CONTENT_BATCH_SIZE - 1) // GRAPHQL_CONTENT_BATCH_SIZE
+        get_logger().info(f"Fetched {len(requests) - len(rest_requests)} file contents in {num_queries} GraphQL "
+                          f"queries in {time.perf_counter() - start_time:.2f} seconds")
+        return rest_requests
+
+    def _fetch_contents_concurrently(self, requests: list) -> None:
+        """
+        Fetches the contents for 'requests' with REST calls, using up to 'github.content_fetch_concurrency' threads.
+        PyGithub clients are not thread-safe, so each thread uses its own client.
+        """
+        concurrency = get_settings().get("github.content_fetch_concurrency", 8)
+        if concurrency <= 1 or len(requests) <= 1:
+            return  # the contents are loaded one by one on first access
+
+        try:
+            remaining_requests, _ = self.github_client.rate_limiting
+        except Exception:
+            remaining_requests = None
+        if remaining_requests is not None and remaining_requests < len(requests) + FETCH_RATE_LIMIT_RESERVE:
+            get_logger().warning(f"Close to the GitHub rate limit ({remaining_requests} requests left), "
+                                 f"skipping the concurrent fetch of {len(requests)} file contents")
+            return
+
+        auth = Auth.Token(self.auth.token)  # resolved once, so the threads don't refresh an app token concurrently
+        thread_local = threading.local()
+
+        def fetch_content(request) -> str:
+            file, _, sha = request
+            if not hasattr(thread_local, 'repo'):
+                thread_local.repo = Github(auth=auth, base_url=self.base_url).get_repo(self.repo, lazy=True)
+            try:
+                return thread_local.repo.get_contents(file.filename, ref=sha).decoded_content.decode()
+            except Exception:
+                return ""
+
+        start_time = time.perf_counter()
+        max_workers = min(concurrency, len(requests))
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            contents = list(executor.map(fetch_content, requests))
+        for (file, attr, _), content in zip(requests, contents, strict=True):
+            setattr(file, attr, content)
+        get_logger().info(f"Fetched {len(requests)} file contents in {time.perf_counter() - start_time:.2f} "
+                          f"seconds using {max_workers} threads")
+
     def publish_labels(self, pr_types):
         try:
             label_color_map = {"Bug fix": "1d76db", "Tests": "e99695", "Bug fix with tests": "c5def5",
@@ -953,7 +1126,7 @@ class GithubProvider(GitProvider):
                 return ""
 
             position, absolute_position = find_line_number_of_relevant_line_in_file \
-                (self.diff_files, relevant_file, relevant_line_str)
+                (self.get_diff_files(), relevant_file, relevant_line_str)
 
             if absolute_position != -1:
                 # # link to right file only
@@ -1110,8 +1283,6 @@ class GithubProvider(GitProvider):
         """
         code_suggestions_copy = copy.deepcopy(code_suggestions)
         diff_files = self.get_diff_files()
-        RE_HUNK_HEADER = re.compile(
-            r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@[ ]?(.*)")
 
         diff_files = set_file_languages(diff_files)
 
@@ -1122,17 +1293,9 @@ class GithubProvider(GitProvider):
                     if file.filename == relevant_file_path:
 
                         # generate on-demand the patches range for the relevant file
-                        patch_str = file.patch
                         if not hasattr(file, 'patches_range'):
-                            file.patches_range = []
-                            patch_lines = patch_str.splitlines()
-                            for i, line in enumerate(patch_lines):
-                                if line.startswith('@@'):
-                                    match = RE_HUNK_HEADER.match(line)
-                                    # identify hunk header
-                                    if match:
-                                        section_header, size1, size2, start1, start2 = extract_hunk_headers(match)
-                                        file.patches_range.append({'start': start2, 'end': start2 + size2 - 1})
+                            file.patches_range = [{'start': hunk.start2, 'end': hunk.start2 + hunk.size2 - 1}
+                                                  for hunk in file.parsed_patch.hunks]
 
                         patches_range = file.patches_range
                         comment_start_line = suggestion.get('relevant_lines_start', None)
@@ -1,4 +1,5 @@
 import difflib
+import functools
 import hashlib
 import re
 import urllib.parse
@@ -72,8 +73,6 @@ class GitLabProvider(GitProvider):
         self._submodule_cache: dict[tuple[str, str, str], list[dict]] = {}
         self.pr_url = merge_request_url
         self._set_merge_request(merge_request_url)
-        self.RE_HUNK_HEADER = re.compile(
-            r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@[ ]?(.*)")
         self.incremental = incremental
 
     # --- submodule expansion helpers (opt-in) ---
@@ -391,6 +390,23 @@ class GitLabProvider(GitProvider):
             get_logger().exception(f"Unexpected error creating/updating file {file_path} in branch {branch}: {e}")
             raise
 
+    def _get_decoded_file_content(self, file_path: str, branch: str) -> str:
+        git_mirror = self.get_git_mirror()
+        if git_mirror:
+            content = git_mirror.read_file(branch, file_path)
+            if content is not None:
+                return content
+        # Ensure content is properly decoded
+        return decode_if_bytes(self.get_pr_file_content(file_path, branch))
+
+    def _get_mirror_source(self) -> Optional[Tuple[str, list[str]]]:
+        if not self.mr:
+            return None
+        clone_url = self._prepare_clone_url_with_token(self.get_git_repo_url(self.pr_url))
+        if not clone_url:
+            return None
+        return clone_url, [f"refs/merge-requests/{self.id_mr}/head", f"refs/heads/{self.mr.target_branch}"]
+
     def get_diff_files(self) -> list[FilePatchInfo]:
         """
         Retrieves the list of files that have been modified, added, deleted, or renamed in a pull request in GitLab,
@@ -430,19 +446,25 @@ class GitLabProvider(GitProvider):
 
             # allow only a limited number of files to be fully loaded. We can manage the rest with diffs only
             counter_valid += 1
-            if counter_valid < MAX_FILES_ALLOWED_FULL or not diff['diff']:
-                original_file_content_str = self.get_pr_file_content(diff['old_path'], self.mr.diff_refs['base_sha'])
-                new_file_content_str = self.get_pr_file_content(diff['new_path'], self.mr.diff_refs['head_sha'])
+            base_file_loader = head_file_loader = None
+            if not diff['diff']:
+                # the patch is generated from the contents, so they are needed now
+                original_file_content_str = self._get_decoded_file_content(diff['old_path'],
+                                                                           self.mr.diff_refs['base_sha'])
+                new_file_content_str = self._get_decoded_file_content(diff['new_path'], self.mr.diff_refs['head_sha'])
+            elif counter_valid < MAX_FILES_ALLOWED_FULL:
+                # fetched on first access, so files that are dropped for budget reasons are never downloaded
+                original_file_content_str = new_file_content_str = None
+                base_file_loader = functools.partial(self._get_decoded_file_content, diff['old_path'],
+                                                     self.mr.diff_refs['base_sha'])
+                head_file_loader = functools.partial(self._get_decoded_file_content, diff['new_path'],
+                                                     self.mr.diff_refs['head_sha'])
             else:
                 if counter_valid == MAX_FILES_ALLOWED_FULL:
                     get_logger().info(f"Too many files in PR, will avoid loading full content for rest of files")
                 original_file_content_str = ''
                 new_file_content_str = ''
 
-            # Ensure content is properly decoded
-            original_file_content_str = decode_if_bytes(original_file_content_str)
-            new_file_content_str = decode_if_bytes(new_file_content_str)
-
             edit_type = EDIT_TYPE.MODIFIED
             if diff['new_file']:
                 edit_type = EDIT_TYPE.ADDED
@@ -468,13 +490,23 @@ class GitLabProvider(GitProvider):
                               edit_type=edit_type,
                               old_filename=None if diff['old_path'] == diff['new_path'] else diff['old_path'],
                               num_plus_lines=num_plus_lines,
-                              num_minus_lines=num_minus_lines, ))
+                              num_minus_lines=num_minus_lines,
+                              base_file_loader=base_file_loader,
+                              head_file_loader=head_file_loader, ))
         if invalid_files_names:
             get_logger().info(f"Filtered out files with invalid extensions: {invalid_files_names}")
 
         self.diff_files = diff_files
         return diff_files
 
+    def get_diff_revision(self) -> Optional[Tuple[str, str, str]]:
+        if not self.mr or self.incremental:
+            return None
+        diff_refs = self.mr.diff_refs or {}
+        if not diff_refs.get('base_sha') or not diff_refs.get('head_sha'):
+            return None
+        return f"{self.gitlab_url}/{self.id_project}", diff_refs['base_sha'], diff_refs['head_sha']
+
     def get_files(self) -> list:
         if not self.git_files:
             raw_changes = self.mr.changes().get('changes', [])
@@ -712,16 +744,14 @@ class GitLabProvider(GitProvider):
         target_line_no = 0
         found = False
         target_file = file
-        patch = file.patch
-        patch_lines = patch.splitlines()
-        for line in patch_lines:
+        parsed_patch = file.parsed_patch
+        for i, line in enumerate(parsed_patch.lines):
             if line.startswith('@@'):
-                match = self.RE_HUNK_HEADER.match(line)
-                if not match:
+                hunk = parsed_patch.hunk_at(i)
+                if not hunk:
                     continue
-                start_old, size_old, start_new, size_new, _ = match.groups()
-                source_line_no = int(start_old)
-                target_line_no = int(start_new)
+                source_line_no = hunk.start1
+                target_line_no = hunk.start2
                 continue
             if line.startswith('-'):
                 source_line_no += 1
@@ -937,7 +967,7 @@ class GitLabProvider(GitProvider):
                 return ""
 
             position, absolute_position = find_line_number_of_relevant_line_in_file \
-                (self.diff_files, relevant_file, relevant_line_str)
+                (self.get_diff_files(), relevant_file, relevant_line_str)
 
             if absolute_position != -1:
                 # link to right file only
@@ -0,0 +1,144 @@
+"""
+Process-level cache of git providers and their PR objects, shared by the requests of a worker. Building a provider
+authenticates, and fetches the repository, the PR and its commits. A webhook usually triggers several tools on the same
+PR within minutes, and each request would otherwise pay for these calls again.
+
+Providers are cached if they implement 'get_pr_revision()' (e.g. GithubProvider). The webhook handler revalidates a
+cached provider before the request reuses it ('revalidate', off the event loop) with a conditional request on the PR
+(ETag, answered with '304 Not Modified' if unchanged). A provider is dropped when its revision (head and base shas)
+changed, when a webhook reports another head sha, or after 'git_provider_cache.ttl_seconds', and is reused only within
+'git_provider_cache.revalidation_max_age_seconds' of its last revalidation. Each request gets its own copy of the
+provider, with the per-request state reset.
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Optional
+
+from starlette_context import context
+
+from pr_agent.config_loader import get_settings
+from pr_agent.git_providers.git_provider import GitProvider
+from pr_agent.log import get_logger
+
+
+def _get_credentials_fingerprint(provider_id: str) -> str:
+    """
+    A hash of what the provider authenticates with: the settings of its section and the GitHub app installation,
+    so that requests with different credentials never share a provider.
+    """
+    try:
+        installation_id = context.get("installation_id", None)
+    except Exception:
+        installation_id = None
+    provider_settings = get_settings().get(provider_id, None) or {}
+    if hasattr(provider_settings, "to_dict"):
+        provider_settings = provider_settings.to_dict()
+    data = json.dumps({"installation_id": installation_id, "settings": provider_settings}, sort_keys=True, default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+class GitProviderCache:
+    """
+    LRU cache of providers, keyed by (provider id, PR url, credentials fingerprint). The size limit and the TTL are read
+    from the settings on each call.
+    """
+
+    def __init__(self):
+        self._entries = OrderedDict()  # key -> (provider, revision, creation time, revalidation time)
+        self._lock = Lock()
+
+    @staticmethod
+    def is_enabled() -> bool:
+        return get_settings().get("git_provider_cache.enable", False)
+
+    def get(self, provider_id: str, pr_url: str) -> Optional[GitProvider]:
+        """
+        A copy of the cached provider of the PR for the current request, or None if there is no valid entry.
+        Makes no request: the entry must have been revalidated recently (see 'revalidate').
+        """
+        key = (provider_id, pr_url, _get_credentials_fingerprint(provider_id))
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            provider, _, created_at, revalidated_at = entry
+            if now - created_at > get_settings().get("git_provider_cache.ttl_seconds", 600):
+                del self._entries[key]
+                return None
+            if now - revalidated_at > get_settings().get("git_provider_cache.revalidation_max_age_seconds", 60):
+                return None
+            self._entries.move_to_end(key)
+        get_logger().debug(f"Reusing the cached git provider of {pr_url}")
+        return provider.copy_for_request()
+
+    async def revalidate(self, provider_id: str, pr_url: str):
+        """
+        Revalidates the cached provider of the PR, if any, in a thread: it is dropped if the PR moved to another
+        revision, and can be reused by 'get' otherwise.
+        """
+        key = (provider_id, pr_url, _get_credentials_fingerprint(provider_id))
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            return
+        provider, revision, created_at, _ = entry
+        try:
+            changed = await asyncio.to_thread(provider.revalidate_pr)
+            current_revision = provider.get_pr_revision()
+        except Exception as e:
+            get_logger().debug(f"Failed to revalidate the cached git provider of {pr_url}: {e}")
+            current_revision = None
+        with self._lock:
+            if self._entries.get(key, (None,))[0] is not provider:
+                return
+            if current_revision != revision:
+                del self._entries[key]
+                return
+            self._entries[key] = (provider, revision, created_at, time.monotonic())
+        get_logger().debug(f"Revalidated the cached git provider of {pr_url} "
+                           f"(PR {'changed' if changed else 'unchanged'})")
+
+    def set(self, provider_id: str, pr_url: str, provider: GitProvider) -> GitProvider:
+        """
+        Caches a provider that was just built, and returns the copy of it to use for the current request.
+        """
+        revision = provider.get_pr_revision()
+        if revision is None:
+            return provider
+        key = (provider_id, pr_url, _get_credentials_fingerprint(provider_id))
+        max_size = get_settings().get("git_provider_cache.max_size", 256)
+        now = time.monotonic()
+        with self._lock:
+            self._entries[key] = (provider, revision, now, now)
+            self._entries.move_to_end(key)
+            while len(self._entries) > max(max_size, 0):
+                self._entries.popitem(last=False)
+        return provider.copy_for_request()
+
+    def invalidate(self, pr_url: str, head_sha: Optional[str] = None):
+        """
+        Drops the providers of a PR, e.g. on a webhook event. With 'head_sha', only the providers of another head
+        commit are dropped.
+        """
+        with self._lock:
+            for key in [key for key in self._entries if key[1] == pr_url]:
+                if head_sha is None or not self._entries[key][1].startswith(f"{head_sha}:"):
+                    del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_git_provider_cache = GitProviderCache()
+
+
+def get_git_provider_cache() -> GitProviderCache:
+    return _git_provider_cache
@@ -37,7 +37,7 @@ def apply_repo_settings(pr_url):
                     os.write(fd, repo_settings)
                     new_settings = Dynaconf(settings_files=[repo_settings_file])
                     for section, contents in new_settings.as_dict().items():
-                        section_dict = copy.deepcopy(get_settings().as_dict().get(section, {}))
+                        section_dict = copy.deepcopy(get_settings().get(section, None) or {})
                         for key, value in contents.items():
                             section_dict[key] = value
                         get_settings().unset(section)
@@ -26,6 +26,7 @@ from pr_agent.git_providers import get_git_provider_with_context
 from pr_agent.git_providers.azuredevops_provider import AzureDevopsProvider
 from pr_agent.git_providers.utils import apply_repo_settings
 from pr_agent.log import LoggingFormat, get_logger, setup_logger
+from pr_agent.servers.job_queue import dispatch_job, register_job_handler, setup_job_queue
 
 setup_logger(fmt=LoggingFormat.JSON, level=get_settings().get("CONFIG.LOG_LEVEL", "DEBUG"))
 security = HTTPBasic(auto_error=False)
@@ -168,13 +169,23 @@ async def handle_request_azure(data, log_context):
         status_code=status.HTTP_202_ACCEPTED, content=jsonable_encoder({"message": "webhook triggered successfully"})
     )
 
+async def handle_webhook_job(payload: dict):
+    await handle_request_azure(payload["data"], payload["log_context"])
+
+
+register_job_handler("azure_devops_server.webhook", handle_webhook_job)
+
+
 @router.post("/", dependencies=[Depends(authorize)])
 async def handle_webhook(background_tasks: BackgroundTasks, request: Request):
     log_context = {"server_type": "azure_devops_server"}
     data = await request.json()
     # get_logger().info(json.dumps(data))
 
-    background_tasks.add_task(handle_request_azure, data, log_context)
+    repository = data.get("resource", {}).get("repository") or \
+        data.get("resource", {}).get("pullRequest", {}).get("repository") or {}
+    await dispatch_job(background_tasks, "azure_devops_server.webhook", {"data": data, "log_context": log_context},
+                       concurrency_key=repository.get("id"))
 
     return JSONResponse(
         status_code=status.HTTP_202_ACCEPTED, content=jsonable_encoder({"message": "webhook triggered successfully"})
@@ -187,6 +198,7 @@ async def root():
 def start():
     app = FastAPI(middleware=[Middleware(RawContextMiddleware)])
     app.include_router(router)
+    setup_job_queue(app)
     uvicorn.run(app, host="0.0.0.0", port=int(os.environ.get("PORT", "3000")))
 
 if __name__ == "__main__":
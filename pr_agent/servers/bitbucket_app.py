@@ -1,5 +1,4 @@
 import base64
-import copy
 import hashlib
 import json
 import os
@@ -18,12 +17,13 @@ from starlette_context.middleware import RawContextMiddleware
 
 from pr_agent.agent.pr_agent import PRAgent
 from pr_agent.algo.utils import update_settings_from_args
-from pr_agent.config_loader import get_settings, global_settings
+from pr_agent.config_loader import LayeredSettings, get_settings, global_settings
 from pr_agent.git_providers.utils import apply_repo_settings
 from pr_agent.identity_providers import get_identity_provider
 from pr_agent.identity_providers.identity_provider import Eligibility
 from pr_agent.log import LoggingFormat, get_logger, setup_logger
 from pr_agent.secret_providers import get_secret_provider
+from pr_agent.servers.job_queue import dispatch_job, register_job_handler, setup_job_queue
 
 setup_logger(fmt=LoggingFormat.JSON, level=get_settings().get("CONFIG.LOG_LEVEL", "DEBUG"))
 router = APIRouter()
@@ -174,65 +174,73 @@ async def handle_github_webhooks(background_tasks: BackgroundTasks, request: Req
     log_context = {"server_type": "bitbucket_app", "app_name": app_name}
     get_logger().debug(request.headers)
     jwt_header = request.headers.get("authorization", None)
-    if jwt_header:
-        input_jwt = jwt_header.split(" ")[1]
+    input_jwt = jwt_header.split(" ")[1] if jwt_header else None
     data = await request.json()
     get_logger().debug(data)
 
-    async def inner():
-        try:
-            # ignore bot users
-            if is_bot_user(data):
+    await dispatch_job(background_tasks, "bitbucket_app.webhook",
+                       {"data": data, "jwt": input_jwt, "log_context": log_context},
+                       concurrency_key=data.get("data", {}).get("repository", {}).get("full_name"))
+    return "OK"
+
+
+async def handle_webhook_job(payload: dict):
+    data, input_jwt, log_context = payload["data"], payload["jwt"], payload["log_context"]
+    try:
+        # ignore bot users
+        if is_bot_user(data):
+            return "OK"
+
+        # Check if the PR should be processed
+        if data.get("event", "") == "pullrequest:created":
+            if not should_process_pr_logic(data):
                 return "OK"
 
-            # Check if the PR should be processed
-            if data.get("event", "") == "pullrequest:created":
-                if not should_process_pr_logic(data):
-                    return "OK"
-
-            # Get the username of the sender
-            log_context["sender"] = _get_username(data)
-
-            sender_id = data.get("data", {}).get("actor", {}).get("account_id", "")
-            log_context["sender_id"] = sender_id
-            jwt_parts = input_jwt.split(".")
-            claim_part = jwt_parts[1]
-            claim_part += "=" * (-len(claim_part) % 4)
-            decoded_claims = base64.urlsafe_b64decode(claim_part)
-            claims = json.loads(decoded_claims)
-            client_key = claims["iss"]
-            secrets = json.loads(secret_provider.get_secret(client_key))
-            shared_secret = secrets["shared_secret"]
-            jwt.decode(input_jwt, shared_secret, audience=client_key, algorithms=["HS256"])
-            bearer_token = await get_bearer_token(shared_secret, client_key)
-            context['bitbucket_bearer_token'] = bearer_token
-            context["settings"] = copy.deepcopy(global_settings)
-            event = data["event"]
-            agent = PRAgent()
-            if event == "pullrequest:created":
-                pr_url = data["data"]["pullrequest"]["links"]["html"]["href"]
-                log_context["api_url"] = pr_url
-                log_context["event"] = "pull_request"
-                if pr_url:
-                    with get_logger().contextualize(**log_context):
-                        apply_repo_settings(pr_url)
-                        if get_identity_provider().verify_eligibility("bitbucket",
-                                                        sender_id, pr_url) is not Eligibility.NOT_ELIGIBLE:
-                            if get_settings().get("bitbucket_app.pr_commands"):
-                                await _perform_commands_bitbucket("pr_commands", PRAgent(), pr_url, log_context, data)
-            elif event == "pullrequest:comment_created":
-                pr_url = data["data"]["pullrequest"]["links"]["html"]["href"]
-                log_context["api_url"] = pr_url
-                log_context["event"] = "comment"
-                comment_body = data["data"]["comment"]["content"]["raw"]
+        # Get the username of the sender
+        log_context["sender"] = _get_username(data)
+
+        sender_id = data.get("data", {}).get("actor", {}).get("account_id", "")
+        log_context["sender_id"] = sender_id
+        jwt_parts = input_jwt.split(".")
+        claim_part = jwt_parts[1]
+        claim_part += "=" * (-len(claim_part) % 4)
+        decoded_claims = base64.urlsafe_b64decode(claim_part)
+        claims = json.loads(decoded_claims)
+        client_key = claims["iss"]
+        secrets = json.loads(secret_provider.get_secret(client_key))
+        shared_secret = secrets["shared_secret"]
+        jwt.decode(input_jwt, shared_secret, audience=client_key, algorithms=["HS256"])
+        bearer_token = await get_bearer_token(shared_secret, client_key)
+        context['bitbucket_bearer_token'] = bearer_token
+        context["settings"] = LayeredSettings(global_settings)
+        event = data["event"]
+        agent = PRAgent()
+        if event == "pullrequest:created":
+            pr_url = data["data"]["pullrequest"]["links"]["html"]["href"]
+            log_context["api_url"] = pr_url
+            log_context["event"] = "pull_request"
+            if pr_url:
                 with get_logger().contextualize(**log_context):
+                    apply_repo_settings(pr_url)
                     if get_identity_provider().verify_eligibility("bitbucket",
-                                                                     sender_id, pr_url) is not Eligibility.NOT_ELIGIBLE:
-                        await agent.handle_request(pr_url, comment_body)
-        except Exception as e:
-            get_logger().error(f"Failed to handle webhook: {e}")
-    background_tasks.add_task(inner)
-    return "OK"
+                                                    sender_id, pr_url) is not Eligibility.NOT_ELIGIBLE:
+                        if get_settings().get("bitbucket_app.pr_commands"):
+                            await _perform_commands_bitbucket("pr_commands", PRAgent(), pr_url, log_context, data)
+        elif event == "pullrequest:comment_created":
+            pr_url = data["data"]["pullrequest"]["links"]["html"]["href"]
+            log_context["api_url"] = pr_url
+            log_context["event"] = "comment"
+            comment_body = data["data"]["comment"]["content"]["raw"]
+            with get_logger().contextualize(**log_context):
+                if get_identity_provider().verify_eligibility("bitbucket",
+                                                                 sender_id, pr_url) is not Eligibility.NOT_ELIGIBLE:
+                    await agent.handle_request(pr_url, comment_body)
+    except Exception as e:
+        get_logger().error(f"Failed to handle webhook: {e}")
+
+
+register_job_handler("bitbucket_app.webhook", handle_webhook_job)
+
 
 @router.get("/webhook")
 async def handle_github_webhooks(request: Request, response: Response):
@@ -272,6 +280,7 @@ def start():
     middleware = [Middleware(RawContextMiddleware)]
     app = FastAPI(middleware=middleware)
     app.include_router(router)
+    setup_job_queue(app)
 
     uvicorn.run(app, host="0.0.0.0", port=int(os.getenv("PORT", "3000")))
 
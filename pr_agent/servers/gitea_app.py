@@ -1,5 +1,4 @@
 import asyncio
-import copy
 import os
 from typing import Any, Dict
 
@@ -10,8 +9,10 @@ from starlette_context import context
 from starlette_context.middleware import RawContextMiddleware
 
 from pr_agent.agent.pr_agent import PRAgent
-from pr_agent.config_loader import get_settings, global_settings
+from pr_agent.algo.inflight_runs import run_latest
+from pr_agent.config_loader import LayeredSettings, get_settings, global_settings
 from pr_agent.log import LoggingFormat, get_logger, setup_logger
+from pr_agent.servers.job_queue import dispatch_job, register_job_handler, setup_job_queue
 from pr_agent.servers.utils import verify_signature
 
 # Setup logging and router
@@ -26,11 +27,13 @@ async def handle_gitea_webhooks(background_tasks: BackgroundTasks, request: Requ
     body = await get_body(request)
 
     # Set context for the request
-    context["settings"] = copy.deepcopy(global_settings)
+    context["settings"] = LayeredSettings(global_settings)
     context["git_provider"] = {}
 
     # Handle the webhook in background
-    background_tasks.add_task(handle_request, body, event=request.headers.get("X-Gitea-Event", None))
+    await dispatch_job(background_tasks, "gitea_app.webhook",
+                       {"body": body, "event": request.headers.get("X-Gitea-Event", None)},
+                       concurrency_key=body.get("repository", {}).get("full_name"))
     return {}
 
 async def get_body(request: Request):
@@ -78,6 +81,11 @@ async def handle_request(body: Dict[str, Any], event: str):
 
     return {}
 
+async def handle_webhook_job(payload: Dict[str, Any]):
+    await handle_request(payload["body"], event=payload["event"])
+
+register_job_handler("gitea_app.webhook", handle_webhook_job)
+
 async def handle_pr_event(body: Dict[str, Any], event: str, action: str, agent: PRAgent):
     """Handle pull request events"""
     pr = body.get("pull_request", {})
@@ -94,8 +102,11 @@ async def handle_pr_event(body: Dict[str, Any], event: str, action: str, agent:
         for command in commands:
             await agent.handle_request(api_url, command)
     elif action == "synchronized":
-        # Handle push to PR
-        await agent.handle_request(api_url, "/review --incremental")
+        # Handle push to PR, superseding the in-flight runs of older commits (see inflight_runs.py)
+        get_settings().set("config.is_auto_command", True)  # no temporary comment, which a superseded run would leave
+        # pushes are ordered by the update time of the head repository, which a push bumps
+        await run_latest(api_url, pr.get("head", {}).get("sha"), agent.handle_request(api_url, "/review --incremental"),
+                         pushed_at=(pr.get("head", {}).get("repo") or {}).get("updated_at"))
 
 async def handle_comment_event(body: Dict[str, Any], event: str, action: str, agent: PRAgent):
     """Handle comment events"""
@@ -117,6 +128,7 @@ async def handle_comment_event(body: Dict[str, Any], event: str, action: str, ag
 middleware = [Middleware(RawContextMiddleware)]
 app = FastAPI(middleware=middleware)
 app.include_router(router)
+setup_job_queue(app)
 
 def start():
     """Start the Gitea webhook server"""
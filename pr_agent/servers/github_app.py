@@ -1,5 +1,3 @@
-import asyncio.locks
-import copy
 import os
 import re
 import uuid
@@ -13,16 +11,23 @@ from starlette_context import context
 from starlette_context.middleware import RawContextMiddleware
 
 from pr_agent.agent.pr_agent import PRAgent
+from pr_agent.algo.inflight_runs import run_latest, supersede_older_runs
 from pr_agent.algo.utils import update_settings_from_args
-from pr_agent.config_loader import get_settings, global_settings
+from pr_agent.config_loader import LayeredSettings, get_settings, global_settings
 from pr_agent.git_providers import (get_git_provider,
                                     get_git_provider_with_context)
 from pr_agent.git_providers.git_provider import IncrementalPR
+from pr_agent.git_providers.provider_cache import (GitProviderCache,
+                                                   get_git_provider_cache)
 from pr_agent.git_providers.utils import apply_repo_settings
 from pr_agent.identity_providers import get_identity_provider
 from pr_agent.identity_providers.identity_provider import Eligibility
 from pr_agent.log import LoggingFormat, get_logger, setup_logger
-from pr_agent.servers.utils import DefaultDictWithTimeout, verify_signature
+from pr_agent.servers.job_queue import (dispatch_job, register_job_handler,
+                                        setup_job_queue)
+from pr_agent.servers.push_trigger_coordinator import \
+    get_push_trigger_coordinator
+from pr_agent.servers.utils import verify_signature
 
 setup_logger(fmt=LoggingFormat.JSON, level=get_settings().get("CONFIG.LOG_LEVEL", "DEBUG"))
 base_path = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
@@ -48,12 +53,23 @@ async def handle_github_webhooks(background_tasks: BackgroundTasks, request: Req
 
     installation_id = body.get("installation", {}).get("id")
     context["installation_id"] = installation_id
-    context["settings"] = copy.deepcopy(global_settings)
+    context["settings"] = LayeredSettings(global_settings)
     context["git_provider"] = {}
-    background_tasks.add_task(handle_request, body, event=request.headers.get("X-GitHub-Event", None))
+    await dispatch_job(background_tasks, "github_app.webhook",
+                       {"body": body, "event": request.headers.get("X-GitHub-Event", None),
+                        "installation_id": installation_id},
+                       concurrency_key=body.get("repository", {}).get("full_name"))
     return {}
 
 
+async def handle_webhook_job(payload: Dict[str, Any]):
+    context["installation_id"] = payload["installation_id"]
+    await handle_request(payload["body"], event=payload["event"])
+
+
+register_job_handler("github_app.webhook", handle_webhook_job)
+
+
 @router.post("/api/v1/marketplace_webhooks")
 async def handle_marketplace_webhooks(request: Request, response: Response):
     body = await get_body(request)
@@ -74,9 +90,6 @@ async def get_body(request):
     return body
 
 
-_duplicate_push_triggers = DefaultDictWithTimeout(ttl=get_settings().github_app.push_trigger_pending_tasks_ttl)
-_pending_task_duplicate_push_conditions = DefaultDictWithTimeout(asyncio.locks.Condition, ttl=get_settings().github_app.push_trigger_pending_tasks_ttl)
-
 async def handle_comments_on_pr(body: Dict[str, Any],
                                 event: str,
                                 sender: str,
@@ -172,38 +185,26 @@ async def handle_push_trigger_for_new_commits(body: Dict[str, Any],
     # We let the second event wait instead of discarding it because while the first event was being processed,
     # more commits may have been pushed that led to the subsequent events,
     # so we keep just one waiting as a delegate to trigger the processing for the new commits when done waiting.
-    current_active_tasks = _duplicate_push_triggers.setdefault(api_url, 0)
+    # The coordination is shared by the server processes (see push_trigger_coordinator.py).
+    # An admitted event supersedes the runs of older commits (see inflight_runs.py), so that a waiting event does
+    # not wait for a run whose results would be outdated.
     max_active_tasks = 2 if get_settings().github_app.push_trigger_pending_tasks_backlog else 1
-    if current_active_tasks < max_active_tasks:
-        # first task can enter, and second tasks too if backlog is enabled
-        get_logger().info(
-            f"Continue processing push trigger for {api_url=} because there are {current_active_tasks} active tasks"
-        )
-        _duplicate_push_triggers[api_url] += 1
-    else:
-        get_logger().info(
-            f"Skipping push trigger for {api_url=} because another event already triggered the same processing"
-        )
-        return {}
-    async with _pending_task_duplicate_push_conditions[api_url]:
-        if current_active_tasks == 1:
-            # second task waits
+    # pushes are ordered by the last push time of the head repository, rather than by the arrival of their events
+    pushed_at = (pull_request.get("head", {}).get("repo") or {}).get("pushed_at")
+    async with get_push_trigger_coordinator().coalesce(
+            api_url, max_active_tasks,
+            on_admitted=lambda: supersede_older_runs(api_url, after_sha, pushed_at)) as admitted:
+        if not admitted:
             get_logger().info(
-                f"Waiting to process push trigger for {api_url=} because the first task is still in progress"
+                f"Skipping push trigger for {api_url=} because another event already triggered the same processing"
             )
-            await _pending_task_duplicate_push_conditions[api_url].wait()
-            get_logger().info(f"Finished waiting to process push trigger for {api_url=} - continue with flow")
-
-    try:
+            return {}
+        get_logger().info(f"Continue processing push trigger for {api_url=}")
         if get_identity_provider().verify_eligibility("github", sender_id, api_url) is not Eligibility.NOT_ELIGIBLE:
             get_logger().info(f"Performing incremental review for {api_url=} because of {event=} and {action=}")
-            await _perform_auto_commands_github("push_commands", agent, body, api_url, log_context)
-
-    finally:
-        # release the waiting task block
-        async with _pending_task_duplicate_push_conditions[api_url]:
-            _pending_task_duplicate_push_conditions[api_url].notify(1)
-            _duplicate_push_triggers[api_url] -= 1
+            await run_latest(api_url, after_sha,
+                             _perform_auto_commands_github("push_commands", agent, body, api_url, log_context),
+                             pushed_at=pushed_at)
 
 
 def handle_closed_pr(body, event, action, log_context):
@@ -324,6 +325,8 @@ async def handle_request(body: Dict[str, Any], event: str):
         return {}
     agent = PRAgent()
     log_context, sender, sender_id, sender_type = get_log_context(body, event, action, build_number)
+    invalidate_cached_git_provider(body, action)
+    await revalidate_cached_git_provider(body, action)
 
     # logic to ignore PRs opened by bot, PRs with specific titles, labels, source branches, or target branches
     if is_bot_user(sender, sender_type) and 'check_run' not in body:
@@ -358,6 +361,28 @@ async def handle_request(body: Dict[str, Any], event: str):
     return {}
 
 
+def invalidate_cached_git_provider(body: Dict[str, Any], action: str):
+    """
+    Drops the providers of the PR cached by the worker when the payload reports another head commit, or a closed PR.
+    """
+    pull_request = body.get("pull_request") or {}
+    api_url = pull_request.get("url")
+    if not api_url:
+        return
+    head_sha = None if action == "closed" else pull_request.get("head", {}).get("sha")
+    get_git_provider_cache().invalidate(api_url, head_sha=head_sha)
+
+
+async def revalidate_cached_git_provider(body: Dict[str, Any], action: str):
+    """
+    Revalidates the provider of the PR cached by the worker, off the event loop, so that the request can reuse it.
+    """
+    api_url = (body.get("pull_request") or body.get("issue", {}).get("pull_request") or {}).get("url")
+    if not api_url or action == "closed" or not GitProviderCache.is_enabled():
+        return
+    await get_git_provider_cache().revalidate(get_settings().config.git_provider, api_url)
+
+
 def handle_line_comments(body: Dict, comment_body: [str, Any]) -> str:
     if not comment_body:
         return ""
@@ -427,6 +452,7 @@ if get_settings().github_app.override_deployment_type:
 middleware = [Middleware(RawContextMiddleware)]
 app = FastAPI(middleware=middleware)
 app.include_router(router)
+setup_job_queue(app)
 
 
 def start():
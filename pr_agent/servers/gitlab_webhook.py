@@ -1,4 +1,3 @@
-import copy
 import json
 import re
 from datetime import datetime
@@ -13,12 +12,15 @@ from starlette_context import context
 from starlette_context.middleware import RawContextMiddleware
 
 from pr_agent.agent.pr_agent import PRAgent
+from pr_agent.algo.inflight_runs import run_latest
 from pr_agent.algo.utils import update_settings_from_args
-from pr_agent.config_loader import get_settings, global_settings
+from pr_agent.config_loader import LayeredSettings, get_settings, global_settings
 from pr_agent.git_providers.utils import apply_repo_settings
 from pr_agent.log import LoggingFormat, get_logger, setup_logger
 from pr_agent.secret_providers import get_secret_provider
 from pr_agent.git_providers import get_git_provider_with_context
+from pr_agent.servers.job_queue import (dispatch_job, register_job_handler,
+                                        setup_job_queue)
 
 setup_logger(fmt=LoggingFormat.JSON, level=get_settings().get("CONFIG.LOG_LEVEL", "DEBUG"))
 router = APIRouter()
@@ -170,109 +172,118 @@ def should_process_pr_logic(data) -> bool:
 async def gitlab_webhook(background_tasks: BackgroundTasks, request: Request):
     start_time = datetime.now()
     request_json = await request.json()
-    context["settings"] = copy.deepcopy(global_settings)
-
-    async def inner(data: dict):
-        log_context = {"server_type": "gitlab_app"}
-        get_logger().debug("Received a GitLab webhook")
-        if request.headers.get("X-Gitlab-Token") and secret_provider:
-            request_token = request.headers.get("X-Gitlab-Token")
-            secret = secret_provider.get_secret(request_token)
-            if not secret:
-                get_logger().warning(f"Empty secret retrieved, request_token: {request_token}")
-                return JSONResponse(status_code=status.HTTP_401_UNAUTHORIZED,
-                                    content=jsonable_encoder({"message": "unauthorized"}))
-            try:
-                secret_dict = json.loads(secret)
-                gitlab_token = secret_dict["gitlab_token"]
-                log_context["token_id"] = secret_dict.get("token_name", secret_dict.get("id", "unknown"))
-                context["settings"].gitlab.personal_access_token = gitlab_token
-            except Exception as e:
-                get_logger().error(f"Failed to validate secret {request_token}: {e}")
-                return JSONResponse(status_code=status.HTTP_401_UNAUTHORIZED, content=jsonable_encoder({"message": "unauthorized"}))
-        elif get_settings().get("GITLAB.SHARED_SECRET"):
-            secret = get_settings().get("GITLAB.SHARED_SECRET")
-            if not request.headers.get("X-Gitlab-Token") == secret:
-                get_logger().error("Failed to validate secret")
-                return JSONResponse(status_code=status.HTTP_401_UNAUTHORIZED, content=jsonable_encoder({"message": "unauthorized"}))
-        else:
-            get_logger().error("Failed to validate secret")
-            return JSONResponse(status_code=status.HTTP_401_UNAUTHORIZED, content=jsonable_encoder({"message": "unauthorized"}))
-        gitlab_token = get_settings().get("GITLAB.PERSONAL_ACCESS_TOKEN", None)
-        if not gitlab_token:
-            get_logger().error("No gitlab token found")
-            return JSONResponse(status_code=status.HTTP_401_UNAUTHORIZED, content=jsonable_encoder({"message": "unauthorized"}))
+    context["settings"] = LayeredSettings(global_settings)
+
+    await dispatch_job(background_tasks, "gitlab_webhook.webhook",
+                       {"data": request_json, "request_token": request.headers.get("X-Gitlab-Token")},
+                       concurrency_key=str(request_json.get("project", {}).get("id", "")))
+    end_time = datetime.now()
+    get_logger().info(f"Processing time: {end_time - start_time}", request=request_json)
+    return JSONResponse(status_code=status.HTTP_200_OK, content=jsonable_encoder({"message": "success"}))
 
-        get_logger().info("GitLab data", artifact=data)
-        sender = data.get("user", {}).get("username", "unknown")
-        sender_id = data.get("user", {}).get("id", "unknown")
 
-        # ignore bot users
-        if is_bot_user(data):
+async def handle_webhook_job(payload: dict):
+    data, request_token = payload["data"], payload["request_token"]
+    log_context = {"server_type": "gitlab_app"}
+    get_logger().debug("Received a GitLab webhook")
+    if request_token and secret_provider:
+        secret = secret_provider.get_secret(request_token)
+        if not secret:
+            get_logger().warning(f"Empty secret retrieved, request_token: {request_token}")
+            return JSONResponse(status_code=status.HTTP_401_UNAUTHORIZED,
+                                content=jsonable_encoder({"message": "unauthorized"}))
+        try:
+            secret_dict = json.loads(secret)
+            gitlab_token = secret_dict["gitlab_token"]
+            log_context["token_id"] = secret_dict.get("token_name", secret_dict.get("id", "unknown"))
+            context["settings"].gitlab.personal_access_token = gitlab_token
+        except Exception as e:
+            get_logger().error(f"Failed to validate secret {request_token}: {e}")
+            return JSONResponse(status_code=status.HTTP_401_UNAUTHORIZED, content=jsonable_encoder({"message": "unauthorized"}))
+    elif get_settings().get("GITLAB.SHARED_SECRET"):
+        secret = get_settings().get("GITLAB.SHARED_SECRET")
+        if not request_token == secret:
+            get_logger().error("Failed to validate secret")
+            return JSONResponse(status_code=status.HTTP_401_UNAUTHORIZED, content=jsonable_encoder({"message": "unauthorized"}))
+    else:
+        get_logger().error("Failed to validate secret")
+        return JSONResponse(status_code=status.HTTP_401_UNAUTHORIZED, content=jsonable_encoder({"message": "unauthorized"}))
+    gitlab_token = get_settings().get("GITLAB.PERSONAL_ACCESS_TOKEN", None)
+    if not gitlab_token:
+        get_logger().error("No gitlab token found")
+        return JSONResponse(status_code=status.HTTP_401_UNAUTHORIZED, content=jsonable_encoder({"message": "unauthorized"}))
+
+    get_logger().info("GitLab data", artifact=data)
+    sender = data.get("user", {}).get("username", "unknown")
+    sender_id = data.get("user", {}).get("id", "unknown")
+
+    # ignore bot users
+    if is_bot_user(data):
+        return JSONResponse(status_code=status.HTTP_200_OK, content=jsonable_encoder({"message": "success"}))
+
+    log_context["sender"] = sender
+    if data.get('object_kind') == 'merge_request':
+        # ignore MRs based on title, labels, source and target branches
+        if not should_process_pr_logic(data):
             return JSONResponse(status_code=status.HTTP_200_OK, content=jsonable_encoder({"message": "success"}))
+        object_attributes = data.get('object_attributes', {})
+        if object_attributes.get('action') in ['open', 'reopen']:
+            url = object_attributes.get('url')
+            get_logger().info(f"New merge request: {url}")
+            if is_draft(data):
+                get_logger().info(f"Skipping draft MR: {url}")
+                return JSONResponse(status_code=status.HTTP_200_OK, content=jsonable_encoder({"message": "success"}))
+
+            await _perform_commands_gitlab("pr_commands", PRAgent(), url, log_context, data)
 
-        log_context["sender"] = sender
-        if data.get('object_kind') == 'merge_request':
-            # ignore MRs based on title, labels, source and target branches
-            if not should_process_pr_logic(data):
+        # for push event triggered merge requests
+        elif object_attributes.get('action') == 'update' and object_attributes.get('oldrev'):
+            url = object_attributes.get('url')
+            get_logger().info(f"New merge request: {url}")
+            if is_draft(data):
+                get_logger().info(f"Skipping draft MR: {url}")
                 return JSONResponse(status_code=status.HTTP_200_OK, content=jsonable_encoder({"message": "success"}))
-            object_attributes = data.get('object_attributes', {})
-            if object_attributes.get('action') in ['open', 'reopen']:
-                url = object_attributes.get('url')
-                get_logger().info(f"New merge request: {url}")
-                if is_draft(data):
-                    get_logger().info(f"Skipping draft MR: {url}")
-                    return JSONResponse(status_code=status.HTTP_200_OK, content=jsonable_encoder({"message": "success"}))
-
-                await _perform_commands_gitlab("pr_commands", PRAgent(), url, log_context, data)
-
-            # for push event triggered merge requests
-            elif object_attributes.get('action') == 'update' and object_attributes.get('oldrev'):
-                url = object_attributes.get('url')
-                get_logger().info(f"New merge request: {url}")
-                if is_draft(data):
-                    get_logger().info(f"Skipping draft MR: {url}")
-                    return JSONResponse(status_code=status.HTTP_200_OK, content=jsonable_encoder({"message": "success"}))
-
-                # Apply repo settings before checking push commands or handle_push_trigger
-                apply_repo_settings(url)
-
-                commands_on_push = get_settings().get(f"gitlab.push_commands", {})
-                handle_push_trigger = get_settings().get(f"gitlab.handle_push_trigger", False)
-                if not commands_on_push or not handle_push_trigger:
-                    get_logger().info("Push event, but no push commands found or push trigger is disabled")
-                    return JSONResponse(status_code=status.HTTP_200_OK,
-                                        content=jsonable_encoder({"message": "success"}))
-
-                get_logger().debug(f'A push event has been received: {url}')
-                await _perform_commands_gitlab("push_commands", PRAgent(), url, log_context, data)
-                
-            # for draft to ready triggered merge requests
-            elif object_attributes.get('action') == 'update' and is_draft_ready(data):
-                url = object_attributes.get('url')
-                get_logger().info(f"Draft MR is ready: {url}")
-
-                # same as open MR
-                await _perform_commands_gitlab("pr_commands", PRAgent(), url, log_context, data)
-
-        elif data.get('object_kind') == 'note' and data.get('event_type') == 'note': # comment on MR
-            if 'merge_request' in data:
-                mr = data['merge_request']
-                url = mr.get('url')
-                comment_id = data.get('object_attributes', {}).get('id')
-                provider = get_git_provider_with_context(pr_url=url)
-
-                get_logger().info(f"A comment has been added to a merge request: {url}")
-                body = data.get('object_attributes', {}).get('note')
-                if data.get('object_attributes', {}).get('type') == 'DiffNote' and '/ask' in body: # /ask_line
-                    body = handle_ask_line(body, data)
-
-                await handle_request(url, body, log_context, sender_id, notify=lambda: provider.add_eyes_reaction(comment_id))
-
-    background_tasks.add_task(inner, request_json)
-    end_time = datetime.now()
-    get_logger().info(f"Processing time: {end_time - start_time}", request=request_json)
-    return JSONResponse(status_code=status.HTTP_200_OK, content=jsonable_encoder({"message": "success"}))
+
+            # Apply repo settings before checking push commands or handle_push_trigger
+            apply_repo_settings(url)
+
+            commands_on_push = get_settings().get(f"gitlab.push_commands", {})
+            handle_push_trigger = get_settings().get(f"gitlab.handle_push_trigger", False)
+            if not commands_on_push or not handle_push_trigger:
+                get_logger().info("Push event, but no push commands found or push trigger is disabled")
+                return JSONResponse(status_code=status.HTTP_200_OK,
+                                    content=jsonable_encoder({"message": "success"}))
+
+            get_logger().debug(f'A push event has been received: {url}')
+            # a newer push supersedes the in-flight runs of older commits (see inflight_runs.py)
+            await run_latest(url, object_attributes.get('last_commit', {}).get('id'),
+                             _perform_commands_gitlab("push_commands", PRAgent(), url, log_context, data),
+                             pushed_at=object_attributes.get('last_commit', {}).get('timestamp'))
+
+        # for draft to ready triggered merge requests
+        elif object_attributes.get('action') == 'update' and is_draft_ready(data):
+            url = object_attributes.get('url')
+            get_logger().info(f"Draft MR is ready: {url}")
+
+            # same as open MR
+            await _perform_commands_gitlab("pr_commands", PRAgent(), url, log_context, data)
+
+    elif data.get('object_kind') == 'note' and data.get('event_type') == 'note': # comment on MR
+        if 'merge_request' in data:
+            mr = data['merge_request']
+            url = mr.get('url')
+            comment_id = data.get('object_attributes', {}).get('id')
+            provider = get_git_provider_with_context(pr_url=url)
+
+            get_logger().info(f"A comment has been added to a merge request: {url}")
+            body = data.get('object_attributes', {}).get('note')
+            if data.get('object_attributes', {}).get('type') == 'DiffNote' and '/ask' in body: # /ask_line
+                body = handle_ask_line(body, data)
+
+            await handle_request(url, body, log_context, sender_id, notify=lambda: provider.add_eyes_reaction(comment_id))
+
+
+register_job_handler("gitlab_webhook.webhook", handle_webhook_job)
 
 
 def handle_ask_line(body, data):
@@ -306,6 +317,7 @@ get_settings().config.git_provider = "gitlab"
 middleware = [Middleware(RawContextMiddleware)]
 app = FastAPI(middleware=middleware)
 app.include_router(router)
+setup_job_queue(app)
 
 
 def start():
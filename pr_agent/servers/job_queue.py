@@ -0,0 +1,426 @@
+"""
+Durable job queue of the webhook servers, enabled with 'job_queue.enable'.
+
+Webhook handlers only enqueue a job (a registered kind and a JSON payload) and return. A pool of asyncio workers in
+each server process claims the jobs and runs their handler in a fresh request context. Jobs are stored by a pluggable
+backend, SQLite by default, so that they survive restarts, and are shared by the processes of a server (e.g. the
+gunicorn workers). The pool limits the number of jobs running per process and per repository.
+The handlers (e.g. the tools publishing comments) are not idempotent, so a job is retried only while its handler did
+not start: a job that failed before (with an exponential backoff), or whose worker died before (claimed again once
+its lease expires). A job that failed, or was interrupted, after its handler started is marked as failed instead.
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import socket
+import sqlite3
+import tempfile
+import time
+import uuid
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from dataclasses import dataclass
+from threading import Lock
+from typing import Awaitable, Callable, Dict, Optional
+
+from starlette.background import BackgroundTasks
+from starlette_context import request_cycle_context
+
+from pr_agent.config_loader import LayeredSettings, get_settings, global_settings
+from pr_agent.log import get_logger
+
+JobHandler = Callable[[dict], Awaitable[None]]
+
+
+@dataclass
+class Job:
+    id: int
+    kind: str
+    payload: dict
+    concurrency_key: Optional[str]
+    attempts: int  # including the current one
+    enqueued_at: float
+    handler_started: bool = False
+
+
+class JobQueue(ABC):
+    """
+    A store of jobs, shared by the worker pools of a server. Claims must be atomic across processes.
+    """
+
+    @abstractmethod
+    def enqueue(self, kind: str, payload: dict, concurrency_key: Optional[str] = None) -> int:
+        pass
+
+    @abstractmethod
+    def claim(self, worker_id: str, lease_seconds: float, max_per_key: int) -> Optional[Job]:
+        """
+        Claims the oldest available job whose concurrency key has fewer than 'max_per_key' running jobs (0: no limit),
+        for 'lease_seconds'. Returns None if there is none.
+        """
+        pass
+
+    @abstractmethod
+    def mark_started(self, job_id: int, worker_id: str):
+        """
+        Records that the handler of a claimed job started, after which the job is never run again.
+        """
+        pass
+
+    @abstractmethod
+    def renew(self, job_id: int, worker_id: str, lease_seconds: float):
+        pass
+
+    @abstractmethod
+    def complete(self, job_id: int, worker_id: str):
+        pass
+
+    @abstractmethod
+    def fail(self, job_id: int, worker_id: str, error: str, retry_at: Optional[float]):
+        """
+        Marks a job as failed, or re-queues it until 'retry_at' (a time.time() timestamp) if not None.
+        """
+        pass
+
+    @abstractmethod
+    def release(self, job_id: int, worker_id: str):
+        """
+        Re-queues a claimed job without counting the attempt, e.g. on shutdown, unless its handler started: the job is
+        marked as failed then.
+        """
+        pass
+
+    @abstractmethod
+    def get_stats(self) -> dict:
+        """
+        Number of queued, running and failed jobs, and the age of the oldest queued job.
+        """
+        pass
+
+
+class SqliteJobQueue(JobQueue):
+    """
+    SQLite-backed queue. Completed jobs are deleted, failed ones are kept for 'failed_retention_seconds'.
+    """
+
+    def __init__(self, db_path: str, max_attempts: int, failed_retention_seconds: float):
+        self.db_path = db_path
+        self.max_attempts = max_attempts
+        self.failed_retention_seconds = failed_retention_seconds
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS jobs (id INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT, "
+                         "payload TEXT, concurrency_key TEXT, status TEXT, attempts INTEGER, enqueued_at REAL, "
+                         "available_at REAL, worker_id TEXT, lease_expires_at REAL, finished_at REAL, "
+                         "last_error TEXT, started_at REAL)")
+            if "started_at" not in [column[1] for column in conn.execute("PRAGMA table_info(jobs)")]:
+                conn.execute("ALTER TABLE jobs ADD COLUMN started_at REAL")  # a queue of an earlier version
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, available_at)")
+        os.chmod(db_path, 0o600)  # payloads may hold webhook tokens
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+        try:
+            conn.execute("BEGIN IMMEDIATE")  # serializes the writers of all processes
+            try:
+                yield conn
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        finally:
+            conn.close()
+
+    def enqueue(self, kind: str, payload: dict, concurrency_key: Optional[str] = None) -> int:
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute("INSERT INTO jobs (kind, payload, concurrency_key, status, attempts, enqueued_at, "
+                                  "available_at) VALUES (?, ?, ?, 'queued', 0, ?, ?)",
+                                  (kind, json.dumps(payload), concurrency_key or None, now, now))
+            conn.execute("DELETE FROM jobs WHERE status = 'failed' AND finished_at < ?",
+                         (now - self.failed_retention_seconds,))
+            return cursor.lastrowid
+
+    def claim(self, worker_id: str, lease_seconds: float, max_per_key: int) -> Optional[Job]:
+        now = time.time()
+        with self._connect() as conn:
+            # jobs of dead workers: retried, unless their handler started or they used all their attempts
+            conn.execute("UPDATE jobs SET status = 'failed', finished_at = ?, last_error = 'lease expired' "
+                         "WHERE status = 'running' AND lease_expires_at < ? "
+                         "AND (started_at IS NOT NULL OR attempts >= ?)", (now, now, self.max_attempts))
+            conn.execute("UPDATE jobs SET status = 'queued', worker_id = NULL WHERE status = 'running' "
+                         "AND lease_expires_at < ?", (now,))
+            row = conn.execute(
+                "SELECT id, kind, payload, concurrency_key, attempts, enqueued_at FROM jobs AS queued "
+                "WHERE status = 'queued' AND available_at <= ? AND (? <= 0 OR concurrency_key IS NULL OR "
+                "(SELECT COUNT(*) FROM jobs WHERE status = 'running' "
+                "AND concurrency_key = queued.concurrency_key) < ?) "
+                "ORDER BY available_at, id LIMIT 1", (now, max_per_key, max_per_key)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE jobs SET status = 'running', attempts = attempts + 1, worker_id = ?, "
+                         "lease_expires_at = ? WHERE id = ?", (worker_id, now + lease_seconds, row[0]))
+        return Job(id=row[0], kind=row[1], payload=json.loads(row[2]), concurrency_key=row[3], attempts=row[4] + 1,
+                   enqueued_at=row[5])
+
+    def mark_started(self, job_id: int, worker_id: str):
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET started_at = ? WHERE id = ? AND worker_id = ? AND status = 'running'",
+                         (time.time(), job_id, worker_id))
+
+    def renew(self, job_id: int, worker_id: str, lease_seconds: float):
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET lease_expires_at = ? WHERE id = ? AND worker_id = ? AND status = 'running'",
+                         (time.time() + lease_seconds, job_id, worker_id))
+
+    def complete(self, job_id: int, worker_id: str):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM jobs WHERE id = ? AND worker_id = ?", (job_id, worker_id))
+
+    def fail(self, job_id: int, worker_id: str, error: str, retry_at: Optional[float]):
+        with self._connect() as conn:
+            if retry_at is not None:
+                conn.execute("UPDATE jobs SET status = 'queued', worker_id = NULL, available_at = ?, last_error = ? "
+                             "WHERE id = ? AND worker_id = ?", (retry_at, error, job_id, worker_id))
+            else:
+                conn.execute("UPDATE jobs SET status = 'failed', finished_at = ?, last_error = ? "
+                             "WHERE id = ? AND worker_id = ?", (time.time(), error, job_id, worker_id))
+
+    def release(self, job_id: int, worker_id: str):
+        with self._connect() as conn:
+            conn.execute("UPDATE jobs SET status = 'failed', finished_at = ?, last_error = 'interrupted' "
+                         "WHERE id = ? AND worker_id = ? AND status = 'running' AND started_at IS NOT NULL",
+                         (time.time(), job_id, worker_id))
+            conn.execute("UPDATE jobs SET status = 'queued', worker_id = NULL, attempts = attempts - 1 "
+                         "WHERE id = ? AND worker_id = ? AND status = 'running'", (job_id, worker_id))
+
+    def get_stats(self) -> dict:
+        with self._connect() as conn:
+            counts = dict(conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+            oldest = conn.execute("SELECT MIN(enqueued_at) FROM jobs WHERE status = 'queued'").fetchone()[0]
+        return {"queued": counts.get("queued", 0), "running": counts.get("running", 0),
+                "failed": counts.get("failed", 0),
+                "oldest_queued_age_seconds": round(time.time() - oldest, 3) if oldest else 0.0}
+
+
+def _create_sqlite_queue() -> JobQueue:
+    db_path = get_settings().get("job_queue.sqlite_path", "") or os.path.join(tempfile.gettempdir(),
+                                                                              "pr_agent_job_queue.db")
+    return SqliteJobQueue(db_path, max_attempts=get_settings().get("job_queue.max_attempts", 3),
+                          failed_retention_seconds=get_settings().get("job_queue.failed_retention_hours", 168) * 3600)
+
+
+_JOB_QUEUE_BACKENDS = {
+    'sqlite': _create_sqlite_queue,
+}
+_JOB_HANDLERS: Dict[str, JobHandler] = {}
+
+_job_queue_instances = {}
+_job_queue_lock = Lock()
+
+
+def register_job_queue_backend(name: str, factory):
+    """
+    Register a custom backend, selectable with 'job_queue.backend=<name>'.
+    'factory' is a no-argument callable returning a JobQueue.
+    """
+    _JOB_QUEUE_BACKENDS[name] = factory
+
+
+def register_job_handler(kind: str, handler: JobHandler):
+    """
+    Register the coroutine running the jobs of a kind. It is called with the job payload, in a new request context
+    with the settings of the request and an empty 'git_provider' cache, like the context set by the webhook handlers.
+    """
+    _JOB_HANDLERS[kind] = handler
+
+
+def get_job_queue() -> JobQueue:
+    backend = get_settings().get("job_queue.backend", "sqlite")
+    if backend not in _JOB_QUEUE_BACKENDS:
+        raise ValueError(f"Unknown job queue backend: {backend}")
+    if backend not in _job_queue_instances:
+        with _job_queue_lock:
+            if backend not in _job_queue_instances:
+                _job_queue_instances[backend] = _JOB_QUEUE_BACKENDS[backend]()
+    return _job_queue_instances[backend]
+
+
+class JobWorkerPool:
+    """
+    'job_queue.workers' asyncio workers of a server process, polling the queue every 'job_queue.poll_interval_seconds'
+    (and woken up on each job enqueued by this process). Each worker renews the lease of its job while it runs.
+    """
+
+    def __init__(self, queue: JobQueue):
+        self.queue = queue
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.num_workers = max(1, get_settings().get("job_queue.workers", 4))
+        self.max_per_key = get_settings().get("job_queue.max_concurrent_jobs_per_repo", 1)
+        self.poll_interval = get_settings().get("job_queue.poll_interval_seconds", 1.0)
+        self.lease_seconds = get_settings().get("job_queue.lease_seconds", 300)
+        self.max_attempts = get_settings().get("job_queue.max_attempts", 3)
+        self.retry_backoff_seconds = get_settings().get("job_queue.retry_backoff_seconds", 30)
+        self.stats = {"completed": 0, "failed": 0, "retried": 0, "total_wait_seconds": 0.0, "max_wait_seconds": 0.0,
+                      "total_run_seconds": 0.0}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._tasks = []
+        self._running_jobs = {}  # job id -> Job
+
+    async def start(self):
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.num_workers)]
+        get_logger().info(f"Started {self.num_workers} job queue workers ({self.worker_id})")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for job_id in list(self._running_jobs):  # interrupted jobs are run again by the next workers
+            await asyncio.to_thread(self.queue.release, job_id, self.worker_id)
+        self._running_jobs.clear()
+
+    def notify(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _work(self):
+        while True:
+            try:
+                job = await asyncio.to_thread(self.queue.claim, self.worker_id, self.lease_seconds, self.max_per_key)
+            except Exception as e:
+                get_logger().error(f"Failed to claim a job: {e}")
+                job = None
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._run(job)
+
+    async def _renew_lease(self, job: Job):
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                await asyncio.to_thread(self.queue.renew, job.id, self.worker_id, self.lease_seconds)
+            except Exception as e:
+                get_logger().warning(f"Failed to renew the lease of job {job.id}: {e}")
+
+    async def _run(self, job: Job):
+        self._running_jobs[job.id] = job
+        wait_seconds = max(0.0, time.time() - job.enqueued_at)
+        start_time = time.monotonic()
+        renew_task = asyncio.create_task(self._renew_lease(job))
+        error = None
+        try:
+            handler = _JOB_HANDLERS.get(job.kind)
+            if handler is None:
+                raise ValueError(f"No handler registered for jobs of kind {job.kind}")
+            await asyncio.to_thread(self.queue.mark_started, job.id, self.worker_id)
+            job.handler_started = True
+            # 'job_attempt' tells the handlers about retries (e.g. a retried push supersedes no run, see inflight_runs)
+            with request_cycle_context({"settings": LayeredSettings(global_settings), "git_provider": {},
+                                        "job_attempt": job.attempts}):
+                await handler(job.payload)
+        except asyncio.CancelledError:
+            raise  # released by stop()
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        finally:
+            renew_task.cancel()
+        self._running_jobs.pop(job.id, None)
+
+        run_seconds = time.monotonic() - start_time
+        self.stats["total_run_seconds"] += run_seconds
+        if job.attempts == 1:  # the wait of a retry includes its backoff
+            self.stats["total_wait_seconds"] += wait_seconds
+            self.stats["max_wait_seconds"] = max(self.stats["max_wait_seconds"], wait_seconds)
+        if error is None:
+            await self._record_outcome(self.queue.complete, job.id, self.worker_id)
+            self.stats["completed"] += 1
+        elif job.attempts < self.max_attempts and not job.handler_started:
+            retry_at = time.time() + self.retry_backoff_seconds * 2 ** (job.attempts - 1)
+            await self._record_outcome(self.queue.fail, job.id, self.worker_id, error, retry_at)
+            self.stats["retried"] += 1
+        else:
+            await self._record_outcome(self.queue.fail, job.id, self.worker_id, error, None)
+            self.stats["failed"] += 1
+        get_logger().info(f"Job {job.id} ({job.kind}) {'done' if error is None else 'failed: ' + error}",
+                          artifact={"attempt": job.attempts, "wait_seconds": round(wait_seconds, 3),
+                                    "run_seconds": round(run_seconds, 3), **await self.get_stats()})
+
+    @staticmethod
+    async def _record_outcome(record, *args):
+        # the job is no longer released by stop(), so its outcome is written even if the worker is being stopped
+        write = asyncio.ensure_future(asyncio.to_thread(record, *args))
+        try:
+            await asyncio.shield(write)
+        except asyncio.CancelledError:
+            await write
+            raise
+
+    async def get_stats(self) -> dict:
+        """
+        Queue depth (all processes) and the counts and latencies of the jobs run by this process.
+        """
+        stats = dict(self.stats)
+        stats["max_wait_seconds"] = round(stats["max_wait_seconds"], 3)
+        started = stats["completed"] + stats["failed"] + stats["retried"]
+        stats["avg_run_seconds"] = round(stats.pop("total_run_seconds") / started, 3) if started else 0.0
+        first_attempts = started - stats["retried"]
+        stats["avg_wait_seconds"] = round(stats.pop("total_wait_seconds") / first_attempts, 3) \
+            if first_attempts > 0 else 0.0
+        try:
+            stats.update(await asyncio.to_thread(self.queue.get_stats))
+        except Exception as e:
+            get_logger().warning(f"Failed to get the job queue stats: {e}")
+        return stats
+
+
+_worker_pool: Optional[JobWorkerPool] = None
+
+
+def get_job_worker_pool() -> Optional[JobWorkerPool]:
+    return _worker_pool
+
+
+def setup_job_queue(app):
+    """
+    Starts the job workers of a server process with the app, if 'job_queue.enable' is set.
+    """
+    if not get_settings().get("job_queue.enable", False):
+        return
+
+    async def start_workers():
+        global _worker_pool
+        _worker_pool = JobWorkerPool(get_job_queue())
+        await _worker_pool.start()
+
+    async def stop_workers():
+        global _worker_pool
+        if _worker_pool is not None:
+            await _worker_pool.stop()
+            _worker_pool = None
+
+    app.add_event_handler("startup", start_workers)
+    app.add_event_handler("shutdown", stop_workers)
+
+
+async def dispatch_job(background_tasks: BackgroundTasks, kind: str, payload: dict,
+                       concurrency_key: Optional[str] = None):
+    """
+    Enqueues a job when this process runs job workers. Otherwise (queue disabled, or an app without workers such as
+    the lambda handlers), the job handler runs as a background task of the request, in its context.
+    """
+    if _worker_pool is None:
+        background_tasks.add_task(_JOB_HANDLERS[kind], payload)
+        return
+    job_id = await asyncio.to_thread(_worker_pool.queue.enqueue, kind, payload, concurrency_key)
+    get_logger().debug(f"Enqueued job {job_id} ({kind})", artifact={"concurrency_key": concurrency_key})
+    _worker_pool.notify()
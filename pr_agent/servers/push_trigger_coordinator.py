@@ -0,0 +1,255 @@
+"""
+Coalescing of the push triggers ("synchronize" events) of a PR, across the processes of a server.
+
+The first push of a PR triggers the processing. A push arriving in the meantime waits for it to finish, as a delegate
+for all the commits pushed during the processing, and any further push is discarded (see
+'github_app.push_trigger_pending_tasks_backlog'). Server processes (e.g. the gunicorn workers) receive the events of
+a PR independently, so the running and waiting triggers are tracked by a shared backend: SQLite by default, which
+coordinates the processes of a host. Other backends (e.g. for several hosts) can be registered.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import sqlite3
+import tempfile
+import time
+import uuid
+from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass
+from threading import Lock
+from typing import AsyncIterator, Awaitable, Callable, Optional
+
+from pr_agent.config_loader import get_settings
+from pr_agent.log import get_logger
+from pr_agent.servers.utils import DefaultDictWithTimeout
+
+
+@dataclass
+class PushTrigger:
+    key: str  # the PR url
+    token: str
+    waiting: bool  # False for the running trigger of the PR
+
+
+class PushTriggerCoordinator(ABC):
+    """
+    Tracks the running and waiting push triggers of each PR. Entries of processes that died expire after 'ttl' seconds
+    without a refresh.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+
+    @abstractmethod
+    async def enter(self, key: str, max_active: int) -> Optional[PushTrigger]:
+        """
+        Registers a trigger, running if none is, or else waiting. Returns None if 'max_active' triggers are already
+        registered for the PR.
+        """
+        pass
+
+    @abstractmethod
+    async def wait_for_turn(self, trigger: PushTrigger):
+        """
+        Returns once a waiting trigger became the running trigger of its PR.
+        """
+        pass
+
+    async def refresh(self, trigger: PushTrigger):
+        """
+        Extends the expiry of a trigger. A no-op for coordinators whose entries cannot outlive their process.
+        """
+        return
+
+    @abstractmethod
+    async def leave(self, trigger: PushTrigger):
+        pass
+
+    @asynccontextmanager
+    async def coalesce(self, key: str, max_active: int,
+                       on_admitted: Optional[Callable[[], Awaitable]] = None) -> AsyncIterator[bool]:
+        """
+        async with coordinator.coalesce(pr_url, max_active) as admitted:
+            if admitted: ...  # the processing of the push
+
+        'on_admitted', if given, is awaited when the trigger is admitted, before it waits for its turn.
+        """
+        trigger = await self.enter(key, max_active)
+        if trigger is None:
+            yield False
+            return
+        refresh_task = None
+        try:
+            if on_admitted:
+                await on_admitted()
+            if trigger.waiting:
+                get_logger().info(
+                    f"Waiting to process push trigger for {key=} because the first task is still in progress")
+                await self.wait_for_turn(trigger)
+                get_logger().info(f"Finished waiting to process push trigger for {key=} - continue with flow")
+            refresh_task = asyncio.create_task(self._refresh_periodically(trigger))
+            yield True
+        finally:
+            if refresh_task:
+                refresh_task.cancel()
+            await self.leave(trigger)
+
+    async def _refresh_periodically(self, trigger: PushTrigger):
+        while True:
+            await asyncio.sleep(self.ttl / 3)
+            try:
+                await self.refresh(trigger)
+            except Exception as e:
+                get_logger().warning(f"Failed to refresh the push trigger of {trigger.key}: {e}")
+
+
+class InProcessPushTriggerCoordinator(PushTriggerCoordinator):
+    """
+    Coordinates the triggers of a single process.
+    """
+
+    def __init__(self, ttl: float):
+        super().__init__(ttl)
+        self._active_triggers = DefaultDictWithTimeout(ttl=ttl)
+        self._running = DefaultDictWithTimeout(bool, ttl=ttl)
+        self._conditions = DefaultDictWithTimeout(asyncio.locks.Condition, ttl=ttl)
+
+    async def enter(self, key: str, max_active: int) -> Optional[PushTrigger]:
+        current_active_triggers = self._active_triggers.setdefault(key, 0)
+        if current_active_triggers >= max_active:
+            return None
+        self._active_triggers[key] += 1
+        waiting = self._running[key]
+        self._running[key] = True
+        return PushTrigger(key=key, token=uuid.uuid4().hex, waiting=waiting)
+
+    async def wait_for_turn(self, trigger: PushTrigger):
+        async with self._conditions[trigger.key]:
+            await self._conditions[trigger.key].wait_for(lambda: not self._running[trigger.key])
+            self._running[trigger.key] = True
+        trigger.waiting = False
+
+    async def leave(self, trigger: PushTrigger):
+        async with self._conditions[trigger.key]:
+            if not trigger.waiting:
+                self._running[trigger.key] = False
+            self._active_triggers[trigger.key] -= 1
+            self._conditions[trigger.key].notify(1)
+
+
+class SqlitePushTriggerCoordinator(PushTriggerCoordinator):
+    """
+    Coordinates the processes sharing a SQLite file. Waiting triggers poll every 'poll_interval' seconds.
+    """
+
+    def __init__(self, db_path: str, ttl: float, poll_interval: float):
+        super().__init__(ttl)
+        self.db_path = db_path
+        self.poll_interval = poll_interval
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS push_triggers (token TEXT PRIMARY KEY, key TEXT, waiting INTEGER, "
+                         "created_at REAL, expires_at REAL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS push_triggers_key ON push_triggers (key)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+        try:
+            conn.execute("BEGIN IMMEDIATE")  # serializes the triggers of all processes
+            try:
+                yield conn
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        finally:
+            conn.close()
+
+    def _enter(self, key: str, max_active: int) -> Optional[PushTrigger]:
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("DELETE FROM push_triggers WHERE expires_at < ?", (now,))
+            active_triggers = conn.execute("SELECT COUNT(*) FROM push_triggers WHERE key = ?", (key,)).fetchone()[0]
+            if active_triggers >= max_active:
+                return None
+            trigger = PushTrigger(key=key, token=uuid.uuid4().hex, waiting=active_triggers > 0)
+            conn.execute("INSERT INTO push_triggers VALUES (?, ?, ?, ?, ?)",
+                         (trigger.token, key, int(trigger.waiting), now, now + self.ttl))
+        return trigger
+
+    def _take_turn(self, trigger: PushTrigger) -> bool:
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("DELETE FROM push_triggers WHERE expires_at < ?", (now,))
+            conn.execute("UPDATE push_triggers SET expires_at = ? WHERE token = ?", (now + self.ttl, trigger.token))
+            running = conn.execute("SELECT COUNT(*) FROM push_triggers WHERE key = ? AND waiting = 0",
+                                   (trigger.key,)).fetchone()[0]
+            if running:
+                return False
+            conn.execute("UPDATE push_triggers SET waiting = 0 WHERE token = ?", (trigger.token,))
+        trigger.waiting = False
+        return True
+
+    async def enter(self, key: str, max_active: int) -> Optional[PushTrigger]:
+        return await asyncio.to_thread(self._enter, key, max_active)
+
+    async def wait_for_turn(self, trigger: PushTrigger):
+        while not await asyncio.to_thread(self._take_turn, trigger):
+            await asyncio.sleep(self.poll_interval)
+
+    async def refresh(self, trigger: PushTrigger):
+        def _refresh():
+            with self._connect() as conn:
+                conn.execute("UPDATE push_triggers SET expires_at = ? WHERE token = ?",
+                             (time.time() + self.ttl, trigger.token))
+        await asyncio.to_thread(_refresh)
+
+    async def leave(self, trigger: PushTrigger):
+        def _leave():
+            with self._connect() as conn:
+                conn.execute("DELETE FROM push_triggers WHERE token = ?", (trigger.token,))
+        await asyncio.to_thread(_leave)
+
+
+def _create_in_process_coordinator() -> PushTriggerCoordinator:
+    return InProcessPushTriggerCoordinator(ttl=get_settings().github_app.push_trigger_pending_tasks_ttl)
+
+
+def _create_sqlite_coordinator() -> PushTriggerCoordinator:
+    db_path = get_settings().get("github_app.push_trigger_coordination_sqlite_path", "") or \
+        os.path.join(tempfile.gettempdir(), "pr_agent_push_triggers.db")
+    return SqlitePushTriggerCoordinator(
+        db_path, ttl=get_settings().github_app.push_trigger_pending_tasks_ttl,
+        poll_interval=get_settings().get("github_app.push_trigger_coordination_poll_seconds", 2))
+
+
+_PUSH_TRIGGER_COORDINATOR_BACKENDS = {
+    'memory': _create_in_process_coordinator,
+    'sqlite': _create_sqlite_coordinator,
+}
+
+_coordinator_instances = {}
+_coordinator_lock = Lock()
+
+
+def register_push_trigger_coordinator_backend(name: str, factory):
+    """
+    Register a custom backend, selectable with 'github_app.push_trigger_coordination_backend=<name>'.
+    'factory' is a no-argument callable returning a PushTriggerCoordinator.
+    """
+    _PUSH_TRIGGER_COORDINATOR_BACKENDS[name] = factory
+
+
+def get_push_trigger_coordinator() -> PushTriggerCoordinator:
+    backend = get_settings().get("github_app.push_trigger_coordination_backend", "sqlite")
+    if backend not in _PUSH_TRIGGER_COORDINATOR_BACKENDS:
+        get_logger().warning(f"Unknown push trigger coordination backend: {backend}, using 'memory'")
+        backend = 'memory'
+    if backend not in _coordinator_instances:
+        with _coordinator_lock:
+            if backend not in _coordinator_instances:
+                _coordinator_instances[backend] = _PUSH_TRIGGER_COORDINATOR_BACKENDS[backend]()
+    return _coordinator_instances[backend]
@@ -3,11 +3,10 @@ import textwrap
 from functools import partial
 from typing import Dict
 
-from jinja2 import Environment, StrictUndefined
-
 from pr_agent.algo.ai_handlers.base_ai_handler import BaseAiHandler
 from pr_agent.algo.ai_handlers.litellm_ai_handler import LiteLLMAIHandler
 from pr_agent.algo.pr_processing import get_pr_diff, retry_with_fallback_models
+from pr_agent.algo.template_registry import get_prompt_template
 from pr_agent.algo.token_handler import TokenHandler
 from pr_agent.algo.utils import load_yaml
 from pr_agent.config_loader import get_settings
@@ -83,9 +82,8 @@ class PRAddDocs:
     async def _get_prediction(self, model: str):
         variables = copy.deepcopy(self.vars)
         variables["diff"] = self.patches_diff  # update diff
-        environment = Environment(undefined=StrictUndefined)
-        system_prompt = environment.from_string(get_settings().pr_add_docs_prompt.system).render(variables)
-        user_prompt = environment.from_string(get_settings().pr_add_docs_prompt.user).render(variables)
+        system_prompt = get_prompt_template(get_settings().pr_add_docs_prompt.system).render(variables)
+        user_prompt = get_prompt_template(get_settings().pr_add_docs_prompt.user).render(variables)
         if get_settings().config.verbosity_level >= 2:
             get_logger().info(f"\nSystem prompt:\n{system_prompt}")
             get_logger().info(f"\nUser prompt:\n{user_prompt}")
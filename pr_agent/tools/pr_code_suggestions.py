@@ -8,8 +8,6 @@ from datetime import datetime
 from functools import partial
 from typing import Dict, List
 
-from jinja2 import Environment, StrictUndefined
-
 from pr_agent.algo import MAX_TOKENS
 from pr_agent.algo.ai_handlers.base_ai_handler import BaseAiHandler
 from pr_agent.algo.ai_handlers.litellm_ai_handler import LiteLLMAIHandler
@@ -17,6 +15,9 @@ from pr_agent.algo.git_patch_processing import decouple_and_convert_to_hunks_wit
 from pr_agent.algo.pr_processing import (add_ai_metadata_to_diff_files,
                                          get_pr_diff, get_pr_multi_diffs,
                                          retry_with_fallback_models)
+from pr_agent.algo.streaming_yaml import IncrementalYamlListParser
+from pr_agent.algo.structured_output import get_response_schema, load_prediction
+from pr_agent.algo.template_registry import get_prompt_template
 from pr_agent.algo.token_handler import TokenHandler
 from pr_agent.algo.utils import (ModelType, load_yaml, replace_code_tags,
                                  show_relevant_configurations, get_max_tokens, clip_tokens, get_model)
@@ -29,6 +30,8 @@ from pr_agent.log import get_logger
 from pr_agent.servers.help import HelpMessage
 from pr_agent.tools.pr_description import insert_br_after_x_chars
 
+CODE_SUGGESTIONS_KEYS_FIX_YAML = ["relevant_file", "suggestion_content", "existing_code", "improved_code"]
+
 
 class PRCodeSuggestions:
     def __init__(self, pr_url: str, cli_mode=False, args: list = None,
@@ -387,17 +390,36 @@ class PRCodeSuggestions:
         variables = copy.deepcopy(self.vars)
         variables["diff"] = patches_diff  # update diff
         variables["diff_no_line_numbers"] = patches_diff_no_line_number  # update diff
-        environment = Environment(undefined=StrictUndefined)
-        system_prompt = environment.from_string(self.pr_code_suggestions_prompt_system).render(variables)
-        user_prompt = environment.from_string(get_settings().pr_code_suggestions_prompt.user).render(variables)
-        response, finish_reason = await self.ai_handler.chat_completion(
-            model=model, temperature=get_settings().config.temperature, system=system_prompt, user=user_prompt)
+        system_prompt = get_prompt_template(self.pr_code_suggestions_prompt_system).render(variables)
+        user_prompt = get_prompt_template(get_settings().pr_code_suggestions_prompt.user).render(variables)
+        stream_parser = None
+        if get_settings().pr_code_suggestions.get("incremental_parsing", False) and \
+                isinstance(self.ai_handler, LiteLLMAIHandler):
+            # parse and validate the suggestions while they are generated, and stop once there are enough of them
+            stream_parser = IncrementalYamlListParser(
+                "code_suggestions", validate_item=self._validate_code_suggestion,
+                max_items=int(get_settings().pr_code_suggestions.num_code_suggestions_per_chunk),
+                keys_fix_yaml=CODE_SUGGESTIONS_KEYS_FIX_YAML, last_key="label")
+            response, finish_reason = await self.ai_handler.chat_completion(
+                model=model, temperature=get_settings().config.temperature, system=system_prompt, user=user_prompt,
+                stream_consumer=stream_parser)
+        elif isinstance(self.ai_handler, LiteLLMAIHandler):
+            response, finish_reason = await self.ai_handler.chat_completion(
+                model=model, temperature=get_settings().config.temperature, system=system_prompt, user=user_prompt,
+                response_schema=get_response_schema(system_prompt))
+        else:
+            response, finish_reason = await self.ai_handler.chat_completion(
+                model=model, temperature=get_settings().config.temperature, system=system_prompt, user=user_prompt)
         if not get_settings().config.publish_output:
             get_settings().system_prompt = system_prompt
             get_settings().user_prompt = user_prompt
 
         # load suggestions from the AI response
-        data = self._prepare_pr_code_suggestions(response)
+        if stream_parser is not None and stream_parser.stopped:
+            # the response was cut after the last needed suggestion, so it is not parsed again as a whole
+            data = {"code_suggestions": stream_parser.items}
+        else:
+            data = self._prepare_pr_code_suggestions(response)
 
         # self-reflect on suggestions (mandatory, since line numbers are generated now here)
         model_reflect_with_reasoning = get_model('model_reasoning')
@@ -486,56 +508,60 @@ class PRCodeSuggestions:
         return suggestion
 
     def _prepare_pr_code_suggestions(self, predictions: str) -> Dict:
-        data = load_yaml(predictions.strip(),
-                         keys_fix_yaml=["relevant_file", "suggestion_content", "existing_code", "improved_code"],
-                         first_key="code_suggestions", last_key="label")
+        data = load_prediction(predictions.strip(),
+                               keys_fix_yaml=CODE_SUGGESTIONS_KEYS_FIX_YAML,
+                               first_key="code_suggestions", last_key="label")
         if isinstance(data, list):
             data = {'code_suggestions': data}
 
         # remove or edit invalid suggestions
         suggestion_list = []
-        one_sentence_summary_list = []
         for i, suggestion in enumerate(data['code_suggestions']):
-            try:
-                needed_keys = ['one_sentence_summary', 'label', 'relevant_file']
-                is_valid_keys = True
-                for key in needed_keys:
-                    if key not in suggestion:
-                        is_valid_keys = False
-                        get_logger().debug(
-                            f"Skipping suggestion {i + 1}, because it does not contain '{key}':\n'{suggestion}")
-                        break
-                if not is_valid_keys:
-                    continue
-
-                if get_settings().get("pr_code_suggestions.focus_only_on_problems", False):
-                    CRITICAL_LABEL = 'critical'
-                    if CRITICAL_LABEL in suggestion['label'].lower(): # we want the published labels to be less declarative
-                        suggestion['label'] = 'possible issue'
-
-                if suggestion['one_sentence_summary'] in one_sentence_summary_list:
-                    get_logger().debug(f"Skipping suggestion {i + 1}, because it is a duplicate: {suggestion}")
-                    continue
-
-                if 'const' in suggestion['suggestion_content'] and 'instead' in suggestion[
-                    'suggestion_content'] and 'let' in suggestion['suggestion_content']:
-                    get_logger().debug(
-                        f"Skipping suggestion {i + 1}, because it uses 'const instead let': {suggestion}")
-                    continue
-
-                if ('existing_code' in suggestion) and ('improved_code' in suggestion):
-                    suggestion = self._truncate_if_needed(suggestion)
-                    one_sentence_summary_list.append(suggestion['one_sentence_summary'])
-                    suggestion_list.append(suggestion)
-                else:
-                    get_logger().info(
-                        f"Skipping suggestion {i + 1}, because it does not contain 'existing_code' or 'improved_code': {suggestion}")
-            except Exception as e:
-                get_logger().error(f"Error processing suggestion {i + 1}: {suggestion}, error: {e}")
+            suggestion = self._validate_code_suggestion(suggestion, suggestion_list, i)
+            if suggestion is not None:
+                suggestion_list.append(suggestion)
         data['code_suggestions'] = suggestion_list
 
         return data
 
+    def _validate_code_suggestion(self, suggestion: dict, valid_suggestions: List[dict], i: int = None):
+        """
+        Returns the suggestion (possibly edited) if it is valid and not a duplicate of 'valid_suggestions',
+        otherwise None.
+        """
+        if i is None:
+            i = len(valid_suggestions)
+        try:
+            needed_keys = ['one_sentence_summary', 'label', 'relevant_file']
+            for key in needed_keys:
+                if key not in suggestion:
+                    get_logger().debug(
+                        f"Skipping suggestion {i + 1}, because it does not contain '{key}':\n'{suggestion}")
+                    return None
+
+            if get_settings().get("pr_code_suggestions.focus_only_on_problems", False):
+                CRITICAL_LABEL = 'critical'
+                if CRITICAL_LABEL in suggestion['label'].lower(): # we want the published labels to be less declarative
+                    suggestion['label'] = 'possible issue'
+
+            if suggestion['one_sentence_summary'] in [s['one_sentence_summary'] for s in valid_suggestions]:
+                get_logger().debug(f"Skipping suggestion {i + 1}, because it is a duplicate: {suggestion}")
+                return None
+
+            if 'const' in suggestion['suggestion_content'] and 'instead' in suggestion[
+                'suggestion_content'] and 'let' in suggestion['suggestion_content']:
+                get_logger().debug(
+                    f"Skipping suggestion {i + 1}, because it uses 'const instead let': {suggestion}")
+                return None
+
+            if ('existing_code' in suggestion) and ('improved_code' in suggestion):
+                return self._truncate_if_needed(suggestion)
+            get_logger().info(
+                f"Skipping suggestion {i + 1}, because it does not contain 'existing_code' or 'improved_code': {suggestion}")
+        except Exception as e:
+            get_logger().error(f"Error processing suggestion {i + 1}: {suggestion}, error: {e}")
+        return None
+
     async def push_inline_code_suggestions(self, data):
         code_suggestions = []
 
@@ -740,7 +766,7 @@ class PRCodeSuggestions:
                 for patch_prompt in patches_diff_list_no_line_numbers:
                     file_prefix = "## File: "
                     patches = patch_prompt.strip().split(f"\n{file_prefix}")
-                    patches_new = copy.deepcopy(patches)
+                    patches_new = list(patches)  # strings are immutable, a shallow copy is enough
                     for i in range(len(patches_new)):
                         if i == 0:
                             prefix = patches_new[i].split("\n@@")[0].strip()
@@ -920,17 +946,16 @@ class PRCodeSuggestions:
                          'prev_suggestions_str': prev_suggestions_str,
                          "is_ai_metadata": get_settings().get("config.enable_ai_metadata", False),
                          'duplicate_prompt_examples': get_settings().config.get('duplicate_prompt_examples', False)}
-            environment = Environment(undefined=StrictUndefined)
 
             if dedicated_prompt:
-                system_prompt_reflect = environment.from_string(
+                system_prompt_reflect = get_prompt_template(
                     get_settings().get(dedicated_prompt).system).render(variables)
-                user_prompt_reflect = environment.from_string(
+                user_prompt_reflect = get_prompt_template(
                     get_settings().get(dedicated_prompt).user).render(variables)
             else:
-                system_prompt_reflect = environment.from_string(
+                system_prompt_reflect = get_prompt_template(
                     get_settings().pr_code_suggestions_reflect_prompt.system).render(variables)
-                user_prompt_reflect = environment.from_string(
+                user_prompt_reflect = get_prompt_template(
                     get_settings().pr_code_suggestions_reflect_prompt.user).render(variables)
 
             with get_logger().contextualize(command="self_reflect_on_suggestions"):
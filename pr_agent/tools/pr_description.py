@@ -6,7 +6,6 @@ from functools import partial
 from typing import List, Tuple
 
 import yaml
-from jinja2 import Environment, StrictUndefined
 
 from pr_agent.algo.ai_handlers.base_ai_handler import BaseAiHandler
 from pr_agent.algo.ai_handlers.litellm_ai_handler import LiteLLMAIHandler
@@ -14,6 +13,8 @@ from pr_agent.algo.pr_processing import (OUTPUT_BUFFER_TOKENS_HARD_THRESHOLD,
                                          get_pr_diff,
                                          get_pr_diff_multiple_patchs,
                                          retry_with_fallback_models)
+from pr_agent.algo.structured_output import get_response_schema, load_prediction
+from pr_agent.algo.template_registry import get_prompt_template
 from pr_agent.algo.token_handler import TokenHandler
 from pr_agent.algo.utils import (ModelType, PRDescriptionHeader, clip_tokens,
                                  get_max_tokens, get_user_labels, load_yaml,
@@ -325,7 +326,7 @@ class PRDescription:
             prediction = original_prediction
 
             # get the original prediction filenames
-            original_prediction_loaded = load_yaml(original_prediction, keys_fix_yaml=self.keys_fix)
+            original_prediction_loaded = load_prediction(original_prediction, keys_fix_yaml=self.keys_fix)
             if isinstance(original_prediction_loaded, list):
                 original_prediction_dict = {"pr_files": original_prediction_loaded}
             else:
@@ -395,7 +396,7 @@ class PRDescription:
     async def extend_additional_files(self, remaining_files_list) -> str:
         prediction = self.prediction
         try:
-            original_prediction_dict = load_yaml(self.prediction, keys_fix_yaml=self.keys_fix)
+            original_prediction_dict = load_prediction(self.prediction, keys_fix_yaml=self.keys_fix)
             prediction_extra = "pr_files:"
             for file in remaining_files_list:
                 extra_file_yaml = f"""\
@@ -425,25 +426,29 @@ class PRDescription:
         variables = copy.deepcopy(self.vars)
         variables["diff"] = patches_diff  # update diff
 
-        environment = Environment(undefined=StrictUndefined)
         set_custom_labels(variables, self.git_provider)
         self.variables = variables
 
-        system_prompt = environment.from_string(get_settings().get(prompt, {}).get("system", "")).render(self.variables)
-        user_prompt = environment.from_string(get_settings().get(prompt, {}).get("user", "")).render(self.variables)
+        system_prompt = get_prompt_template(get_settings().get(prompt, {}).get("system", "")).render(self.variables)
+        user_prompt = get_prompt_template(get_settings().get(prompt, {}).get("user", "")).render(self.variables)
 
+        kwargs = {}
+        # the large PR handling prompts are merged as YAML text, only the full description is structured
+        if prompt == "pr_description_prompt" and isinstance(self.ai_handler, LiteLLMAIHandler):
+            kwargs["response_schema"] = get_response_schema(system_prompt)
         response, finish_reason = await self.ai_handler.chat_completion(
             model=model,
             temperature=get_settings().config.temperature,
             system=system_prompt,
-            user=user_prompt
+            user=user_prompt,
+            **kwargs
         )
 
         return response
 
     def _prepare_data(self):
         # Load the AI prediction data into a dictionary
-        self.data = load_yaml(self.prediction.strip(), keys_fix_yaml=self.keys_fix)
+        self.data = load_prediction(self.prediction.strip(), keys_fix_yaml=self.keys_fix)
 
         if get_settings().pr_description.add_original_user_description and self.user_description:
             self.data["User Description"] = self.user_description
@@ -1,7 +1,6 @@
 import copy
 from functools import partial
 
-from jinja2 import Environment, StrictUndefined
 import math
 import os
 import re
@@ -11,6 +10,7 @@ from pr_agent.algo import MAX_TOKENS
 from pr_agent.algo.ai_handlers.base_ai_handler import BaseAiHandler
 from pr_agent.algo.ai_handlers.litellm_ai_handler import LiteLLMAIHandler
 from pr_agent.algo.pr_processing import retry_with_fallback_models
+from pr_agent.algo.template_registry import get_prompt_template
 from pr_agent.algo.token_handler import TokenHandler
 from pr_agent.algo.utils import clip_tokens, get_max_tokens, load_yaml, ModelType
 from pr_agent.config_loader import get_settings
@@ -261,9 +261,8 @@ class PredictionPreparator:
         try:
             self.ai_handler = ai_handler
             variables = copy.deepcopy(vars)
-            environment = Environment(undefined=StrictUndefined)
-            self.system_prompt = environment.from_string(system_prompt).render(variables)
-            self.user_prompt = environment.from_string(user_prompt).render(variables)
+            self.system_prompt = get_prompt_template(system_prompt).render(variables)
+            self.user_prompt = get_prompt_template(user_prompt).render(variables)
         except Exception as e:
             get_logger().exception(f"Caught exception during init. Setting ai_handler to None to prevent __call__.")
             self.ai_handler = None
@@ -5,17 +5,18 @@ from collections import OrderedDict
 from functools import partial
 from typing import List, Tuple
 
-from jinja2 import Environment, StrictUndefined
-
 from pr_agent.algo.ai_handlers.base_ai_handler import BaseAiHandler
 from pr_agent.algo.ai_handlers.litellm_ai_handler import LiteLLMAIHandler
+from pr_agent.algo.ai_handlers.prompt_caching import is_prompt_caching_enabled
 from pr_agent.algo.pr_processing import (add_ai_metadata_to_diff_files,
                                          get_pr_diff,
                                          retry_with_fallback_models)
+from pr_agent.algo.structured_output import get_response_schema, load_prediction
+from pr_agent.algo.template_registry import get_prompt_template
 from pr_agent.algo.token_handler import TokenHandler
 from pr_agent.algo.utils import (ModelType, PRReviewHeader,
                                  convert_to_markdown_v2, github_action_output,
-                                 load_yaml, show_relevant_configurations)
+                                 show_relevant_configurations)
 from pr_agent.config_loader import get_settings
 from pr_agent.git_providers import (get_git_provider,
                                     get_git_provider_with_context)
@@ -80,7 +81,9 @@ class PRReviewer:
             "description": self.pr_description,
             "language": self.main_language,
             "diff": "",  # empty diff for initial calculation
-            "num_pr_files": self.git_provider.get_num_of_files(),
+            # per-PR values are left out of the system prompt when it is cached by the provider. It still branches on
+            # related tickets, answered questions and AI metadata, so up to eight variants are cached per config
+            "num_pr_files": None if is_prompt_caching_enabled() else self.git_provider.get_num_of_files(),
             "num_max_findings": get_settings().pr_reviewer.num_max_findings,
             "require_score": get_settings().pr_reviewer.require_score_review,
             "require_tests": get_settings().pr_reviewer.require_tests_review,
@@ -213,15 +216,18 @@ class PRReviewer:
         variables = copy.deepcopy(self.vars)
         variables["diff"] = self.patches_diff  # update diff
 
-        environment = Environment(undefined=StrictUndefined)
-        system_prompt = environment.from_string(get_settings().pr_review_prompt.system).render(variables)
-        user_prompt = environment.from_string(get_settings().pr_review_prompt.user).render(variables)
+        system_prompt = get_prompt_template(get_settings().pr_review_prompt.system).render(variables)
+        user_prompt = get_prompt_template(get_settings().pr_review_prompt.user).render(variables)
 
+        kwargs = {}
+        if isinstance(self.ai_handler, LiteLLMAIHandler):
+            kwargs["response_schema"] = get_response_schema(system_prompt)
         response, finish_reason = await self.ai_handler.chat_completion(
             model=model,
             temperature=get_settings().config.temperature,
             system=system_prompt,
-            user=user_prompt
+            user=user_prompt,
+            **kwargs
         )
 
         return response
@@ -233,10 +239,11 @@ class PRReviewer:
         """
         first_key = 'review'
         last_key = 'security_concerns'
-        data = load_yaml(self.prediction.strip(),
-                         keys_fix_yaml=["ticket_compliance_check", "estimated_effort_to_review_[1-5]:", "security_concerns:", "key_issues_to_review:",
-                                        "relevant_file:", "relevant_line:", "suggestion:"],
-                         first_key=first_key, last_key=last_key)
+        data = load_prediction(self.prediction.strip(),
+                               keys_fix_yaml=["ticket_compliance_check", "estimated_effort_to_review_[1-5]:",
+                                              "security_concerns:", "key_issues_to_review:",
+                                              "relevant_file:", "relevant_line:", "suggestion:"],
+                               first_key=first_key, last_key=last_key)
         github_action_output(data, 'review')
 
         if 'review' not in data:
@@ -4,11 +4,10 @@ from functools import partial
 from time import sleep
 from typing import Tuple
 
-from jinja2 import Environment, StrictUndefined
-
 from pr_agent.algo.ai_handlers.base_ai_handler import BaseAiHandler
 from pr_agent.algo.ai_handlers.litellm_ai_handler import LiteLLMAIHandler
 from pr_agent.algo.pr_processing import get_pr_diff, retry_with_fallback_models
+from pr_agent.algo.template_registry import get_prompt_template
 from pr_agent.algo.token_handler import TokenHandler
 from pr_agent.algo.utils import ModelType, show_relevant_configurations
 from pr_agent.config_loader import get_settings
@@ -105,9 +104,8 @@ class PRUpdateChangelog:
         variables["diff"] = self.patches_diff  # update diff
         if get_settings().pr_update_changelog.add_pr_link:
             variables["pr_link"] = self.git_provider.get_pr_url()
-        environment = Environment(undefined=StrictUndefined)
-        system_prompt = environment.from_string(get_settings().pr_update_changelog_prompt.system).render(variables)
-        user_prompt = environment.from_string(get_settings().pr_update_changelog_prompt.user).render(variables)
+        system_prompt = get_prompt_template(get_settings().pr_update_changelog_prompt.system).render(variables)
+        user_prompt = get_prompt_template(get_settings().pr_update_changelog_prompt.user).render(variables)
         response, finish_reason = await self.ai_handler.chat_completion(
             model=model, system=system_prompt, user=user_prompt, temperature=get_settings().config.temperature)
 
@@ -0,0 +1,78 @@
+"""
+Benchmark of 'decouple_and_convert_to_hunks_with_lines_numbers' on large synthetic patches.
+
+Usage:
+    python tests/benchmarks/benchmark_decouple_hunks.py [--lines 10000 50000] [--baseline <git revision>]
+
+With '--baseline', the implementation at the given git revision (e.g. a commit before the linear-time renderer)
+is timed as well, and its output is checked against the current one.
+"""
+import argparse
+import importlib.util
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from pr_agent.algo import git_patch_processing  # noqa: E402
+from pr_agent.algo.types import FilePatchInfo  # noqa: E402
+
+MODULE_PATH = "pr_agent/algo/git_patch_processing.py"
+LINES_PER_HUNK = 10
+
+
+def make_patch(num_lines: int) -> str:
+    lines = []
+    start = 1
+    for hunk_i in range(num_lines // LINES_PER_HUNK):
+        lines.append(f"@@ -{start},{LINES_PER_HUNK - 1} +{start},{LINES_PER_HUNK - 1} @@ def func_{hunk_i}():")
+        lines += [f" context_line_{start + i} = compute(value, {i}) * 2" for i in range(LINES_PER_HUNK - 2)]
+        lines.append(f"-    return old_value_{hunk_i}")
+        lines.append(f"+    return new_value_{hunk_i}")
+        start += LINES_PER_HUNK + 5
+    return "\n".join(lines)
+
+
+def load_baseline_module(revision: str):
+    source = subprocess.run(["git", "show", f"{revision}:{MODULE_PATH}"], check=True, stdout=subprocess.PIPE,
+                            cwd=os.path.dirname(__file__)).stdout
+    with tempfile.NamedTemporaryFile("wb", suffix=".py", delete=False) as f:
+        f.write(source)
+    spec = importlib.util.spec_from_file_location("baseline_git_patch_processing", f.name)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    os.remove(f.name)
+    return module
+
+
+def time_render(module, patch: str, file: FilePatchInfo) -> tuple[float, str]:
+    start_time = time.perf_counter()
+    output = module.decouple_and_convert_to_hunks_with_lines_numbers(patch, file)
+    return time.perf_counter() - start_time, output
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lines", type=int, nargs="+", default=[10000, 50000])
+    parser.add_argument("--baseline", help="git revision of the implementation to compare against")
+    args = parser.parse_args()
+
+    baseline = load_baseline_module(args.baseline) if args.baseline else None
+    for num_lines in args.lines:
+        patch = make_patch(num_lines)
+        file = FilePatchInfo("", "", patch, "file.py")
+        elapsed, output = time_render(git_patch_processing, patch, file)
+        print(f"{num_lines} lines: current {elapsed * 1000:.1f} ms", end="")
+        if baseline:
+            baseline_elapsed, baseline_output = time_render(baseline, patch, file)
+            same_output = "identical output" if baseline_output == output else "OUTPUT DIFFERS"
+            print(f", baseline {baseline_elapsed * 1000:.1f} ms ({baseline_elapsed / elapsed:.1f}x, {same_output})",
+                  end="")
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Benchmark of 'try_fix_yaml' on the malformed AI responses of tests/unittest/test_try_fix_yaml.py.
+
+Usage:
+    python tests/benchmarks/benchmark_try_fix_yaml.py [--repeat 200] [--scale 1 50] [--baseline <git revision>]
+
+Each case is a response recorded from a test of TestTryFixYaml. With '--scale N', the list items of the responses
+are repeated N times, to time long responses. With '--baseline', the implementation at the given git revision
+(e.g. a commit before the single-pass repair) is timed as well, and its output is checked against the current one.
+"""
+import argparse
+import importlib.util
+import inspect
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
+
+from pr_agent.algo import utils  # noqa: E402
+from pr_agent.log import setup_logger  # noqa: E402
+from tests.unittest import test_try_fix_yaml  # noqa: E402
+
+MODULE_PATH = "pr_agent/algo/utils.py"
+
+
+def collect_cases() -> list[tuple[str, tuple, dict]]:
+    """
+    Runs the tests of TestTryFixYaml with a recording 'try_fix_yaml', and returns the name and arguments of each call.
+    """
+    cases = []
+    original_try_fix_yaml = test_try_fix_yaml.try_fix_yaml
+    test_instance = test_try_fix_yaml.TestTryFixYaml()
+    for name in sorted(dir(test_instance)):
+        test = getattr(test_instance, name)
+        if not name.startswith("test_") or inspect.signature(test).parameters:  # skip the tests using fixtures
+            continue
+
+        def recorder(*args, _name=name, **kwargs):
+            cases.append((_name, args, kwargs))
+            return original_try_fix_yaml(*args, **kwargs)
+
+        test_try_fix_yaml.try_fix_yaml = recorder
+        try:
+            test()
+        finally:
+            test_try_fix_yaml.try_fix_yaml = original_try_fix_yaml
+    return cases
+
+
+def scale_response(response_text: str, scale: int) -> str:
+    """
+    Repeats the list items (from the first '- ' line to the closing code fence or brace) 'scale' times.
+    """
+    if scale <= 1:
+        return response_text
+    lines = response_text.split("\n")
+    item_start = next((i for i, line in enumerate(lines) if line.lstrip().startswith("- ")), None)
+    if item_start is None:
+        return response_text
+    item_end = next((i for i in range(item_start, len(lines)) if lines[i].startswith("```") or
+                     lines[i].strip() == "}"), len(lines))
+    while item_end > item_start + 1 and not lines[item_end - 1].strip():
+        item_end -= 1
+    return "\n".join(lines[:item_start] + lines[item_start:item_end] * scale + lines[item_end:])
+
+
+def load_baseline_module(revision: str):
+    source = subprocess.run(["git", "show", f"{revision}:{MODULE_PATH}"], check=True, stdout=subprocess.PIPE,
+                            cwd=os.path.dirname(__file__)).stdout
+    with tempfile.NamedTemporaryFile("wb", suffix=".py", delete=False) as f:
+        f.write(source)
+    spec = importlib.util.spec_from_file_location("baseline_utils", f.name)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    os.remove(f.name)
+    return module
+
+
+def time_fix(module, cases: list, repeat: int) -> tuple[float, list]:
+    start_time = time.perf_counter()
+    for _ in range(repeat):
+        outputs = [module.try_fix_yaml(*args, **kwargs) for _, args, kwargs in cases]
+    return (time.perf_counter() - start_time) / repeat, outputs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument("--scale", type=int, nargs="+", default=[1, 50])
+    parser.add_argument("--baseline", help="git revision of the implementation to compare against")
+    args = parser.parse_args()
+
+    setup_logger(level="WARNING")
+    baseline = load_baseline_module(args.baseline) if args.baseline else None
+    cases = collect_cases()
+    for scale in args.scale:
+        scaled_cases = [(name, (scale_response(call_args[0], scale),) + call_args[1:], kwargs)
+                        for name, call_args, kwargs in cases]
+        repeat = max(1, args.repeat // scale)
+        print(f"scale {scale}:")
+        for case in scaled_cases:
+            elapsed, output = time_fix(utils, [case], repeat)
+            print(f"  {case[0]}: current {elapsed * 1000:.2f} ms", end="")
+            if baseline:
+                baseline_elapsed, baseline_output = time_fix(baseline, [case], repeat)
+                same_output = "identical output" if baseline_output == output else "OUTPUT DIFFERS"
+                print(f", baseline {baseline_elapsed * 1000:.2f} ms ({baseline_elapsed / elapsed:.1f}x, "
+                      f"{same_output})", end="")
+            print()
+
+
+if __name__ == "__main__":
+    main()
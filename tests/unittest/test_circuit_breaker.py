@@ -0,0 +1,189 @@
+from unittest.mock import AsyncMock, patch
+
+import openai
+import pytest
+from tenacity import RetryError
+
+from pr_agent.algo import model_health
+from pr_agent.algo.ai_handlers.litellm_ai_handler import LiteLLMAIHandler
+from pr_agent.algo.model_health import (
+    CIRCUIT_CLOSED,
+    CIRCUIT_HALF_OPEN,
+    CIRCUIT_OPEN,
+    ModelCircuitBreaker,
+    ModelLatencyTracker,
+    track_model_call,
+)
+from pr_agent.algo.pr_processing import retry_with_fallback_models
+from pr_agent.config_loader import get_settings
+
+
+class _FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake_clock = _FakeClock()
+    monkeypatch.setattr(model_health.time, "monotonic", fake_clock.monotonic)
+    return fake_clock
+
+
+@pytest.fixture(autouse=True)
+def breaker_settings(monkeypatch):
+    monkeypatch.setattr(get_settings().config, 'model', 'primary')
+    monkeypatch.setattr(get_settings().config, 'fallback_models', ['fallback'])
+    monkeypatch.setattr(get_settings().config, 'enable_hedged_requests', False)
+    monkeypatch.setattr(get_settings().config, 'enable_circuit_breaker', True)
+    monkeypatch.setattr(get_settings().config, 'circuit_breaker_failure_threshold', 2)
+    monkeypatch.setattr(get_settings().config, 'circuit_breaker_open_seconds', 60)
+    monkeypatch.setattr(get_settings().config, 'circuit_breaker_slow_call_seconds', 0)
+    monkeypatch.setattr(model_health, '_latency_tracker', ModelLatencyTracker())
+    breaker = ModelCircuitBreaker()
+    monkeypatch.setattr(model_health, '_circuit_breaker', breaker)
+    return breaker
+
+
+def _prediction(failing: set, failing_before_llm_call: set = frozenset()):
+    calls = []
+
+    async def predict(model):
+        calls.append(model)
+        if model in failing_before_llm_call:
+            raise ValueError(f"failed to prepare the prediction for {model}")
+        with track_model_call(model, None):  # the LLM call, as in chat_completion
+            if model in failing:
+                raise ValueError(f"{model} failed")
+        return f"answer from {model}"
+
+    return predict, calls
+
+
+class TestModelCircuitBreaker:
+    def test_opens_after_consecutive_failures(self, clock, breaker_settings):
+        breaker = breaker_settings
+        breaker.record_failure("primary", None)
+        assert breaker.get_state("primary") == CIRCUIT_CLOSED
+        breaker.record_success("primary", None, 1)
+        breaker.record_failure("primary", None)
+        assert breaker.get_state("primary") == CIRCUIT_CLOSED
+        breaker.record_failure("primary", None)
+        assert breaker.get_state("primary") == CIRCUIT_OPEN
+
+    def test_circuits_are_per_deployment(self, clock, breaker_settings):
+        breaker = breaker_settings
+        breaker.record_failure("primary", "east")
+        breaker.record_failure("primary", "east")
+        assert breaker.select_targets([("primary", "east"), ("primary", "west")]) == [("primary", "west")]
+
+    def test_healthy_targets_come_first(self, clock, breaker_settings):
+        breaker = breaker_settings
+        breaker.record_failure("primary", None)
+        assert breaker.select_targets([("primary", None), ("fallback", None)]) == [("fallback", None),
+                                                                                   ("primary", None)]
+
+    def test_single_probe_after_open_period(self, clock, breaker_settings):
+        breaker = breaker_settings
+        breaker.record_failure("primary", None)
+        breaker.record_failure("primary", None)
+        targets = [("primary", None), ("fallback", None)]
+        assert breaker.select_targets(targets) == [("fallback", None)]
+
+        clock.now += 60
+        assert breaker.select_targets(targets) == targets
+        assert breaker.get_state("primary") == CIRCUIT_HALF_OPEN
+        # the probe is handed to a single request
+        assert breaker.select_targets(targets) == [("fallback", None)]
+
+        breaker.record_failure("primary", None)
+        assert breaker.get_state("primary") == CIRCUIT_OPEN
+        clock.now += 60
+        assert breaker.select_targets(targets) == targets
+        breaker.record_success("primary", None, 1)
+        assert breaker.get_state("primary") == CIRCUIT_CLOSED
+
+    def test_slow_calls_count_as_failures(self, clock, breaker_settings, monkeypatch):
+        monkeypatch.setattr(get_settings().config, 'circuit_breaker_slow_call_seconds', 10)
+        breaker = breaker_settings
+        breaker.record_success("primary", None, 11)
+        breaker.record_success("primary", None, 11)
+        assert breaker.get_state("primary") == CIRCUIT_OPEN
+
+    def test_disabled(self, clock, breaker_settings, monkeypatch):
+        monkeypatch.setattr(get_settings().config, 'enable_circuit_breaker', False)
+        breaker = breaker_settings
+        for _ in range(5):
+            breaker.record_failure("primary", None)
+        assert breaker.get_state("primary") == CIRCUIT_CLOSED
+        assert breaker.select_targets([("primary", None)]) == [("primary", None)]
+
+
+class TestRetryWithCircuitBreaker:
+    @pytest.mark.asyncio
+    async def test_failing_model_is_tried_last_then_skipped(self, clock):
+        predict, calls = _prediction(failing={'primary'})
+        assert await retry_with_fallback_models(predict) == "answer from fallback"
+        assert calls == ['primary', 'fallback']
+
+        calls.clear()
+        assert await retry_with_fallback_models(predict) == "answer from fallback"
+        assert calls == ['fallback']
+
+    @pytest.mark.asyncio
+    async def test_open_model_is_skipped(self, clock, monkeypatch):
+        monkeypatch.setattr(get_settings().config, 'circuit_breaker_failure_threshold', 1)
+        predict, calls = _prediction(failing={'primary', 'fallback'})
+        with pytest.raises(Exception, match="Failed to generate prediction with any model"):
+            await retry_with_fallback_models(predict)
+        assert calls == ['primary', 'fallback']
+
+        calls.clear()
+        clock.now += 60
+        predict, calls = _prediction(failing={'primary'})
+        assert await retry_with_fallback_models(predict) == "answer from fallback"
+        assert calls == ['primary', 'fallback']
+
+    @pytest.mark.asyncio
+    async def test_recovered_model_is_probed(self, clock, monkeypatch):
+        monkeypatch.setattr(get_settings().config, 'circuit_breaker_failure_threshold', 1)
+        predict, calls = _prediction(failing={'primary'})
+        await retry_with_fallback_models(predict)
+        calls.clear()
+        await retry_with_fallback_models(predict)
+        assert calls == ['fallback']
+
+        clock.now += 60
+        predict, calls = _prediction(failing=set())
+        assert await retry_with_fallback_models(predict) == "answer from primary"
+        assert calls == ['primary']
+
+    @pytest.mark.asyncio
+    async def test_all_circuits_open(self, clock):
+        predict, calls = _prediction(failing={'primary', 'fallback'})
+        for _ in range(2):
+            with pytest.raises(Exception, match="Failed to generate prediction with any model"):
+                await retry_with_fallback_models(predict)
+        calls.clear()
+        with pytest.raises(Exception, match="the circuits of all models of .* are open"):
+            await retry_with_fallback_models(predict)
+        assert calls == []
+
+    @pytest.mark.asyncio
+    async def test_failures_outside_of_the_llm_call_do_not_count(self, clock, breaker_settings):
+        predict, calls = _prediction(failing=set(), failing_before_llm_call={'primary'})
+        for _ in range(3):
+            assert await retry_with_fallback_models(predict) == "answer from fallback"
+        assert breaker_settings.get_state("primary") == CIRCUIT_CLOSED
+        assert calls[-2:] == ['primary', 'fallback']
+
+    @pytest.mark.asyncio
+    async def test_chat_completion_failures_are_recorded(self, clock, breaker_settings):
+        with patch("pr_agent.algo.ai_handlers.litellm_ai_handler.acompletion",
+                   new=AsyncMock(side_effect=openai.APITimeoutError(request=None))):
+            with pytest.raises(RetryError):
+                await LiteLLMAIHandler().chat_completion(model="gpt-4o", system="system", user="user")
+        assert breaker_settings.get_state("gpt-4o") == CIRCUIT_OPEN  # both attempts of the tenacity retry failed
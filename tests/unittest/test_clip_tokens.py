@@ -1,6 +1,6 @@
 import pytest
 from unittest.mock import patch, MagicMock
-from pr_agent.algo.utils import clip_tokens
+from pr_agent.algo.utils import clip_tokens, clip_tokens_exact
 from pr_agent.algo.token_handler import TokenEncoder
 
 
@@ -305,4 +305,53 @@ class TestClipTokens:
         max_tokens = 10
         result = clip_tokens(text, max_tokens)
         expected_results = 'line1\nline2\nline3\n\n...(truncated)'
-        assert result == expected_results
\ No newline at end of file
+        assert result == expected_results
+
+
+class ByteEncoder:
+    """A byte-level tokenizer: every utf-8 byte is one token."""
+    name = "test_bytes"
+
+    def encode(self, text, **kwargs):
+        return list(text.encode('utf-8'))
+
+    def decode_bytes(self, tokens):
+        return bytes(tokens)
+
+
+class TestClipTokensExact:
+    def test_text_under_token_limit(self):
+        with patch.object(TokenEncoder, 'get_token_encoder', return_value=ByteEncoder()):
+            assert clip_tokens_exact("line1\nline2", 100) == ("line1\nline2", 11)
+
+    def test_clip_snaps_to_line_boundary(self):
+        text = "line1\nline2\nline3\nline4"
+        with patch.object(TokenEncoder, 'get_token_encoder', return_value=ByteEncoder()):
+            result, num_tokens = clip_tokens_exact(text, 14, add_three_dots=False)
+        assert result == "line1\nline2"
+        assert num_tokens == len(result)
+
+    def test_clip_with_three_dots_stays_within_budget(self):
+        text = "\n".join(f"line{i}" for i in range(100))
+        with patch.object(TokenEncoder, 'get_token_encoder', return_value=ByteEncoder()):
+            result, num_tokens = clip_tokens_exact(text, 50)
+        assert result.endswith("\n...(truncated)")
+        assert num_tokens == len(result.encode('utf-8')) <= 50
+        assert result[:-len("\n...(truncated)")] == "line0\nline1\nline2\nline3\nline4"
+
+    def test_clip_does_not_split_multibyte_characters(self):
+        text = "\u00e9" * 20  # two bytes per character, no line breaks
+        with patch.object(TokenEncoder, 'get_token_encoder', return_value=ByteEncoder()):
+            result, num_tokens = clip_tokens_exact(text, 9, add_three_dots=False)
+        assert result == "\u00e9" * 4
+        assert num_tokens == 8
+
+    def test_non_positive_budget(self):
+        with patch.object(TokenEncoder, 'get_token_encoder', return_value=ByteEncoder()):
+            assert clip_tokens_exact("line1\nline2", 0) == ("", 0)
+            assert clip_tokens_exact("line1\nline2", 5) == ("", 0)  # no room for the truncation indicator
+
+    def test_clip_tokens_exact_flag(self):
+        text = "line1\nline2\nline3\nline4"
+        with patch.object(TokenEncoder, 'get_token_encoder', return_value=ByteEncoder()):
+            assert clip_tokens(text, 14, add_three_dots=False, exact=True) == "line1\nline2"
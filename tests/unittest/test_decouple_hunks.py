@@ -0,0 +1,39 @@
+from pr_agent.algo.git_patch_processing import decouple_and_convert_to_hunks_with_lines_numbers
+from pr_agent.algo.types import EDIT_TYPE, FilePatchInfo
+
+PATCH = """@@ -1,3 +1,3 @@ def foo():
+ line1
+-line2
++line2 changed
+ line3  
+@@ -10,2 +10,3 @@
+ line10
++line11
+ line12"""
+
+
+class TestDecoupleAndConvertToHunksWithLineNumbers:
+    def test_output(self):
+        # trailing whitespace before a section is trimmed
+        expected = ("\n\n## File: 'file.py'\n"
+                    "\n@@ -1,3 +1,3 @@ def foo():\n"
+                    "__new hunk__\n1  line1\n2 +line2 changed\n3  line3\n"
+                    "__old hunk__\n line1\n-line2\n line3  \n"
+                    "\n@@ -10,2 +10,3 @@\n"
+                    "__new hunk__\n10  line10\n11 +line11\n12  line12")
+        file = FilePatchInfo("", "", PATCH, "file.py")
+        assert decouple_and_convert_to_hunks_with_lines_numbers(PATCH, file) == expected
+
+    def test_without_file(self):
+        output = decouple_and_convert_to_hunks_with_lines_numbers(PATCH, None)
+        assert output.startswith("\n@@ -1,3 +1,3 @@ def foo():\n__new hunk__\n")
+
+    def test_deleted_file(self):
+        file = FilePatchInfo("", "", PATCH, "file.py", edit_type=EDIT_TYPE.DELETED)
+        assert decouple_and_convert_to_hunks_with_lines_numbers(PATCH, file) == "\n\n## File 'file.py' was deleted\n"
+
+    def test_large_patch(self):
+        hunks = [f"@@ -{i * 10 + 1},2 +{i * 10 + 1},2 @@\n context {i}\n-old {i}\n+new {i}" for i in range(2000)]
+        output = decouple_and_convert_to_hunks_with_lines_numbers("\n".join(hunks), None)
+        assert output.count("__new hunk__") == 2000
+        assert output.endswith("__old hunk__\n context 1999\n-old 1999")
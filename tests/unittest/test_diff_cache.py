@@ -0,0 +1,106 @@
+from unittest.mock import MagicMock
+
+from pr_agent.algo.diff_cache import DiskDiffArtifactCache, InMemoryDiffArtifactCache, get_diff_cache_key
+from pr_agent.algo.pr_processing import get_pr_diff
+from pr_agent.algo.types import EDIT_TYPE, FilePatchInfo
+from pr_agent.config_loader import get_settings
+
+
+class TestInMemoryDiffArtifactCache:
+    def test_get_and_set(self):
+        cache = InMemoryDiffArtifactCache(max_size_bytes=1024)
+        cache.set("key", {"patches": ["a"]})
+        assert cache.get("key") == {"patches": ["a"]}
+        assert cache.get("missing") is None
+
+    def test_returned_value_is_a_copy(self):
+        cache = InMemoryDiffArtifactCache(max_size_bytes=1024)
+        cache.set("key", {"patches": ["a"], "tokens": [1]})
+        value = cache.get("key")
+        value["patches"].append("b")
+        value["tokens"][0] = 2
+        assert cache.get("key") == {"patches": ["a"], "tokens": [1]}
+
+    def test_lru_eviction_by_size(self):
+        cache = InMemoryDiffArtifactCache(max_size_bytes=80)  # room for two 33-byte entries
+        cache.set("first", {"patch": "x" * 20})
+        cache.set("second", {"patch": "y" * 20})
+        cache.get("first")  # 'second' is now the least recently used entry
+        cache.set("third", {"patch": "z" * 20})
+        assert cache.get("first") is not None
+        assert cache.get("second") is None
+        assert cache.get("third") is not None
+
+    def test_entry_larger_than_cache_is_ignored(self):
+        cache = InMemoryDiffArtifactCache(max_size_bytes=10)
+        cache.set("key", {"patch": "x" * 100})
+        assert cache.get("key") is None
+
+
+class TestDiskDiffArtifactCache:
+    def test_get_and_set(self, tmp_path):
+        cache = DiskDiffArtifactCache(str(tmp_path), max_size_bytes=1024)
+        cache.set("key", {"tokens": [1, 2, 3]})
+        assert cache.get("key") == {"tokens": [1, 2, 3]}
+        # a new instance on the same directory sees the stored artifact
+        assert DiskDiffArtifactCache(str(tmp_path), max_size_bytes=1024).get("key") == {"tokens": [1, 2, 3]}
+
+    def test_eviction_by_size(self, tmp_path):
+        cache = DiskDiffArtifactCache(str(tmp_path), max_size_bytes=100)
+        for i in range(5):
+            cache.set(f"key{i}", {"patch": "x" * 30})
+        total_size = sum(f.stat().st_size for f in tmp_path.glob("*.json"))
+        assert total_size <= 100
+        assert cache.get("key4") is not None
+
+
+class TestDiffCacheKey:
+    def test_no_key_without_revision(self):
+        git_provider = MagicMock()
+        git_provider.get_diff_revision.return_value = None
+        assert get_diff_cache_key(git_provider, "pr_diff") is None
+
+    def test_key_depends_on_revision_and_params(self):
+        git_provider = MagicMock()
+        git_provider.get_diff_revision.return_value = ("repo", "base", "head")
+        key = get_diff_cache_key(git_provider, "pr_diff", add_line_numbers_to_hunks=True)
+        assert key == get_diff_cache_key(git_provider, "pr_diff", add_line_numbers_to_hunks=True)
+        assert key != get_diff_cache_key(git_provider, "pr_diff", add_line_numbers_to_hunks=False)
+        git_provider.get_diff_revision.return_value = ("repo", "base", "head2")
+        assert key != get_diff_cache_key(git_provider, "pr_diff", add_line_numbers_to_hunks=True)
+
+    def test_key_depends_on_bad_extensions(self, monkeypatch):
+        git_provider = MagicMock()
+        git_provider.get_diff_revision.return_value = ("repo", "base", "head")
+        key = get_diff_cache_key(git_provider, "pr_diff")
+        monkeypatch.setattr(get_settings().bad_extensions, "extra", ["py"], raising=False)
+        assert key != get_diff_cache_key(git_provider, "pr_diff")
+
+
+class TestGetPrDiffWithCache:
+    def test_second_call_skips_git_provider(self, monkeypatch):
+        monkeypatch.setattr(get_settings().diff_cache, 'enable', True)
+        monkeypatch.setattr(get_settings().diff_cache, 'backend', 'memory')
+        diff_file = FilePatchInfo("line1\nline2\n", "line1\nline2 changed\n",
+                                  "@@ -1,2 +1,2 @@\n line1\n-line2\n+line2 changed", "file.py",
+                                  edit_type=EDIT_TYPE.MODIFIED)
+        git_provider = MagicMock()
+        git_provider.get_diff_revision.return_value = ("test/repo", "base_sha_cache_test", "head_sha_cache_test")
+        git_provider.get_diff_files.return_value = [diff_file]
+        git_provider.get_languages.return_value = {"Python": 100}
+        token_handler = MagicMock()
+        token_handler.prompt_tokens = 100
+        token_handler.count_tokens.side_effect = lambda text: len(text.split())
+        token_handler.count_tokens_batch.side_effect = lambda texts: [len(text.split()) for text in texts]
+
+        first = get_pr_diff(git_provider, token_handler, "gpt-4o")
+        assert git_provider.get_diff_files.call_count == 1
+
+        second = get_pr_diff(git_provider, token_handler, "gpt-4o")
+        assert second == first
+        assert git_provider.get_diff_files.call_count == 1
+
+        # a tool with a longer prompt has a smaller budget for the file contents
+        token_handler.prompt_tokens = 1000
+        get_pr_diff(git_provider, token_handler, "gpt-4o")
+        assert git_provider.get_diff_files.call_count == 2
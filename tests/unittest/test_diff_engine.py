@@ -0,0 +1,46 @@
+import pytest
+
+from pr_agent.algo import diff_engine
+from pr_agent.algo.diff_engine import DiffTimeoutError, generate_unified_diff, register_diff_engine
+from pr_agent.algo.utils import load_large_diff
+from pr_agent.config_loader import get_settings
+
+ORIGINAL = "line1\nline2\nline3\n"
+NEW = "line1\nline2 changed\nline3\nline4\n"
+
+
+@pytest.fixture
+def diff_engines(monkeypatch):
+    """
+    Engines registered by a test are dropped after it.
+    """
+    monkeypatch.setattr(diff_engine, "_DIFF_ENGINES", dict(diff_engine._DIFF_ENGINES))
+
+
+class TestDiffEngine:
+    def test_git_engine_matches_difflib(self, monkeypatch):
+        difflib_patch = generate_unified_diff("file.py", ORIGINAL, NEW)
+        monkeypatch.setattr(get_settings().config, 'diff_engine', 'git')
+        assert generate_unified_diff("file.py", ORIGINAL, NEW) == difflib_patch
+
+    def test_header_only_over_max_lines(self, monkeypatch):
+        monkeypatch.setattr(get_settings().config, 'large_diff_max_lines', 3)
+        assert generate_unified_diff("file.py", ORIGINAL, NEW) == "--- \n+++ \n@@ -1,3 +1,4 @@\n"
+
+    def test_header_only_on_timeout(self, monkeypatch, diff_engines):
+        def slow_engine(original, new, timeout):
+            raise DiffTimeoutError()
+
+        register_diff_engine('slow', slow_engine)
+        monkeypatch.setattr(get_settings().config, 'diff_engine', 'slow')
+        assert load_large_diff("file.py", NEW, ORIGINAL) == "--- \n+++ \n@@ -1,3 +1,4 @@\n"
+
+    def test_failing_engine_falls_back_to_difflib(self, monkeypatch, diff_engines):
+        difflib_patch = generate_unified_diff("file.py", ORIGINAL, NEW)
+
+        def broken_engine(original, new, timeout):
+            raise RuntimeError("broken")
+
+        register_diff_engine('broken', broken_engine)
+        monkeypatch.setattr(get_settings().config, 'diff_engine', 'broken')
+        assert generate_unified_diff("file.py", ORIGINAL, NEW) == difflib_patch
@@ -0,0 +1,141 @@
+import copy
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from pr_agent.config_loader import LayeredSettings, global_settings
+from pr_agent.git_providers import _GIT_PROVIDERS, get_git_provider_with_context
+from pr_agent.git_providers.git_provider import IncrementalPR
+from pr_agent.git_providers.github_provider import GithubProvider
+from pr_agent.git_providers.provider_cache import get_git_provider_cache
+from pr_agent.servers.github_app import invalidate_cached_git_provider, revalidate_cached_git_provider
+
+PR_URL = "https://api.github.com/repos/org/repo/pulls/1"
+
+
+class _FakeProvider:
+    instances = 0
+
+    def __init__(self, pr_url):
+        _FakeProvider.instances += 1
+        self.pr_url = pr_url
+        self.revision = "head1:base1"
+        self.revalidations = 0
+
+    def get_pr_revision(self):
+        return self.revision
+
+    def revalidate_pr(self):
+        self.revalidations += 1
+        return False
+
+    def copy_for_request(self):
+        return copy.copy(self)
+
+
+@pytest.fixture
+def request_context(monkeypatch):
+    settings = LayeredSettings(global_settings)
+    settings.set("config.git_provider", "fake")
+    settings.set("git_provider_cache.enable", True)
+    request_context = {"settings": settings, "installation_id": 1}
+    monkeypatch.setitem(_GIT_PROVIDERS, "fake", _FakeProvider)
+    _FakeProvider.instances = 0
+    get_git_provider_cache().clear()
+    with patch("pr_agent.config_loader.context", request_context), \
+            patch("pr_agent.git_providers.context", request_context), \
+            patch("pr_agent.git_providers.provider_cache.context", request_context):
+        yield request_context
+    get_git_provider_cache().clear()
+
+
+def _new_request(request_context):
+    request_context.pop("git_provider", None)
+
+
+def _cached_provider():
+    return next(iter(get_git_provider_cache()._entries.values()))[0]
+
+
+class TestGitProviderCache:
+    def test_provider_is_reused_within_a_request(self, request_context):
+        provider = get_git_provider_with_context(PR_URL)
+        assert get_git_provider_with_context(PR_URL) is provider
+        assert _FakeProvider.instances == 1
+
+    @pytest.mark.asyncio
+    async def test_provider_is_reused_across_requests(self, request_context):
+        first = get_git_provider_with_context(PR_URL)
+        _new_request(request_context)
+        await revalidate_cached_git_provider({"pull_request": {"url": PR_URL}}, "labeled")
+        second = get_git_provider_with_context(PR_URL)
+        assert _FakeProvider.instances == 1
+        assert second is not first  # each request gets its own copy
+        assert _cached_provider().revalidations == 1
+
+    @pytest.mark.asyncio
+    async def test_revision_change_rebuilds_the_provider(self, request_context):
+        get_git_provider_with_context(PR_URL)
+        _cached_provider().revision = "head2:base1"  # new commits seen by the revalidation
+        _new_request(request_context)
+        await get_git_provider_cache().revalidate("fake", PR_URL)
+        get_git_provider_with_context(PR_URL)
+        assert _FakeProvider.instances == 2
+
+    def test_provider_not_revalidated_recently_is_not_reused(self, request_context):
+        request_context["settings"].set("git_provider_cache.revalidation_max_age_seconds", -1)
+        get_git_provider_with_context(PR_URL)
+        _new_request(request_context)
+        get_git_provider_with_context(PR_URL)  # no request is made on the event loop: rebuilt instead
+        assert _FakeProvider.instances == 2
+        assert _cached_provider().revalidations == 0
+
+    def test_other_credentials_do_not_share_a_provider(self, request_context):
+        get_git_provider_with_context(PR_URL)
+        _new_request(request_context)
+        request_context["installation_id"] = 2
+        get_git_provider_with_context(PR_URL)
+        assert _FakeProvider.instances == 2
+
+    def test_ttl_and_disabled_cache(self, request_context):
+        request_context["settings"].set("git_provider_cache.ttl_seconds", -1)
+        get_git_provider_with_context(PR_URL)
+        _new_request(request_context)
+        get_git_provider_with_context(PR_URL)
+        assert _FakeProvider.instances == 2
+        request_context["settings"].set("git_provider_cache.enable", False)
+        _new_request(request_context)
+        get_git_provider_with_context(PR_URL)
+        assert _FakeProvider.instances == 3
+
+    def test_webhook_head_sha_invalidation(self, request_context):
+        get_git_provider_with_context(PR_URL)
+        body = {"pull_request": {"url": PR_URL, "head": {"sha": "head1"}}}
+        invalidate_cached_git_provider(body, "labeled")
+        assert len(get_git_provider_cache()._entries) == 1
+        body["pull_request"]["head"]["sha"] = "head2"
+        invalidate_cached_git_provider(body, "synchronize")
+        assert not get_git_provider_cache()._entries
+
+
+class TestGithubProviderReuse:
+    def test_revalidation_and_copy(self):
+        provider = GithubProvider.__new__(GithubProvider)
+        provider.pr = MagicMock()
+        provider.pr.head.sha, provider.pr.base.sha = "head", "base"
+        provider.pr.update.return_value = False
+        provider.incremental = IncrementalPR(True)
+        provider.comments = ["comment"]
+        provider.unreviewed_files_set = {"file": None}
+        provider.diff_files = ["file"]
+        provider.git_files = ["file"]
+        provider.pr_commits = ["commit"]
+
+        assert provider.revalidate_pr() is False
+        assert provider.get_pr_revision() == "head:base"
+        copied = provider.copy_for_request()
+        assert copied.pr is provider.pr
+        assert not copied.incremental.is_incremental and copied.comments is None and copied.unreviewed_files_set == {}
+        assert provider.comments == ["comment"]
+        assert copied.diff_files is None and copied.git_files is None
+        assert copied.pr_commits == ["commit"] and copied.pr_commits is not provider.pr_commits
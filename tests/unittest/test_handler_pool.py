@@ -0,0 +1,105 @@
+import sys
+import time
+import types
+from collections import namedtuple
+
+import litellm
+import pytest
+
+from pr_agent.algo.ai_handlers import litellm_helpers
+from pr_agent.algo.ai_handlers.handler_pool import AIHandlerPool
+from pr_agent.algo.ai_handlers.litellm_ai_handler import LiteLLMAIHandler
+from pr_agent.algo.ai_handlers.litellm_helpers import _get_azure_ad_token
+from pr_agent.config_loader import get_settings
+
+
+@pytest.fixture
+def settings_override():
+    overridden = {}
+
+    def override(key, value):
+        overridden.setdefault(key, get_settings().get(key, None))
+        get_settings().set(key, value)
+
+    yield override
+    for key, value in overridden.items():
+        get_settings().set(key, value)
+
+
+@pytest.fixture
+def init_calls(monkeypatch):
+    calls = []
+    original_init = LiteLLMAIHandler.__init__
+
+    def counting_init(self):
+        calls.append(self)
+        original_init(self)
+
+    monkeypatch.setattr(LiteLLMAIHandler, "__init__", counting_init)
+    return calls
+
+
+class TestAIHandlerPool:
+    def test_handler_is_reused(self, init_calls):
+        pool = AIHandlerPool()
+        first, second = pool.get(LiteLLMAIHandler), pool.get(LiteLLMAIHandler)
+        assert len(init_calls) == 1
+        assert isinstance(first, LiteLLMAIHandler)
+        # each tool gets its own copy for per-request attributes
+        first.main_pr_language = "python"
+        assert not hasattr(second, "main_pr_language")
+
+    def test_changed_settings_are_reapplied(self, init_calls, settings_override, monkeypatch):
+        monkeypatch.setattr(litellm, "api_base", litellm.api_base)
+        pool = AIHandlerPool()
+        pool.get(LiteLLMAIHandler)
+        settings_override("openai.deployment_id", "fallback-deployment")
+        pool.get(LiteLLMAIHandler)
+        assert len(init_calls) == 1
+
+        settings_override("ollama.api_base", "http://localhost:11434")
+        handler = pool.get(LiteLLMAIHandler)
+        assert len(init_calls) == 2
+        assert handler.api_base == "http://localhost:11434"
+
+    def test_disabled_pool(self, init_calls, monkeypatch):
+        monkeypatch.setattr(get_settings().litellm, "enable_handler_pool", False)
+        pool = AIHandlerPool()
+        pool.get(LiteLLMAIHandler)
+        pool.get(LiteLLMAIHandler)
+        assert len(init_calls) == 2
+
+
+AccessToken = namedtuple("AccessToken", ["token", "expires_on"])
+
+
+class TestAzureAdTokenCache:
+    @pytest.fixture
+    def credential_calls(self, monkeypatch, settings_override):
+        calls = []
+
+        class ClientSecretCredential:
+            def __init__(self, tenant_id, client_id, client_secret):
+                pass
+
+            def get_token(self, scope):
+                calls.append(scope)
+                return AccessToken(f"token-{len(calls)}", time.time() + 3600)
+
+        monkeypatch.setitem(sys.modules, "azure.identity",
+                            types.SimpleNamespace(ClientSecretCredential=ClientSecretCredential))
+        monkeypatch.setattr(litellm_helpers, "_azure_ad_token_cache", {})
+        for key, value in (("tenant_id", "tenant"), ("client_id", "client"), ("client_secret", "secret")):
+            settings_override(f"azure_ad.{key}", value)
+        return calls
+
+    def test_token_is_cached(self, credential_calls):
+        assert _get_azure_ad_token() == "token-1"
+        assert _get_azure_ad_token() == "token-1"
+        assert len(credential_calls) == 1
+
+    def test_token_is_refreshed_before_expiry(self, credential_calls, monkeypatch):
+        assert _get_azure_ad_token() == "token-1"
+        expiring_soon = time.time() + 3600 - 60
+        monkeypatch.setattr(litellm_helpers.time, "time", lambda: expiring_soon)
+        assert _get_azure_ad_token() == "token-2"
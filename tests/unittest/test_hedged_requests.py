@@ -0,0 +1,138 @@
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from pr_agent.algo import model_health
+from pr_agent.algo.ai_handlers.litellm_ai_handler import LiteLLMAIHandler
+from pr_agent.algo.model_health import ModelLatencyTracker, run_hedged
+from pr_agent.algo.pr_processing import retry_with_fallback_models
+from pr_agent.config_loader import get_settings
+
+
+@pytest.fixture(autouse=True)
+def hedging_settings(monkeypatch):
+    monkeypatch.setattr(get_settings().config, 'model', 'gpt-4o')
+    monkeypatch.setattr(get_settings().config, 'fallback_models', ['gpt-4o-mini'])
+    monkeypatch.setattr(get_settings().config, 'enable_hedged_requests', True)
+    monkeypatch.setattr(get_settings().config, 'hedge_default_delay_seconds', 0.05)
+    monkeypatch.setattr(model_health, '_latency_tracker', ModelLatencyTracker())
+
+
+def _call(delays: dict, failing=()):
+    calls, cancelled = [], []
+
+    async def call(model):
+        calls.append(model)
+        try:
+            await asyncio.sleep(delays[model])
+        except asyncio.CancelledError:
+            cancelled.append(model)
+            raise
+        if model in failing:
+            raise ValueError(f"{model} failed")
+        return f"answer from {model}"
+
+    return call, calls, cancelled
+
+
+class TestRunHedged:
+    @pytest.mark.asyncio
+    async def test_slow_primary_is_hedged(self):
+        call, calls, cancelled = _call({'primary': 10, 'fallback': 0})
+        assert await run_hedged(call, ['primary', 'fallback']) == "answer from fallback"
+        assert calls == ['primary', 'fallback']
+        assert cancelled == ['primary']
+
+    @pytest.mark.asyncio
+    async def test_fast_primary_is_not_hedged(self):
+        call, calls, _ = _call({'primary': 0, 'fallback': 0})
+        assert await run_hedged(call, ['primary', 'fallback']) == "answer from primary"
+        assert calls == ['primary']
+
+    @pytest.mark.asyncio
+    async def test_failed_primary_is_left_to_the_sequential_fallback(self, monkeypatch):
+        monkeypatch.setattr(get_settings().config, 'hedge_default_delay_seconds', 10)
+        call, calls, _ = _call({'primary': 0, 'fallback': 0}, failing=('primary',))
+        with pytest.raises(ValueError, match="primary failed"):
+            await run_hedged(call, ['primary', 'fallback'])
+        assert calls == ['primary']
+
+    @pytest.mark.asyncio
+    async def test_failed_hedge_waits_for_primary(self):
+        call, calls, _ = _call({'primary': 0.2, 'fallback': 0}, failing=('fallback',))
+        assert await run_hedged(call, ['primary', 'fallback']) == "answer from primary"
+        assert calls == ['primary', 'fallback']
+
+
+class _ModelResponse(dict):
+    def dict(self):
+        return dict(self)
+
+
+class _Tool:
+    """
+    Stands for a tool whose '_prepare_prediction' stores the diff prepared for a model, then its prediction.
+    """
+
+    def __init__(self):
+        self.ai_handler = LiteLLMAIHandler()
+        self.prepared_models = []
+
+    async def _prepare_prediction(self, model):
+        self.prepared_models.append(model)
+        self.patches_diff = f"diff for {model}"
+        self.prediction, _ = await self.ai_handler.chat_completion(model=model, system="system",
+                                                                   user=self.patches_diff)
+
+
+def _acompletion(delays: dict):
+    async def acompletion(**kwargs):
+        await asyncio.sleep(delays[kwargs["model"]])
+        content = f"{kwargs['model']} on {kwargs['messages'][1]['content']}"
+        return _ModelResponse(choices=[{"message": {"content": content}, "finish_reason": "stop"}],
+                              usage={"total_tokens": 10})
+
+    return AsyncMock(side_effect=acompletion)
+
+
+class TestHedgedChatCompletion:
+    @pytest.mark.asyncio
+    async def test_slow_completion_is_hedged_within_the_prediction(self):
+        tool = _Tool()
+        delays = {'gpt-4o': 10, 'gpt-4o-mini': 0}
+        with patch("pr_agent.algo.ai_handlers.litellm_ai_handler.acompletion", new=_acompletion(delays)):
+            await retry_with_fallback_models(tool._prepare_prediction)
+        # the prediction is prepared once, and the winning completion answers the diff prepared for it
+        assert tool.prepared_models == ['gpt-4o']
+        assert tool.patches_diff == "diff for gpt-4o"
+        assert tool.prediction == "gpt-4o-mini on diff for gpt-4o"
+
+    @pytest.mark.asyncio
+    async def test_fallback_with_a_smaller_context_window_is_not_hedged(self, monkeypatch):
+        monkeypatch.setattr(get_settings().config, 'fallback_models', ['gpt-4'])
+        tool = _Tool()
+        delays = {'gpt-4o': 0.2, 'gpt-4': 0}
+        with patch("pr_agent.algo.ai_handlers.litellm_ai_handler.acompletion", new=_acompletion(delays)) as acompletion:
+            await retry_with_fallback_models(tool._prepare_prediction)
+        assert tool.prediction == "gpt-4o on diff for gpt-4o"
+        assert acompletion.call_count == 1
+
+
+class TestModelLatencyTracker:
+    def test_percentile(self):
+        tracker = ModelLatencyTracker()
+        for latency in range(1, 101):
+            tracker.record("model", latency)
+        assert tracker.percentile("model", 95) == 95
+        assert tracker.percentile("model", 50) == 50
+        assert tracker.percentile("other", 95) is None
+
+    def test_hedge_delay_uses_default_until_enough_samples(self, monkeypatch):
+        monkeypatch.setattr(get_settings().config, 'hedge_min_samples', 3)
+        tracker = ModelLatencyTracker()
+        tracker.record("model", 2)
+        assert tracker.hedge_delay("model") == 0.05
+        tracker.record("model", 2)
+        tracker.record("model", 4)
+        assert tracker.hedge_delay("model") == 4
@@ -0,0 +1,173 @@
+import asyncio
+from unittest.mock import AsyncMock, patch
+
+import pytest
+from starlette_context import request_cycle_context
+
+from pr_agent.algo import inflight_runs
+from pr_agent.algo.ai_handlers.litellm_ai_handler import LiteLLMAIHandler
+from pr_agent.algo.inflight_runs import (
+    InProcessHeadStore,
+    RunSuperseded,
+    SqliteHeadStore,
+    check_superseded,
+    parse_pushed_at,
+    raise_if_superseded,
+    run_latest,
+    track_completion_tokens,
+)
+from pr_agent.config_loader import get_settings
+
+PR_URL = "https://api.github.com/repos/org/repo/pulls/1"
+
+
+@pytest.fixture
+def head_store(monkeypatch):
+    monkeypatch.setattr(get_settings().inflight_runs, "enable", True, raising=False)
+    monkeypatch.setattr(get_settings().inflight_runs, "backend", "memory", raising=False)
+    store = InProcessHeadStore(ttl_seconds=3600)
+    monkeypatch.setitem(inflight_runs._head_store_instances, "memory", store)
+    monkeypatch.setattr(inflight_runs, "_stats", {"superseded_runs": 0, "wasted_tokens": 0})
+    return store
+
+
+class TestInflightRuns:
+    @pytest.mark.asyncio
+    async def test_newer_commit_stops_the_run_of_this_process_at_its_next_checkpoint(self, head_store):
+        events = []
+        started = asyncio.Event()
+        resume = asyncio.Event()
+
+        async def review(name):
+            track_completion_tokens(used_tokens=100)
+            track_completion_tokens(pending_tokens=50)
+            started.set()
+            await resume.wait()
+            events.append(f"{name} resumed")  # not interrupted between checkpoints
+            raise_if_superseded()
+            events.append(f"{name} published")
+
+        older_run = asyncio.create_task(run_latest(PR_URL, "sha1", review("older"), pushed_at=1))
+        await started.wait()
+        started.clear()
+        newer_run = asyncio.create_task(run_latest(PR_URL, "sha2", review("newer"), pushed_at=2))
+        await started.wait()
+        resume.set()
+        assert await asyncio.wait_for(older_run, timeout=5) is False
+        assert await asyncio.wait_for(newer_run, timeout=5) is True
+        assert sorted(events) == ["newer published", "newer resumed", "older resumed"]
+        assert inflight_runs.get_inflight_run_stats() == {"superseded_runs": 1, "wasted_tokens": 150}
+        assert not inflight_runs._runs
+
+    @pytest.mark.asyncio
+    async def test_cancellation_for_another_reason_is_propagated(self, head_store):
+        started = asyncio.Event()
+
+        async def review():
+            started.set()
+            await asyncio.sleep(10)
+
+        run = asyncio.create_task(run_latest(PR_URL, "sha1", review(), pushed_at=1))
+        await started.wait()
+        run.cancel()  # e.g. a shutdown
+        with pytest.raises(asyncio.CancelledError):
+            await run
+        assert inflight_runs.get_inflight_run_stats()["superseded_runs"] == 0
+        assert not inflight_runs._runs
+
+    @pytest.mark.asyncio
+    async def test_run_of_another_process_stops_at_its_next_check(self, head_store):
+        checks = []
+
+        async def review():
+            await check_superseded()
+            checks.append("first check")
+            head_store.set_head(PR_URL, "sha2", 2)  # pushed and recorded by another process
+            raise_if_superseded()  # does not read the store
+            checks.append("second check")
+            await check_superseded()
+            checks.append("published")
+
+        assert await run_latest(PR_URL, "sha1", review(), pushed_at=1) is False
+        assert checks == ["first check", "second check"]
+        assert head_store.get_head(PR_URL) == "sha2"
+
+    @pytest.mark.asyncio
+    async def test_chat_completion_of_a_superseded_run(self, head_store):
+        handler = LiteLLMAIHandler()
+        with patch("pr_agent.algo.ai_handlers.litellm_ai_handler.acompletion", new=AsyncMock()) as acompletion:
+            async def review():
+                head_store.set_head(PR_URL, "sha2", 2)
+                await handler.chat_completion(model="gpt-4o", system="system", user="user")
+
+            assert await run_latest(PR_URL, "sha1", review(), pushed_at=1) is False
+        acompletion.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_outside_of_a_run_or_disabled(self, head_store, monkeypatch):
+        await check_superseded()
+        head_store.set_head(PR_URL, "sha2", 2)
+        monkeypatch.setattr(get_settings().inflight_runs, "enable", False, raising=False)
+
+        async def review():
+            await check_superseded()
+
+        assert await run_latest(PR_URL, "sha1", review()) is True
+        assert issubclass(RunSuperseded, asyncio.CancelledError)
+
+    @pytest.mark.asyncio
+    async def test_late_event_of_an_older_push_is_skipped(self, head_store):
+        events = []
+        started = asyncio.Event()
+
+        async def review(name):
+            events.append(f"{name} started")
+            started.set()
+            await asyncio.sleep(0.1)
+            events.append(f"{name} published")
+
+        newer_run = asyncio.create_task(run_latest(PR_URL, "sha2", review("newer"), pushed_at="2024-01-01T10:00:05Z"))
+        await started.wait()
+        assert await run_latest(PR_URL, "sha1", review("older"), pushed_at="2024-01-01T10:00:00Z") is False
+        assert await newer_run is True
+        assert events == ["newer started", "newer published"]
+        assert head_store.get_head(PR_URL) == "sha2"
+
+    @pytest.mark.asyncio
+    async def test_retried_job_supersedes_nothing(self, head_store):
+        events = []
+        started = asyncio.Event()
+
+        async def review(name):
+            started.set()
+            await asyncio.sleep(0.1)
+            events.append(f"{name} published")
+
+        newer_run = asyncio.create_task(run_latest(PR_URL, "sha2", review("newer"), pushed_at=2))
+        await started.wait()
+        with request_cycle_context({"job_attempt": 2}):
+            assert await run_latest(PR_URL, "sha1", review("retried older"), pushed_at=3) is False
+            assert await run_latest(PR_URL, "sha2", review("retried newer"), pushed_at=2) is True
+        await newer_run
+        assert sorted(events) == ["newer published", "retried newer published"]
+        assert head_store.get_head(PR_URL) == "sha2"
+
+
+class TestHeadStores:
+    @pytest.mark.parametrize("store_type", ["memory", "sqlite"])
+    def test_heads_are_ordered_by_push_time(self, store_type, tmp_path):
+        if store_type == "memory":
+            store = InProcessHeadStore(ttl_seconds=3600)
+        else:
+            store = SqliteHeadStore(str(tmp_path / "heads.db"), ttl_seconds=3600)
+        assert store.set_head(PR_URL, "sha2", 2) is True
+        assert store.set_head(PR_URL, "sha1", 1) is False  # a late event of an older push
+        assert store.get_head(PR_URL) == "sha2"
+        assert store.set_head(PR_URL, "sha3", 3) is True
+        assert store.get_head(PR_URL) == "sha3"
+
+    def test_parse_pushed_at(self):
+        assert parse_pushed_at("2024-01-01T10:00:00Z") == parse_pushed_at("2024-01-01 10:00:00 UTC") == 1704103200
+        assert parse_pushed_at("2024-01-01T12:00:00+02:00") == 1704103200
+        assert parse_pushed_at(1.5) == 1.5
+        assert parse_pushed_at(None) == pytest.approx(parse_pushed_at("invalid"), abs=5)
@@ -0,0 +1,127 @@
+import asyncio
+import time
+
+import pytest
+from starlette.background import BackgroundTasks
+from starlette_context import context
+
+from pr_agent.config_loader import LayeredSettings, get_settings
+from pr_agent.servers import job_queue
+from pr_agent.servers.job_queue import JobWorkerPool, SqliteJobQueue, dispatch_job, register_job_handler
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return SqliteJobQueue(str(tmp_path / "jobs.db"), max_attempts=2, failed_retention_seconds=3600)
+
+
+class TestSqliteJobQueue:
+    def test_jobs_are_claimed_in_order(self, queue):
+        first = queue.enqueue("kind", {"n": 1}, "org/repo")
+        queue.enqueue("kind", {"n": 2}, "org/repo")
+        job = queue.claim("worker", lease_seconds=60, max_per_key=0)
+        assert (job.id, job.payload, job.attempts) == (first, {"n": 1}, 1)
+        assert queue.claim("worker", lease_seconds=60, max_per_key=0).payload == {"n": 2}
+        assert queue.claim("worker", lease_seconds=60, max_per_key=0) is None
+        assert queue.get_stats()["running"] == 2
+
+    def test_concurrency_cap_per_repo(self, queue):
+        queue.enqueue("kind", {"n": 1}, "org/repo")
+        queue.enqueue("kind", {"n": 2}, "org/repo")
+        queue.enqueue("kind", {"n": 3}, "org/other")
+        first = queue.claim("worker", lease_seconds=60, max_per_key=1)
+        assert queue.claim("worker", lease_seconds=60, max_per_key=1).payload == {"n": 3}
+        assert queue.claim("worker", lease_seconds=60, max_per_key=1) is None
+        queue.complete(first.id, "worker")
+        assert queue.claim("worker", lease_seconds=60, max_per_key=1).payload == {"n": 2}
+
+    def test_expired_lease_is_claimed_again(self, queue):
+        queue.enqueue("kind", {}, None)
+        queue.claim("dead-worker", lease_seconds=-1, max_per_key=0)
+        job = queue.claim("worker", lease_seconds=-1, max_per_key=0)
+        assert job.attempts == 2
+        # out of attempts: failed, and kept for inspection
+        assert queue.claim("worker", lease_seconds=60, max_per_key=0) is None
+        assert queue.get_stats()["failed"] == 1
+
+    def test_job_whose_handler_started_is_not_run_again(self, queue):
+        queue.enqueue("kind", {"n": 1}, None)
+        job = queue.claim("dead-worker", lease_seconds=-1, max_per_key=0)
+        queue.mark_started(job.id, "dead-worker")
+        assert queue.claim("worker", lease_seconds=60, max_per_key=0) is None  # lease expired: failed
+        queue.enqueue("kind", {"n": 2}, None)
+        job = queue.claim("worker", lease_seconds=60, max_per_key=0)
+        queue.mark_started(job.id, "worker")
+        queue.release(job.id, "worker")  # interrupted by a shutdown
+        assert queue.claim("worker", lease_seconds=60, max_per_key=0) is None
+        assert queue.get_stats()["failed"] == 2
+
+    def test_retry_and_release(self, queue):
+        queue.enqueue("kind", {}, None)
+        job = queue.claim("worker", lease_seconds=60, max_per_key=0)
+        queue.fail(job.id, "worker", "error", retry_at=time.time() + 60)
+        assert queue.claim("worker", lease_seconds=60, max_per_key=0) is None  # backing off
+        assert queue.get_stats()["queued"] == 1
+        queue.fail(job.id, "worker", "error", retry_at=time.time())  # no-op, not claimed by this worker
+        queue.enqueue("kind", {"n": 2}, None)
+        job = queue.claim("worker", lease_seconds=60, max_per_key=0)
+        queue.release(job.id, "worker")
+        assert queue.claim("worker", lease_seconds=60, max_per_key=0).attempts == 1
+
+
+class TestJobWorkerPool:
+    @pytest.mark.asyncio
+    async def test_jobs_run_in_their_own_context_with_retries(self, queue, monkeypatch):
+        monkeypatch.setattr(get_settings().config, "job_queue_test_value", "base", raising=False)
+        runs = []
+        mark_started = queue.mark_started
+        failed_starts = []
+
+        def flaky_mark_started(job_id, worker_id):
+            if not failed_starts:  # fails before the first handler starts: retried
+                failed_starts.append(job_id)
+                raise RuntimeError("transient error")
+            mark_started(job_id, worker_id)
+
+        async def handler(payload):
+            runs.append((payload["n"], isinstance(context["settings"], LayeredSettings)))
+            context["settings"].set("config.job_queue_test_value", payload["n"])
+            if payload["n"] == 3:
+                raise RuntimeError("failed after publishing")  # not retried
+
+        monkeypatch.setattr(queue, "mark_started", flaky_mark_started)
+        register_job_handler("test.job", handler)
+        pool = JobWorkerPool(queue)
+        pool.retry_backoff_seconds = 0
+        pool.poll_interval = 0.01
+        monkeypatch.setattr(job_queue, "_worker_pool", pool)
+        await pool.start()
+        try:
+            await dispatch_job(BackgroundTasks(), "test.job", {"n": 1}, "org/repo")
+            await dispatch_job(BackgroundTasks(), "test.job", {"n": 2}, "org/repo")
+            await dispatch_job(BackgroundTasks(), "test.job", {"n": 3}, "org/repo")
+            for _ in range(500):
+                if pool.stats["completed"] == 2 and pool.stats["failed"] == 1:
+                    break
+                await asyncio.sleep(0.01)
+        finally:
+            await pool.stop()
+        assert sorted(runs) == [(1, True), (2, True), (3, True)]
+        assert pool.stats["retried"] == 1
+        assert get_settings().config.job_queue_test_value == "base"
+        stats = await pool.get_stats()
+        assert stats["queued"] == 0 and stats["running"] == 0 and stats["failed"] == 1
+
+    @pytest.mark.asyncio
+    async def test_background_task_without_workers(self, monkeypatch):
+        calls = []
+
+        async def handler(payload):
+            calls.append(payload)
+
+        register_job_handler("test.background", handler)
+        monkeypatch.setattr(job_queue, "_worker_pool", None)
+        background_tasks = BackgroundTasks()
+        await dispatch_job(background_tasks, "test.background", {"n": 1})
+        await background_tasks()
+        assert calls == [{"n": 1}]
@@ -0,0 +1,89 @@
+from unittest.mock import patch
+
+import pytest
+
+from pr_agent.agent.pr_agent import PRAgent
+from pr_agent.algo.utils import update_settings_from_args
+from pr_agent.config_loader import LayeredSettings, global_settings
+from pr_agent.git_providers.utils import apply_repo_settings
+
+
+@pytest.fixture
+def request_settings():
+    settings = LayeredSettings(global_settings)
+    request_context = {"settings": settings}
+    with patch("pr_agent.config_loader.context", request_context), \
+            patch("pr_agent.git_providers.utils.context", request_context):
+        yield settings
+
+
+class _RepoSettingsProvider:
+    def get_repo_settings(self):
+        return b'[pr_reviewer]\nnum_max_findings = 7\n\n[config]\nmodel = "repo-model"\n'
+
+
+class TestLayeredSettings:
+    def test_reads_go_to_the_base(self, request_settings):
+        assert request_settings.config.model == global_settings.config.model
+        assert request_settings.get("PR_REVIEWER.NUM_MAX_FINDINGS") == global_settings.pr_reviewer.num_max_findings
+        assert request_settings.get("missing.key", 3) == 3
+        assert request_settings["config"]["model"] == global_settings.config.model
+        with pytest.raises(AttributeError):
+            _ = request_settings.missing_section
+        # values are read without copying their section
+        request_settings.get("pr_description.publish_labels")
+        assert "PR_DESCRIPTION" not in request_settings._overlay
+
+    def test_writes_stay_in_the_request(self, request_settings):
+        base_model = global_settings.config.model
+        base_fallback_models = list(global_settings.config.fallback_models)
+        request_settings.set("config.model", "request-model")
+        request_settings.pr_reviewer.num_max_findings = 9
+        request_settings.config.fallback_models.append("another-model")
+        request_settings.set("related_tickets", [{"url": "a"}])
+
+        assert request_settings.config.model == "request-model"
+        assert request_settings.get("CONFIG.MODEL") == "request-model"
+        assert request_settings.pr_reviewer.num_max_findings == 9
+        assert request_settings.related_tickets == [{"url": "a"}]
+        assert global_settings.config.model == base_model
+        assert list(global_settings.config.fallback_models) == base_fallback_models
+        assert global_settings.get("related_tickets") is None
+        assert LayeredSettings(global_settings).pr_reviewer.num_max_findings != 9
+        assert set(request_settings._overlay) == {"CONFIG", "PR_REVIEWER", "RELATED_TICKETS"}
+
+    def test_dynaconf_merge_semantics(self, request_settings):
+        request_settings.set("config.test_statistics", {"a": 1})
+        request_settings.set("config.test_statistics", {"b": 2})
+        assert request_settings.config.test_statistics == {"a": 1, "b": 2}
+        request_settings.set("pr_reviewer", {"num_max_findings": 1})
+        assert request_settings.pr_reviewer.num_max_findings == 1
+        assert request_settings.pr_reviewer.require_tests_review == global_settings.pr_reviewer.require_tests_review
+        request_settings.unset("pr_reviewer")
+        assert request_settings.get("pr_reviewer") is None
+        request_settings.set("pr_reviewer", {"num_max_findings": 2}, merge=False)
+        assert request_settings.as_dict()["PR_REVIEWER"] == {"num_max_findings": 2}
+
+    def test_update_settings_from_args(self, request_settings):
+        base_values = (global_settings.pr_reviewer.num_max_findings, global_settings.config.verbosity_level)
+        update_settings_from_args(["--pr_reviewer.num_max_findings=5", "--config.verbosity_level=2"])
+        assert request_settings.pr_reviewer.num_max_findings == 5
+        assert request_settings.config.verbosity_level == 2
+        assert (global_settings.pr_reviewer.num_max_findings, global_settings.config.verbosity_level) == base_values
+
+    def test_apply_repo_settings(self, request_settings):
+        with patch("pr_agent.git_providers.utils.get_git_provider_with_context",
+                   return_value=_RepoSettingsProvider()):
+            apply_repo_settings("https://github.com/org/repo/pull/1")
+        assert request_settings.pr_reviewer.num_max_findings == 7
+        assert request_settings.config.model == "repo-model"
+        assert request_settings.pr_reviewer.require_tests_review == global_settings.pr_reviewer.require_tests_review
+        assert global_settings.config.model != "repo-model"
+
+    @pytest.mark.asyncio
+    async def test_response_language(self, request_settings):
+        request_settings.set("config.response_language", "it-IT")
+        with patch("pr_agent.agent.pr_agent.apply_repo_settings"):
+            assert not await PRAgent()._handle_request("https://github.com/org/repo/pull/1", "unknown_command")
+        assert "locale code: 'it-IT'" in request_settings.pr_reviewer.extra_instructions
+        assert "it-IT" not in global_settings.pr_reviewer.extra_instructions
@@ -0,0 +1,175 @@
+import json
+from unittest.mock import MagicMock, patch
+
+from pr_agent.algo.pr_processing import pr_generate_extended_diff
+from pr_agent.algo.types import EDIT_TYPE, FilePatchInfo
+from pr_agent.config_loader import get_settings
+from pr_agent.git_providers.github_provider import GithubProvider
+
+BASE_FILE = "line1\nline2\nline3\nline4\nline5\nline6\nline7"
+HEAD_FILE = "line1\nline2\nline3\nline4 changed\nline5\nline6\nline7"
+PATCH = "@@ -4,1 +4,1 @@\n-line4\n+line4 changed"
+
+
+def _lazy_file(filename="file.py"):
+    base_file_loader = MagicMock(return_value=BASE_FILE)
+    head_file_loader = MagicMock(return_value=HEAD_FILE)
+    file = FilePatchInfo(None, None, PATCH, filename, edit_type=EDIT_TYPE.MODIFIED,
+                         base_file_loader=base_file_loader, head_file_loader=head_file_loader)
+    return file, base_file_loader, head_file_loader
+
+
+def _token_handler():
+    token_handler = MagicMock()
+    token_handler.prompt_tokens = 10
+    token_handler.count_tokens.side_effect = lambda text: len(text.split())
+    token_handler.count_tokens_batch.side_effect = lambda texts: [len(text.split()) for text in texts]
+    return token_handler
+
+
+class TestLazyFileContent:
+    def test_content_is_loaded_once_on_access(self):
+        file, base_file_loader, head_file_loader = _lazy_file()
+        assert not file.is_content_loaded()
+        assert file.base_file == BASE_FILE
+        assert file.base_file == BASE_FILE
+        assert base_file_loader.call_count == 1
+        head_file_loader.assert_not_called()
+        assert file.head_file == HEAD_FILE
+        assert file.is_content_loaded()
+
+    def test_provided_content_ignores_loader(self):
+        loader = MagicMock(return_value="from loader")
+        file = FilePatchInfo("base", "head", PATCH, "file.py", base_file_loader=loader)
+        assert file.base_file == "base"
+        assert file.is_content_loaded()
+        loader.assert_not_called()
+
+    def test_setting_content_drops_loader(self):
+        file, base_file_loader, _ = _lazy_file()
+        file.base_file = "new base"
+        assert file.base_file == "new base"
+        base_file_loader.assert_not_called()
+
+    def test_repr_and_eq_do_not_load_content(self):
+        file, base_file_loader, head_file_loader = _lazy_file()
+        assert "line1" not in repr(file)
+        assert file == _lazy_file()[0]
+        base_file_loader.assert_not_called()
+        head_file_loader.assert_not_called()
+
+
+class TestExtendedDiffTokenBudget:
+    def test_contents_are_fetched_when_diff_fits(self):
+        file, base_file_loader, head_file_loader = _lazy_file()
+        patches, total_tokens, _ = pr_generate_extended_diff([{'files': [file]}], _token_handler(), False,
+                                                             patch_extra_lines_before=1, patch_extra_lines_after=1,
+                                                             max_tokens=1000)
+        assert base_file_loader.call_count == 1
+        assert head_file_loader.call_count == 1
+        assert " line3" in patches[0] and " line5" in patches[0]
+
+    def test_contents_are_not_fetched_when_diff_cannot_fit(self):
+        files = [_lazy_file(f"file{i}.py") for i in range(3)]
+        patches, total_tokens, _ = pr_generate_extended_diff([{'files': [f[0] for f in files]}], _token_handler(),
+                                                             False, patch_extra_lines_before=1,
+                                                             patch_extra_lines_after=1, max_tokens=20)
+        for file, base_file_loader, head_file_loader in files:
+            base_file_loader.assert_not_called()
+            head_file_loader.assert_not_called()
+            assert file.tokens > 0
+        assert len(patches) == 3
+        assert total_tokens >= 20
+
+    def test_contents_are_not_fetched_without_extra_lines(self):
+        file, base_file_loader, head_file_loader = _lazy_file()
+        pr_generate_extended_diff([{'files': [file]}], _token_handler(), True, max_tokens=1000)
+        base_file_loader.assert_not_called()
+        head_file_loader.assert_not_called()
+
+    def test_contents_are_prefetched_when_diff_fits(self):
+        files = [_lazy_file(f"file{i}.py") for i in range(3)]
+        prefetch_contents = MagicMock()
+        pr_generate_extended_diff([{'files': [f[0] for f in files]}], _token_handler(), False,
+                                  patch_extra_lines_before=1, patch_extra_lines_after=1, max_tokens=1000,
+                                  prefetch_contents=prefetch_contents)
+        prefetch_contents.assert_called_once_with([f[0] for f in files])
+
+    def test_contents_are_not_prefetched_when_diff_cannot_fit(self):
+        files = [_lazy_file(f"file{i}.py") for i in range(3)]
+        prefetch_contents = MagicMock()
+        pr_generate_extended_diff([{'files': [f[0] for f in files]}], _token_handler(), False,
+                                  patch_extra_lines_before=1, patch_extra_lines_after=1, max_tokens=20,
+                                  prefetch_contents=prefetch_contents)
+        prefetch_contents.assert_not_called()
+
+
+def _github_provider(remaining_requests=5000):
+    provider = GithubProvider.__new__(GithubProvider)
+    provider.repo = "owner/repo"
+    provider.base_url = "https://api.github.com"
+    provider.auth = MagicMock(token="token")
+    provider.pr = MagicMock()
+    provider.pr.head.sha = "head_sha"
+    provider._merge_base_sha = "base_sha"
+    provider.github_client = MagicMock(rate_limiting=(remaining_requests, 5000))
+    return provider
+
+
+def _github_client(contents: dict):
+    def get_contents(path, ref):
+        return MagicMock(decoded_content=contents[(path, ref)].encode())
+
+    client = MagicMock()
+    client.get_repo.return_value.get_contents.side_effect = get_contents
+    return client
+
+
+class TestGithubPrefetchContent:
+    def test_contents_are_fetched_concurrently_in_order(self, monkeypatch):
+        monkeypatch.setattr(get_settings().github, 'content_fetch_concurrency', 4)
+        files = [_lazy_file(f"file{i}.py") for i in range(5)]
+        contents = {(f"file{i}.py", sha): f"{sha} {i}" for i in range(5) for sha in ("head_sha", "base_sha")}
+        with patch("pr_agent.git_providers.github_provider.Github", return_value=_github_client(contents)):
+            _github_provider().prefetch_diff_files_content([f[0] for f in files])
+        for i, (file, base_file_loader, head_file_loader) in enumerate(files):
+            assert file.is_content_loaded()
+            assert file.head_file == f"head_sha {i}"
+            assert file.base_file == f"base_sha {i}"
+            base_file_loader.assert_not_called()
+            head_file_loader.assert_not_called()
+
+    def test_no_prefetch_when_close_to_rate_limit(self, monkeypatch):
+        monkeypatch.setattr(get_settings().github, 'content_fetch_concurrency', 4)
+        files = [_lazy_file(f"file{i}.py") for i in range(5)]
+        with patch("pr_agent.git_providers.github_provider.Github") as github:
+            _github_provider(remaining_requests=10).prefetch_diff_files_content([f[0] for f in files])
+        github.assert_not_called()
+        assert not any(f[0].is_content_loaded() for f in files)
+
+    def test_graphql_mode_batches_and_falls_back_to_rest_for_large_blobs(self, monkeypatch):
+        monkeypatch.setattr(get_settings().github, 'content_fetch_concurrency', 4)
+        monkeypatch.setattr(get_settings().github, 'content_fetch_mode', 'graphql')
+        files = [_lazy_file(f"file{i}.py") for i in range(2)]
+
+        def request_json(verb, url, input):
+            repository = {}
+            for name, expression in input["variables"].items():
+                if name.startswith("expression"):
+                    blob_name = name.replace("expression", "blob")
+                    truncated = expression.endswith(":file1.py")
+                    repository[blob_name] = {"text": None if truncated else expression, "isTruncated": truncated}
+            return 200, {}, json.dumps({"data": {"repository": repository}})
+
+        provider = _github_provider()
+        provider.github_client._Github__requester.requestJson.side_effect = request_json
+        # the truncated blobs, and no others, are fetched with REST
+        rest_contents = {("file1.py", "head_sha"): "large head", ("file1.py", "base_sha"): "large base"}
+        with patch("pr_agent.git_providers.github_provider.Github", return_value=_github_client(rest_contents)):
+            provider.prefetch_diff_files_content([f[0] for f in files])
+
+        assert provider.github_client._Github__requester.requestJson.call_count == 1
+        assert files[0][0].head_file == "head_sha:file0.py"
+        assert files[0][0].base_file == "base_sha:file0.py"
+        assert files[1][0].head_file == "large head"
+        assert files[1][0].base_file == "large base"
@@ -0,0 +1,62 @@
+from pr_agent.algo.parsed_patch import ParsedPatch, parse_patch
+from pr_agent.algo.types import FilePatchInfo
+
+PATCH = """@@ -1,3 +1,4 @@ def foo():
+ line1
+-line2
++line2 changed
++line3
+@@ -10 +11,2 @@
+ line10
++line11"""
+
+
+class TestParsedPatch:
+    def test_hunks(self):
+        parsed = parse_patch(PATCH)
+        assert len(parsed.hunks) == 2
+
+        first, second = parsed.hunks
+        assert (first.start1, first.size1, first.start2, first.size2) == (1, 3, 1, 4)
+        assert first.section_header == "def foo():"
+        assert (first.header_index, first.end_index) == (0, 5)
+
+        # a missing size is parsed as 0, matching 'extract_hunk_headers'
+        assert (second.start1, second.size1, second.start2, second.size2) == (10, 0, 11, 2)
+        assert (second.header_index, second.end_index) == (5, 8)
+
+    def test_hunk_at(self):
+        parsed = parse_patch(PATCH)
+        assert parsed.hunk_at(0) is parsed.hunks[0]
+        assert parsed.hunk_at(5) is parsed.hunks[1]
+        assert parsed.hunk_at(1) is None
+
+    def test_invalid_header_is_not_a_hunk(self):
+        parsed = ParsedPatch.from_lines(["@@ invalid @@", "+line"])
+        assert parsed.hunks == []
+        assert parsed.hunk_at(0) is None
+
+    def test_empty_patch(self):
+        assert parse_patch("").hunks == []
+        assert parse_patch(None).lines == []
+
+    def test_same_patch_is_parsed_once(self):
+        assert parse_patch(PATCH) is parse_patch(PATCH)
+
+
+class TestFilePatchInfoParsedPatch:
+    def test_parsed_patch_follows_patch(self):
+        file = FilePatchInfo("", "", PATCH, "file.py")
+        parsed = file.parsed_patch
+        assert parsed is file.parsed_patch
+        assert len(parsed.hunks) == 2
+
+        file.patch = "@@ -1 +1 @@\n-a\n+b"
+        assert file.parsed_patch is not parsed
+        assert len(file.parsed_patch.hunks) == 1
+
+    def test_parsed_patch_not_part_of_equality(self):
+        file1 = FilePatchInfo("", "", PATCH, "file.py")
+        file2 = FilePatchInfo("", "", PATCH, "file.py")
+        _ = file1.parsed_patch
+        assert file1 == file2
@@ -0,0 +1,80 @@
+import pytest
+from jinja2 import Environment, StrictUndefined
+
+from pr_agent.algo.ai_handlers import prompt_caching
+from pr_agent.algo.ai_handlers.prompt_caching import (
+    add_cache_control_breakpoint,
+    get_prompt_cache_stats,
+    log_prompt_cache_usage,
+    supports_cache_control,
+)
+from pr_agent.config_loader import get_settings
+
+
+@pytest.fixture(autouse=True)
+def prompt_cache_stats(monkeypatch):
+    monkeypatch.setattr(prompt_caching, "_prompt_cache_stats",
+                        {"requests": 0, "prompt_tokens": 0, "cached_tokens": 0, "cache_creation_tokens": 0})
+
+
+class TestPromptCaching:
+    @pytest.mark.parametrize("model, expected", [
+        ("anthropic/claude-3-7-sonnet-20250219", True),
+        ("claude-3-5-sonnet", True),
+        ("bedrock/anthropic.claude-3-7-sonnet-20250219-v1:0", True),
+        ("vertex_ai/claude-3-7-sonnet@20250219", True),
+        ("gpt-4o", False),
+        ("bedrock/amazon.nova-pro-v1:0", False),
+    ])
+    def test_supports_cache_control(self, model, expected):
+        assert supports_cache_control(model) == expected
+
+    def test_cache_control_breakpoint_on_system_prompt(self):
+        messages = [{"role": "system", "content": "static instructions"}, {"role": "user", "content": "diff"}]
+        assert add_cache_control_breakpoint(messages) == [
+            {"role": "system", "content": [{"type": "text", "text": "static instructions",
+                                            "cache_control": {"type": "ephemeral"}}]},
+            {"role": "user", "content": "diff"},
+        ]
+        user_only = [{"role": "user", "content": "everything"}]
+        assert add_cache_control_breakpoint(user_only) == user_only
+
+    def test_cached_tokens_are_logged(self):
+        log_prompt_cache_usage("gpt-4o", {"usage": {"prompt_tokens": 3000,
+                                                    "prompt_tokens_details": {"cached_tokens": 2048}}})
+        log_prompt_cache_usage("anthropic/claude", {"usage": {"prompt_tokens": 1000, "cache_read_input_tokens": 0,
+                                                              "cache_creation_input_tokens": 900}})
+        log_prompt_cache_usage("mock", {})
+        stats = get_prompt_cache_stats()
+        assert stats["requests"] == 2
+        assert stats["cached_tokens"] == 2048
+        assert stats["cache_creation_tokens"] == 900
+        assert stats["cached_ratio"] == pytest.approx(2048 / 4000)
+
+
+def _review_variables(num_pr_files):
+    return {"num_pr_files": num_pr_files, "num_max_findings": 3, "require_score": False, "require_tests": True,
+            "require_estimate_effort_to_review": True, "require_estimate_contribution_time_cost": False,
+            "require_can_be_split_review": True, "require_security_review": True, "require_todo_scan": False,
+            "question_str": "", "answer_str": "", "extra_instructions": "", "is_ai_metadata": False,
+            "related_tickets": [], "duplicate_prompt_examples": False}
+
+
+class TestStableSystemPrompt:
+    def test_reviewer_system_prompt(self):
+        template = Environment(undefined=StrictUndefined).from_string(get_settings().pr_review_prompt.system)
+        with_files = template.render(_review_variables(num_pr_files=12))
+        assert "Can this PR, which contains 12 changed files in total, be divided" in with_files
+        without_files = template.render(_review_variables(num_pr_files=None))
+        assert "Can this PR be divided" in without_files
+        assert "None" not in without_files
+
+    def test_changelog_system_prompt(self):
+        template = Environment(undefined=StrictUndefined).from_string(get_settings().pr_update_changelog_prompt.system)
+        pr_link = "https://github.com/org/repo/pull/1"
+        assert template.render(pr_link=pr_link, extra_instructions="") == \
+            template.render(pr_link="https://github.com/org/repo/pull/2", extra_instructions="")
+        user = Environment(undefined=StrictUndefined).from_string(get_settings().pr_update_changelog_prompt.user)
+        user_prompt = user.render(title="t", branch="b", description="", language="", pr_link=pr_link,
+                                  commit_messages_str="", diff="", today="", changelog_file_str="")
+        assert f"PR URL: '{pr_link}'" in user_prompt
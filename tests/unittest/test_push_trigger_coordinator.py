@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+
+from pr_agent.servers.push_trigger_coordinator import InProcessPushTriggerCoordinator, SqlitePushTriggerCoordinator
+
+PR_URL = "https://api.github.com/repos/org/repo/pulls/1"
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def coordinators(request, tmp_path):
+    """
+    Two coordinators standing for two server processes (the same one for the in-process backend).
+    """
+    if request.param == "memory":
+        coordinator = InProcessPushTriggerCoordinator(ttl=300)
+        return coordinator, coordinator
+    db_path = str(tmp_path / "push_triggers.db")
+    return (SqlitePushTriggerCoordinator(db_path, ttl=300, poll_interval=0.01),
+            SqlitePushTriggerCoordinator(db_path, ttl=300, poll_interval=0.01))
+
+
+async def _process_push(coordinator, name, events, release=None):
+    async with coordinator.coalesce(PR_URL, max_active=2) as admitted:
+        if not admitted:
+            events.append(f"{name} skipped")
+            return
+        events.append(f"{name} started")
+        if release:
+            await release.wait()
+        events.append(f"{name} done")
+
+
+class TestPushTriggerCoordinator:
+    @pytest.mark.asyncio
+    async def test_one_running_plus_one_waiting(self, coordinators):
+        first_process, second_process = coordinators
+        events = []
+        release = asyncio.Event()
+        first = asyncio.create_task(_process_push(first_process, "first", events, release))
+        await asyncio.sleep(0.05)
+        second = asyncio.create_task(_process_push(second_process, "second", events))
+        await asyncio.sleep(0.05)
+        await _process_push(second_process, "third", events)
+        await _process_push(first_process, "fourth", events)
+        assert events == ["first started", "third skipped", "fourth skipped"]
+
+        release.set()
+        await asyncio.wait_for(asyncio.gather(first, second), timeout=5)
+        assert events[3:] == ["first done", "second started", "second done"]
+
+        await _process_push(second_process, "fifth", events)
+        assert events[-2:] == ["fifth started", "fifth done"]
+
+    @pytest.mark.asyncio
+    async def test_without_backlog(self, coordinators):
+        first_process, second_process = coordinators
+        async with first_process.coalesce(PR_URL, max_active=1) as admitted:
+            assert admitted
+            async with second_process.coalesce(PR_URL, max_active=1) as second_admitted:
+                assert not second_admitted
+            async with second_process.coalesce("https://api.github.com/repos/org/repo/pulls/2", 1) as other_admitted:
+                assert other_admitted
+
+    @pytest.mark.asyncio
+    async def test_triggers_of_dead_processes_expire(self, tmp_path):
+        db_path = str(tmp_path / "push_triggers.db")
+        dead_process = SqlitePushTriggerCoordinator(db_path, ttl=-1, poll_interval=0.01)
+        assert await dead_process.enter(PR_URL, max_active=1) is not None  # never left
+        coordinator = SqlitePushTriggerCoordinator(db_path, ttl=300, poll_interval=0.01)
+        async with coordinator.coalesce(PR_URL, max_active=1) as admitted:
+            assert admitted
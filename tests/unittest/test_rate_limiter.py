@@ -0,0 +1,131 @@
+import pytest
+
+from pr_agent.algo.ai_handlers import rate_limiter as rate_limiter_module
+from pr_agent.algo.ai_handlers.rate_limiter import ModelRateLimiter, TokenBucket
+from pr_agent.config_loader import get_settings
+
+
+class _FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake_clock = _FakeClock()
+    monkeypatch.setattr(rate_limiter_module.time, "monotonic", fake_clock.monotonic)
+    return fake_clock
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    slept = []
+
+    async def fake_sleep(seconds):
+        slept.append(seconds)
+
+    monkeypatch.setattr(rate_limiter_module.asyncio, "sleep", fake_sleep)
+    return slept
+
+
+@pytest.fixture
+def limits():
+    settings = get_settings()
+    keys = ("rate_limit_rpm", "rate_limit_tpm", "model_rate_limits")
+    original = {key: settings.get(f"litellm.{key}") for key in keys}
+    yield settings
+    for key, value in original.items():
+        settings.set(f"litellm.{key}", value)
+
+
+class TestTokenBucket:
+    def test_waits_once_capacity_is_exhausted(self, clock):
+        bucket = TokenBucket(60)  # one token per second
+        assert bucket.reserve(60) == 0
+        assert bucket.reserve(1) == pytest.approx(1)
+        assert bucket.reserve(2) == pytest.approx(3)
+
+        clock.now += 3
+        assert bucket.reserve(1) == pytest.approx(1)
+
+    def test_refill_is_capped_at_capacity(self, clock):
+        bucket = TokenBucket(60)
+        clock.now += 3600
+        assert bucket.reserve(60) == 0
+        assert bucket.reserve(1) == pytest.approx(1)
+
+    def test_adjust_returns_overestimated_tokens(self, clock):
+        bucket = TokenBucket(60)
+        bucket.reserve(60)
+        bucket.adjust(30)
+        assert bucket.reserve(30) == 0
+
+
+class TestModelRateLimiter:
+    @pytest.mark.asyncio
+    async def test_unlimited_by_default(self, clock, sleeps, limits):
+        limits.set("litellm.rate_limit_rpm", 0)
+        limits.set("litellm.rate_limit_tpm", 0)
+        limiter = ModelRateLimiter()
+        for _ in range(100):
+            assert await limiter.acquire("gpt-4o", 10_000) == 0
+        assert not limiter.needs_token_estimate("gpt-4o")
+        assert sleeps == []
+        assert limiter.get_stats()["gpt-4o"]["requests"] == 100
+
+    @pytest.mark.asyncio
+    async def test_requests_per_minute(self, clock, sleeps, limits):
+        limits.set("litellm.rate_limit_rpm", 2)
+        limits.set("litellm.rate_limit_tpm", 0)
+        limiter = ModelRateLimiter()
+        assert await limiter.acquire("gpt-4o") == 0
+        assert await limiter.acquire("gpt-4o") == 0
+        assert await limiter.acquire("gpt-4o") == pytest.approx(30)
+        assert sleeps == [pytest.approx(30)]
+
+        stats = limiter.get_stats()["gpt-4o"]
+        assert stats["requests"] == 3
+        assert stats["queued_requests"] == 1
+        assert stats["max_queue_seconds"] == pytest.approx(30)
+
+    @pytest.mark.asyncio
+    async def test_tokens_per_minute_and_model_overrides(self, clock, sleeps, limits):
+        limits.set("litellm.rate_limit_rpm", 0)
+        limits.set("litellm.rate_limit_tpm", 6000)
+        limits.set("litellm.model_rate_limits", {"small-model": {"tpm": 600}})
+        limiter = ModelRateLimiter()
+        assert limiter.needs_token_estimate("gpt-4o")
+        assert await limiter.acquire("gpt-4o", 6000) == 0
+        assert await limiter.acquire("gpt-4o", 100) == pytest.approx(1)
+
+        # the limits of each model are independent
+        assert await limiter.acquire("small-model", 600) == 0
+        assert await limiter.acquire("small-model", 100) == pytest.approx(10)
+
+    @pytest.mark.asyncio
+    async def test_record_usage_corrects_the_estimate(self, clock, sleeps, limits):
+        limits.set("litellm.rate_limit_rpm", 0)
+        limits.set("litellm.rate_limit_tpm", 6000)
+        limiter = ModelRateLimiter()
+        await limiter.acquire("gpt-4o", 6000)
+        limiter.record_usage("gpt-4o", estimated_tokens=6000, actual_tokens=3000)
+        assert await limiter.acquire("gpt-4o", 3000) == 0
+
+    @pytest.mark.asyncio
+    async def test_changed_limits_apply_to_the_next_requests(self, clock, sleeps, limits):
+        limits.set("litellm.rate_limit_rpm", 1)
+        limits.set("litellm.rate_limit_tpm", 0)
+        limiter = ModelRateLimiter()
+        assert await limiter.acquire("gpt-4o") == 0
+        assert await limiter.acquire("gpt-4o") == pytest.approx(60)
+
+        limits.set("litellm.model_rate_limits", {"gpt-4o": {"rpm": 60}})  # e.g. a repo settings override
+        assert await limiter.acquire("gpt-4o") == 0
+        assert await limiter.acquire("gpt-4o") == 0
+        limits.set("litellm.model_rate_limits", {"gpt-4o": {"rpm": 0, "tpm": 0}})
+        assert not limiter.needs_token_estimate("gpt-4o")
+        for _ in range(100):
+            assert await limiter.acquire("gpt-4o") == 0
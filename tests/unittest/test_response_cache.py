@@ -0,0 +1,85 @@
+import time
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from pr_agent.algo.ai_handlers import response_cache
+from pr_agent.algo.ai_handlers.litellm_ai_handler import LiteLLMAIHandler
+from pr_agent.algo.ai_handlers.response_cache import (
+    SqliteResponseCache,
+    get_response_cache_key,
+    get_response_cache_stats,
+)
+from pr_agent.config_loader import get_settings
+
+
+class _ModelResponse(dict):
+    def dict(self):
+        return dict(self)
+
+
+@pytest.fixture
+def enabled_response_cache(monkeypatch, tmp_path):
+    monkeypatch.setattr(get_settings().response_cache, 'enable', True)
+    monkeypatch.setattr(get_settings().response_cache, 'sqlite_path', str(tmp_path / "responses.db"))
+    monkeypatch.setattr(response_cache, '_response_cache_instances', {})
+    monkeypatch.setattr(response_cache, '_response_cache_stats', {"hits": 0, "misses": 0, "tokens_saved": 0})
+
+
+class TestSqliteResponseCache:
+    def test_get_and_set(self, tmp_path):
+        cache = SqliteResponseCache(str(tmp_path / "responses.db"), ttl_seconds=60, max_size_bytes=1024)
+        cache.set("key", "response", "stop", 100)
+        assert cache.get("key") == ("response", "stop", 100)
+        assert cache.get("missing") is None
+
+    def test_expired_entries_are_ignored(self, tmp_path):
+        cache = SqliteResponseCache(str(tmp_path / "responses.db"), ttl_seconds=60, max_size_bytes=1024)
+        cache.set("key", "response", "stop", 100)
+        with patch.object(time, 'time', return_value=time.time() + 120):
+            assert cache.get("key") is None
+
+    def test_lru_eviction_by_size(self, tmp_path):
+        cache = SqliteResponseCache(str(tmp_path / "responses.db"), ttl_seconds=60, max_size_bytes=50)
+        cache.set("first", "x" * 20, "stop", 0)
+        cache.set("second", "y" * 20, "stop", 0)
+        cache.get("first")  # 'second' is now the least recently used entry
+        cache.set("third", "z" * 20, "stop", 0)
+        assert cache.get("first") is not None
+        assert cache.get("second") is None
+        assert cache.get("third") is not None
+
+
+class TestResponseCacheKey:
+    def test_no_key_when_disabled(self):
+        assert get_response_cache_key({"model": "gpt-4o", "messages": []}) is None
+
+    def test_key_ignores_timeout(self, enabled_response_cache):
+        kwargs = {"model": "gpt-4o", "messages": [{"role": "user", "content": "hi"}], "temperature": 0.2}
+        key = get_response_cache_key({**kwargs, "timeout": 120})
+        assert key == get_response_cache_key({**kwargs, "timeout": 60})
+        assert key != get_response_cache_key({**kwargs, "temperature": 0})
+        assert key != get_response_cache_key({**kwargs, "seed": 42})
+
+    def test_nonzero_temperature_opt_out(self, enabled_response_cache, monkeypatch):
+        monkeypatch.setattr(get_settings().response_cache, 'skip_nonzero_temperature', True)
+        assert get_response_cache_key({"model": "gpt-4o", "messages": [], "temperature": 0.2}) is None
+        assert get_response_cache_key({"model": "gpt-4o", "messages": [], "temperature": 0}) is not None
+
+
+class TestLiteLLMResponseCache:
+    @pytest.mark.asyncio
+    async def test_second_call_is_served_from_cache(self, enabled_response_cache):
+        response = _ModelResponse(choices=[{"message": {"content": "looks good"}, "finish_reason": "stop"}],
+                                  usage={"total_tokens": 1234})
+        with patch("pr_agent.algo.ai_handlers.litellm_ai_handler.acompletion",
+                   new=AsyncMock(return_value=response)) as acompletion:
+            handler = LiteLLMAIHandler()
+            first = await handler.chat_completion(model="gpt-4o", system="system", user="user", temperature=0)
+            second = await handler.chat_completion(model="gpt-4o", system="system", user="user", temperature=0)
+            await handler.chat_completion(model="gpt-4o", system="system", user="other user", temperature=0)
+
+        assert first == second == ("looks good", "stop")
+        assert acompletion.call_count == 2
+        stats = get_response_cache_stats()
+        assert (stats["hits"], stats["misses"], stats["tokens_saved"]) == (1, 2, 1234)
@@ -0,0 +1,118 @@
+from types import SimpleNamespace
+
+import pytest
+
+from pr_agent.algo.ai_handlers.litellm_helpers import STREAM_CONSUMER_STOP_FINISH_REASON, _handle_streaming_response
+from pr_agent.algo.streaming_yaml import IncrementalYamlListParser
+
+RESPONSE = """```yaml
+code_suggestions:
+- relevant_file: |
+    src/a.py
+  existing_code: |
+    x = 1
+    - not an item
+  label: |
+    bug
+- relevant_file: |
+    src/b.py
+  existing_code: |
+    y = 2
+  label: |
+    style
+- relevant_file: |
+    src/c.py
+  label: |
+    bug
+```
+"""
+
+
+def _feed_in_chunks(parser, text, chunk_size):
+    for i in range(0, len(text), chunk_size):
+        if parser.feed(text[i:i + chunk_size]):
+            return True
+    parser.finish()
+    return False
+
+
+class TestIncrementalYamlListParser:
+    @pytest.mark.parametrize("chunk_size", [1, 7, 1000])
+    def test_items_are_parsed(self, chunk_size):
+        parser = IncrementalYamlListParser("code_suggestions")
+        assert not _feed_in_chunks(parser, RESPONSE, chunk_size)
+        assert [item["relevant_file"].strip() for item in parser.items] == ["src/a.py", "src/b.py", "src/c.py"]
+        assert parser.items[0]["existing_code"] == "x = 1\n- not an item\n"
+
+    def test_item_is_emitted_once_the_next_one_starts(self):
+        parser = IncrementalYamlListParser("code_suggestions")
+        first_item_end = RESPONSE.index("- relevant_file: |\n    src/b.py")
+        parser.feed(RESPONSE[:first_item_end])
+        assert parser.items == []
+        parser.feed("- relevant_file: |\n")
+        assert [item["relevant_file"].strip() for item in parser.items] == ["src/a.py"]
+
+    def test_stops_after_max_items(self):
+        parser = IncrementalYamlListParser("code_suggestions", max_items=2)
+        assert _feed_in_chunks(parser, RESPONSE, 5)
+        assert parser.stopped
+        assert len(parser.items) == 2
+
+    def test_validate_item(self):
+        def keep_bugs(item, valid_items):
+            return item if item["label"].strip() == "bug" else None
+
+        parser = IncrementalYamlListParser("code_suggestions", validate_item=keep_bugs)
+        _feed_in_chunks(parser, RESPONSE, 10)
+        assert [item["relevant_file"].strip() for item in parser.items] == ["src/a.py", "src/c.py"]
+
+    def test_reset(self):
+        parser = IncrementalYamlListParser("code_suggestions", max_items=1)
+        _feed_in_chunks(parser, RESPONSE, 10)
+        parser.reset()
+        assert parser.items == [] and not parser.stopped
+        assert _feed_in_chunks(parser, RESPONSE, 10)
+
+
+class _FakeStream:
+    def __init__(self, text, chunk_size):
+        self.chunks = [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)]
+        self.consumed = 0
+        self.closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.consumed == len(self.chunks):
+            raise StopAsyncIteration
+        content = self.chunks[self.consumed]
+        self.consumed += 1
+        finish_reason = "stop" if self.consumed == len(self.chunks) else None
+        return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content),
+                                                        finish_reason=finish_reason)])
+
+    async def aclose(self):
+        self.closed = True
+
+
+class TestStreamingResponse:
+    @pytest.mark.asyncio
+    async def test_consumer_stops_the_stream(self):
+        stream = _FakeStream(RESPONSE, 8)
+        parser = IncrementalYamlListParser("code_suggestions", max_items=1)
+        response, finish_reason = await _handle_streaming_response(stream, parser)
+        assert finish_reason == STREAM_CONSUMER_STOP_FINISH_REASON
+        assert stream.closed
+        assert stream.consumed < len(stream.chunks)
+        assert RESPONSE.startswith(response)
+        assert len(parser.items) == 1
+
+    @pytest.mark.asyncio
+    async def test_full_stream(self):
+        stream = _FakeStream(RESPONSE, 8)
+        parser = IncrementalYamlListParser("code_suggestions")
+        response, finish_reason = await _handle_streaming_response(stream, parser)
+        assert (response, finish_reason) == (RESPONSE, "stop")
+        assert not stream.closed
+        assert len(parser.items) == 3
@@ -0,0 +1,96 @@
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+from pr_agent.algo.ai_handlers.litellm_ai_handler import LiteLLMAIHandler
+from pr_agent.algo.structured_output import get_response_schema, load_prediction
+from pr_agent.algo.template_registry import get_prompt_template
+from pr_agent.config_loader import get_settings
+
+
+class _ModelResponse(dict):
+    def dict(self):
+        return dict(self)
+
+
+@pytest.fixture
+def structured_output(monkeypatch):
+    monkeypatch.setattr(get_settings().config, "enable_structured_output", True, raising=False)
+
+
+def _code_suggestions_system_prompt():
+    return get_prompt_template(get_settings().pr_code_suggestions_prompt.system).render(
+        {"num_code_suggestions": 3, "extra_instructions": "", "focus_only_on_problems": True, "is_ai_metadata": False,
+         "duplicate_prompt_examples": False, "date": "2026-01-01"})
+
+
+class TestResponseSchema:
+    def test_no_schema_when_disabled(self):
+        assert get_response_schema(_code_suggestions_system_prompt()) is None
+
+    def test_code_suggestions_schema(self, structured_output):
+        response_schema = get_response_schema(_code_suggestions_system_prompt())
+        assert response_schema["name"] == "PRCodeSuggestions"
+        suggestions = response_schema["schema"]["properties"]["code_suggestions"]
+        assert suggestions["type"] == "array"
+        suggestion = suggestions["items"]
+        assert suggestion["required"] == ["relevant_file", "language", "existing_code", "suggestion_content",
+                                          "improved_code", "one_sentence_summary", "label"]
+        assert suggestion["properties"]["relevant_file"] == {"type": "string",
+                                                             "description": "Full path of the relevant file"}
+
+    def test_types_and_field_options(self, structured_output):
+        system_prompt = '''\
+The output must be a YAML object equivalent to type $Output, according to the following Pydantic definitions:
+=====
+class Kind(str, Enum):
+    bug = "Bug"
+
+class Item(BaseModel):
+    name_[1-5]: int = Field("positional description")
+    kinds: List[Kind] = Field(min_items=0, max_items=2, description="kinds")
+
+class Output(BaseModel):
+    items: Union[List[Item], str]
+    __import__('os').system('false'): str
+=====
+'''
+        schema = get_response_schema(system_prompt)["schema"]
+        item = schema["properties"]["items"]["anyOf"][0]["items"]
+        assert item["properties"]["name_[1-5]"] == {"type": "integer", "description": "positional description"}
+        assert item["properties"]["kinds"] == {"type": "array", "items": {"type": "string"}, "description": "kinds",
+                                               "minItems": 0, "maxItems": 2}
+        assert schema["properties"]["items"]["anyOf"][1] == {"type": "string"}
+        assert schema["required"] == ["items"]
+
+    def test_prompt_without_definitions(self, structured_output):
+        assert get_response_schema("Answer the question.") is None
+
+
+class TestLoadPrediction:
+    def test_json_is_parsed_directly(self):
+        assert load_prediction('```json\n{"review": {"relevant_tests": "No"}}\n```') == \
+            {"review": {"relevant_tests": "No"}}
+
+    def test_yaml_fallback(self):
+        assert load_prediction("review:\n  relevant_tests: |\n    No\n", first_key="review") == \
+            {"review": {"relevant_tests": "No"}}
+
+
+class TestLiteLLMResponseFormat:
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("model, expected_response_format", [("gpt-4o", True), ("gpt-3.5-turbo", False)])
+    async def test_response_format_only_for_supporting_models(self, model, expected_response_format):
+        response_schema = {"name": "Output", "schema": {"type": "object", "properties": {}}}
+        response = _ModelResponse(choices=[{"message": {"content": "{}"}, "finish_reason": "stop"}],
+                                  usage={"total_tokens": 10})
+        with patch("pr_agent.algo.ai_handlers.litellm_ai_handler.acompletion",
+                   new=AsyncMock(return_value=response)) as acompletion:
+            handler = LiteLLMAIHandler()
+            await handler.chat_completion(model=model, system="system", user="user", temperature=0,
+                                          response_schema=response_schema)
+        kwargs = acompletion.call_args.kwargs
+        if expected_response_format:
+            assert kwargs["response_format"] == {"type": "json_schema", "json_schema": response_schema}
+        else:
+            assert "response_format" not in kwargs
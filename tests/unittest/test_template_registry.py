@@ -0,0 +1,40 @@
+import pytest
+from jinja2 import UndefinedError
+
+from pr_agent.algo import template_registry
+from pr_agent.algo.template_registry import get_prompt_template, get_prompt_template_stats
+
+
+@pytest.fixture(autouse=True)
+def empty_registry(monkeypatch):
+    monkeypatch.setattr(template_registry, "_templates", template_registry.OrderedDict())
+    monkeypatch.setattr(template_registry, "_template_stats", {"hits": 0, "compilations": 0, "compile_seconds": 0.0})
+
+
+class TestTemplateRegistry:
+    def test_template_is_compiled_once(self):
+        first = get_prompt_template("Title: '{{ title }}'")
+        second = get_prompt_template("Title: '{{ title }}'")
+        assert first is second
+        assert second.render({"title": "Fix bug"}) == "Title: 'Fix bug'"
+        stats = get_prompt_template_stats()
+        assert (stats["compilations"], stats["hits"], stats["cached_templates"]) == (1, 1, 1)
+
+    def test_overridden_prompt_is_compiled_again(self):
+        assert get_prompt_template("{{ title }}").render({"title": "a"}) == "a"
+        assert get_prompt_template("custom: {{ title }}").render({"title": "a"}) == "custom: a"
+        assert get_prompt_template_stats()["compilations"] == 2
+
+    def test_undefined_variables_are_errors(self):
+        with pytest.raises(UndefinedError):
+            get_prompt_template("{{ missing }}").render({})
+
+    def test_least_recently_used_templates_are_evicted(self, monkeypatch):
+        monkeypatch.setattr(template_registry, "PROMPT_TEMPLATE_CACHE_SIZE", 2)
+        first = get_prompt_template("1")
+        get_prompt_template("2")
+        get_prompt_template("1")
+        get_prompt_template("3")
+        assert get_prompt_template_stats()["cached_templates"] == 2
+        assert get_prompt_template("1") is first
+        assert get_prompt_template_stats()["compilations"] == 3
@@ -0,0 +1,74 @@
+from collections import OrderedDict
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from pr_agent.algo.token_handler import TokenEncoder, TokenHandler
+from pr_agent.config_loader import get_settings
+
+LONG_TEXT = "def foo():\n    return 'bar'\n" * 50
+
+
+@pytest.fixture(autouse=True)
+def empty_token_count_cache():
+    with patch.object(TokenEncoder, '_token_count_cache', OrderedDict()):
+        yield
+
+
+def _mock_encoder(name="mock_encoding"):
+    encoder = MagicMock()
+    encoder.name = name
+    encoder.encode.side_effect = lambda text, **kwargs: text.split()
+    encoder.encode_batch.side_effect = lambda texts, **kwargs: [text.split() for text in texts]
+    return encoder
+
+
+class TestTokenCountCache:
+    def test_same_text_is_encoded_once(self):
+        encoder = _mock_encoder()
+        assert TokenEncoder.count_tokens(LONG_TEXT, encoder) == len(LONG_TEXT.split())
+        assert TokenEncoder.count_tokens(LONG_TEXT, encoder) == len(LONG_TEXT.split())
+        assert encoder.encode.call_count == 1
+
+    def test_short_text_is_not_cached(self):
+        encoder = _mock_encoder()
+        TokenEncoder.count_tokens("short text", encoder)
+        TokenEncoder.count_tokens("short text", encoder)
+        assert encoder.encode.call_count == 2
+
+    def test_cache_is_keyed_by_encoder(self):
+        encoder1 = _mock_encoder("encoding1")
+        encoder2 = _mock_encoder("encoding2")
+        TokenEncoder.count_tokens(LONG_TEXT, encoder1)
+        TokenEncoder.count_tokens(LONG_TEXT, encoder2)
+        assert encoder1.encode.call_count == 1
+        assert encoder2.encode.call_count == 1
+
+    def test_cache_size_is_bounded(self, monkeypatch):
+        monkeypatch.setattr(get_settings().config, 'token_count_cache_size', 2)
+        encoder = _mock_encoder()
+        for i in range(3):
+            TokenEncoder.count_tokens(f"{i}\n{LONG_TEXT}", encoder)
+        assert len(TokenEncoder._token_count_cache) == 2
+        TokenEncoder.count_tokens(f"0\n{LONG_TEXT}", encoder)  # evicted, encoded again
+        assert encoder.encode.call_count == 4
+
+
+class TestCountTokensBatch:
+    def test_batch_matches_single_counts(self):
+        encoder = _mock_encoder()
+        texts = [LONG_TEXT, "short text", LONG_TEXT + "extra"]
+        assert TokenEncoder.count_tokens_batch(texts, encoder) == [len(text.split()) for text in texts]
+        encoder.encode_batch.assert_called_once()
+
+    def test_batch_only_encodes_missing_texts(self):
+        encoder = _mock_encoder()
+        TokenEncoder.count_tokens(LONG_TEXT, encoder)
+        TokenEncoder.count_tokens_batch([LONG_TEXT, LONG_TEXT + "extra"], encoder)
+        assert encoder.encode_batch.call_args[0][0] == [LONG_TEXT + "extra"]
+
+    def test_token_handler_batch(self):
+        with patch.object(TokenEncoder, 'get_token_encoder', return_value=_mock_encoder()):
+            token_handler = TokenHandler()
+            texts = [LONG_TEXT, "short text", ""]
+            assert token_handler.count_tokens_batch(texts) == [token_handler.count_tokens(text) for text in texts]
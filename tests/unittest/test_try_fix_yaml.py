@@ -2,6 +2,7 @@
 # Generated by CodiumAI
 import pytest
 
+from pr_agent.algo import utils
 from pr_agent.algo.utils import try_fix_yaml
 
 
@@ -244,3 +245,32 @@ int sub(int a, int b) {
 '''
         expected_output = {'code_suggestions': [{'relevant_file': 'a.c\n', 'existing_code': '  int sum(int a, int b) {\n    return a + b;\n  }\n\n  int sub(int a, int b) {\n    return a - b;\n  }\n'}]}
         assert try_fix_yaml(review_text, first_key='code_suggestions', last_key='existing_code') == expected_output
+
+    def test_combined_failure_modes_single_pass(self, monkeypatch):
+        review_text = '''\
+Here are my suggestions:
+```yaml
+{
+code_suggestions:
+- relevant_file: |
+    src/a.py
+  improved_code: |
++   return x
+  label: bug
+}
+```
+Let me know if you need anything else.
+'''
+        loads = []
+        safe_load_yaml = utils._safe_load_yaml
+
+        def counting_safe_load_yaml(text):
+            loads.append(text)
+            return safe_load_yaml(text)
+
+        monkeypatch.setattr(utils, "_safe_load_yaml", counting_safe_load_yaml)
+        expected_output = {'code_suggestions': [{'relevant_file': 'src/a.py\n', 'improved_code': 'return x\n',
+                                                 'label': 'bug'}]}
+        assert try_fix_yaml(review_text, first_key='code_suggestions', last_key='label') == expected_output
+        # fixed by the single-pass repair, the fallbacks are not reached
+        assert len(loads) == 1